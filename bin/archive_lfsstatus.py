@@ -0,0 +1,6 @@
+#!/usr/bin/env python
+
+from tokio.cli.archive_lfsstatus import main
+
+if __name__ == "__main__":
+    main()
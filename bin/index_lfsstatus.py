@@ -0,0 +1,6 @@
+#!/usr/bin/env python
+
+from tokio.cli.index_lfsstatus import main
+
+if __name__ == "__main__":
+    main()
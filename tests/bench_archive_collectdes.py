@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""Benchmark the page pipeline in cli.archive_collectdes
+
+Compares the throughput, in pages per second, of pages_to_hdf5() when pages
+are retrieved, decoded, and inserted strictly one after another versus when
+retrieval runs ahead in a background thread and decoding is spread across a
+pool of processes.  Pages are taken from the cached sample_collectdes-*.json.gz
+inputs, repeated to emulate a longer query, and each page is delayed by a fixed
+latency to emulate the round trip to Elasticsearch.
+
+Run from the tests directory::
+
+    python bench_archive_collectdes.py --latency 0.05 --threads 1 2 4
+"""
+
+import os
+import glob
+import time
+import argparse
+import datetime
+import tempfile
+
+import numpy
+import h5py
+
+import tokiotest
+import tokio.connectors.es
+import tokio.cli.archive_collectdes as archive_collectdes
+
+SAMPLE_INPUTS = sorted(glob.glob(os.path.join(tokiotest.INPUT_DIR, 'sample_collectdes-*.json.gz')))
+
+def delayed_pages(pages, latency):
+    """Yield pages as if each one took `latency` seconds to retrieve
+    """
+    for page in pages:
+        time.sleep(latency)
+        yield page
+
+def bench(pages, latency, output_file, threads, prefetch):
+    """Time the archival of pages into a new HDF5 file
+
+    Returns:
+        tuple: (seconds elapsed, progress counters)
+    """
+    if os.path.exists(output_file):
+        os.unlink(output_file)
+    start = datetime.datetime.strptime(tokiotest.SAMPLE_COLLECTDES_START, archive_collectdes.DATE_FMT)
+    end = datetime.datetime.strptime(tokiotest.SAMPLE_COLLECTDES_END, archive_collectdes.DATE_FMT)
+    t_start = time.time()
+    progress = archive_collectdes.pages_to_hdf5(
+        pages=delayed_pages(pages, latency),
+        output_file=output_file,
+        init_start=start,
+        init_end=end,
+        query_start=start,
+        query_end=end,
+        timestep=tokiotest.SAMPLE_COLLECTDES_TIMESTEP,
+        num_servers=tokiotest.SAMPLE_COLLECTDES_NUMNODES,
+        devices_per_server=tokiotest.SAMPLE_COLLECTDES_SSDS_PER,
+        threads=threads,
+        prefetch=prefetch)
+    return time.time() - t_start, progress
+
+def same_datasets(file0, file1):
+    """Check that two HDF5 files contain identical datasets
+    """
+    with h5py.File(file0, 'r') as h5_file0, h5py.File(file1, 'r') as h5_file1:
+        for key in archive_collectdes.DATASETS:
+            if key in h5_file0 and not numpy.array_equal(h5_file0[key][...], h5_file1[key][...]):
+                return False
+    return True
+
+def main(argv=None):
+    """Run the benchmark
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--repeat', type=int, default=10,
+                        help="times to repeat the sample pages (default: 10)")
+    parser.add_argument('-l', '--latency', type=float, default=0.05,
+                        help="seconds to retrieve each page (default: 0.05)")
+    parser.add_argument('-t', '--threads', type=int, nargs='+', default=[1, 2, 4],
+                        help="decoder process counts to test (default: 1 2 4)")
+    parser.add_argument('-p', '--prefetch', type=int, default=4,
+                        help="pages to retrieve ahead (default: 4)")
+    args = parser.parse_args(argv)
+
+    pages = []
+    for input_file in SAMPLE_INPUTS:
+        pages += list(tokio.connectors.es.iter_cache(input_file))
+    pages *= args.repeat
+    num_docs = sum(len(page) for page in pages)
+    print("%d pages containing %d documents from %s" % (
+        len(pages), num_docs, ", ".join(os.path.basename(x) for x in SAMPLE_INPUTS)))
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        baseline_file = os.path.join(temp_dir, 'sequential.hdf5')
+        baseline, progress = bench(pages, args.latency, baseline_file, threads=1, prefetch=0)
+
+        print("%-24s %10s %10s %12s %8s" % ("configuration", "seconds", "pages/s", "elements/s", "speedup"))
+        print("%-24s %10.3f %10.1f %12.0f %7.2fx" % (
+            "sequential", baseline, len(pages) / baseline, progress['elements'] / baseline, 1.0))
+        for threads in args.threads:
+            output_file = os.path.join(temp_dir, 'pipelined%d.hdf5' % threads)
+            elapsed, progress = bench(pages, args.latency, output_file, threads=threads,
+                                      prefetch=args.prefetch)
+            assert same_datasets(baseline_file, output_file)
+            print("%-24s %10.3f %10.1f %12.0f %7.2fx" % (
+                "prefetch=%d threads=%d" % (args.prefetch, threads), elapsed,
+                len(pages) / elapsed, progress['elements'] / elapsed, baseline / elapsed))
+    finally:
+        for output_file in glob.glob(os.path.join(temp_dir, '*.hdf5')):
+            os.unlink(output_file)
+        os.rmdir(temp_dir)
+
+if __name__ == '__main__':
+    main()
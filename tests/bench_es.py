@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Benchmark sliced scroll retrieval in connectors.es
+
+Compares the throughput, in documents per second, of EsConnection.iter_scroll()
+when retrieving a query as a single scroll versus as a number of slices
+scrolled in parallel.  Queries are served by tokiotest.FakeEsService with a
+fixed latency per request to emulate the round trip to a remote Elasticsearch
+service.
+
+Run from the tests directory::
+
+    python bench_es.py --latency 0.05 --slices 1 2 4 8
+"""
+
+import time
+import argparse
+
+import tokiotest
+import tokio.connectors.es
+
+def bench(documents, latency, page_size, slices):
+    """Time the retrieval of all documents using some number of slices
+
+    Returns:
+        tuple: (seconds elapsed, number of documents retrieved)
+    """
+    es_obj = tokio.connectors.es.EsConnection(host=None, port=None, page_size=page_size,
+                                              slices=slices)
+    es_obj.local_mode = False
+    es_obj.client = tokiotest.FakeEsService(documents, latency=latency)
+
+    t_start = time.time()
+    num_docs = 0
+    for page in es_obj.iter_scroll({}, filter_function=lambda x: x['hits']['hits']):
+        num_docs += len(page)
+    return time.time() - t_start, num_docs
+
+def main(argv=None):
+    """Run the benchmark
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--num-docs', type=int, default=200000,
+                        help="documents returned by the query (default: 200000)")
+    parser.add_argument('--page-size', type=int, default=10000,
+                        help="documents per page (default: 10000)")
+    parser.add_argument('-l', '--latency', type=float, default=0.05,
+                        help="seconds of latency per request (default: 0.05)")
+    parser.add_argument('-s', '--slices', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="slice counts to test (default: 1 2 4 8)")
+    args = parser.parse_args(argv)
+
+    documents = tokiotest.make_es_documents(args.num_docs)
+
+    print("%8s %10s %12s %8s" % ("slices", "seconds", "docs/s", "speedup"))
+    baseline = None
+    for slices in args.slices:
+        elapsed, num_docs = bench(documents, args.latency, args.page_size, slices)
+        assert num_docs == args.num_docs
+        if baseline is None:
+            baseline = elapsed
+        print("%8d %10.3f %12.0f %7.2fx" % (slices, elapsed, num_docs / elapsed, baseline / elapsed))
+
+if __name__ == '__main__':
+    main()
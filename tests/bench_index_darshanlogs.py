@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+"""Benchmark the lite darshan-parser reducer used by cli.index_darshanlogs
+
+Compares the throughput, in lines of ``darshan-parser --base`` output per
+second, of index_darshanlogs.reduce_base_output() against the original
+line-at-a-time reducer that it replaced.  The output of darshan-parser is
+captured once per sample log so that only the reducers are timed.  If
+darshan-parser is not available, synthetic darshan-parser output is used
+instead.
+
+Run from the tests directory::
+
+    python bench_index_darshanlogs.py --repeat 20
+"""
+
+import os
+import io
+import glob
+import time
+import argparse
+import subprocess
+
+import tokiotest
+import tokio.cli.index_darshanlogs as index_darshanlogs
+
+SAMPLE_DARSHAN_LOGS = glob.glob(os.path.join(tokiotest.INPUT_DIR, '*.darshan'))
+
+SYNTHETIC_MOUNTS = [
+    ('/', 'rootfs'),
+    ('/scratch1', 'lustre'),
+    ('/scratch2', 'lustre'),
+    ('/global/cscratch1', 'lustre'),
+    ('/global/u1', 'dvs'),
+    ('/global/u2', 'dvs'),
+    ('/global/project', 'dvs'),
+    ('/usr/lib64/libibverbs.so.1.0.0', 'dvs'),
+]
+
+SYNTHETIC_COUNTERS = {
+    'POSIX': [x.upper() for x in index_darshanlogs.SUMMARY_COUNTERS] \
+        + ['ACCESS%d_ACCESS' % x for x in range(1, 5)] \
+        + ['SIZE_READ_0_100', 'SIZE_WRITE_0_100', 'MODE', 'FASTEST_RANK'],
+    'STDIO': ['OPENS', 'READS', 'WRITES', 'SEEKS', 'FLUSHES', 'BYTES_WRITTEN', 'BYTES_READ',
+              'F_OPEN_START_TIMESTAMP', 'F_CLOSE_END_TIMESTAMP'],
+    'MPI-IO': ['INDEP_OPENS', 'COLL_OPENS', 'BYTES_READ', 'BYTES_WRITTEN', 'F_READ_TIME'],
+    'LUSTRE': ['OSTS', 'MDTS', 'STRIPE_SIZE', 'STRIPE_WIDTH'] + ['OST_ID_%d' % x for x in range(8)],
+}
+
+def synthesize_base_output(num_records):
+    """Generate output resembling that of darshan-parser --base
+
+    Args:
+        num_records (int): Number of file records per module
+
+    Returns:
+        bytes: Synthetic output of darshan-parser --base for a Darshan 3 log
+    """
+    lines = [
+        "# darshan log version: 3.10",
+        "# compression method: ZLIB",
+        "# exe: /global/u1/u/user/bin/app.x --input foo",
+        "# uid: 12345",
+        "# jobid: 8675309",
+        "# start_time: 1490000867",
+        "# end_time: 1490000983",
+        "# nprocs: 2048",
+        "# run time: 117",
+        "# mounted file systems (mount point and fs type)",
+        "# -------------------------------------------------------",
+    ]
+    lines += ["# mount entry:\t%s\t%s" % x for x in SYNTHETIC_MOUNTS]
+    lines += ["", "# *******************************************************"]
+    for module, counters in SYNTHETIC_COUNTERS.items():
+        lines += ["# %s module data" % module, "# *******************************************************"]
+        for record in range(num_records):
+            mount, fstype = SYNTHETIC_MOUNTS[1 + record % (len(SYNTHETIC_MOUNTS) - 2)]
+            if module == 'STDIO' and record % 7 == 0:
+                filename, mount, fstype = "<STDOUT>", "UNKNOWN", "UNKNOWN"
+            else:
+                filename = "%s/dir%d/file.%d" % (mount, record % 13, record)
+            for index, counter in enumerate(counters):
+                if 'TIME' in counter:
+                    value = "%.6f" % (record * 0.001 + index)
+                else:
+                    value = "%d" % (record * 31 + index)
+                lines.append("\t".join([module, str(record % 64), str(1000 + record),
+                                        "%s_%s" % (module.replace('-', ''), counter),
+                                        value, filename, mount, fstype]))
+    return ("\n".join(lines) + "\n").encode('utf-8')
+
+def legacy_reduce_base_output(stream):
+    """Reduce darshan-parser output one decoded line at a time
+
+    This is the reduction loop formerly used by summarize_by_fs_lite().
+    """
+    def legacy_get_file_mount(filename, mount_list):
+        sorted_mount_list = sorted(mount_list, key=len, reverse=True)
+        for mount in sorted_mount_list:
+            if filename.startswith(mount):
+                logical = mount
+                for mount_rex, fsname in index_darshanlogs.MOUNT_TO_FSNAME.items():
+                    if mount_rex.match(mount):
+                        logical = fsname
+                return (mount, logical)
+            if filename in ("<STDOUT>", "<STDERR>") and mount == "UNKNOWN":
+                return mount, mount
+            elif os.sep not in filename:
+                return "UNKNOWN", "UNKNOWN"
+        return None
+
+    mount_list = ["UNKNOWN"]
+    logical_mount_names = {}
+    header = {}
+    reduced_counters = {}
+    while True:
+        line = stream.readline().decode('utf-8')
+        if not line:
+            break
+        if line.startswith('# darshan log version:'):
+            header['version'] = line.split(":", 1)[-1].strip()
+            continue
+        elif line.startswith('# mount entry:'):
+            mount_list.append(line.split(':', 1)[-1].strip().split(None, 1)[0])
+            continue
+        elif not line.startswith('#'):
+            fields = line.split()
+            if len(fields) < 7 or fields[0] not in ('POSIX', 'STDIO'):
+                continue
+            counter = fields[3].split('_', 1)[-1].lower()
+            if counter in index_darshanlogs.INTEGER_COUNTERS:
+                value = int(fields[4])
+                reducer = index_darshanlogs.INTEGER_COUNTERS.get(counter)
+            elif counter in index_darshanlogs.REAL_COUNTERS:
+                value = float(fields[4])
+                reducer = index_darshanlogs.REAL_COUNTERS.get(counter)
+            else:
+                continue
+            mount = legacy_get_file_mount(fields[-2], mount_list)
+            if mount is None:
+                continue
+            mount, logical = mount
+            logical_mount_names[mount] = logical
+            if mount not in reduced_counters:
+                reduced_counters[mount] = {}
+            if counter not in reduced_counters[mount]:
+                reduced_counters[mount][counter] = value
+            else:
+                reduced_counters[mount][counter] = reducer(reduced_counters[mount][counter], value)
+    return header, reduced_counters, logical_mount_names
+
+def get_parser_outputs(repeat, num_records):
+    """Capture darshan-parser --base output for each sample log
+
+    Falls back to synthetic output if darshan-parser cannot be run.
+
+    Returns:
+        dict: Keyed by log name, values are darshan-parser output as bytes
+    """
+    outputs = {}
+    for darshan_log in SAMPLE_DARSHAN_LOGS:
+        try:
+            output = subprocess.check_output(['darshan-parser', '--base', darshan_log],
+                                             stderr=subprocess.DEVNULL)
+        except (OSError, subprocess.CalledProcessError):
+            continue
+        # repeat counter lines to emulate a larger log
+        head, sep, body = output.partition(b'# *****')
+        outputs[os.path.basename(darshan_log)] = head + sep + body * repeat
+
+    if not outputs:
+        print("darshan-parser not available; using synthetic output")
+        outputs['synthetic'] = synthesize_base_output(num_records * repeat)
+    return outputs
+
+def bench(func, output):
+    """Time one reducer over one darshan-parser output
+
+    Returns:
+        tuple: (seconds elapsed, reduced counters)
+    """
+    stream = io.BufferedReader(io.BytesIO(output))
+    t_start = time.time()
+    _, reduced_counters, _ = func(stream)
+    return time.time() - t_start, reduced_counters
+
+def main(argv=None):
+    """Run the benchmark
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--repeat', type=int, default=10,
+                        help="times to repeat the records of each log (default: 10)")
+    parser.add_argument('-n', '--num-records', type=int, default=1000,
+                        help="records per module in synthetic output (default: 1000)")
+    args = parser.parse_args(argv)
+
+    index_darshanlogs.init_mount_to_fsname()
+
+    outputs = get_parser_outputs(args.repeat, args.num_records)
+
+    print("%-40s %12s %14s %14s %8s" % ("log", "lines", "legacy lines/s", "new lines/s", "speedup"))
+    total = {'lines': 0, 'legacy': 0.0, 'new': 0.0}
+    for name, output in sorted(outputs.items()):
+        num_lines = output.count(b'\n')
+        legacy_time, legacy_result = bench(legacy_reduce_base_output, output)
+        new_time, new_result = bench(index_darshanlogs.reduce_base_output, output)
+        assert legacy_result == new_result
+
+        total['lines'] += num_lines
+        total['legacy'] += legacy_time
+        total['new'] += new_time
+        print("%-40s %12d %14.0f %14.0f %7.2fx" % (
+            name[:40], num_lines, num_lines / legacy_time, num_lines / new_time,
+            legacy_time / new_time))
+
+    print("%-40s %12d %14.0f %14.0f %7.2fx" % (
+        "total", total['lines'], total['lines'] / total['legacy'],
+        total['lines'] / total['new'], total['legacy'] / total['new']))
+
+if __name__ == '__main__':
+    main()
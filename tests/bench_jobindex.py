@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""Benchmark interval queries against the jobs database and a JobIndex
+
+Compares the time taken to count the jobs, nodes, and node-hours overlapping a
+number of random windows by calling NerscJobsDb.get_concurrent_jobs() once per
+window versus building a JobIndex once and querying every window in a single
+call to JobIndex.get_concurrent_jobs().  Both use the sample jobs database.
+
+Run from the tests directory::
+
+    python bench_jobindex.py --windows 100 1000 10000
+"""
+
+import time
+import random
+import argparse
+
+import tokiotest
+import tokio.connectors.nersc_jobsdb
+import tokio.tools.jobindex
+
+def random_windows(num_windows):
+    """Generate random windows spanning the sample jobs database
+
+    Args:
+        num_windows (int): Number of windows to generate
+
+    Returns:
+        tuple of list: Start times and end times of each window
+    """
+    starts = []
+    ends = []
+    for _ in range(num_windows):
+        start = random.randint(tokiotest.SAMPLE_NERSCJOBSDB_START, tokiotest.SAMPLE_NERSCJOBSDB_END)
+        starts.append(start)
+        ends.append(start + random.randint(0, 86400))
+    return starts, ends
+
+def bench_jobsdb(starts, ends):
+    """Query the jobs database once per window
+
+    Returns:
+        tuple: Elapsed seconds and list of node-hours for each window
+    """
+    t_start = time.time()
+    nerscjobsdb = tokio.connectors.nersc_jobsdb.NerscJobsDb(
+        cache_file=tokiotest.SAMPLE_NERSCJOBSDB_FILE)
+    nodehrs = []
+    for start, end in zip(starts, ends):
+        totals = nerscjobsdb.get_concurrent_jobs(start, end, tokiotest.SAMPLE_NERSCJOBSDB_HOST)
+        nodehrs.append(totals['nodehrs'])
+    return time.time() - t_start, nodehrs
+
+def bench_jobindex(starts, ends):
+    """Build a job index and query all windows at once
+
+    Returns:
+        tuple: Elapsed seconds and list of node-hours for each window
+    """
+    t_start = time.time()
+    job_index = tokio.tools.jobindex.JobIndex.from_jobsdb(
+        min(starts),
+        max(ends),
+        tokiotest.SAMPLE_NERSCJOBSDB_HOST,
+        cache_file=tokiotest.SAMPLE_NERSCJOBSDB_FILE)
+    totals = job_index.get_concurrent_jobs(starts, ends)
+    return time.time() - t_start, list(totals['nodehrs'])
+
+def main(argv=None):
+    """Run the benchmark
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-w', '--windows', type=int, nargs='+', default=[100, 1000],
+                        help="numbers of windows to query (default: 100 1000)")
+    args = parser.parse_args(argv)
+
+    random.seed(0)
+    print("%10s %12s %12s %8s" % ("windows", "jobsdb (s)", "index (s)", "speedup"))
+    for num_windows in args.windows:
+        starts, ends = random_windows(num_windows)
+        jobsdb_elapsed, jobsdb_nodehrs = bench_jobsdb(starts, ends)
+        index_elapsed, index_nodehrs = bench_jobindex(starts, ends)
+        assert jobsdb_nodehrs == index_nodehrs
+        print("%10d %12.4f %12.4f %7.1fx" % (num_windows, jobsdb_elapsed, index_elapsed,
+                                             jobsdb_elapsed / index_elapsed))
+
+if __name__ == '__main__':
+    main()
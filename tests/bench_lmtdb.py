@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""Benchmark concurrent time-chunk queries in connectors.lmtdb
+
+Compares the time taken by LmtDb.get_timeseries_data() to retrieve a range of
+OST_DATA when its hourly chunks are queried serially versus concurrently over a
+pool of connections.  The remote MySQL database is stood in for by an SQLite
+database built by replicating the five minutes of data in the sample LMT
+database over a longer time range, and each query can be delayed by a fixed
+latency to emulate the round trip to a remote database.
+
+Run from the tests directory::
+
+    python bench_lmtdb.py --hours 24 --latency 0.05 --connections 1 2 4 8
+"""
+
+import os
+import time
+import shutil
+import sqlite3
+import datetime
+import argparse
+import tempfile
+
+import tokiotest
+import tokio.connectors.lmtdb
+import tokio.connectors.cachingdb
+
+#: Number of timestamps in each five-minute copy of the sample database
+SAMPLE_TIMESTEPS = 60
+
+class LatentConnection(object):
+    """Wraps an SQLite connection and delays each query
+    """
+    def __init__(self, connection, latency):
+        self.connection = connection
+        self.latency = latency
+
+    def cursor(self):
+        """Return a cursor after waiting for the emulated round trip"""
+        time.sleep(self.latency)
+        return self.connection.cursor()
+
+    def close(self):
+        """Close the wrapped connection"""
+        self.connection.close()
+
+def build_standin(output_file, hours):
+    """Replicate the sample LMT database over a number of hours
+
+    Args:
+        output_file (str): Path to the SQLite database to create
+        hours (int): Number of hours of data to create
+    """
+    shutil.copyfile(tokiotest.SAMPLE_LMTDB_FILE, output_file)
+    conn = sqlite3.connect(output_file)
+    conn.execute("ATTACH DATABASE ? AS src", (tokiotest.SAMPLE_LMTDB_FILE,))
+    (min_ts_id,), = conn.execute("SELECT MIN(TS_ID) FROM src.TIMESTAMP_INFO")
+    max_ts_id = min_ts_id + SAMPLE_TIMESTEPS
+
+    for copy in range(1, hours * 3600 // (SAMPLE_TIMESTEPS * 5)):
+        offset = copy * SAMPLE_TIMESTEPS
+        conn.execute("INSERT OR IGNORE INTO TIMESTAMP_INFO SELECT TS_ID + ?, "
+                     "DATETIME(TIMESTAMP, ?) FROM src.TIMESTAMP_INFO WHERE TS_ID < ?",
+                     (offset, "+%d seconds" % (offset * 5), max_ts_id))
+        for table in ('OST_DATA', 'OSS_DATA', 'MDS_DATA', 'MDS_OPS_DATA'):
+            columns = tokio.connectors.lmtdb.LMTDB_TABLES[table]['columns']
+            conn.execute("INSERT OR IGNORE INTO %s SELECT %s FROM src.%s WHERE TS_ID < ?" % (
+                table,
+                ', '.join(['TS_ID + %d' % offset if x == 'TS_ID' else x for x in columns]),
+                table), (max_ts_id,))
+    # index the stand-in like the LMT MySQL schema so that chunks are cheap to find
+    conn.execute("CREATE INDEX IF NOT EXISTS TIMESTAMP_INDEX ON TIMESTAMP_INFO (TIMESTAMP)")
+    for table in ('OST_DATA', 'OSS_DATA', 'MDS_DATA', 'MDS_OPS_DATA'):
+        conn.execute("CREATE INDEX IF NOT EXISTS %s_TS_INDEX ON %s (TS_ID)" % (table, table))
+    conn.commit()
+    conn.close()
+
+def bench(cache_file, start, end, latency, max_connections):
+    """Time the retrieval of OST_DATA using some number of connections
+
+    Returns:
+        tuple: (seconds elapsed, rows retrieved)
+    """
+    lmtdb = tokio.connectors.lmtdb.LmtDb(cache_file=cache_file, max_connections=max_connections)
+    lmtdb._pool = tokio.connectors.cachingdb.ConnectionPool(
+        lambda: LatentConnection(sqlite3.connect(cache_file, check_same_thread=False), latency),
+        max_connections)
+
+    t_start = time.time()
+    rows, _ = lmtdb.get_ost_data(start, end)
+    return time.time() - t_start, rows
+
+def main(argv=None):
+    """Run the benchmark
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=int, default=24,
+                        help="hours of data in the stand-in database (default: 24)")
+    parser.add_argument('-l', '--latency', type=float, default=0.05,
+                        help="seconds of latency per query (default: 0.05)")
+    parser.add_argument('-c', '--connections', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="connection counts to test (default: 1 2 4 8)")
+    args = parser.parse_args(argv)
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        cache_file = os.path.join(temp_dir, 'standin.sqlite3')
+        build_standin(cache_file, args.hours)
+        start = datetime.datetime.strptime("2018-01-28 00:00:00", "%Y-%m-%d %H:%M:%S")
+        end = start + datetime.timedelta(hours=args.hours)
+
+        print("%12s %10s %12s %8s" % ("connections", "seconds", "rows/s", "speedup"))
+        baseline = None
+        for max_connections in args.connections:
+            elapsed, rows = bench(cache_file, start, end, args.latency, max_connections)
+            if baseline is None:
+                baseline = (elapsed, rows)
+            assert rows == baseline[1]
+            print("%12d %10.3f %12.0f %7.2fx" % (max_connections, elapsed, len(rows) / elapsed,
+                                                 baseline[0] / elapsed))
+    finally:
+        shutil.rmtree(temp_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""Benchmark parallel parsing of mmperfmon tarballs in connectors.mmperfmon
+
+Compares the time taken to load a tarball of mmperfmon outputs when its members
+are parsed serially versus by a pool of processes.  The tarball is built by
+replicating the members of the sample mmperfmon tarball under different names
+to emulate a day of outputs from many NSD servers.
+
+Run from the tests directory::
+
+    python bench_mmperfmon.py --copies 20 --processes 1 2 4 8
+"""
+
+import io
+import os
+import time
+import shutil
+import tarfile
+import argparse
+import tempfile
+
+import tokiotest
+import tokio.connectors.mmperfmon
+
+def build_tarball(output_file, copies):
+    """Replicate the members of the sample mmperfmon tarball
+
+    Args:
+        output_file (str): Path to the tarball to create
+        copies (int): Number of copies of each member to create
+    """
+    with tarfile.open(tokiotest.SAMPLE_MMPERFMON_MULTI, 'r:gz') as input_tar, \
+         tarfile.open(output_file, 'w:gz') as output_tar:
+        members = [(x, input_tar.extractfile(x).read()) for x in input_tar.getmembers() if x.isfile()]
+        for copy in range(copies):
+            for member, contents in members:
+                member.name = "%d/%s" % (copy, os.path.basename(member.name))
+                output_tar.addfile(member, io.BytesIO(contents))
+
+def bench(input_file, processes, window):
+    """Time the loading of a tarball using some number of processes
+
+    Returns:
+        tuple: (seconds elapsed, Mmperfmon object)
+    """
+    t_start = time.time()
+    mmpm = tokio.connectors.mmperfmon.Mmperfmon(input_file, processes=processes, window=window)
+    return time.time() - t_start, mmpm
+
+def main(argv=None):
+    """Run the benchmark
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--copies', type=int, default=20,
+                        help="copies of each sample member (default: 20)")
+    parser.add_argument('-p', '--processes', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="process counts to test (default: 1 2 4 8)")
+    parser.add_argument('-w', '--window', type=int, default=None,
+                        help="members in flight (default: twice processes)")
+    args = parser.parse_args(argv)
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        input_file = os.path.join(temp_dir, 'mmperfmon.tgz')
+        build_tarball(input_file, args.copies)
+
+        print("%10s %10s %12s %8s" % ("processes", "seconds", "members/s", "speedup"))
+        num_members = len(tarfile.open(input_file, 'r:gz').getmembers())
+        baseline = None
+        for processes in args.processes:
+            elapsed, mmpm = bench(input_file, processes, args.window)
+            if baseline is None:
+                baseline = (elapsed, mmpm)
+            assert mmpm == baseline[1]
+            print("%10d %10.3f %12.1f %7.2fx" % (processes, elapsed, num_members / elapsed,
+                                                 baseline[0] / elapsed))
+    finally:
+        shutil.rmtree(temp_dir)
+
+if __name__ == '__main__':
+    main()
@@ -4,10 +4,14 @@ Test the archive_collectdes.py tool
 """
 
 import os
+import time
 import datetime
 import warnings
 import nose
 import h5py
+import numpy
+import tokio.connectors.es
+import tokio.connectors.collectd_es
 import tokio.connectors.hdf5
 import tokiotest
 import tokio.cli.archive_collectdes
@@ -169,3 +173,158 @@ def test_out_of_bounds():
         tokio.cli.archive_collectdes.main(argv)
         print("Caught %d warnings" % len(warn))
         assert len(warn) > 0
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_ndjson_input():
+    """
+    cli.archive_collectdes --input with NDJSON cache
+    """
+    ndjson_file = os.path.join(tokiotest.TEMP_DIR, 'sample_collectdes.ndjson.gz')
+    tokio.connectors.es.convert_cache(tokiotest.SAMPLE_COLLECTDES_FILE, ndjson_file)
+
+    summaries = []
+    for input_file in tokiotest.SAMPLE_COLLECTDES_FILE, ndjson_file:
+        output_file = os.path.join(tokiotest.TEMP_DIR, 'output%d.hdf5' % len(summaries))
+        generate_tts(output_file=output_file, input_file=input_file)
+        with tokio.connectors.hdf5.Hdf5(output_file, 'r') as h5_file:
+            summaries.append(summarize_hdf5(h5_file))
+
+    assert summaries[0]['shapes']
+    assert summaries[0]['shapes'] == summaries[1]['shapes']
+    assert summaries[0]['sums'] == summaries[1]['sums']
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_aggregate():
+    """
+    cli.archive_collectdes aggregation matches document retrieval
+    """
+    documents = []
+    for input_file in tokiotest.SAMPLE_COLLECTDES_FILE, tokiotest.SAMPLE_COLLECTDES_CPULOAD:
+        for page in tokio.connectors.es.iter_cache(input_file):
+            documents += page
+    service = tokiotest.FakeEsService(documents)
+    esdb = tokio.connectors.collectd_es.CollectdEs(host=None, port=None)
+    esdb.local_mode = False
+    esdb.client = service
+
+    start = datetime.datetime.strptime(tokiotest.SAMPLE_COLLECTDES_START, "%Y-%m-%dT%H:%M:%S")
+    end = datetime.datetime.strptime(tokiotest.SAMPLE_COLLECTDES_END, "%Y-%m-%dT%H:%M:%S")
+    kwargs = {
+        'init_start': start,
+        'init_end': end,
+        'query_start': start,
+        'query_end': end,
+        'timestep': tokiotest.SAMPLE_COLLECTDES_TIMESTEP,
+        'num_servers': tokiotest.SAMPLE_COLLECTDES_NUMNODES,
+        'devices_per_server': tokiotest.SAMPLE_COLLECTDES_SSDS_PER,
+    }
+
+    # retrieve every document
+    raw_file = os.path.join(tokiotest.TEMP_DIR, 'raw.hdf5')
+    pages = []
+    for query in (tokio.connectors.collectd_es.QUERY_CPU_DATA,
+                  tokio.connectors.collectd_es.QUERY_DISK_DATA,
+                  tokio.connectors.collectd_es.QUERY_MEMORY_DATA):
+        pages += list(esdb.iter_timeseries(query, start, end))
+    tokio.cli.archive_collectdes.pages_to_hdf5(pages=pages, output_file=raw_file, **kwargs)
+
+    # retrieve only buckets
+    agg_file = os.path.join(tokiotest.TEMP_DIR, 'aggregated.hdf5')
+    service.num_requests = 0
+    pages = esdb.iter_aggregations(start, end, tokiotest.SAMPLE_COLLECTDES_TIMESTEP,
+                                   window=datetime.timedelta(minutes=15))
+    tokio.cli.archive_collectdes.pages_to_hdf5(
+        pages=pages,
+        output_file=agg_file,
+        process_function=tokio.cli.archive_collectdes.process_buckets,
+        **kwargs)
+    assert service.num_requests == 0 # aggregation queries return no hits to scroll
+
+    num_compared = 0
+    with tokio.connectors.hdf5.Hdf5(raw_file, 'r') as raw_h5, \
+         tokio.connectors.hdf5.Hdf5(agg_file, 'r') as agg_h5:
+        for dataset_name in tokio.cli.archive_collectdes.DATASETS:
+            if '/_' in dataset_name:
+                continue
+            raw = raw_h5.to_timeseries(dataset_name=dataset_name)
+            aggregated = agg_h5.to_timeseries(dataset_name=dataset_name)
+            print("%s: %s vs %s" % (dataset_name, raw.dataset.sum(), aggregated.dataset.sum()))
+            assert raw.dataset.shape == aggregated.dataset.shape
+            # columns may be ordered differently
+            for raw_index, column in enumerate(raw.columns):
+                assert numpy.allclose(raw.dataset[:, raw_index],
+                                      aggregated.dataset[:, aggregated.column_map[column]])
+            num_compared += raw.dataset.sum() != 0.0
+    assert num_compared > 1
+
+def test_iter_prefetched():
+    """
+    cli.archive_collectdes.iter_prefetched()
+    """
+    retrieved = []
+    def pages(num_pages):
+        """Record which pages have been retrieved"""
+        for page in range(num_pages):
+            retrieved.append(page)
+            yield page
+
+    progress = {'fetched': 0}
+    assert list(tokio.cli.archive_collectdes.iter_prefetched(pages(20), 3, progress)) \
+        == list(range(20))
+    assert progress['fetched'] == 20
+
+    # retrieval should not run more than a few pages ahead of the consumer
+    del retrieved[:]
+    prefetched = tokio.cli.archive_collectdes.iter_prefetched(pages(20), 3)
+    assert next(prefetched) == 0
+    time.sleep(0.5)
+    print("retrieved %d pages" % len(retrieved))
+    assert len(retrieved) <= 5
+    prefetched.close()
+
+    # errors during retrieval should be raised by the consumer
+    def bad_pages():
+        """Fail after one page"""
+        yield 0
+        raise KeyError('bad page')
+    consumed = []
+    try:
+        for page in tokio.cli.archive_collectdes.iter_prefetched(bad_pages(), 3):
+            consumed.append(page)
+    except KeyError:
+        pass
+    else:
+        assert False # KeyError not raised
+    assert consumed == [0]
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_pipeline():
+    """
+    cli.archive_collectdes with parallel decoding and partial commits
+    """
+    summaries = []
+    for options in [], ['--prefetch', '0'], ['--threads', '2', '--commit-every', '2']:
+        output_file = os.path.join(tokiotest.TEMP_DIR, 'output%d.hdf5' % len(summaries))
+        argv = ['--input', tokiotest.SAMPLE_COLLECTDES_CPULOAD,
+                '--num-nodes', str(tokiotest.SAMPLE_COLLECTDES_NUMNODES),
+                '--ssds-per-node', str(tokiotest.SAMPLE_COLLECTDES_SSDS_PER),
+                '--timestep', str(tokiotest.SAMPLE_COLLECTDES_TIMESTEP),
+                '--output', output_file,
+                tokiotest.SAMPLE_COLLECTDES_START,
+                tokiotest.SAMPLE_COLLECTDES_END] + options
+        print("Running [%s]" % ' '.join(argv))
+        tokio.cli.archive_collectdes.main(argv)
+        with h5py.File(output_file, 'r') as h5_file:
+            summary = {}
+            for key in tokio.cli.archive_collectdes.DATASETS:
+                if key in h5_file:
+                    columns = h5_file[key].attrs.get(tokio.connectors.hdf5.COLUMN_NAME_KEY, [])
+                    summary[key] = (h5_file[key][...], list(columns))
+            summaries.append(summary)
+
+    assert summaries[0]
+    for summary in summaries[1:]:
+        assert sorted(summary.keys()) == sorted(summaries[0].keys())
+        for key, (dataset, columns) in summary.items():
+            assert numpy.array_equal(dataset, summaries[0][key][0])
+            assert columns == summaries[0][key][1]
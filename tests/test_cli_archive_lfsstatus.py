@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Test the archive_lfsstatus CLI tool
+"""
+
+import time
+import datetime
+import nose
+import tokiotest
+import tokio.connectors.hdf5
+import tokio.connectors.nersc_lfsstate
+import tokio.cli.archive_lfsstatus
+
+QUERY_START = datetime.datetime.fromtimestamp(tokiotest.SAMPLE_OSTFULLNESS_START).replace(hour=0, minute=0, second=0)
+QUERY_END = QUERY_START + datetime.timedelta(days=1)
+TIMESTEP = 60
+
+def generate_tts(output_file, extra_argv=None):
+    """Create a TokioTimeSeries output file
+    """
+    argv = (extra_argv or []) + [
+        '--timestep', str(TIMESTEP),
+        '--output', output_file,
+        tokiotest.SAMPLE_DARSHAN_SONEXION_ID,
+        QUERY_START.strftime(tokio.cli.archive_lfsstatus.DATE_FMT),
+        QUERY_END.strftime(tokio.cli.archive_lfsstatus.DATE_FMT),
+    ]
+    print("Running [%s]" % ' '.join(argv))
+    tokio.cli.archive_lfsstatus.main(argv)
+    print("Created %s" % output_file)
+
+def count_snapshots(input_file):
+    """Count the snapshots in an input file that fall within the query range
+    """
+    start = int(time.mktime(QUERY_START.timetuple()))
+    end = int(time.mktime(QUERY_END.timetuple()))
+    index = tokio.connectors.nersc_lfsstate.get_index(input_file)
+    return len([x for x in index.timestamps if start <= x < end])
+
+def verify_dataset(output_file, dataset_name, num_snapshots):
+    """Verify that a dataset contains one populated row per snapshot
+    """
+    with tokio.connectors.hdf5.Hdf5(output_file, 'r') as hdf5_file:
+        dataframe = hdf5_file.to_dataframe(dataset_name).dropna(how='all')
+        columns = hdf5_file.get_columns(dataset_name)
+    print("%s has %d populated rows and %d columns" % (dataset_name, len(dataframe), len(columns)))
+    assert len(dataframe) == num_snapshots
+    assert len(columns) > 1
+    for column in columns:
+        assert column.startswith(tokiotest.SAMPLE_DARSHAN_SONEXION_ID + '-OST')
+    return dataframe
+
+@nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
+def test_archive_lfsstatus_files():
+    """cli.archive_lfsstatus --fullness --map
+    """
+    tokiotest.TEMP_FILE.close()
+    generate_tts(tokiotest.TEMP_FILE.name,
+                 extra_argv=['--fullness', tokiotest.SAMPLE_OSTFULLNESS_FILE,
+                             '--map', tokiotest.SAMPLE_OSTMAP_FILE])
+
+    num_snapshots = count_snapshots(tokiotest.SAMPLE_OSTFULLNESS_FILE)
+    used = verify_dataset(tokiotest.TEMP_FILE.name, 'fullness/bytes', num_snapshots)
+    total = verify_dataset(tokiotest.TEMP_FILE.name, 'fullness/bytestotal', num_snapshots)
+    assert (used <= total).all().all()
+
+    failovers = verify_dataset(tokiotest.TEMP_FILE.name,
+                               'failover/datatargets',
+                               count_snapshots(tokiotest.SAMPLE_OSTMAP_FILE))
+    assert (failovers >= 1).all().all()
+
+@nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
+def test_archive_lfsstatus_inodes():
+    """cli.archive_lfsstatus --inodes
+    """
+    tokiotest.TEMP_FILE.close()
+    generate_tts(tokiotest.TEMP_FILE.name, extra_argv=['--inodes', tokiotest.SAMPLE_OSTFULLNESS_FILE])
+    num_snapshots = count_snapshots(tokiotest.SAMPLE_OSTFULLNESS_FILE)
+    verify_dataset(tokiotest.TEMP_FILE.name, 'fullness/inodes', num_snapshots)
+    verify_dataset(tokiotest.TEMP_FILE.name, 'fullness/inodestotal', num_snapshots)
+    with tokio.connectors.hdf5.Hdf5(tokiotest.TEMP_FILE.name, 'r') as hdf5_file:
+        assert 'fullness/bytes' not in hdf5_file
+
+@nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
+def test_archive_lfsstatus_config():
+    """cli.archive_lfsstatus with inputs from site config
+    """
+    tokiotest.TEMP_FILE.close()
+    generate_tts(tokiotest.TEMP_FILE.name)
+    verify_dataset(tokiotest.TEMP_FILE.name,
+                   'fullness/bytes',
+                   count_snapshots(tokiotest.SAMPLE_OSTFULLNESS_FILE))
+    verify_dataset(tokiotest.TEMP_FILE.name,
+                   'failover/datatargets',
+                   count_snapshots(tokiotest.SAMPLE_OSTMAP_FILE))
+
+@nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
+def test_archive_lfsstatus_update():
+    """cli.archive_lfsstatus into an existing file
+    """
+    tokiotest.TEMP_FILE.close()
+    generate_tts(tokiotest.TEMP_FILE.name, extra_argv=['--fullness', tokiotest.SAMPLE_OSTFULLNESS_FILE])
+    generate_tts(tokiotest.TEMP_FILE.name, extra_argv=['--map', tokiotest.SAMPLE_OSTMAP_FILE])
+    verify_dataset(tokiotest.TEMP_FILE.name,
+                   'fullness/bytes',
+                   count_snapshots(tokiotest.SAMPLE_OSTFULLNESS_FILE))
+    verify_dataset(tokiotest.TEMP_FILE.name,
+                   'failover/datatargets',
+                   count_snapshots(tokiotest.SAMPLE_OSTMAP_FILE))
@@ -111,6 +111,98 @@ def test_bin_archive_lmtdb_overlaps():
 #       yield func, summary0, summary1
         func(summary0, summary1)
 
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_bin_archive_lmtdb_incremental():
+    """cli.archive_lmtdb --incremental
+
+    1. archive the first half of a window to a new HDF5
+    2. incrementally archive the whole window into the same HDF5
+    3. ensure that the result is identical to archiving the whole window at once
+    4. ensure that incrementally archiving a complete file does nothing
+    """
+    full_file = os.path.join(tokiotest.TEMP_DIR, 'full.hdf5')
+    incremental_file = os.path.join(tokiotest.TEMP_DIR, 'incremental.hdf5')
+
+    start = datetime.datetime.fromtimestamp(tokiotest.SAMPLE_LMTDB_START)
+    end = datetime.datetime.fromtimestamp(tokiotest.SAMPLE_LMTDB_END)
+    midpoint = start + (end - start) // 2
+
+    generate_tts(full_file)
+    argv = ['--init-start', tokiotest.SAMPLE_LMTDB_START_STAMP,
+            '--init-end', tokiotest.SAMPLE_LMTDB_END_STAMP,
+            '--input', tokiotest.SAMPLE_LMTDB_FILE,
+            '--output', incremental_file,
+            tokiotest.SAMPLE_LMTDB_START_STAMP,
+            midpoint.strftime(tokiotest.SAMPLE_TIMESTAMP_DATE_FMT)]
+    tokio.cli.archive_lmtdb.main(argv)
+
+    argv = ['--incremental',
+            '--input', tokiotest.SAMPLE_LMTDB_FILE,
+            '--output', incremental_file,
+            tokiotest.SAMPLE_LMTDB_START_STAMP,
+            tokiotest.SAMPLE_LMTDB_END_STAMP]
+    output = tokiotest.run_bin(tokio.cli.archive_lmtdb, argv)
+    assert "Writing out" in output
+
+    full = h5py.File(full_file, 'r')
+    incremental = h5py.File(incremental_file, 'r')
+    num_compared = 0
+    for dataset_name in tokio.connectors.hdf5.SCHEMA[tokio.cli.archive_lmtdb.SCHEMA_VERSION].values():
+        if dataset_name in full:
+            assert (full[dataset_name][...] == incremental[dataset_name][...]).all()
+            assert (numpy.signbit(full[dataset_name][...])
+                    == numpy.signbit(incremental[dataset_name][...])).all()
+            num_compared += 1
+    assert num_compared > 0
+    full.close()
+    incremental.close()
+
+    output = tokiotest.run_bin(tokio.cli.archive_lmtdb, argv)
+    assert "Writing out" not in output
+    assert "already fully populated" in output
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_find_resume_time_stopped_column():
+    """cli.archive_lmtdb.DatasetDict.find_resume_time() with a stopped column
+
+    A column that stops reporting partway through the window (e.g., a failed
+    OST) must not pin the resume time to the moment it stopped.
+    """
+    output_file = os.path.join(tokiotest.TEMP_DIR, 'stopped.hdf5')
+    generate_tts(output_file)
+
+    start = datetime.datetime.fromtimestamp(tokiotest.SAMPLE_LMTDB_START)
+    end = datetime.datetime.fromtimestamp(tokiotest.SAMPLE_LMTDB_END)
+    datasets = tokio.cli.archive_lmtdb.DatasetDict(start, end, tokiotest.SAMPLE_LMTDB_TIMESTEP)
+    dataset_names = [datasets.schema[x] for x in datasets.config if datasets.schema.get(x)]
+
+    # column 0 of every multi-column dataset stops reporting halfway through
+    with h5py.File(output_file, 'r+') as hdf5_file:
+        num_rows = None
+        for dataset_name in dataset_names:
+            if dataset_name in hdf5_file and hdf5_file[dataset_name].shape[1] > 1:
+                num_rows = hdf5_file[dataset_name].shape[0]
+                hdf5_file[dataset_name][num_rows // 2:, 0] = -0.0
+
+    trailing_secs = 10 * tokiotest.SAMPLE_LMTDB_TIMESTEP
+    with tokio.connectors.hdf5.Hdf5(output_file, 'r') as hdf5_file:
+        resume_time = datasets.find_resume_time(hdf5_file, trailing_secs=trailing_secs)
+    print("resume time with stopped column is %s" % resume_time)
+    assert resume_time == end
+
+    # all columns stop reporting three quarters of the way through the window
+    with h5py.File(output_file, 'r+') as hdf5_file:
+        for dataset_name in dataset_names:
+            if dataset_name in hdf5_file:
+                hdf5_file[dataset_name][3 * num_rows // 4:, :] = -0.0
+        timestamps = hdf5_file[dataset_names[0]].parent['timestamps'][...]
+
+    with tokio.connectors.hdf5.Hdf5(output_file, 'r') as hdf5_file:
+        resume_time = datasets.find_resume_time(hdf5_file, trailing_secs=trailing_secs)
+    print("resume time with truncated tail is %s" % resume_time)
+    assert resume_time == datetime.datetime.fromtimestamp(timestamps[3 * num_rows // 4])
+    assert start < resume_time < end
+
 def test_bin_archive_lmtdb_nonmonotonic():
     """cli.archive_lmtdb: counter reset to zero mid-day
 
@@ -10,6 +10,7 @@ import datetime
 import h5py
 import tokio
 import tokio.connectors.hdf5
+import tokio.connectors.mmperfmon
 import tokio.cli.archive_mmperfmon
 import tokiotest
 
@@ -18,10 +19,11 @@ def generate_tts(output_file,
                  init_start=tokiotest.SAMPLE_MMPERFMON_MULTI_START,
                  init_end=tokiotest.SAMPLE_MMPERFMON_MULTI_END,
                  query_start=tokiotest.SAMPLE_MMPERFMON_MINI_START,
-                 query_end=tokiotest.SAMPLE_MMPERFMON_MINI_END):
+                 query_end=tokiotest.SAMPLE_MMPERFMON_MINI_END,
+                 extra_argv=None):
     """Create a TokioTimeSeries output file
     """
-    argv = [
+    argv = (extra_argv or []) + [
         '--init-start', init_start,
         '--init-end', init_end,
         '--timestep', str(tokiotest.SAMPLE_MMPERFMON_TIMESTEP),
@@ -119,6 +121,48 @@ def test_bin_archive_mmperfmon_overlaps():
 
     tokiotest.identical_datasets(summary0, summary1)
 
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_bin_archive_mmperfmon_processes():
+    """cli.archive_mmperfmon --processes
+    """
+    summaries = []
+    for extra_argv in ([], ['--processes', '2', '--window', '3']):
+        output_file = os.path.join(tokiotest.TEMP_DIR, 'output%d.hdf5' % len(summaries))
+        generate_tts(output_file, extra_argv=extra_argv)
+        h5_file = h5py.File(output_file, 'r')
+        summaries.append(tokiotest.summarize_hdf5(h5_file))
+        h5_file.close()
+
+    # the two files are written independently, so only compare their contents
+    for metric in 'sums', 'shapes':
+        assert summaries[0][metric] == summaries[1][metric]
+
+def test_archiver_streaming():
+    """cli.archive_mmperfmon.Archiver: streamed tables match loaded object
+    """
+    input_file = tokiotest.SAMPLE_MMPERFMON_TGZ_INPUT
+    archivers = []
+    for _ in range(2):
+        archivers.append(tokio.cli.archive_mmperfmon.Archiver(
+            init_start=None,
+            init_end=None,
+            timestep=tokiotest.SAMPLE_MMPERFMON_TIMESTEP,
+            num_luns=None,
+            num_servers=None))
+
+    archivers[0].archive(tokio.connectors.mmperfmon.Mmperfmon(input_file))
+    archivers[1].archive_tables(tokio.connectors.mmperfmon.iter_tables(input_file))
+
+    for archiver in archivers:
+        archiver.finalize()
+
+    assert sorted(archivers[0].keys()) == sorted(archivers[1].keys())
+    for dataset_name, timeseries in archivers[0].items():
+        print("Comparing %s" % dataset_name)
+        assert list(timeseries.columns) == list(archivers[1][dataset_name].columns)
+        assert (timeseries.timestamps == archivers[1][dataset_name].timestamps).all()
+        assert (timeseries.dataset == archivers[1][dataset_name].dataset).all()
+
 @nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
 def test_bin_archive_mmperfmon_edges():
     """cli.archive_mmperfmon: test boundary correctness
@@ -3,10 +3,14 @@
 Test the cli.summarize_darshanlogs and cli.darshan_scoreboard tools
 """
 
+import os
 import json
+import shutil
+import sqlite3
 import nose
 import tokiotest
 import tokio.cli.darshan_scoreboard
+import tokio.cli.index_darshanlogs
 
 INDEXDB = tokiotest.SAMPLE_DARSHAN_INDEX_DB
 INDEXDB_USER = tokiotest.SAMPLE_DARSHAN_INDEX_DB_USER
@@ -211,3 +215,91 @@ def test_scoreboard_combo():
 
         for category in ['per_user', 'per_exe', 'per_fs', 'per_user_exe_fs']:
             assert len(subresult[category]) == 1
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_scoreboard_shards():
+    """cli.darshan_scoreboard with multiple sharded databases
+    """
+    argv = ['--json', INDEXDB]
+    print("Executing: %s" % " ".join(argv))
+    reference_result = json.loads(tokiotest.run_bin(tokio.cli.darshan_scoreboard, argv))
+
+    # split the sample database into two disjoint shards
+    shard_files = []
+    for shard in range(2):
+        shard_file = os.path.join(tokiotest.TEMP_DIR, 'shard%d.db' % shard)
+        shutil.copyfile(INDEXDB, shard_file)
+        conn = sqlite3.connect(shard_file)
+        conn.execute("DELETE FROM summaries WHERE log_id %% 2 = %d" % shard)
+        conn.execute("DELETE FROM headers WHERE log_id %% 2 = %d" % shard)
+        conn.commit()
+        conn.close()
+        shard_files.append(shard_file)
+
+    for threads in 1, 2:
+        argv = ['--json', '--threads', str(threads)] + shard_files
+        print("Executing: %s" % " ".join(argv))
+        decoded_result = json.loads(tokiotest.run_bin(tokio.cli.darshan_scoreboard, argv))
+        print("Result: %s" % decoded_result)
+
+        for category, rankings in reference_result.items():
+            assert len(rankings) == len(decoded_result[category])
+            truth = {tuple(x[3:]): x[0:3] for x in rankings}
+            for ranking in decoded_result[category]:
+                assert truth[tuple(ranking[3:])] == ranking[0:3]
+
+def compare_results(result1, result2):
+    """Ensure two scoreboard results are equivalent irrespective of ordering
+    """
+    assert list(result1.keys()) == list(result2.keys())
+    for category in result1:
+        print("Comparing %s" % category)
+        assert sorted(result1[category], key=str) == sorted(result2[category], key=str)
+
+@nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
+def test_scoreboard_rollups():
+    """cli.darshan_scoreboard with rollups
+    """
+    tokiotest.TEMP_FILE.close()
+    shutil.copyfile(INDEXDB, tokiotest.TEMP_FILE.name)
+    conn = sqlite3.connect(tokiotest.TEMP_FILE.name)
+    tokio.cli.index_darshanlogs.create_rollups_table(conn)
+    tokio.cli.index_darshanlogs.create_indices(conn)
+    tokio.cli.index_darshanlogs.update_rollups_table(conn)
+
+    cursor = conn.cursor()
+    assert tokio.cli.darshan_scoreboard.get_rollup_status(cursor) == (True, True)
+
+    filters = [
+        {},
+        {'limit_user': [INDEXDB_USER]},
+        {'exclude_user': [INDEXDB_USER]},
+        {'limit_exe': INDEXDB_EXES},
+        {'exclude_exe': INDEXDB_EXES[0:1]},
+        {'limit_fs': INDEXDB_ALL_MOUNTS[0:1]},
+        {'exclude_fs': INDEXDB_ALL_MOUNTS[0:1]},
+        {'limit_fs': INDEXDB_ALL_MOUNTS, 'limit_user': ['%a%'], 'max_results': 3},
+    ]
+    for kwargs in filters:
+        print("Testing filters %s" % kwargs)
+        truth = tokio.cli.darshan_scoreboard.query_index_db([tokiotest.TEMP_FILE.name],
+                                                            use_rollups=False,
+                                                            **kwargs)
+        result = tokio.cli.darshan_scoreboard.query_index_db([tokiotest.TEMP_FILE.name],
+                                                             **kwargs)
+        if 'max_results' in kwargs:
+            for category in truth:
+                assert len(truth[category]) == len(result[category])
+        else:
+            compare_results(truth, result)
+
+    # stale rollups must not be used
+    cursor.execute("DELETE FROM summaries WHERE log_id % 2 = 0")
+    cursor.execute("DELETE FROM headers WHERE log_id % 2 = 0")
+    conn.commit()
+    assert tokio.cli.darshan_scoreboard.get_rollup_status(cursor) == (False, False)
+    compare_results(
+        tokio.cli.darshan_scoreboard.query_index_db([tokiotest.TEMP_FILE.name], use_rollups=False),
+        tokio.cli.darshan_scoreboard.query_index_db([tokiotest.TEMP_FILE.name]))
+
+    conn.close()
@@ -11,7 +11,9 @@ import warnings
 import nose
 import tokiotest
 import tokio#.connectors.darshan - TODO: fix the import problems
+import tokio.connectors.darshan
 import tokio.cli.index_darshanlogs
+import tokio.cli.merge_darshanindex
 
 SAMPLE_DARSHAN_LOGS = glob.glob(os.path.join(os.getcwd(), 'inputs', '*.darshan'))
 TABLES = [
@@ -31,7 +33,7 @@ def verify_index_db(output_file):
     tables = [row[0] for row in rows]
 
     print("%s contains %d tables" % (output_file, len(tables)))
-    assert len(tables) == 3
+    assert len(tables) >= len(TABLES)
     for table in TABLES:
         print("Verifying existence of table %s" % table)
         assert table in tables
@@ -501,3 +503,237 @@ def test_update():
     for table in TABLES:
         num_rows = get_table_len(table=table, conn=conn, cursor=cursor)
         assert num_rows == orig_num_rows[table]
+
+def test_process_log_list_shards():
+    """cli.index_darshanlogs.process_log_list with shards
+    """
+    conn = sqlite3.connect(':memory:')
+    num_shards = 3
+    sharded_logs = []
+    for shard in range(num_shards):
+        new_log_list = tokio.cli.index_darshanlogs.process_log_list(
+            conn, SAMPLE_DARSHAN_LOGS, shard=shard, num_shards=num_shards)
+        print("Shard %d/%d has %d logs" % (shard, num_shards, len(new_log_list)))
+        for log in new_log_list:
+            assert log not in sharded_logs
+        sharded_logs += new_log_list
+    conn.close()
+
+    # every log must land in exactly one shard
+    assert sorted(sharded_logs) == sorted(SAMPLE_DARSHAN_LOGS)
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_merge_index_dbs():
+    """cli.index_darshanlogs.merge_index_dbs
+    """
+    truth_rows = verify_index_db(tokiotest.SAMPLE_DARSHAN_INDEX_DB)
+
+    # split the sample database into overlapping shards
+    shard_files = []
+    for shard, mod_queries in enumerate([
+            ["DELETE FROM summaries WHERE log_id % 2 = 0",
+             "DELETE FROM headers WHERE log_id % 2 = 0"],
+            ["DELETE FROM summaries WHERE log_id % 2 = 1",
+             "DELETE FROM headers WHERE log_id % 2 = 1"],
+            ["DELETE FROM summaries WHERE log_id % 3 = 0",
+             "DELETE FROM headers WHERE log_id % 3 = 0"]]):
+        shard_file = os.path.join(tokiotest.TEMP_DIR, 'shard%d.db' % shard)
+        make_index_db(dest_db=shard_file, mod_queries=mod_queries).close()
+        shard_files.append(shard_file)
+
+    output_file = os.path.join(tokiotest.TEMP_DIR, 'merged.db')
+    argv = ['--output', output_file] + shard_files
+    print("Executing: %s" % " ".join(argv))
+    tokiotest.run_bin(tokio.cli.merge_darshanindex, argv)
+    test_rows = verify_index_db(output_file)
+
+    assert len(truth_rows) == len(test_rows)
+    for rowid, row in enumerate(truth_rows):
+        for rowname in row.keys():
+            if not rowname.endswith('_id'):
+                assert row[rowname] == test_rows[rowid][rowname]
+
+    # merging again must not introduce duplicates
+    tokiotest.run_bin(tokio.cli.merge_darshanindex, argv)
+    assert len(verify_index_db(output_file)) == len(truth_rows)
+
+    # merged database must have up-to-date rollups
+    conn = sqlite3.connect(output_file)
+    assert get_rollups(conn) == get_rollups(conn, rebuild=True)
+    conn.close()
+
+def get_rollups(conn, rebuild=False):
+    """Retrieve the contents of the rollups table, optionally rebuilding it
+    """
+    cursor = conn.cursor()
+    if rebuild:
+        cursor.execute("DELETE FROM %s" % tokio.cli.index_darshanlogs.ROLLUPS_META_TABLE)
+        conn.commit()
+        tokio.cli.index_darshanlogs.update_rollups_table(conn)
+    cursor.execute("""SELECT r.username, r.exename, m.mountpt, r.day,
+                             r.bytes_read, r.bytes_written, r.jobcount, r.primary_jobcount
+                      FROM %s AS r
+                      INNER JOIN %s AS m ON m.fs_id = r.fs_id""" % (
+                          tokio.cli.index_darshanlogs.ROLLUPS_TABLE,
+                          tokio.cli.index_darshanlogs.MOUNTS_TABLE))
+    rows = sorted(cursor.fetchall(), key=str)
+    cursor.close()
+    return rows
+
+@nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
+def test_update_rollups_table():
+    """cli.index_darshanlogs.update_rollups_table
+    """
+    tokiotest.TEMP_FILE.close()
+
+    conn = make_index_db(dest_db=tokiotest.TEMP_FILE.name)
+    tokio.cli.index_darshanlogs.create_rollups_table(conn)
+    tokio.cli.index_darshanlogs.create_indices(conn)
+    tokio.cli.index_darshanlogs.update_rollups_table(conn)
+    truth = get_rollups(conn)
+    print("Full rollups table has %d rows" % len(truth))
+    assert truth
+
+    # every log must be counted exactly once in primary_jobcount
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM %s" % tokio.cli.index_darshanlogs.HEADERS_TABLE)
+    assert sum([x[-1] for x in truth]) == cursor.fetchall()[0][0]
+
+    print("Test rebuild after logs are removed")
+    cursor.execute("DELETE FROM summaries WHERE log_id > 10")
+    cursor.execute("DELETE FROM headers WHERE log_id > 10")
+    conn.commit()
+    tokio.cli.index_darshanlogs.update_rollups_table(conn)
+    half = get_rollups(conn)
+    assert half
+    assert len(half) < len(truth)
+    assert half == get_rollups(conn, rebuild=True)
+
+    print("Test incremental update after logs are added")
+    cursor.execute("ATTACH DATABASE ? AS src", (tokiotest.SAMPLE_DARSHAN_INDEX_DB,))
+    cursor.execute("INSERT INTO headers SELECT * FROM src.headers WHERE log_id > 10")
+    cursor.execute("INSERT INTO summaries SELECT * FROM src.summaries WHERE log_id > 10")
+    conn.commit()
+    cursor.execute("DETACH DATABASE src")
+    tokio.cli.index_darshanlogs.update_rollups_table(conn)
+    assert get_rollups(conn) == truth
+
+    conn.close()
+
+@nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
+def test_headers_only():
+    """cli.index_darshanlogs --headers-only
+    """
+    tokiotest.TEMP_FILE.close()
+    argv = ['--quiet', '--headers-only', '--output', tokiotest.TEMP_FILE.name] + SAMPLE_DARSHAN_LOGS
+    print("Executing: %s" % " ".join(argv))
+    tokiotest.run_bin(tokio.cli.index_darshanlogs, argv)
+
+    conn = sqlite3.connect(tokiotest.TEMP_FILE.name)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM %s" % tokio.cli.index_darshanlogs.HEADERS_TABLE)
+    headers = {row['filename']: row for row in cursor.fetchall()}
+    assert len(headers) == len(SAMPLE_DARSHAN_LOGS)
+    assert get_table_len(tokio.cli.index_darshanlogs.SUMMARIES_TABLE, conn=conn) == 0
+
+    sample_header = headers[os.path.basename(tokiotest.SAMPLE_DARSHAN_LOG)]
+    assert sample_header['jobid'] == tokiotest.SAMPLE_DARSHAN_JOBID
+    assert sample_header['exename']
+    for row in headers.values():
+        for counter in tokio.cli.index_darshanlogs.HEADER_COUNTERS:
+            assert row[counter] is not None
+
+    # headers-only logs must not be re-read by another headers-only run
+    assert not tokio.cli.index_darshanlogs.process_log_list(conn, SAMPLE_DARSHAN_LOGS, headers_only=True)
+    # but they must still be fully indexed by a normal run
+    assert len(tokio.cli.index_darshanlogs.process_log_list(conn, SAMPLE_DARSHAN_LOGS)) == len(SAMPLE_DARSHAN_LOGS)
+    conn.close()
+
+@nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
+def test_exclude():
+    """cli.index_darshanlogs --exclude-user and --exclude-jobid
+    """
+    tokiotest.TEMP_FILE.close()
+    header = tokio.connectors.darshan.read_header(tokiotest.SAMPLE_DARSHAN_LOG)['header']
+    argv = ['--quiet', '--headers-only',
+            '--exclude-user', str(header['uid']),
+            '--exclude-jobid', 'nonexistent',
+            '--output', tokiotest.TEMP_FILE.name] + SAMPLE_DARSHAN_LOGS
+    print("Executing: %s" % " ".join(argv))
+    tokiotest.run_bin(tokio.cli.index_darshanlogs, argv)
+
+    conn = sqlite3.connect(tokiotest.TEMP_FILE.name)
+    cursor = conn.cursor()
+    cursor.execute("SELECT uid, jobid FROM %s" % tokio.cli.index_darshanlogs.HEADERS_TABLE)
+    rows = cursor.fetchall()
+    print("Found %d unexcluded logs" % len(rows))
+    assert 0 < len(rows) < len(SAMPLE_DARSHAN_LOGS)
+    for uid, _ in rows:
+        assert uid != header['uid']
+
+    # now exclude a job id instead
+    cursor.execute("DELETE FROM %s" % tokio.cli.index_darshanlogs.HEADERS_TABLE)
+    conn.commit()
+    argv = ['--quiet', '--headers-only',
+            '--exclude-jobid', header['jobid'],
+            '--output', tokiotest.TEMP_FILE.name] + SAMPLE_DARSHAN_LOGS
+    print("Executing: %s" % " ".join(argv))
+    tokiotest.run_bin(tokio.cli.index_darshanlogs, argv)
+    cursor.execute("SELECT uid, jobid FROM %s" % tokio.cli.index_darshanlogs.HEADERS_TABLE)
+    rows = cursor.fetchall()
+    assert 0 < len(rows) < len(SAMPLE_DARSHAN_LOGS)
+    for _, jobid in rows:
+        assert jobid != header['jobid']
+    conn.close()
+
+def test_reduce_base_output():
+    """cli.index_darshanlogs.reduce_base_output
+    """
+    lines = [
+        "# darshan log version: 3.10",
+        "# exe: /bin/app.x --flag",
+        "# uid: 12345",
+        "# jobid: 8675309",
+        "# start_time: 1490000867",
+        "# end_time: 1490000983",
+        "# nprocs: 32",
+        "# run time: 117",
+        "# mount entry:\t/\trootfs",
+        "# mount entry:\t/scratch\tlustre",
+        "# mount entry:\t/scratch2\tlustre",
+        "# *******************************************************",
+        "POSIX\t0\t1\tPOSIX_BYTES_READ\t100\t/scratch/a\t/scratch\tlustre",
+        "POSIX\t1\t1\tPOSIX_BYTES_READ\t50\t/scratch/a\t/scratch\tlustre",
+        "POSIX\t0\t2\tPOSIX_BYTES_WRITTEN\t7\t/scratch2/tab\tname\t/scratch2\tlustre",
+        "POSIX\t0\t1\tPOSIX_F_OPEN_START_TIMESTAMP\t2.500000\t/scratch/a\t/scratch\tlustre",
+        "POSIX\t1\t1\tPOSIX_F_OPEN_START_TIMESTAMP\t1.500000\t/scratch/a\t/scratch\tlustre",
+        "POSIX\t0\t1\tPOSIX_MODE\t436\t/scratch/a\t/scratch\tlustre",
+        "MPI-IO\t0\t1\tMPIIO_BYTES_READ\t100\t/scratch/a\t/scratch\tlustre",
+        "STDIO\t0\t3\tSTDIO_BYTES_WRITTEN\t10\t<STDOUT>\tUNKNOWN\tUNKNOWN",
+        "STDIO\t0\t4\tSTDIO_BYTES_WRITTEN\t5\t/etc/motd\t/\trootfs",
+    ]
+    expected = {
+        '/scratch': {'bytes_read': 150, 'f_open_start_timestamp': 1.5},
+        '/scratch2': {'bytes_written': 7},
+        'UNKNOWN': {'bytes_written': 10},
+        '/': {'bytes_written': 5},
+    }
+    output = ("\n".join(lines) + "\n").encode('utf-8')
+
+    # small chunk sizes force lines to be split across reads
+    for chunk_size in (7, 64, 1024 * 1024):
+        print("Testing chunk size %d" % chunk_size)
+        header, reduced, logical = tokio.cli.index_darshanlogs.reduce_base_output(
+            tokiotest.io.BytesIO(output), chunk_size=chunk_size)
+        print(reduced)
+        assert reduced == expected
+        assert set(logical.keys()) == set(expected.keys())
+        assert header['jobid'] == '8675309'
+        assert header['exe'] == ['/bin/app.x', '--flag']
+        assert header['walltime'] == 117
+
+    # missing trailing newline
+    header, reduced, logical = tokio.cli.index_darshanlogs.reduce_base_output(
+        tokiotest.io.BytesIO(output.rstrip()))
+    assert reduced == expected
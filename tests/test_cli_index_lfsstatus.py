@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+"""
+Test the index_lfsstatus CLI tool
+"""
+
+import os
+import shutil
+import nose
+import tokiotest
+import tokio.connectors.nersc_lfsstate as nersc_lfsstate
+import tokio.cli.index_lfsstatus
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_index_lfsstatus():
+    """cli.index_lfsstatus
+    """
+    input_files = []
+    for sample_file in tokiotest.SAMPLE_OSTFULLNESS_FILE, tokiotest.SAMPLE_OSTMAP_FILE:
+        input_file = os.path.join(tokiotest.TEMP_DIR, os.path.basename(sample_file))
+        shutil.copyfile(sample_file, input_file)
+        input_files.append(input_file)
+
+    tokio.cli.index_lfsstatus.main(['-v'] + input_files)
+
+    for input_file in input_files:
+        assert os.path.isfile(input_file + nersc_lfsstate.INDEX_SUFFIX)
+        index = nersc_lfsstate.LfsStateIndex(input_file)
+        assert index.load()
+        rebuilt = nersc_lfsstate.LfsStateIndex(input_file)
+        rebuilt.build()
+        print("%s has %d snapshots" % (input_file, len(index)))
+        assert len(index) > 0
+        assert index.timestamps == rebuilt.timestamps
+        assert index.offsets == rebuilt.offsets
+
+    # re-running finds the existing indices
+    tokio.cli.index_lfsstatus.main(['-v'] + input_files)
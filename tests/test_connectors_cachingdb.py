@@ -6,6 +6,12 @@ database is not available, so only the sqlite3 functionality will be exercised.
 """
 
 import os
+import json
+import time
+import pickle
+import shutil
+import sqlite3
+import numpy
 import nose
 import tokiotest
 import tokio.connectors.cachingdb
@@ -187,3 +193,305 @@ def test_cache_db():
         func = test_function
         func.description = description
         yield func, test_db
+
+class FlakyConnection(object):
+    """Wraps an SQLite connection and fails its first queries
+    """
+    def __init__(self, connection, failures):
+        self.connection = connection
+        self.failures = failures
+
+    def cursor(self):
+        """Return a cursor that fails while failures remain"""
+        cursor = self.connection.cursor()
+        if self.failures[0] > 0:
+            self.failures[0] -= 1
+            def execute(*args, **kwargs):
+                raise sqlite3.OperationalError("database is locked")
+            return type('FlakyCursor', (object,), {'execute': staticmethod(execute),
+                                                   'close': cursor.close})()
+        return cursor
+
+    def close(self):
+        """Close the wrapped connection"""
+        self.connection.close()
+
+def test_query_many():
+    """
+    cachingdb.CachingDb.query_many()
+    """
+    query_str = 'SELECT * FROM OST_DATA WHERE TS_ID >= %(ps)s AND TS_ID < %(ps)s ORDER BY OST_ID, TS_ID'
+    (min_ts_id, max_ts_id), = tokio.connectors.cachingdb.CachingDb(
+        cache_file=tokiotest.SAMPLE_LMTDB_FILE).query('SELECT MIN(TS_ID), MAX(TS_ID) FROM OST_DATA')
+    query_variables_list = [(x, x + 7) for x in range(min_ts_id, max_ts_id + 1, 7)]
+
+    expected = None
+    for max_connections in (1, 2, 4):
+        test_db = tokio.connectors.cachingdb.CachingDb(cache_file=tokiotest.SAMPLE_LMTDB_FILE,
+                                                       max_connections=max_connections)
+        results = test_db.query_many(query_str, query_variables_list, table='OST_DATA')
+        assert len(results) == len(query_variables_list)
+        if expected is None:
+            expected = results
+            assert sum(len(x) for x in results) > 0
+        # results are always in the order of the query variables
+        assert results == expected
+        assert test_db.saved_results['OST_DATA']['rows'] == [x for y in expected for x in y]
+        assert test_db.last_hit == tokio.connectors.cachingdb.HIT_CACHE_DB
+
+def test_query_many_retry():
+    """
+    cachingdb.CachingDb.query_many() retries transient errors
+    """
+    query_str = 'SELECT * FROM OST_INFO WHERE OST_ID = %(ps)s'
+
+    def make_db(failures):
+        """Create a CachingDb whose connections fail a number of times"""
+        failures = [failures]
+        test_db = tokio.connectors.cachingdb.CachingDb(cache_file=tokiotest.SAMPLE_LMTDB_FILE,
+                                                       max_connections=2,
+                                                       max_retries=2,
+                                                       retry_delay=0.0)
+        test_db._pool = tokio.connectors.cachingdb.ConnectionPool(
+            lambda: FlakyConnection(sqlite3.connect(tokiotest.SAMPLE_LMTDB_FILE,
+                                                    check_same_thread=False),
+                                    failures),
+            max_connections=2)
+        return test_db
+
+    expected = make_db(0).query_many(query_str, [(1,), (2,)])
+    assert expected[0] and expected[1]
+    assert make_db(2).query_many(query_str, [(1,), (2,)]) == expected
+
+    # give up after max_retries
+    nose.tools.assert_raises(sqlite3.OperationalError,
+                             make_db(6).query_many, query_str, [(1,), (2,)])
+
+    # do not retry errors that are not transient
+    nose.tools.assert_raises(sqlite3.OperationalError,
+                             make_db(0).query_many, 'SELECT * FROM NO_SUCH_TABLE', [()])
+
+def test_iter_query():
+    """
+    cachingdb.CachingDb.iter_query() and iter_query_many()
+    """
+    query_str = 'SELECT * FROM OST_DATA WHERE TS_ID >= %(ps)s AND TS_ID < %(ps)s ORDER BY OST_ID, TS_ID'
+    dtype = numpy.dtype([(x, numpy.float64) for x in TEST_TABLES['OST_DATA']['columns']])
+    test_db = tokio.connectors.cachingdb.CachingDb(cache_file=tokiotest.SAMPLE_LMTDB_FILE)
+    (min_ts_id, max_ts_id), = test_db.query('SELECT MIN(TS_ID), MAX(TS_ID) FROM OST_DATA')
+    query_variables_list = [(x, x + 7) for x in range(min_ts_id, max_ts_id + 1, 7)]
+    expected = [x for y in test_db.query_many(query_str, query_variables_list) for x in y]
+
+    arrays = list(test_db.iter_query(query_str, (min_ts_id, max_ts_id + 1), dtype=dtype,
+                                     batch_size=100))
+    assert max(len(x) for x in arrays) == 100
+    assert numpy.concatenate(arrays).tolist() == test_db.query(query_str, (min_ts_id, max_ts_id + 1))
+    assert not test_db.saved_results
+
+    for max_connections in (1, 3):
+        test_db = tokio.connectors.cachingdb.CachingDb(cache_file=tokiotest.SAMPLE_LMTDB_FILE,
+                                                       max_connections=max_connections)
+        arrays = list(test_db.iter_query_many(query_str, query_variables_list, dtype=dtype,
+                                              batch_size=50))
+        assert numpy.concatenate(arrays).tolist() == expected
+
+        # abandoning the results should not leave queries running
+        arrays = test_db.iter_query_many(query_str, query_variables_list, dtype=dtype,
+                                         batch_size=50)
+        next(arrays)
+        arrays.close()
+
+@nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
+def test_write_cache():
+    """
+    cachingdb.CachingDb.open_write_cache() write-through mode
+    """
+    test_db = tokio.connectors.cachingdb.CachingDb(cache_file=tokiotest.SAMPLE_LMTDB_FILE)
+    expected = {}
+    for test_table in TEST_TABLES:
+        expected[test_table] = sorted(test_db.query('SELECT * FROM %s' % test_table))
+
+    test_table_schema = dict(TEST_TABLES['OST_DATA'])
+    test_table_schema['indexes'] = [['TS_ID']]
+
+    test_db.open_write_cache(tokiotest.TEMP_FILE.name, batch_size=100)
+    for test_table, table_schema in TEST_TABLES.items():
+        if test_table == 'OST_DATA':
+            table_schema = test_table_schema
+        # query() still returns all rows
+        result = test_db.query('SELECT * FROM %s' % test_table, table=test_table,
+                               table_schema=table_schema)
+        assert sorted(result) == expected[test_table]
+        # duplicate rows are replaced, and cache_query() does not retain rows
+        assert test_db.cache_query('SELECT * FROM %s' % test_table,
+                                   table=test_table) == len(expected[test_table])
+    # query_many() results are written through too
+    test_db.query_many('SELECT * FROM OST_DATA WHERE TS_ID = %(ps)s',
+                       [(x[1],) for x in expected['OST_DATA'][:10]], table='OST_DATA')
+    assert not test_db.saved_results
+    test_db.close_write_cache()
+    assert test_db.write_cache_db is None
+
+    cache_db = sqlite3.connect(tokiotest.TEMP_FILE.name)
+    for test_table in TEST_TABLES:
+        result = cache_db.execute('SELECT * FROM %s' % test_table).fetchall()
+        print("Found table %s with %d records" % (test_table, len(result)))
+        assert sorted(result) == expected[test_table]
+    indexes = [x[0] for x in cache_db.execute("SELECT name FROM sqlite_master WHERE type='index'")]
+    print("Found indexes %s" % indexes)
+    assert 'OST_DATA_TS_ID_INDEX' in indexes
+
+def test_query_cache_lru():
+    """
+    cachingdb.QueryCache evicts least recently used results and expired results
+    """
+    rows = [(x, 'row%d' % x) for x in range(100)]
+    query_cache = tokio.connectors.cachingdb.QueryCache(max_bytes=1)
+    query_cache.put('a', rows, 3600)
+    assert query_cache.get('a') == (None, None) # larger than the budget
+
+    # budget for two copies of rows
+    query_cache.max_bytes = 1024**2
+    query_cache.put('a', rows, 3600)
+    query_cache.max_bytes = 2.5 * query_cache.nbytes
+    query_cache.put('b', rows, 3600)
+    assert query_cache.get('a') == (rows, tokio.connectors.cachingdb.HIT_MEMORY)
+    query_cache.put('c', rows, 3600) # evicts b, which was used less recently than a
+    assert 'a' in query_cache and 'c' in query_cache and 'b' not in query_cache
+    assert query_cache.nbytes <= query_cache.max_bytes
+
+    query_cache.put('d', rows, -1)
+    assert query_cache.get('d') == (None, None)
+    assert 'd' not in query_cache
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_query_cache():
+    """
+    cachingdb.CachingDb.query() reuses results from memory and disk
+    """
+    class TestDb(tokio.connectors.cachingdb.CachingDb):
+        """CachingDb that caches lookup tables"""
+        query_cache_ttls = {'OST_INFO': 3600, 'OSS_INFO': 3600}
+
+    query_str = 'SELECT * FROM OST_INFO JOIN OSS_INFO ON OST_INFO.OSS_ID = OSS_INFO.OSS_ID WHERE OST_ID < %(ps)s'
+    test_db = TestDb(cache_file=tokiotest.SAMPLE_LMTDB_FILE, query_cache_dir=tokiotest.TEMP_DIR)
+    assert test_db.get_query_ttl(query_str) == 3600
+    assert test_db.get_query_ttl('SELECT * FROM OST_INFO, OST_DATA') == 3600 # only FROM and JOIN
+    assert test_db.get_query_ttl('SELECT * FROM OST_INFO JOIN OST_DATA') == 0
+    assert test_db.get_query_ttl('SELECT 1') == 0
+
+    expected = test_db.query(query_str, (5,), table='OST_INFO')
+    assert expected
+    assert test_db.last_hit == tokio.connectors.cachingdb.HIT_CACHE_DB
+    # whitespace does not matter
+    assert test_db.query(query_str.replace(' ', '\n  '), (5,), table='OST_INFO') == expected
+    assert test_db.last_hit == tokio.connectors.cachingdb.HIT_MEMORY
+    assert len(test_db.saved_results['OST_INFO']['rows']) == len(expected)
+    # parameters do matter
+    assert test_db.query(query_str, (6,)) != expected
+    assert test_db.last_hit == tokio.connectors.cachingdb.HIT_CACHE_DB
+    assert test_db.query(query_str, (5,), nocache=True) == expected
+    assert test_db.last_hit == tokio.connectors.cachingdb.HIT_CACHE_DB
+
+    # uncached tables are always queried
+    test_db.query('SELECT * FROM OST_DATA LIMIT 1')
+    test_db.query('SELECT * FROM OST_DATA LIMIT 1')
+    assert test_db.last_hit == tokio.connectors.cachingdb.HIT_CACHE_DB
+    assert len(test_db.query_cache) == 2
+
+    # results on disk are reused by a new instance
+    test_db = TestDb(cache_file=tokiotest.SAMPLE_LMTDB_FILE, query_cache_dir=tokiotest.TEMP_DIR)
+    assert test_db.query(query_str, (5,), table='OST_INFO') == expected
+    assert test_db.last_hit == tokio.connectors.cachingdb.HIT_QUERY_CACHE_DIR
+    assert len(test_db.saved_results['OST_INFO']['rows']) == len(expected)
+    test_db.drop_cache()
+    assert not test_db.query_cache
+    test_db.query(query_str, (5,))
+    assert test_db.last_hit == tokio.connectors.cachingdb.HIT_QUERY_CACHE_DIR
+
+    # results are keyed by database
+    test_db = TestDb(cache_file=tokiotest.SAMPLE_LMTDB_FILE, query_cache_dir=tokiotest.TEMP_DIR)
+    test_db.cache_file = tokiotest.SAMPLE_NERSCJOBSDB_FILE
+    assert test_db.get_query_key(query_str, (5,)) != TestDb(
+        cache_file=tokiotest.SAMPLE_LMTDB_FILE).get_query_key(query_str, (5,))
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_query_cache_dir_json():
+    """
+    cachingdb.QueryCache stores results on disk as JSON and ignores other files
+    """
+    rows = [(x, 'row%d' % x, x / 3.0, None) for x in range(10)]
+    query_cache = tokio.connectors.cachingdb.QueryCache(cache_dir=tokiotest.TEMP_DIR)
+    query_cache.put('a', rows, 3600)
+
+    # a new cache reads the results back from disk
+    cache_path = query_cache._get_path('a')
+    with open(cache_path, 'r') as cache_file:
+        print(json.load(cache_file))
+    query_cache = tokio.connectors.cachingdb.QueryCache(cache_dir=tokiotest.TEMP_DIR)
+    assert query_cache.get('a') == (rows, tokio.connectors.cachingdb.HIT_QUERY_CACHE_DIR)
+
+    # files that are not JSON, such as pickles, are never loaded
+    with open(cache_path, 'wb') as cache_file:
+        cache_file.write(pickle.dumps((time.time() + 3600, rows)))
+    query_cache = tokio.connectors.cachingdb.QueryCache(cache_dir=tokiotest.TEMP_DIR)
+    assert query_cache.get('a') == (None, None)
+
+def test_query_cache_save_after_drop():
+    """
+    cachingdb.CachingDb.query() saves cached results again after drop_cache()
+    """
+    class TestDb(tokio.connectors.cachingdb.CachingDb):
+        """CachingDb that caches lookup tables"""
+        query_cache_ttls = {'OST_INFO': 3600}
+
+    query_str = 'SELECT * FROM OST_INFO WHERE OST_ID < %(ps)s'
+    test_db = TestDb(cache_file=tokiotest.SAMPLE_LMTDB_FILE)
+    expected = test_db.query(query_str, (5,), table='OST_INFO')
+    assert len(test_db.saved_results['OST_INFO']['rows']) == len(expected)
+
+    # repeated queries do not save the same rows twice
+    test_db.query(query_str, (5,), table='OST_INFO')
+    assert test_db.last_hit == tokio.connectors.cachingdb.HIT_MEMORY
+    assert len(test_db.saved_results['OST_INFO']['rows']) == len(expected)
+
+    # but do save them again once the table has been dropped
+    test_db.drop_cache(tables=['OST_INFO'])
+    assert 'OST_INFO' not in test_db.saved_results
+    assert test_db.query(query_str, (5,), table='OST_INFO') == expected
+    assert test_db.last_hit == tokio.connectors.cachingdb.HIT_MEMORY
+    assert len(test_db.saved_results['OST_INFO']['rows']) == len(expected)
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_query_cache_replaced_file():
+    """
+    cachingdb.CachingDb.query() does not reuse results from a replaced file
+    """
+    class TestDb(tokio.connectors.cachingdb.CachingDb):
+        """CachingDb that caches lookup tables"""
+        query_cache_ttls = {'OST_INFO': 3600}
+
+    query_str = 'SELECT * FROM OST_INFO WHERE OST_ID < %(ps)s'
+    query_cache_dir = os.path.join(tokiotest.TEMP_DIR, 'query_cache')
+    cache_file = os.path.join(tokiotest.TEMP_DIR, 'lmtdb.sqlite3')
+    shutil.copyfile(tokiotest.SAMPLE_LMTDB_FILE, cache_file)
+
+    test_db = TestDb(cache_file=cache_file, query_cache_dir=query_cache_dir)
+    expected = test_db.query(query_str, (5,))
+    assert len(expected) > 1
+    test_db = TestDb(cache_file=cache_file, query_cache_dir=query_cache_dir)
+    assert test_db.query(query_str, (5,)) == expected
+    assert test_db.last_hit == tokio.connectors.cachingdb.HIT_QUERY_CACHE_DIR
+    test_db.close_cache()
+
+    # regenerate the file at the same path with different contents
+    conn = sqlite3.connect(cache_file)
+    conn.execute('DELETE FROM OST_INFO WHERE OST_ID = ?', (expected[0][0],))
+    conn.commit()
+    conn.close()
+    stat = os.stat(cache_file)
+    os.utime(cache_file, (stat.st_atime, stat.st_mtime + 10))
+
+    test_db = TestDb(cache_file=cache_file, query_cache_dir=query_cache_dir)
+    assert test_db.query(query_str, (5,)) == expected[1:]
+    assert test_db.last_hit == tokio.connectors.cachingdb.HIT_CACHE_DB
@@ -3,6 +3,12 @@
 Test the Darshan connector
 """
 
+import os
+import glob
+import time
+import zlib
+import struct
+import nose
 import tokiotest
 import tokio.connectors.darshan
 
@@ -154,3 +160,112 @@ def test_filename_metadata():
     for key, value in tokiotest.SAMPLE_DARSHAN_FQLOG_META.items():
         assert key in darshan.filename_metadata
         assert darshan.filename_metadata[key] == value
+
+def test_darshan_header():
+    """darshan.Darshan.darshan_header() without darshan-parser"""
+    darshan = tokio.connectors.darshan.Darshan(tokiotest.SAMPLE_DARSHAN_LOG)
+    darshan.darshan_header()
+    assert 'header' in darshan
+    assert 'mounts' in darshan
+    assert 'counters' not in darshan
+
+    header = darshan['header']
+    assert header['jobid'] == tokiotest.SAMPLE_DARSHAN_JOBID
+    assert header['start_time'] == int(time.mktime(time.strptime(
+        tokiotest.SAMPLE_DARSHAN_START_TIME, "%Y-%m-%d %H:%M:%S")))
+    assert header['end_time'] == int(time.mktime(time.strptime(
+        tokiotest.SAMPLE_DARSHAN_END_TIME, "%Y-%m-%d %H:%M:%S")))
+    assert header['walltime'] == header['end_time'] - header['start_time'] + 1
+    assert header['nprocs'] > 0
+    assert header['exe']
+    assert header['metadata']
+
+    # the file system targeted by the job must be in the mount table
+    assert [x for x in darshan['mounts'] if x.endswith(tokiotest.SAMPLE_DARSHAN_FILE_SYSTEM)]
+
+def test_read_header_invalid():
+    """darshan.read_header() on non-Darshan files"""
+    for filename in (tokiotest.SAMPLE_XTDB2PROC_FILE, tokiotest.SAMPLE_LMTDB_FILE):
+        assert tokio.connectors.darshan.read_header(filename) is None
+
+def repack_darshan_log(output_file, version, num_mods, job=None):
+    """Rewrite SAMPLE_DARSHAN_LOG with a different header layout
+
+    Replaces the header of the sample log with one of the given version that
+    has `num_mods` module maps and module versions, and stores its job region
+    uncompressed.  Only the header and job region are meaningful in the
+    resulting log.
+
+    Args:
+        output_file (str): Path to which the repacked log should be written
+        version (str): Log version to record in the header
+        num_mods (int): Number of module maps in the header
+        job (bytes or None): Uncompressed job region to store instead of that
+            of the sample log
+    """
+    with open(tokiotest.SAMPLE_DARSHAN_LOG, 'rb') as log_fp:
+        orig = log_fp.read()
+    # the sample log is a zlib-compressed 3.10 log with 16 modules
+    name_map_off, name_map_len = struct.unpack('<QQ', orig[24:40])
+    orig_header_size = 40 + 16 * 16 + 4 * 16
+    if job is None:
+        job = zlib.decompress(orig[orig_header_size:name_map_off])
+
+    header_size = 40 + num_mods * 16 + 4 * num_mods
+    shift = header_size + len(job) - name_map_off
+    mod_maps = []
+    for index in range(num_mods):
+        offset, length = struct.unpack('<QQ', orig[40 + 16 * index:56 + 16 * index]) \
+            if index < 16 else (0, 0)
+        mod_maps.append(struct.pack('<QQ', offset + shift if length else 0, length))
+
+    header = version.encode().ljust(8, b'\0') \
+        + struct.pack('<q', tokio.connectors.darshan.DARSHAN_MAGIC_NR) \
+        + struct.pack('<B3x', 2) \
+        + orig[20:24] \
+        + struct.pack('<QQ', name_map_off + shift, name_map_len) \
+        + b''.join(mod_maps) \
+        + b'\0' * 4 * num_mods
+    assert len(header) == header_size
+
+    with open(output_file, 'wb') as log_fp:
+        log_fp.write(header + job + orig[name_map_off:])
+
+@nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
+def test_read_header_uncompressed():
+    """darshan.read_header() on uncompressed logs"""
+    tokiotest.TEMP_FILE.close()
+    expected = tokio.connectors.darshan.read_header(tokiotest.SAMPLE_DARSHAN_LOG)
+    assert expected is not None
+
+    # the header size must match the log version, or the job record is garbage
+    for version, num_mods in (('3.10', 16), ('3.21', 64)):
+        repack_darshan_log(tokiotest.TEMP_FILE.name, version, num_mods)
+        decoded = tokio.connectors.darshan.read_header(tokiotest.TEMP_FILE.name)
+        print("Decoded %s header: %s" % (version, decoded and decoded['header']))
+        assert decoded is not None
+        assert decoded['header']['version'] == version
+        assert decoded['header']['compression'] == 'NONE'
+        for key, value in expected['header'].items():
+            if key not in ('version', 'compression'):
+                assert decoded['header'][key] == value
+        assert decoded['mounts'] == expected['mounts']
+
+    # implausible job records are rejected so darshan-parser can be used instead
+    repack_darshan_log(tokiotest.TEMP_FILE.name, '3.21', 64, job=b'\0' * 4096)
+    assert tokio.connectors.darshan.read_header(tokiotest.TEMP_FILE.name) is None
+
+@tokiotest.needs_darshan
+def test_darshan_header_vs_parser():
+    """darshan.Darshan.darshan_header() matches darshan-parser"""
+    tokiotest.check_darshan()
+    for log_file in glob.glob(os.path.join(tokiotest.INPUT_DIR, '*.darshan')):
+        darshan = tokio.connectors.darshan.Darshan(log_file)
+        darshan.darshan_parser_base()
+        fast = tokio.connectors.darshan.Darshan(log_file)
+        fast.darshan_header()
+        print("Comparing headers of %s" % log_file)
+        for key, value in darshan['header'].items():
+            print("  %s: %s == %s" % (key, value, fast['header'].get(key)))
+            assert fast['header'].get(key) == value
+        assert fast['mounts'] == darshan['mounts']
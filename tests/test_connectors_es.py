@@ -4,9 +4,14 @@ Test the ElasticSearch collectd connector.  Some of these tests will essentially
 pass only at NERSC because of the assumptions built into the indices.
 """
 
+import os
 import copy
 import datetime
+import nose
+import tokiotest
 import tokio.connectors.es
+import tokio.connectors.collectd_es
+import tokio.connectors.nersc_globuslogs
 
 FLUSH_STATE = {'pages': []}
 PAGE_SIZE = 100
@@ -159,3 +164,337 @@ def test_build_timeseries_query():
             start_key='@timestamp',
             end_key='INVALID KEY')
         assert ret != ret_ref
+
+class FakeClient(object):
+    """Stands in for elasticsearch.Elasticsearch by serving fake pages
+    """
+    def __init__(self, pages):
+        self.pages = pages
+        self.cleared = []
+
+    def search(self, **kwargs):
+        """Return the first page"""
+        return self.pages.pop(0)
+
+    def scroll(self, scroll_id, **kwargs):
+        """Return the next page"""
+        return self.pages.pop(0)
+
+    def clear_scroll(self, scroll_id):
+        """Record which scroll contexts were cleared"""
+        self.cleared.append(scroll_id)
+
+def test_iter_scroll():
+    """connectors.es.EsConnection.iter_scroll()
+    """
+    es_obj = tokio.connectors.es.EsConnection(host=None, port=None)
+    es_obj.local_mode = True
+    es_obj.fake_pages = make_fake_pages()
+
+    num_pages = 0
+    hits = set([])
+    for page in es_obj.iter_scroll("", filter_function=lambda x: x['hits']['hits']):
+        num_pages += 1
+        hits |= set([x['_id'] for x in page])
+    assert num_pages == NUM_PAGES
+    assert len(hits) == NUM_PAGES * PAGE_SIZE
+    assert not es_obj.fake_pages
+    assert not es_obj.scroll_pages
+
+def test_iter_scroll_early_exit():
+    """connectors.es.EsConnection.iter_scroll() closed early
+    """
+    # in local mode, the rest of the abandoned scroll should be discarded
+    es_obj = tokio.connectors.es.EsConnection(host=None, port=None)
+    es_obj.local_mode = True
+    es_obj.fake_pages = make_fake_pages() + make_fake_pages(num_pages=2)
+    for index, _ in enumerate(es_obj.iter_scroll("")):
+        if index == 2:
+            break
+    assert len(es_obj.fake_pages) == 3
+    assert len(list(es_obj.iter_scroll(""))) == 2
+
+    # in remote mode, the scroll context should be released
+    es_obj = tokio.connectors.es.EsConnection(host=None, port=None)
+    es_obj.local_mode = False
+    es_obj.client = FakeClient(make_fake_pages())
+    pages = es_obj.iter_scroll("")
+    next(pages)
+    next(pages)
+    assert not es_obj.client.cleared
+    pages.close()
+    assert es_obj.client.cleared == ['1']
+    assert es_obj.scroll_id is None
+
+    # and also released when scrolling completes
+    es_obj.client = FakeClient(make_fake_pages())
+    es_obj.query_and_scroll("")
+    assert len(es_obj.scroll_pages) == NUM_PAGES
+    assert es_obj.client.cleared == [str(NUM_PAGES - 1)]
+
+def make_sliced_connection(service, slices, max_workers=None, cls=tokio.connectors.es.EsConnection):
+    """Create a connection that retrieves from a FakeEsService
+    """
+    es_obj = cls(host=None, port=None, page_size=PAGE_SIZE, slices=slices, max_workers=max_workers)
+    es_obj.local_mode = False
+    es_obj.client = service
+    return es_obj
+
+def test_sliced_scroll():
+    """connectors.es.EsConnection.iter_scroll() with slices
+    """
+    num_docs = PAGE_SIZE * NUM_PAGES + PAGE_SIZE // 2
+    for slices, max_workers in [(1, None), (2, None), (4, 2), (7, None)]:
+        service = tokiotest.FakeEsService(tokiotest.make_es_documents(num_docs))
+        es_obj = make_sliced_connection(service, slices, max_workers)
+        doc_ids = []
+        for page in es_obj.iter_scroll("", filter_function=lambda x: x['hits']['hits']):
+            assert len(page) <= PAGE_SIZE
+            doc_ids += [x['_id'] for x in page]
+        print("%d slices returned %d documents" % (slices, len(doc_ids)))
+        assert len(doc_ids) == num_docs
+        assert set(doc_ids) == set([str(x) for x in range(num_docs)])
+        assert not service.contexts
+        assert es_obj.scroll_id is None
+
+def test_sliced_query_and_scroll():
+    """connectors.es.EsConnection.query_and_scroll() with slices
+    """
+    num_docs = PAGE_SIZE * NUM_PAGES
+    flushed = []
+    def sliced_flush_function(es_obj):
+        """Flush all pages retrieved so far"""
+        for page in es_obj.scroll_pages:
+            flushed.extend(page)
+        es_obj.scroll_pages = []
+
+    service = tokiotest.FakeEsService(tokiotest.make_es_documents(num_docs))
+    es_obj = make_sliced_connection(service, slices=3)
+    es_obj.query_and_scroll(
+        query="",
+        filter_function=lambda x: x['hits']['hits'],
+        flush_every=PAGE_SIZE * 2,
+        flush_function=sliced_flush_function)
+    sliced_flush_function(es_obj)
+    assert es_obj._num_flushes > 0
+    assert sorted([int(x['_id']) for x in flushed]) == list(range(num_docs))
+
+@nose.tools.raises(KeyError)
+def test_sliced_scroll_error():
+    """connectors.es.EsConnection.iter_scroll() with slices, failed slice
+    """
+    service = tokiotest.FakeEsService(tokiotest.make_es_documents(PAGE_SIZE * NUM_PAGES))
+    es_obj = make_sliced_connection(service, slices=4)
+    # invalidate one slice's scroll context
+    service.scroll = lambda scroll_id, **kwargs: {}[scroll_id] if scroll_id == '2' \
+        else tokiotest.FakeEsService.scroll(service, scroll_id, **kwargs)
+    for _ in es_obj.iter_scroll(""):
+        pass
+
+def test_sliced_scroll_early_exit():
+    """connectors.es.EsConnection.iter_scroll() with slices closed early
+    """
+    service = tokiotest.FakeEsService(tokiotest.make_es_documents(PAGE_SIZE * NUM_PAGES * 4))
+    es_obj = make_sliced_connection(service, slices=4)
+    pages = es_obj.iter_scroll("")
+    next(pages)
+    next(pages)
+    pages.close()
+    assert not service.contexts
+    assert len(service.cleared) == 4
+    # workers should not have run far ahead of the consumer
+    assert service.num_requests < NUM_PAGES * 4
+
+def test_sliced_connectors():
+    """connectors.es subclasses with slices
+    """
+    end_time = datetime.datetime.now()
+    start_time = end_time - datetime.timedelta(hours=1)
+    num_docs = PAGE_SIZE * NUM_PAGES
+
+    timestamp = (start_time + datetime.timedelta(minutes=1)).isoformat()
+    service = tokiotest.FakeEsService(tokiotest.make_es_documents(
+        num_docs, hostname='bb01', plugin='cpu', type_instance='idle', **{'@timestamp': timestamp}))
+    es_obj = make_sliced_connection(service, slices=3, cls=tokio.connectors.collectd_es.CollectdEs)
+    doc_ids = []
+    for page in es_obj.iter_timeseries(tokio.connectors.collectd_es.QUERY_CPU_DATA, start_time, end_time):
+        doc_ids += [x['_id'] for x in page]
+    assert len(doc_ids) == num_docs
+
+    service = tokiotest.FakeEsService(tokiotest.make_es_documents(
+        num_docs, start_date=timestamp, end_date=end_time.isoformat()))
+    es_obj = make_sliced_connection(service, slices=3, cls=tokio.connectors.nersc_globuslogs.NerscGlobusLogs)
+    es_obj.query(start_time, end_time)
+    assert sum([len(x) for x in es_obj.scroll_pages]) == num_docs
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_cache_formats():
+    """connectors.es cache file formats
+    """
+    pages = [x['hits']['hits'] for x in make_fake_pages()[:-1]]
+    cache_files = [os.path.join(tokiotest.TEMP_DIR, x)
+                   for x in ('pages.json', 'pages.json.gz', 'pages.ndjson', 'pages.ndjson.gz')]
+
+    # write each format, then convert each format into every other format
+    for cache_file in cache_files:
+        tokio.connectors.es.write_cache(cache_file, iter(pages))
+        assert list(tokio.connectors.es.iter_cache(cache_file)) == pages
+    for input_file in cache_files:
+        for output_file in cache_files:
+            if input_file == output_file:
+                continue
+            tokio.connectors.es.convert_cache(input_file, output_file)
+            assert list(tokio.connectors.es.iter_cache(output_file)) == pages
+
+    with open(cache_files[2], 'r') as ndjson_file:
+        assert len(ndjson_file.readlines()) == len(pages)
+    assert tokio.connectors.es.is_ndjson(cache_files[3])
+    assert not tokio.connectors.es.is_ndjson(cache_files[1])
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_from_ndjson_cache():
+    """connectors.es.EsConnection.from_cache() with NDJSON
+    """
+    pages = [x['hits']['hits'] for x in make_fake_pages()[:-1]]
+    cache_file = os.path.join(tokiotest.TEMP_DIR, 'pages.ndjson.gz')
+    tokio.connectors.es.write_cache(cache_file, pages)
+
+    es_obj = tokio.connectors.es.EsConnection.from_cache(cache_file)
+    scrolled = []
+    for page in es_obj.iter_scroll("", filter_function=lambda x: x['hits']['hits']):
+        # pages should be read from the cache as they are needed
+        assert len(es_obj.fake_pages) <= 1
+        scrolled.append(page)
+    assert scrolled == pages
+
+    # pages written while scrolling should be identical to the original cache
+    es_obj = tokio.connectors.es.EsConnection.from_cache(cache_file)
+    output_file = os.path.join(tokiotest.TEMP_DIR, 'output.ndjson')
+    es_obj.save_cache(output_file, pages=es_obj.iter_scroll("", filter_function=lambda x: x['hits']['hits']))
+    assert list(tokio.connectors.es.iter_cache(output_file)) == pages
+
+def make_timestamped_documents(start_time, num_docs, step, **source):
+    """Create documents spaced `step` seconds apart starting at `start_time`
+    """
+    documents = tokiotest.make_es_documents(num_docs, **source)
+    for index, document in enumerate(documents):
+        timestamp = start_time + datetime.timedelta(seconds=index * step)
+        document['_source']['@timestamp'] = timestamp.isoformat()
+    return documents
+
+def test_split_time_buckets():
+    """connectors.es.split_time_buckets()
+    """
+    start_time = datetime.datetime(2019, 3, 1, 0, 0, 0)
+    settled = tokio.connectors.es.time.mktime(datetime.datetime(2019, 3, 1, 3, 0, 0).timetuple())
+
+    # unaligned edges and unsettled buckets are merged into uncacheable segments
+    segments = tokio.connectors.es.split_time_buckets(
+        start_time + datetime.timedelta(minutes=30),
+        start_time + datetime.timedelta(hours=5),
+        3600,
+        settled)
+    assert [x[2] for x in segments] == [False, True, True, False]
+    assert segments[0][0] == start_time + datetime.timedelta(minutes=30)
+    assert segments[1][0] == start_time + datetime.timedelta(hours=1)
+    assert segments[-1][0] == start_time + datetime.timedelta(hours=3)
+    assert segments[-1][1] == start_time + datetime.timedelta(hours=5)
+    for index in range(1, len(segments)):
+        assert segments[index - 1][1] == segments[index][0]
+
+    # windows within a single bucket are never cacheable
+    segments = tokio.connectors.es.split_time_buckets(
+        start_time + datetime.timedelta(minutes=10),
+        start_time + datetime.timedelta(minutes=20),
+        3600,
+        settled)
+    assert segments == [(start_time + datetime.timedelta(minutes=10),
+                         start_time + datetime.timedelta(minutes=20),
+                         False)]
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_cached_timeseries():
+    """connectors.es.EsConnection.query_timeseries() with bucket cache
+    """
+    start_time = datetime.datetime(2019, 3, 1, 0, 0, 0)
+    end_time = start_time + datetime.timedelta(hours=6)
+    service = tokiotest.FakeEsService(make_timestamped_documents(
+        start_time, 6 * 60, 60, hostname='bb01', plugin='cpu', type_instance='idle'))
+
+    def query(query_start, query_end, **kwargs):
+        es_obj = make_sliced_connection(service, slices=1, cls=tokio.connectors.collectd_es.CollectdEs)
+        es_obj.cache_dir = tokiotest.TEMP_DIR
+        es_obj.cache_bucket = 3600
+        for key, value in kwargs.items():
+            setattr(es_obj, key, value)
+        service.num_requests = 0
+        es_obj.query_cpu(query_start, query_end)
+        return sorted(int(x['_id']) for page in es_obj.scroll_pages for x in page)
+
+    def expected(query_start, query_end):
+        return list(range(int((query_start - start_time).total_seconds() // 60),
+                          min(6 * 60, int((query_end - start_time).total_seconds() // 60))))
+
+    # buckets that have not settled are never cached
+    assert query(start_time, end_time, cache_settle=10**10) == expected(start_time, end_time)
+    assert not os.listdir(tokiotest.TEMP_DIR)
+
+    # the first query populates the cache
+    assert query(start_time, end_time) == expected(start_time, end_time)
+    cold_requests = service.num_requests
+
+    # the same query is then served entirely from the cache
+    assert query(start_time, end_time) == expected(start_time, end_time)
+    assert service.num_requests == 0
+
+    # overlapping queries only retrieve the buckets that are not cached
+    query_start = start_time + datetime.timedelta(hours=4, minutes=30)
+    query_end = end_time + datetime.timedelta(hours=2)
+    assert query(query_start, query_end) == expected(query_start, query_end)
+    assert 0 < service.num_requests < cold_requests
+
+    # different queries are cached separately
+    es_obj = make_sliced_connection(service, slices=1, cls=tokio.connectors.collectd_es.CollectdEs)
+    es_obj.cache_dir = tokiotest.TEMP_DIR
+    es_obj.query_disk(start_time, end_time)
+    assert not es_obj.scroll_pages
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_cached_timeseries_overlaps():
+    """connectors.es.EsConnection.query_timeseries() with bucket cache and end_key
+    """
+    start_time = datetime.datetime(2019, 3, 1, 0, 0, 0)
+    end_time = start_time + datetime.timedelta(hours=6)
+
+    # transfers that span several buckets should only be returned once
+    documents = tokiotest.make_es_documents(50)
+    for index, document in enumerate(documents):
+        document['_source']['start_date'] = (start_time + datetime.timedelta(minutes=7 * index)).isoformat()
+        document['_source']['end_date'] = (start_time + datetime.timedelta(minutes=13 * index + 1)).isoformat()
+    service = tokiotest.FakeEsService(documents)
+
+    def query(**kwargs):
+        es_obj = make_sliced_connection(service, slices=1,
+                                        cls=tokio.connectors.nersc_globuslogs.NerscGlobusLogs)
+        es_obj.cache_dir = tokiotest.TEMP_DIR
+        es_obj.cache_bucket = 3600
+        for key, value in kwargs.items():
+            setattr(es_obj, key, value)
+        service.num_requests = 0
+        es_obj.query(start_time, end_time)
+        doc_ids = [x['_id'] for page in es_obj.scroll_pages for x in page]
+        assert len(doc_ids) == len(set(doc_ids)) == len(documents)
+
+    # records may be indexed long after the buckets they overlap have ended,
+    # so nothing is cached unless their maximum duration is known
+    query()
+    assert not os.listdir(tokiotest.TEMP_DIR)
+
+    # buckets are not cached until the longest record could have been indexed
+    query(cache_max_duration=10**10)
+    assert not os.listdir(tokiotest.TEMP_DIR)
+
+    query(cache_max_duration=86400)
+    assert os.listdir(tokiotest.TEMP_DIR)
+    query(cache_max_duration=86400)
+    assert service.num_requests == 0
@@ -6,6 +6,7 @@ MySQL database.
 """
 
 import datetime
+import numpy
 import nose
 import tokiotest
 import tokio.connectors.lmtdb
@@ -110,3 +111,45 @@ def test_get_timeseries_data():
                                         datetime.timedelta(seconds=60))
     assert result0 == result1 == result2 == result3
     print(result0)
+
+def test_get_timeseries_data_parallel():
+    """
+    LmtDb.get_timeseries_data() with concurrent chunks
+    """
+    dt_start = datetime.datetime.fromtimestamp(tokiotest.SAMPLE_LMTDB_START)
+    dt_end = datetime.datetime.fromtimestamp(tokiotest.SAMPLE_LMTDB_END)
+    timechunk = datetime.timedelta(seconds=30)
+
+    lmtdb = tokio.connectors.lmtdb.LmtDb(cache_file=SAMPLE_CACHE_DB)
+    expected = lmtdb.get_timeseries_data('OST_DATA', dt_start, dt_end, timechunk)
+    assert len(expected[0]) > 0
+    for max_connections in (2, 4):
+        lmtdb = tokio.connectors.lmtdb.LmtDb(cache_file=SAMPLE_CACHE_DB,
+                                             max_connections=max_connections)
+        result = lmtdb.get_timeseries_data('OST_DATA', dt_start, dt_end, timechunk)
+        assert result == expected
+        # rows must be ordered by timestamp across chunks
+        timestamps = [x[0] for x in result[0]]
+        assert timestamps == sorted(timestamps)
+
+def test_iter_timeseries_arrays():
+    """
+    LmtDb.iter_timeseries_arrays()
+    """
+    dt_start = datetime.datetime.fromtimestamp(tokiotest.SAMPLE_LMTDB_START)
+    dt_end = datetime.datetime.fromtimestamp(tokiotest.SAMPLE_LMTDB_END)
+    timechunk = datetime.timedelta(seconds=30)
+    for table in ('OST_DATA', 'OSS_DATA', 'MDS_DATA', 'MDS_OPS_DATA'):
+        lmtdb = tokio.connectors.lmtdb.LmtDb(cache_file=SAMPLE_CACHE_DB, max_connections=2)
+        rows, columns = lmtdb.get_timeseries_data(table, dt_start, dt_end, timechunk)
+        arrays = list(lmtdb.iter_timeseries_arrays(table, dt_start, dt_end, timechunk,
+                                                   batch_size=100))
+        result = numpy.concatenate(arrays)
+        assert list(result.dtype.names) == columns
+        assert len(result) == len(rows)
+        for index, column in enumerate(columns):
+            if column == 'TIMESTAMP':
+                expected = numpy.array([x[index] for x in rows], dtype='datetime64[s]')
+            else:
+                expected = numpy.array([x[index] for x in rows], dtype=result.dtype[column])
+            assert (result[column] == expected).all()
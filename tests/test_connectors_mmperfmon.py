@@ -4,6 +4,8 @@ import os
 import gzip
 import json
 import nose
+import numpy
+import pandas
 
 import tokio.connectors.mmperfmon
 import tokiotest
@@ -149,6 +151,122 @@ def test_unpacked_input():
     tokiotest.cleanup_untar(tokiotest.SAMPLE_MMPERFMON_TGZ_INPUT)
     validate_object(mmp_data)
 
+def test_from_str():
+    """connectors.mmperfmon.Mmperfmon.from_str()
+    """
+    input_str = gzip.open(tokiotest.SAMPLE_MMPERFMON_USAGE_INPUT, 'rt').read()
+    mmp_data = tokio.connectors.mmperfmon.Mmperfmon.from_str(input_str)
+    validate_object(mmp_data)
+    assert mmp_data == tokio.connectors.mmperfmon.Mmperfmon(tokiotest.SAMPLE_MMPERFMON_USAGE_INPUT)
+
+def test_load_multiple_processes():
+    """connectors.mmperfmon.Mmperfmon, load multiple with processes
+    """
+    for input_file in (tokiotest.SAMPLE_MMPERFMON_TGZ_INPUT, tokiotest.SAMPLE_MMPERFMON_MULTI):
+        serial = tokio.connectors.mmperfmon.Mmperfmon(input_file)
+        validate_object(serial)
+        for processes, window in ((2, None), (3, 1)):
+            print("Loading from %s with %d processes" % (input_file, processes))
+            parallel = tokio.connectors.mmperfmon.Mmperfmon(input_file, processes=processes, window=window)
+            assert parallel == serial
+            assert list(parallel.keys()) == list(serial.keys())
+
+def test_parse_table():
+    """connectors.mmperfmon.parse_table()
+    """
+    for input_file in (tokiotest.SAMPLE_MMPERFMON_USAGE_INPUT, tokiotest.SAMPLE_MMPERFMON_NSDDS_INPUT):
+        print("Parsing %s" % input_file)
+        input_str = gzip.open(input_file, 'rt').read()
+        table = tokio.connectors.mmperfmon.parse_table(input_str)
+        print("Table has shape %s" % str(table.values.shape))
+        assert table.values.shape == (len(table.timestamps), len(table.legend))
+        assert table.integers.shape == table.values.shape
+        assert not numpy.isnan(table.values).all()
+
+        # the dict representation is derived from the table
+        assert table.to_dict() == tokio.connectors.mmperfmon.Mmperfmon.from_str(input_str)
+
+    # counters with units are converted into bytes
+    input_str = gzip.open(tokiotest.SAMPLE_MMPERFMON_USAGE_INPUT, 'rt').read()
+    table = tokio.connectors.mmperfmon.parse_table(input_str)
+    counters = set([x['counter'] for x in table.columns])
+    print("Found counters %s" % counters)
+    for counter in tokiotest.SAMPLE_MMPERFMON_METRICS:
+        assert counter in counters
+
+    # but the legend retains the counter names reported by mmperfmon
+    mmp_data = tokio.connectors.mmperfmon.Mmperfmon.from_str(input_str)
+    legend_counters = set([x['counter'] for x in table.legend])
+    assert 'mem_total' in legend_counters
+    assert 'mem_total_bytes' not in legend_counters
+    assert legend_counters == set([x['counter'] for x in mmp_data.legend.values()])
+
+def test_unknown_units():
+    """connectors.mmperfmon.parse_table() with unknown units
+    """
+    input_str = gzip.open(tokiotest.SAMPLE_MMPERFMON_USAGE_INPUT, 'rt').read()
+    mmp_data = tokio.connectors.mmperfmon.Mmperfmon.from_str(input_str)
+    mmp_unknown = tokio.connectors.mmperfmon.Mmperfmon.from_str(input_str.replace(' MB', ' XB'))
+
+    # values with unknown units are kept as reported, like other non-numbers
+    for timestamp, hosts in mmp_data.items():
+        for hostname, counters in hosts.items():
+            for counter, value in counters.items():
+                if counter in mmp_unknown[timestamp][hostname]:
+                    assert mmp_unknown[timestamp][hostname][counter] == value
+                    continue
+                reported = mmp_unknown[timestamp][hostname][counter[:-len('_bytes')]]
+                print("%s converted to %s" % (reported, value))
+                assert reported.endswith(' XB')
+                assert float(reported.split()[0]) * 1048576 == value
+
+    # and they appear in dataframes as strings
+    dataframe = mmp_unknown.to_dataframe(by_host=tokiotest.SAMPLE_MMPERFMON_HOSTS[0])
+    assert dataframe['mem_total'].map(lambda x: x.endswith(' XB')).all()
+    assert dataframe['cpu_user'].dtype == mmp_data.to_dataframe(
+        by_host=tokiotest.SAMPLE_MMPERFMON_HOSTS[0])['cpu_user'].dtype
+
+def test_iter_tables():
+    """connectors.mmperfmon.iter_tables()
+    """
+    input_file = tokiotest.SAMPLE_MMPERFMON_TGZ_INPUT
+    mmp_data = tokio.connectors.mmperfmon.Mmperfmon(input_file)
+    tables = list(tokio.connectors.mmperfmon.iter_tables(input_file))
+    print("Found %d tables in %s" % (len(tables), input_file))
+    assert len(tables) > 1
+
+    # merging the streamed tables reproduces the fully loaded object
+    streamed = tokio.connectors.mmperfmon.Mmperfmon()
+    for table in tables:
+        streamed.add_table(table)
+    assert streamed == mmp_data
+
+def test_table_from_dict():
+    """connectors.mmperfmon.MmperfmonTable.from_dict()
+    """
+    mmp_data = tokio.connectors.mmperfmon.Mmperfmon(tokiotest.SAMPLE_MMPERFMON_TGZ_INPUT)
+    table = tokio.connectors.mmperfmon.MmperfmonTable.from_dict(mmp_data)
+    assert table.to_dict() == mmp_data
+    assert json.dumps(table.to_dict(), sort_keys=True) == json.dumps(mmp_data, sort_keys=True)
+
+@nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
+def test_to_df_from_cache():
+    """connectors.mmperfmon.Mmperfmon.to_dataframe() from a JSON cache
+    """
+    mmp_data = tokio.connectors.mmperfmon.Mmperfmon(tokiotest.SAMPLE_MMPERFMON_USAGE_INPUT)
+    mmp_data.save_cache(tokiotest.TEMP_FILE.name)
+    mmp_cached = tokio.connectors.mmperfmon.Mmperfmon(cache_file=tokiotest.TEMP_FILE.name)
+    tokiotest.TEMP_FILE.close()
+    assert mmp_cached.tables is None
+    assert mmp_cached == mmp_data
+
+    for sample_host in tokiotest.SAMPLE_MMPERFMON_HOSTS:
+        pandas.testing.assert_frame_equal(mmp_cached.to_dataframe(by_host=sample_host),
+                                          mmp_data.to_dataframe(by_host=sample_host))
+    for sample_metric in tokiotest.SAMPLE_MMPERFMON_METRICS:
+        pandas.testing.assert_frame_equal(mmp_cached.to_dataframe(by_metric=sample_metric),
+                                          mmp_data.to_dataframe(by_metric=sample_metric))
+
 @nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
 def test_mmperfmon_serializer():
     """connectors.mmperfmon.Mmperfmon: can serialize and deserialize circularly
@@ -4,6 +4,8 @@ Test the NERSC Lustre health data connector
 """
 
 import os
+import gzip
+import shutil
 import nose
 import tokiotest
 import tokio.connectors.nersc_lfsstate as nersc_lfsstate
@@ -121,3 +123,103 @@ def test_ostfullness_serializer():
     ostfullness = nersc_lfsstate.NerscLfsOstFullness(tokiotest.TEMP_FILE.name)
     tokiotest.TEMP_FILE.close()
     verify_ost(ostfullness, input_type='ostfullness')
+
+def split_gzip_members(input_file, output_file):
+    """
+    Recompress a dump so that each BEGIN block is its own gzip member
+    """
+    blocks = []
+    for line in gzip.open(input_file, 'rt'):
+        if line.startswith('BEGIN') or not blocks:
+            blocks.append([])
+        blocks[-1].append(line)
+    with open(output_file, 'wb') as output:
+        for block in blocks:
+            output.write(gzip.compress(''.join(block).encode()))
+
+def verify_index(index, loader_class):
+    """
+    Verify that an index locates every snapshot in a dump
+    """
+    full = loader_class(index.cache_file)
+    print("Indexed %d snapshots in %s" % (len(index), index.cache_file))
+    assert sorted(index.timestamps) == sorted(full.keys())
+    for position, timestamp in enumerate(index.timestamps):
+        assert index.read_block(position).startswith('BEGIN %d' % timestamp)
+
+    # load a single snapshot through the index
+    timestamp = index.timestamps[len(index) // 2]
+    partial = loader_class(index.cache_file, timestamps=[timestamp])
+    assert list(partial.keys()) == [timestamp]
+    assert partial[timestamp] == full[timestamp]
+
+def test_index_gz():
+    """
+    LfsStateIndex on compressed files
+    """
+    for input_file, loader_class in ((tokiotest.SAMPLE_OSTFULLNESS_FILE, nersc_lfsstate.NerscLfsOstFullness),
+                                     (tokiotest.SAMPLE_OSTMAP_FILE, nersc_lfsstate.NerscLfsOstMap)):
+        index = nersc_lfsstate.LfsStateIndex(input_file)
+        index.build()
+        verify_index(index, loader_class)
+
+@nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
+def test_index_uncompressed():
+    """
+    LfsStateIndex on uncompressed files
+    """
+    tokiotest.TEMP_FILE.close()
+    tokiotest.gunzip(tokiotest.SAMPLE_OSTFULLNESS_FILE, tokiotest.TEMP_FILE.name)
+    index = nersc_lfsstate.LfsStateIndex(tokiotest.TEMP_FILE.name)
+    index.build()
+    assert set(index.member_offsets) == set([0])
+    verify_index(index, nersc_lfsstate.NerscLfsOstFullness)
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_index_gz_members():
+    """
+    LfsStateIndex on files with one gzip member per snapshot
+    """
+    for input_file, loader_class in ((tokiotest.SAMPLE_OSTFULLNESS_FILE, nersc_lfsstate.NerscLfsOstFullness),
+                                     (tokiotest.SAMPLE_OSTMAP_FILE, nersc_lfsstate.NerscLfsOstMap)):
+        output_file = os.path.join(tokiotest.TEMP_DIR, os.path.basename(input_file))
+        split_gzip_members(input_file, output_file)
+        index = nersc_lfsstate.LfsStateIndex(output_file)
+        index.build()
+
+        # every snapshot begins at the start of its own member
+        assert len(set(index.member_offsets)) == len(index)
+        assert set(index.offsets) == set([0])
+        verify_index(index, loader_class)
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_index_sidecar():
+    """
+    LfsStateIndex sidecar files and get_index()
+    """
+    output_file = os.path.join(tokiotest.TEMP_DIR, 'osts.txt.gz')
+    shutil.copyfile(tokiotest.SAMPLE_OSTFULLNESS_FILE, output_file)
+
+    index = nersc_lfsstate.LfsStateIndex(output_file)
+    assert not index.load()
+    index.build()
+    index.save()
+    assert os.path.isfile(output_file + nersc_lfsstate.INDEX_SUFFIX)
+
+    loaded = nersc_lfsstate.LfsStateIndex(output_file)
+    assert loaded.load()
+    assert loaded.timestamps == index.timestamps
+    assert loaded.member_offsets == index.member_offsets
+    assert loaded.offsets == index.offsets
+
+    # get_index returns the same object until the file changes
+    assert nersc_lfsstate.get_index(output_file) is nersc_lfsstate.get_index(output_file)
+
+    # a sidecar describing a different file is ignored
+    with open(output_file, 'ab') as output:
+        output.write(gzip.compress(b'BEGIN 2000000000\n'))
+    stale = nersc_lfsstate.LfsStateIndex(output_file)
+    assert not stale.load()
+    rebuilt = nersc_lfsstate.get_index(output_file)
+    assert rebuilt.timestamps[-1] == 2000000000
+    assert len(rebuilt) == len(index) + 1
@@ -103,6 +103,21 @@ def test_slurm_to_dataframe():
         day_ago = dataframe[datetime_field][0] - datetime.timedelta(days=1)
         assert (dataframe[datetime_field][0] - day_ago).total_seconds() == 86400
 
+def load_scontrol_transcript(path):
+    """
+    Read a file of captured scontrol commands and their outputs
+    """
+    cases = []
+    with open(path, 'r') as fp:
+        for line in fp:
+            line = line.strip()
+            if line.startswith('$ scontrol show '):
+                subcommand, argument = line.split()[3:5]
+                cases.append((subcommand, argument, []))
+            elif line:
+                cases[-1][2].append(line)
+    return cases
+
 def expand_nodelist(min_nid, max_nid):
     """
     Create a known nodelist and ensure that it expands correctly
@@ -110,15 +125,13 @@ def expand_nodelist(min_nid, max_nid):
     # + 1 below because node list is inclusive
     num_nodes = max_nid - min_nid + 1
     nid_str = "nid[%05d-%05d]" % (min_nid, max_nid)
-    try:
-        node_list = tokio.connectors.slurm.expand_nodelist(nid_str)
-    except OSError as error:
-        # scontrol is not available
-        raise nose.SkipTest(error)
+    node_list = tokio.connectors.slurm.expand_nodelist(nid_str)
 
     print("node range is %s to %s" % (min_nid, max_nid))
     print("length of node list is %s" % len(node_list))
     assert len(node_list) == num_nodes
+    assert "nid%05d" % min_nid in node_list
+    assert "nid%05d" % max_nid in node_list
 
 def test_expand_nodelist():
     """
@@ -128,6 +141,52 @@ def test_expand_nodelist():
     max_node = min_node + random.randint(1, 10000)
     expand_nodelist(min_node, max_node)
 
+def test_expand_nodelist_scontrol():
+    """
+    tokio.connectors.slurm.expand_nodelist() matches scontrol show hostname
+    """
+    cases = load_scontrol_transcript(tokiotest.SAMPLE_SLURM_HOSTLISTS_FILE)
+    num_tested = 0
+    for subcommand, node_string, output in cases:
+        if subcommand != 'hostname':
+            continue
+        print("expanding %s" % node_string)
+        assert tokio.connectors.slurm.expand_nodelist(node_string) == set(output)
+        num_tested += 1
+    assert num_tested > 0
+
+def test_expand_nodelist_formats():
+    """
+    tokio.connectors.slurm.expand_nodelist() nested and multiple brackets
+    """
+    expand = tokio.connectors.slurm.expand_nodelist
+    assert expand("r[1-2]n[01-02]") == set(["r1n01", "r1n02", "r2n01", "r2n02"])
+    assert expand("n[0[1-2],10]") == set(["n01", "n02", "n10"])
+    assert expand("nid0[0009-0010] nid00020") == set(["nid00009", "nid00010", "nid00020"])
+    assert expand("nid00001") == set(["nid00001"])
+    assert expand("") == set([])
+
+def test_expand_nodelist_invalid():
+    """
+    tokio.connectors.slurm.expand_nodelist() invalid hostlists
+    """
+    for node_string in ["nid[1-2", "nid1-2]", "nid[2-1]", "nid[a-b]", "nid[]"]:
+        print("expanding %s" % node_string)
+        nose.tools.assert_raises(ValueError,
+                                 tokio.connectors.slurm.expand_nodelist,
+                                 node_string)
+
+def test_expand_nodelist_nids():
+    """
+    tokio.connectors.slurm.expand_nodelist_nids()
+    """
+    nids = tokio.connectors.slurm.expand_nodelist_nids("nid0[5301-5303,5305],nid05302")
+    assert nids.dtype.kind == 'i'
+    assert list(nids) == [5301, 5302, 5303, 5305]
+    nose.tools.assert_raises(ValueError,
+                             tokio.connectors.slurm.expand_nodelist_nids,
+                             "nid00001,login")
+
 def test_compact_nodelist():
     """
     tokio.connectors.slurm.compact_nodelist() from set and string
@@ -135,24 +194,42 @@ def test_compact_nodelist():
     min_node = random.randint(1, 6000)
     max_node = min_node + random.randint(1, 10000)
     nodelist = set(["nid%05d" % i for i in range(min_node, max_node + 1)])
-    try:
-        nodelist_str_from_set = tokio.connectors.slurm.compact_nodelist(nodelist)
-        nodelist_str_from_str = tokio.connectors.slurm.compact_nodelist(','.join(list(nodelist)))
-        assert len(nodelist_str_from_set) > 0
-        assert len(nodelist_str_from_str) > 0
-        assert nodelist_str_from_set == nodelist_str_from_str
-    except OSError as error:
-        # scontrol is not available
-        raise nose.SkipTest(error)
+    nodelist_str_from_set = tokio.connectors.slurm.compact_nodelist(nodelist)
+    nodelist_str_from_str = tokio.connectors.slurm.compact_nodelist(','.join(list(nodelist)))
+    assert len(nodelist_str_from_set) > 0
+    assert len(nodelist_str_from_str) > 0
+    assert nodelist_str_from_set == nodelist_str_from_str
+    assert tokio.connectors.slurm.expand_nodelist(nodelist_str_from_set) == nodelist
 
+def test_compact_nodelist_scontrol():
+    """
+    tokio.connectors.slurm.compact_nodelist() matches scontrol show hostlist
+    """
+    cases = load_scontrol_transcript(tokiotest.SAMPLE_SLURM_HOSTLISTS_FILE)
+    num_tested = 0
+    for subcommand, node_string, output in cases:
+        if subcommand != 'hostlist':
+            continue
+        print("compacting %s" % node_string)
+        assert tokio.connectors.slurm.compact_nodelist(node_string) == output[0]
+        num_tested += 1
+    assert num_tested > 0
+
+def test_compact_nodelist_padding():
+    """
+    tokio.connectors.slurm.compact_nodelist() mixed zero padding
+    """
+    nodes = set(["nid01234", "nid01235", "nid12345", "n9", "n10", "login"])
+    compact = tokio.connectors.slurm.compact_nodelist(nodes)
+    print(compact)
+    assert compact == "login,n[9-10],nid[01234-01235,12345]"
+    assert tokio.connectors.slurm.expand_nodelist(compact) == nodes
 
-@tokiotest.needs_slurm
 @nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
 def test_slurm_serializer():
     """
     tokio.connectors.slurm.Slurm: serialize and deserialize
     """
-    tokiotest.check_slurm()
     # Read from a cache file
     slurm_data = tokio.connectors.slurm.Slurm(cache_file=tokiotest.SAMPLE_SLURM_CACHE_FILE)
     # Serialize the object, then re-read it and verify it
@@ -177,6 +254,15 @@ def test_get_job_nodes():
     slurm_data = tokio.connectors.slurm.Slurm(cache_file=tokiotest.SAMPLE_SLURM_CACHE_FILE)
     assert len(slurm_data.get_job_nodes()) == tokiotest.SAMPLE_SLURM_CACHE_NODECT
 
+def test_get_job_nids():
+    """
+    tokio.connectors.slurm.Slurm.get_job_nids()
+    """
+    slurm_data = tokio.connectors.slurm.Slurm(cache_file=tokiotest.SAMPLE_SLURM_CACHE_FILE)
+    nids = slurm_data.get_job_nids()
+    assert len(nids) == tokiotest.SAMPLE_SLURM_CACHE_NODECT
+    assert set(["nid%05d" % nid for nid in nids]) == slurm_data.get_job_nodes()
+
 def test_get_job_startend():
     """
     tokio.connectors.slurm.Slurm.get_job_startend()
@@ -185,6 +271,36 @@ def test_get_job_startend():
     start, end = slurm_data.get_job_startend()
     assert (end - start).total_seconds() < tokiotest.SAMPLE_SLURM_CACHE_MAX_WALLSECS
 
+def test_split_jobs():
+    """
+    tokio.connectors.slurm.split_jobs()
+    """
+    slurm_data = tokio.connectors.slurm.Slurm(cache_file=tokiotest.SAMPLE_SACCT_FILE)
+    jobs = tokio.connectors.slurm.split_jobs(slurm_data)
+    assert len(jobs) == tokiotest.SAMPLE_SACCT_JOBCT
+    assert sum([len(job) for job in jobs.values()]) == len(slurm_data)
+    for jobid, job in jobs.items():
+        assert job.jobid == jobid
+        assert job.get_job_ids() == [jobid]
+
+    # the sample job must be identical to the one retrieved on its own
+    reference = tokio.connectors.slurm.Slurm(cache_file=tokiotest.SAMPLE_SLURM_CACHE_FILE)
+    job = jobs[tokiotest.SAMPLE_DARSHAN_JOBID]
+    assert job.get_job_startend() == reference.get_job_startend()
+    assert job.get_job_nodes() == reference.get_job_nodes()
+
+@tokiotest.needs_slurm
+def test_load_jobs():
+    """
+    tokio.connectors.slurm.load_jobs()
+    """
+    tokiotest.check_slurm()
+    jobids = [SAMPLE_JOBID, SAMPLE_JOBID + 1, SAMPLE_JOBID + 2]
+    jobs = tokio.connectors.slurm.load_jobs(jobids, chunk_size=2)
+    for jobid, job in jobs.items():
+        assert jobid in [str(x) for x in jobids]
+        verify_slurm(job)
+
 @tokiotest.needs_slurm
 def test_jobs_running_between():
     """tokio.connectors.slurm.jobs_running_between()
@@ -3,6 +3,7 @@
 tokio.timeseries.TimeSeries methods
 """
 
+import time
 import datetime
 import random
 import pandas
@@ -225,6 +226,27 @@ def test_add_rows():
     assert timeseries.timestamps.shape[0] == timeseries.dataset.shape[0]
     assert (timeseries.timestamps.shape[0] - add_rows) == orig_row_count
 
+def test_add_trim_columns():
+    """
+    TimeSeries.add_columns() and TimeSeries.trim_columns()
+    """
+    timeseries = generate_timeseries()
+    orig_shape = timeseries.dataset.shape
+    orig_columns = list(timeseries.columns)
+
+    timeseries.add_columns(3)
+    assert timeseries.dataset.shape == (orig_shape[0], orig_shape[1] + 3)
+    assert (timeseries.dataset[:, orig_shape[1]:] == 0.0).all()
+    assert list(timeseries.columns) == orig_columns
+
+    timeseries.trim_columns(3)
+    assert timeseries.dataset.shape == orig_shape
+    assert list(timeseries.columns) == orig_columns
+
+    timeseries.trim_columns(1)
+    assert timeseries.dataset.shape == (orig_shape[0], orig_shape[1] - 1)
+    assert list(timeseries.columns) == orig_columns[:-1]
+
 def _test_insert_element(timeseries, timestamp, column_name, value, reducer, expect_failure):
     worked = timeseries.insert_element(
         timestamp=timestamp,
@@ -289,6 +311,36 @@ def test_insert_element_column_overflow():
 
     _test_insert_element(timeseries, START + DELTIM, 'f', 1.0, None, True)
 
+def test_insert_column():
+    """TimeSeries.insert_column()
+    """
+    kwargs = dict(dataset_name='test_dataset', start=START, end=END,
+                  timestep=DELTIM.total_seconds(), num_columns=3, column_names=['a', 'b'])
+    expected = tokio.timeseries.TimeSeries(**kwargs)
+    actual = tokio.timeseries.TimeSeries(**kwargs)
+
+    # include timestamps on both edges and beyond them, plus missing values
+    timestamps = [START - DELTIM, START, START + DELTIM, END - DELTIM, END, END + DELTIM]
+    values = [1.0, 2.0, numpy.nan, 4.0, 5.0, 6.0]
+    for align in 'l', 'r':
+        for column_name in 'b', 'c':
+            num_expected = 0
+            for timestamp, value in zip(timestamps, values):
+                if not numpy.isnan(value):
+                    num_expected += expected.insert_element(timestamp, column_name, value,
+                                                            align=align)
+            num_inserted = actual.insert_column(
+                timestamps=[int(time.mktime(x.timetuple())) for x in timestamps],
+                column_name=column_name,
+                values=values,
+                align=align)
+            print("Inserted %d values with align=%s" % (num_inserted, align))
+            assert num_inserted == num_expected
+
+        assert actual.columns == expected.columns
+        assert numpy.array_equal(actual.dataset, expected.dataset)
+        assert numpy.array_equal(numpy.signbit(actual.dataset), numpy.signbit(expected.dataset))
+
 def test_align():
     """TimeSeries.insert_element() and TimeSeries.convert_deltas()
     """
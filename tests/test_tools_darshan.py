@@ -1,9 +1,14 @@
 """Test tools.darshan interfaces
 """
+import os
 import sys
+import glob
+import time
+import sqlite3
 import nose.tools
 import datetime
 import tokio.tools.darshan
+import tokio.cli.index_darshanlogs
 import tokiotest
 
 DATETIME_START = datetime.datetime.strptime(tokiotest.SAMPLE_DARSHAN_START_TIME, "%Y-%m-%d %H:%M:%S")
@@ -209,3 +214,156 @@ def test_find_darshanlogs():
         test_func = tokiotest.needs_darshan(test['test_function'])
         test_func.description = "tools.darshan.find_darshanlogs(): " + test['descr']
         yield test_func, test
+
+def build_index_db(output_file, log_dir=tokiotest.SAMPLE_DARSHAN_LOG_DIR):
+    """Create a headers-only index database from the logs in log_dir
+
+    Uses only file names and paths to populate the headers table so that
+    darshan-parser is not required.
+    """
+    conn = sqlite3.connect(output_file)
+    tokio.cli.index_darshanlogs.create_mount_table(conn)
+    tokio.cli.index_darshanlogs.create_headers_table(conn)
+    tokio.cli.index_darshanlogs.create_summaries_table(conn)
+    tokio.cli.index_darshanlogs.create_rollups_table(conn)
+    tokio.cli.index_darshanlogs.create_indices(conn)
+    for log_path in glob.glob(os.path.join(log_dir, '*', '*', '*', '*.darshan')):
+        year, month, day = [int(x) for x in log_path.split(os.sep)[-4:-1]]
+        metadata = tokio.connectors.darshan.parse_filename_metadata(log_path)
+        start_time = time.mktime(datetime.datetime(year, month, day).timetuple()) \
+                     + metadata['start_second_in_day']
+        conn.execute("INSERT INTO headers (filename, jobid, username, exename, start_time) VALUES (?, ?, ?, ?, ?)",
+                     (os.path.basename(log_path), metadata['jobid'], metadata['username'],
+                      metadata['exename'], int(start_time)))
+    conn.commit()
+    conn.close()
+
+def wrap_find_darshanlogs_index(test_input, index_db):
+    """Compare index-backed and glob-backed find_darshanlogs
+    """
+    print("Running: %s" % test_input['descr'])
+    print("Test args: %s" % test_input['params'])
+    truth = tokio.tools.darshan.find_darshanlogs(**(test_input['params']))
+    results = tokio.tools.darshan.find_darshanlogs_index(
+        log_dir=tokio.config.CONFIG.get('darshan_log_dirs'),
+        index_db=index_db,
+        **(test_input['params']))
+    print("Glob found: %s" % truth)
+    print("Index found: %s" % results)
+    assert sorted(results) == sorted(truth)
+    assert (test_input['pass_criteria'])(results)
+
+@nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
+def test_find_darshanlogs_index():
+    """tools.darshan.find_darshanlogs_index()
+    """
+    tokiotest.TEMP_FILE.close()
+    build_index_db(tokiotest.TEMP_FILE.name)
+
+    for test in TEST_MATRIX:
+        if test['test_function'] == wrap_find_darshanlogs:
+            wrap_find_darshanlogs_index(test, tokiotest.TEMP_FILE.name)
+
+    # jobid-only lookups should not require a job start time from slurm
+    results = tokio.tools.darshan.find_darshanlogs(jobid=tokiotest.SAMPLE_DARSHAN_JOBID,
+                                                   index_db=tokiotest.TEMP_FILE.name)
+    print("Index found: %s" % results)
+    assert len(results) >= tokiotest.SAMPLE_DARSHAN_LOGS_PER_DIR
+    for result in results:
+        assert os.path.isfile(result)
+
+    # logs found in the index must be returned without globbing log_dir
+    conn = sqlite3.connect(tokiotest.TEMP_FILE.name)
+    conn.execute("UPDATE headers SET filename = 'renamed_' || filename")
+    conn.commit()
+    conn.close()
+    results = tokio.tools.darshan.find_darshanlogs(datetime_start=DATETIME_START,
+                                                   index_db=tokiotest.TEMP_FILE.name)
+    print("Index found: %s" % results)
+    assert results
+    for result in results:
+        assert os.path.basename(result).startswith('renamed_')
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_find_darshanlogs_partial_index():
+    """tools.darshan.find_darshanlogs() with only some days indexed
+    """
+    # index only the first of two days, renaming logs so that results found
+    # in the index can be told apart from those found by globbing
+    day1 = DATETIME_START
+    day2 = DATETIME_START + datetime.timedelta(days=1)
+    index_db = os.path.join(tokiotest.TEMP_DIR, 'darshanlogs_%Y-%m-%d.db')
+    build_index_db(day1.strftime(index_db))
+    conn = sqlite3.connect(day1.strftime(index_db))
+    conn.execute("DELETE FROM headers WHERE start_time >= ?",
+                 (int(time.mktime(day2.date().timetuple())),))
+    conn.execute("UPDATE headers SET filename = 'renamed_' || filename")
+    conn.commit()
+    conn.close()
+    assert not os.path.exists(day2.strftime(index_db))
+
+    results = tokio.tools.darshan.find_darshanlogs(datetime_start=day1,
+                                                   datetime_end=day2,
+                                                   index_db=index_db)
+    print("Found: %s" % results)
+    day1_dir = os.path.join(str(day1.year), str(day1.month), str(day1.day))
+    day2_dir = os.path.join(str(day2.year), str(day2.month), str(day2.day))
+    day1_logs = [x for x in results if day1_dir + os.sep in x]
+    day2_logs = [x for x in results if day2_dir + os.sep in x]
+
+    # the indexed day comes from the index, the other from globbing
+    assert len(day1_logs) >= tokiotest.SAMPLE_DARSHAN_LOGS_PER_DIR
+    for result in day1_logs:
+        assert os.path.basename(result).startswith('renamed_')
+    assert len(day2_logs) >= tokiotest.SAMPLE_DARSHAN_LOGS_PER_DIR
+    for result in day2_logs:
+        assert os.path.isfile(result)
+    assert len(results) == len(day1_logs) + len(day2_logs)
+
+@nose.tools.with_setup(tokiotest.create_tempdir, tokiotest.delete_tempdir)
+def test_find_darshanlogs_undated_index():
+    """tools.darshan.find_darshanlogs() with an undated index behind the logs
+    """
+    day1 = DATETIME_START
+    day2 = DATETIME_START + datetime.timedelta(days=1)
+    day1_dir = os.path.join(str(day1.year), str(day1.month), str(day1.day))
+    day2_dir = os.path.join(str(day2.year), str(day2.month), str(day2.day))
+    truth = tokio.tools.darshan.find_darshanlogs(datetime_start=day1, datetime_end=day2)
+    print("Glob found: %s" % truth)
+    assert [x for x in truth if day1_dir + os.sep in x]
+    assert [x for x in truth if day2_dir + os.sep in x]
+
+    # an index that has not yet ingested the second day's logs
+    index_db = os.path.join(tokiotest.TEMP_DIR, 'darshanlogs.db')
+    build_index_db(index_db)
+    conn = sqlite3.connect(index_db)
+    conn.execute("DELETE FROM headers WHERE start_time >= ?",
+                 (int(time.mktime(day2.date().timetuple())),))
+    conn.commit()
+    conn.close()
+    results = tokio.tools.darshan.find_darshanlogs(datetime_start=day1,
+                                                   datetime_end=day2,
+                                                   index_db=index_db)
+    print("Found: %s" % results)
+    assert sorted(results) == sorted(truth)
+
+    # days before that of the most recent indexed log come only from the index,
+    # but logs from that day may not all be indexed yet
+    os.unlink(index_db)
+    build_index_db(index_db)
+    conn = sqlite3.connect(index_db)
+    conn.execute("UPDATE headers SET filename = 'renamed_' || filename")
+    conn.commit()
+    conn.close()
+    results = tokio.tools.darshan.find_darshanlogs(datetime_start=day1,
+                                                   datetime_end=day2,
+                                                   index_db=index_db)
+    print("Found: %s" % results)
+    day1_logs = [x for x in results if day1_dir + os.sep in x]
+    day2_logs = [x for x in results if day2_dir + os.sep in x]
+    assert day1_logs
+    for result in day1_logs:
+        assert os.path.basename(result).startswith('renamed_')
+    assert [x for x in day2_logs if os.path.basename(x).startswith('renamed_')]
+    assert sorted([x for x in day2_logs if not os.path.basename(x).startswith('renamed_')]) \
+        == sorted([x for x in truth if day2_dir + os.sep in x])
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Test the job index used to answer interval queries
+"""
+
+import random
+import nose
+import numpy
+import tokiotest
+import tokio.connectors.nersc_jobsdb
+import tokio.tools.jobindex
+
+# keep it deterministic
+random.seed(0)
+
+def generate_windows(num_windows):
+    """
+    Generate random windows spanning the sample jobs database
+    """
+    windows = []
+    for _ in range(num_windows):
+        start = random.randint(tokiotest.SAMPLE_NERSCJOBSDB_START - 3600,
+                               tokiotest.SAMPLE_NERSCJOBSDB_END + 3600)
+        windows.append((start, start + random.choice([0, 1, 3600, random.randint(0, 86400)])))
+    return windows
+
+def load_jobsdb_index():
+    """
+    Build a JobIndex and NerscJobsDb from the sample jobs database
+    """
+    nerscjobsdb = tokio.connectors.nersc_jobsdb.NerscJobsDb(
+        cache_file=tokiotest.SAMPLE_NERSCJOBSDB_FILE)
+    job_index = tokio.tools.jobindex.JobIndex.from_jobsdb(
+        tokiotest.SAMPLE_NERSCJOBSDB_START - 86400,
+        tokiotest.SAMPLE_NERSCJOBSDB_END + 86400,
+        tokiotest.SAMPLE_NERSCJOBSDB_HOST,
+        nerscjobsdb=nerscjobsdb)
+    return job_index, nerscjobsdb
+
+def verify_concurrent_jobs(job_index, nerscjobsdb, windows):
+    """
+    Ensure that a JobIndex and NerscJobsDb agree on a list of windows
+    """
+    totals = job_index.get_concurrent_jobs([x[0] for x in windows],
+                                           [x[1] for x in windows])
+    for index, (start, end) in enumerate(windows):
+        expected = nerscjobsdb.get_concurrent_jobs(start, end, tokiotest.SAMPLE_NERSCJOBSDB_HOST)
+        print("%d-%d: expected %s" % (start, end, expected))
+        assert totals['numjobs'][index] == expected['numjobs']
+        assert totals['numnodes'][index] == expected['numnodes']
+        assert totals['nodehrs'][index] == expected['nodehrs']
+
+def test_from_jobsdb():
+    """
+    tools.jobindex.JobIndex.from_jobsdb() matches NerscJobsDb
+    """
+    job_index, nerscjobsdb = load_jobsdb_index()
+    assert len(job_index) == tokiotest.SAMPLE_SACCT_JOBCT
+    verify_concurrent_jobs(job_index, nerscjobsdb, generate_windows(100))
+
+def test_from_sacct():
+    """
+    tools.jobindex.JobIndex.from_sacct() matches NerscJobsDb
+    """
+    job_index = tokio.tools.jobindex.JobIndex.from_sacct(tokiotest.SAMPLE_SACCT_FILE)
+    assert len(job_index) == tokiotest.SAMPLE_SACCT_JOBCT
+    _, nerscjobsdb = load_jobsdb_index()
+    verify_concurrent_jobs(job_index, nerscjobsdb, generate_windows(100))
+
+def test_get_concurrent_jobs_scalar():
+    """
+    tools.jobindex.JobIndex.get_concurrent_jobs() with a single window
+    """
+    job_index, nerscjobsdb = load_jobsdb_index()
+    totals = job_index.get_concurrent_jobs(tokiotest.SAMPLE_NERSCJOBSDB_START,
+                                           tokiotest.SAMPLE_NERSCJOBSDB_END)
+    expected = nerscjobsdb.get_concurrent_jobs(tokiotest.SAMPLE_NERSCJOBSDB_START,
+                                               tokiotest.SAMPLE_NERSCJOBSDB_END,
+                                               tokiotest.SAMPLE_NERSCJOBSDB_HOST)
+    assert totals == expected
+    assert isinstance(totals['numjobs'], int)
+    assert isinstance(totals['nodehrs'], float)
+
+def test_get_running_jobs():
+    """
+    tools.jobindex.JobIndex.get_running_jobs()
+    """
+    job_index, nerscjobsdb = load_jobsdb_index()
+    for start, end in generate_windows(20):
+        jobids = job_index.get_running_jobs(start, end)
+        expected = nerscjobsdb.get_jobs_running_between(start, end,
+                                                        tokiotest.SAMPLE_NERSCJOBSDB_HOST)
+        assert sorted(jobids) == sorted([row[0] for row in expected])
+
+def test_empty_index():
+    """
+    tools.jobindex.JobIndex with no jobs
+    """
+    job_index = tokio.tools.jobindex.JobIndex()
+    assert len(job_index) == 0
+    totals = job_index.get_concurrent_jobs([0, 100], [50, 200])
+    assert (totals['numjobs'] == 0).all()
+    assert (totals['numnodes'] == 0).all()
+    assert (totals['nodehrs'] == 0.0).all()
+    assert len(job_index.get_running_jobs(0, 100)) == 0
+
+@nose.tools.with_setup(tokiotest.create_tempfile, tokiotest.delete_tempfile)
+def test_save_cache():
+    """
+    tools.jobindex.JobIndex.save_cache() and reload
+    """
+    job_index, _ = load_jobsdb_index()
+    job_index.save_cache(tokiotest.TEMP_FILE.name)
+    cached_index = tokio.tools.jobindex.JobIndex(cache_file=tokiotest.TEMP_FILE.name)
+    assert len(cached_index) == len(job_index)
+    assert (cached_index.jobids == job_index.jobids).all()
+    windows = numpy.array(generate_windows(50))
+    totals = job_index.get_concurrent_jobs(windows[:, 0], windows[:, 1])
+    cached_totals = cached_index.get_concurrent_jobs(windows[:, 0], windows[:, 1])
+    for key, values in totals.items():
+        assert (values == cached_totals[key]).all()
@@ -1,5 +1,7 @@
 """Test jobinfo and all supported backends
 """
+import nose
+import tokio.connectors.slurm
 import tokio.tools.jobinfo
 import tokiotest
 
@@ -39,7 +41,25 @@ def test_get_job_nodes_slurm():
     print(type(jobnodes), jobnodes)
     assert jobnodes
 
+@nose.tools.with_setup(teardown=tokio.tools.jobinfo.clear_cache)
+def test_cache_jobs():
+    """tools.jobinfo.cache_jobs, from cached sacct output
+    """
+    tokio.config.CONFIG["jobinfo_jobid_providers"] = ["slurm"]
+    tokio.config.CONFIG["jobinfo_jobnodes_providers"] = ["slurm"]
+    tokio.tools.jobinfo.clear_cache()
+    num_jobs = tokio.tools.jobinfo.cache_jobs(cache_file=tokiotest.SAMPLE_SACCT_FILE)
+    assert num_jobs == tokiotest.SAMPLE_SACCT_JOBCT
+
+    # these would invoke sacct if the cache were not consulted
+    reference = tokio.connectors.slurm.Slurm(cache_file=tokiotest.SAMPLE_SLURM_CACHE_FILE)
+    start, end = tokio.tools.jobinfo.get_job_startend(jobid=tokiotest.SAMPLE_DARSHAN_JOBID)
+    assert (start, end) == reference.get_job_startend()
+    jobnodes = tokio.tools.jobinfo.get_job_nodes(jobid=tokiotest.SAMPLE_DARSHAN_JOBID)
+    assert jobnodes == reference.get_job_nodes()
+
 if __name__ == "__main__":
     test_get_job_startend_slurm()
     test_get_job_startend_nerscjobsdb()
     test_get_job_nodes_slurm()
+    test_cache_jobs()
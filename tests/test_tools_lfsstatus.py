@@ -3,6 +3,7 @@
 Test the lfsstatus tool API
 """
 
+import os
 import copy
 import json
 import datetime
@@ -12,6 +13,8 @@ import tokiotest
 from tokiotest import SAMPLE_OSTMAP_FILE, SAMPLE_OSTFULLNESS_FILE, SAMPLE_DARSHAN_SONEXION_ID
 import tokio
 import tokio.tools.lfsstatus as lfsstatus
+import tokio.connectors.nersc_lfsstate
+import tokio.cli.archive_lfsstatus
 
 # These should correspond to the first and last BEGIN in the sample ost-map.txt
 # and ost-fullness.txt files.  If you change the contents of those files, you
@@ -215,3 +218,49 @@ def test_get_fullness_fallthru():
     tokio.config.CONFIG["lfsstatus_fullness_files"] = ["something invalid"]
     tokio.config.CONFIG["hdf5_files"] = ["something invalid"]
     wrap_get_fullness(SAMPLE_OSTFULLNESS_HALFWAY, cache_file=None)
+
+def archive_sample_hdf5():
+    """Archive the sample lfsstatus inputs into an HDF5 file and use it
+    """
+    save_config()
+    tokiotest.create_tempdir()
+    output_file = os.path.join(tokiotest.TEMP_DIR, 'lfsstatus.hdf5')
+    query_start = SAMPLE_OSTFULLNESS_START.replace(hour=0, minute=0, second=0)
+    tokio.cli.archive_lfsstatus.main([
+        '--fullness', SAMPLE_OSTFULLNESS_FILE,
+        '--map', SAMPLE_OSTMAP_FILE,
+        '--timestep', '60',
+        '--output', output_file,
+        SAMPLE_DARSHAN_SONEXION_ID,
+        query_start.strftime(tokio.cli.archive_lfsstatus.DATE_FMT),
+        (query_start + datetime.timedelta(days=1)).strftime(tokio.cli.archive_lfsstatus.DATE_FMT)])
+    tokio.config.CONFIG['hdf5_files'] = {SAMPLE_DARSHAN_SONEXION_ID: output_file}
+
+def delete_sample_hdf5():
+    """Remove the archived sample and restore the config
+    """
+    tokiotest.delete_tempdir()
+    restore_config()
+
+@nose.tools.with_setup(archive_sample_hdf5, delete_sample_hdf5)
+def test_hdf5_matches_lfsstate():
+    """tools.lfsstatus: archived HDF5 matches nersc_lfsstate
+    """
+    for metric, cache_file in (('fullness', SAMPLE_OSTFULLNESS_FILE), ('failures', SAMPLE_OSTMAP_FILE)):
+        tokio.config.CONFIG["lfsstatus_%s_providers" % metric] = ["hdf5"]
+        timestamps = tokio.connectors.nersc_lfsstate.get_index(cache_file).timestamps
+        for timestamp in timestamps[1:-2:7]:
+            # one second after a snapshot, both sources should report that snapshot
+            datetime_target = datetime.datetime.fromtimestamp(timestamp + 1)
+            if metric == 'fullness':
+                result = lfsstatus.get_fullness(SAMPLE_DARSHAN_SONEXION_ID, datetime_target)
+                verify_fullness(result)
+            else:
+                result = lfsstatus.get_failures(SAMPLE_DARSHAN_SONEXION_ID, datetime_target)
+                verify_failures(result)
+            expected = lfsstatus.get_lfsstate(SAMPLE_DARSHAN_SONEXION_ID, datetime_target, metric,
+                                              cache_file=cache_file)
+            for key, value in expected.items():
+                if not key.endswith('_timestamp'):
+                    assert result[key] == value
+            assert result['ost_actual_timestamp'] <= timestamp < result['ost_actual_timestamp'] + 60
@@ -4,15 +4,19 @@ Useful helpers that are used throughout the TOKIO test suite
 """
 
 import os
+import re
 import sys
+import time
 import gzip
 import errno
 import shutil
 import tarfile
 import tempfile
+import threading
 import subprocess
 import datetime
 import numpy # for compare_timeseries
+import dateutil.parser # for FakeEsService
 import h5py
 
 try:
@@ -156,6 +160,9 @@ SAMPLE_SLURM_CACHE_KEYS = ['start', 'end', 'jobidraw']
 SAMPLE_SLURM_CACHE_JOBCT = 1
 SAMPLE_SLURM_CACHE_NODECT = 128
 SAMPLE_SLURM_CACHE_MAX_WALLSECS = 3600
+SAMPLE_SLURM_HOSTLISTS_FILE = os.path.join(INPUT_DIR, 'sample_hostlists.txt')
+SAMPLE_SACCT_FILE = os.path.join(INPUT_DIR, 'sample_sacct.txt')
+SAMPLE_SACCT_JOBCT = 485
 
 SAMPLE_NERSCISDCT_FILE = os.path.join(INPUT_DIR, 'sample_nersc_isdct.tgz')
 # SAMPLE_NERSCISDCT_PREV_FILE is used to verify the .diff() method.  It should
@@ -281,6 +288,149 @@ class CaptureOutputs(object):
         sys.stdout = self.actual_stdout
         sys.stderr = self.actual_stderr
 
+class FakeEsService(object):
+    """Stands in for elasticsearch.Elasticsearch
+
+    Serves a fixed list of documents through the search/scroll/clear_scroll
+    interface used by tokio.connectors.es.  Pages are ``size`` documents long,
+    the ``slice`` clause of sliced scroll queries is honored, and each request
+    can be delayed by ``latency`` seconds to emulate round trips to a remote
+    service.  Safe to use from multiple threads.
+
+    Queries built from tokio.connectors.es.BASE_QUERY are applied to each
+    document's ``_source``, and the terms, date_histogram, and avg
+    aggregations built by tokio.connectors.es.build_histogram_aggregation()
+    are supported.
+    """
+    def __init__(self, documents, latency=0.0):
+        self.documents = documents
+        self.latency = latency
+        self.contexts = {}
+        self.cleared = []
+        self.num_requests = 0
+        self._next_scroll_id = 0
+        self._lock = threading.Lock()
+
+    def search(self, body=None, size=10000, **kwargs):
+        """Open a scroll context and return its first page"""
+        documents = self.documents
+        if body and 'query' in body:
+            must = body['query']['constant_score']['filter']['bool']['must']
+            documents = [x for x in documents if all(_es_match(x['_source'], y) for y in must)]
+        if body and 'aggs' in body:
+            return {'hits': {'hits': []}, 'aggregations': _es_aggregate(documents, body['aggs'])}
+
+        slice_clause = body.get('slice') if body else None
+        if slice_clause:
+            documents = documents[slice_clause['id']::slice_clause['max']]
+        with self._lock:
+            scroll_id = str(self._next_scroll_id)
+            self._next_scroll_id += 1
+            self.contexts[scroll_id] = {'documents': documents, 'offset': 0, 'size': size}
+        return self._next_page(scroll_id)
+
+    def scroll(self, scroll_id, **kwargs):
+        """Return the next page of an open scroll context"""
+        if scroll_id not in self.contexts:
+            raise KeyError("no such scroll context %s" % scroll_id)
+        return self._next_page(scroll_id)
+
+    def clear_scroll(self, scroll_id):
+        """Release a scroll context"""
+        with self._lock:
+            self.contexts.pop(scroll_id, None)
+            self.cleared.append(scroll_id)
+
+    def _next_page(self, scroll_id):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.num_requests += 1
+            context = self.contexts[scroll_id]
+            offset = context['offset']
+            context['offset'] += context['size']
+        return {
+            '_scroll_id': scroll_id,
+            'hits': {
+                'hits': context['documents'][offset:offset + context['size']],
+            }
+        }
+
+def _es_value(source, field):
+    """Return a _source value, converting timestamps to epoch seconds"""
+    value = source.get(field)
+    if field == '@timestamp' and isinstance(value, str):
+        value = dateutil.parser.parse(value).timestamp()
+    return value
+
+def _es_match(source, clause):
+    """Apply a single term, prefix, regexp, or range query to a _source"""
+    (kind, spec), = clause.items()
+    (field, criteria), = spec.items()
+    value = _es_value(source, field)
+    if value is None:
+        return False
+    if kind == 'term':
+        return value == criteria
+    elif kind == 'prefix':
+        return str(value).startswith(criteria)
+    elif kind == 'regexp':
+        return re.match('(?:%s)$' % criteria, str(value)) is not None
+    elif kind == 'range':
+        if isinstance(value, str):
+            value = dateutil.parser.parse(value).timestamp()
+        return ('gte' not in criteria or value >= criteria['gte']) \
+            and ('gt' not in criteria or value > criteria['gt']) \
+            and ('lte' not in criteria or value <= criteria['lte']) \
+            and ('lt' not in criteria or value < criteria['lt'])
+    raise NotImplementedError("FakeEsService does not support %s queries" % kind)
+
+def _es_aggregate(documents, aggs):
+    """Apply nested terms, date_histogram, and avg aggregations to documents"""
+    result = {}
+    for name, agg in aggs.items():
+        if 'avg' in agg:
+            values = [_es_value(x['_source'], agg['avg']['field']) for x in documents]
+            values = [x for x in values if x is not None]
+            result[name] = {'value': sum(values) / len(values) if values else None}
+            continue
+
+        groups = {}
+        if 'terms' in agg:
+            for document in documents:
+                key = _es_value(document['_source'], agg['terms']['field'])
+                if key is not None:
+                    groups.setdefault(key, []).append(document)
+            keys = sorted(groups, key=lambda x: len(groups[x]), reverse=True)[:agg['terms']['size']]
+        elif 'date_histogram' in agg:
+            interval = int(agg['date_histogram']['interval'].rstrip('s'))
+            for document in documents:
+                epoch = _es_value(document['_source'], agg['date_histogram']['field'])
+                groups.setdefault(int(epoch // interval * interval * 1000), []).append(document)
+            keys = sorted(groups)
+        else:
+            raise NotImplementedError("FakeEsService does not support %s" % list(agg.keys()))
+
+        buckets = []
+        for key in keys:
+            bucket = _es_aggregate(groups[key], agg.get('aggs', {}))
+            bucket.update({'key': key, 'doc_count': len(groups[key])})
+            buckets.append(bucket)
+        result[name] = {'buckets': buckets}
+    return result
+
+def make_es_documents(num_docs, **source):
+    """Create documents to be served by FakeEsService
+
+    Args:
+        num_docs (int): Number of documents to create
+        source: Additional fields to include in each document's _source
+    """
+    documents = []
+    for doc_id in range(num_docs):
+        documents.append({'_id': str(doc_id), '_source': dict(value=doc_id, **source)})
+    return documents
+
 def run_bin(module, argv, also_error=False):
     """Run a standalone pytokio script directly and return its stdout
     
@@ -3,28 +3,34 @@ Dumps a lot of data out of ElasticSearch using the Python API and native
 scrolling support.  Output either as native json from ElasticSearch or as
 serialized TOKIO TimeSeries (TTS) HDF5 files.
 
+With ``--aggregate``, Elasticsearch averages documents into buckets of one
+timestep per host and only these buckets are retrieved.  This transfers far
+less data than retrieving every document; retrieving every document remains
+the default so the two can be compared.
+
 Can use ``PYTOKIO_ES_USER`` and ``PYTOKIO_ES_PASSWORD`` environment variables to
 pass on to the Elasticsearch connector for http authentication.
 """
 
 import os
 import sys
-import gzip
 import json
 import time
+import queue
 import datetime
 import argparse
 import warnings
-import mimetypes
+import itertools
+import threading
 import collections
 import multiprocessing
 
 import dateutil.parser # because of how ElasticSearch returns time data
-import dateutil.tz
 import numpy
 
 import tokio.debug
 import tokio.timeseries
+import tokio.connectors.es
 import tokio.connectors.collectd_es
 import tokio.connectors.hdf5
 
@@ -52,13 +58,49 @@ DATASETS = collections.OrderedDict([
 
 DATE_FMT = "%Y-%m-%dT%H:%M:%S"
 
-# This is necessary because multiprocessing needs to be able to serialize the
-# reducer that is passed back, but lambda functions are not pickleable.  So we
-# pass back a string that maps to a lambda.
-LAMBDA_MAPS = {
-    'sum': lambda x, y: x + y,
+# seconds between progress reports while inserting pages
+PROGRESS_INTERVAL = 10.0
+
+CPU_DATASETS = set(['dataservers/cpuload', 'dataservers/cpuuser', 'dataservers/cpusys'])
+
+# Elements of these datasets are summed across all inserts rather than replaced
+# by the last insert.  CPU datasets are later divided by their metadatasets.
+SUM_DATASETS = CPU_DATASETS | set(['dataservers/_num_cpuload',
+                                   'dataservers/_num_cpuuser',
+                                   'dataservers/_num_cpusys'])
+
+DISK_DATASETS = {
+    'disk_octets': ('datatargets/readrates', 'datatargets/writerates'),
+    'disk_ops': ('datatargets/readoprates', 'datatargets/writeoprates'),
 }
 
+CPU_TYPE_DATASETS = {
+    'idle': 'dataservers/cpuload',
+    'user': 'dataservers/cpuuser',
+    'system': 'dataservers/cpusys',
+}
+
+MEMORY_DATASETS = {
+    'cached': 'dataservers/memcached',
+    'buffered': 'dataservers/membuffered',
+    'free': 'dataservers/memfree',
+    'used': 'dataservers/memused',
+    'slab_recl': 'dataservers/memslab',
+    'slab_unrecl': 'dataservers/memslab_unrecl',
+}
+
+# Elements to be inserted into a single dataset, stored as parallel arrays so
+# that they can be passed between processes and inserted without per-element
+# Python overhead:
+#
+#   * timestamps: seconds since the epoch (numpy.float64)
+#   * columns: index into column_names for each element (numpy.int64)
+#   * column_names: unique column names (list of str)
+#   * values: value of each element (numpy.float64)
+#
+ColumnarInserts = collections.namedtuple('ColumnarInserts',
+                                         ['timestamps', 'columns', 'column_names', 'values'])
+
 def metadataset2dataset_key(metadataset_name):
     """Return the dataset name corresponding to a metadataset name
 
@@ -88,19 +130,59 @@ def dataset2metadataset_key(dataset_key):
     """
     return dataset_key.replace('/', '/_num_', 1)
 
-def process_page(page):
+def parse_timestamps(timestamps):
+    """Convert Elasticsearch timestamps into seconds since the epoch
+
+    Args:
+        timestamps (list of str): ISO 8601 timestamps as stored in
+            Elasticsearch.  Timestamps without a timezone are treated as local
+            time.
+
+    Returns:
+        numpy.ndarray: Seconds since the epoch as float64
     """
-    Go through a list of docs and insert their data into a numpy matrix.  In
-    the future this should be a flush function attached to the CollectdEs
-    connector class.
+    if all(timestamp.endswith('Z') for timestamp in timestamps):
+        # UTC timestamps, which is what collectd generates, can be parsed by numpy
+        utc = numpy.array([timestamp[:-1] for timestamp in timestamps], dtype='datetime64[us]')
+        return utc.astype(numpy.int64) / 1.0e6
+    return numpy.array([dateutil.parser.parse(timestamp).timestamp() for timestamp in timestamps],
+                       dtype=numpy.float64)
+
+def to_columnar(timestamps, column_names, values):
+    """Convert parallel lists of elements into a ColumnarInserts
 
     Args:
-        page (dict): A single page of output from an Elasticsearch scroll
-            query.  Should contain a ``hits`` key.
+        timestamps (numpy.ndarray): seconds since the epoch for each element
+        column_names (list of str): column name for each element
+        values (list): value for each element
+
+    Returns:
+        ColumnarInserts: The same elements as compact arrays
     """
+    unique_names, columns = numpy.unique(numpy.array(column_names, dtype=str), return_inverse=True)
+    return ColumnarInserts(timestamps=timestamps,
+                           columns=columns.astype(numpy.int64).reshape(-1),
+                           column_names=[str(x) for x in unique_names],
+                           values=numpy.array(values, dtype=numpy.float64))
 
+def process_page(page):
+    """Decode a page of documents into columns of elements to insert
+
+    Each document is reduced to a timestamp, column name, and value for each
+    dataset it updates.  These are accumulated per dataset and returned as
+    arrays so that they are cheap to pass between processes and can be inserted
+    in bulk by update_datasets().
+
+    Args:
+        page (list of dict): A single page of output from an Elasticsearch
+            scroll query, filtered by
+            :attr:`tokio.connectors.collectd_es.CollectdEs.filter_function`
+
+    Returns:
+        dict: Keyed by dataset name, values are :class:`ColumnarInserts`
+    """
     _time0 = time.time()
-    inserts = []
+    elements = collections.defaultdict(lambda: ([], [], []))
     for doc in page:
         # basic validity checking
         if '_source' not in doc:
@@ -108,118 +190,178 @@ def process_page(page):
             print(json.dumps(doc, indent=4))
             continue
         source = doc['_source']
-
-        # check to see if this is from plugin:disk
-        if source['plugin'] == 'disk':
-            # We jump through these hoops because most of TOKIO uses tz-unaware
-            # local datetimes and we don't want to inject a bunch of dateutil
-            # dependencies elsewhere
-            # timezone-aware string
-            # `-> tz-aware utc datetime
-            #     `-> local datetime
-            #         `-> tz-unaware local datetime
-            timestamp = dateutil.parser.parse(source['@timestamp'])\
-                                              .astimezone(dateutil.tz.tzlocal())\
-                                              .replace(tzinfo=None)
+        plugin = source.get('plugin')
+
+        if plugin == 'disk':
+            dataset_names = DISK_DATASETS.get(source.get('collectd_type'))
+            val1 = source.get('read')
+            val2 = source.get('write')
+            if dataset_names is None or val1 is None or val2 is None:
+                continue
             col_name = "%s:%s" % (source['hostname'], source['plugin_instance'])
-
-            if source['collectd_type'] == 'disk_octets':
-                val1 = source.get('read')
-                val2 = source.get('write')
-                if val1 is not None and val2 is not None:
-                    inserts.append(('datatargets/readrates', timestamp, col_name, val1))
-                    inserts.append(('datatargets/writerates', timestamp, col_name, val2))
-            elif source['collectd_type'] == 'disk_ops':
-                val1 = source.get('read')
-                val2 = source.get('write')
-                if val1 is not None and val2 is not None:
-                    inserts.append(('datatargets/readoprates', timestamp, col_name, val1))
-                    inserts.append(('datatargets/writeoprates', timestamp, col_name, val2))
-        elif source['plugin'] == 'cpu' and 'value' in source:
-            timestamp = dateutil.parser.parse(source['@timestamp'])\
-                                              .astimezone(dateutil.tz.tzlocal())\
-                                              .replace(tzinfo=None)
-            val1 = source.get('value')
-            if source['type_instance'] == 'idle':
+            for dataset_name, value in zip(dataset_names, (val1, val2)):
+                timestamps, col_names, values = elements[dataset_name]
+                timestamps.append(source['@timestamp'])
+                col_names.append(col_name)
+                values.append(value)
+        elif plugin == 'cpu' and source.get('value') is not None:
+            dataset_name = CPU_TYPE_DATASETS.get(source.get('type_instance'))
+            if dataset_name is None:
+                continue
+            value = source['value']
+            if dataset_name == 'dataservers/cpuload':
                 # note that we store (100 - idle) as load
-                inserts.append(('dataservers/cpuload', timestamp, source['hostname'],
-                                100.0 - val1, 'sum'))
-                inserts.append(('dataservers/_num_cpuload', timestamp, source['hostname'],
-                                1, 'sum'))
-            elif source['type_instance'] == 'user':
-                inserts.append(('dataservers/cpuuser', timestamp, source['hostname'],
-                                val1, 'sum'))
-                inserts.append(('dataservers/_num_cpuuser', timestamp, source['hostname'],
-                                1, 'sum'))
-            elif source['type_instance'] == 'system':
-                inserts.append(('dataservers/cpusys', timestamp, source['hostname'],
-                                val1, 'sum'))
-                inserts.append(('dataservers/_num_cpusys', timestamp, source['hostname'],
-                                1, 'sum'))
-        elif source['plugin'] == 'memory' and 'value' in source:
-            timestamp = dateutil.parser.parse(source['@timestamp'])\
-                                              .astimezone(dateutil.tz.tzlocal())\
-                                              .replace(tzinfo=None)
-            val1 = source.get('value')
-            if source['type_instance'] == 'cached':
-                inserts.append(('dataservers/memcached', timestamp, source['hostname'], val1))
-            elif source['type_instance'] == 'buffered':
-                inserts.append(('dataservers/membuffered', timestamp, source['hostname'], val1))
-            elif source['type_instance'] == 'free':
-                inserts.append(('dataservers/memfree', timestamp, source['hostname'], val1))
-            elif source['type_instance'] == 'used':
-                inserts.append(('dataservers/memused', timestamp, source['hostname'], val1))
-            elif source['type_instance'] == 'slab_recl':
-                inserts.append(('dataservers/memslab', timestamp, source['hostname'], val1))
-            elif source['type_instance'] == 'slab_unrecl':
-                inserts.append(('dataservers/memslab_unrecl', timestamp, source['hostname'], val1))
-
-    _timef = time.time()
+                value = 100.0 - value
+            # also count the CPUs contributing to each element so that the sum
+            # can be normalized by normalize_cpu_elements()
+            for dataset_name, value in ((dataset_name, value),
+                                        (dataset2metadataset_key(dataset_name), 1)):
+                timestamps, col_names, values = elements[dataset_name]
+                timestamps.append(source['@timestamp'])
+                col_names.append(source['hostname'])
+                values.append(value)
+        elif plugin == 'memory' and source.get('value') is not None:
+            dataset_name = MEMORY_DATASETS.get(source.get('type_instance'))
+            if dataset_name is None:
+                continue
+            timestamps, col_names, values = elements[dataset_name]
+            timestamps.append(source['@timestamp'])
+            col_names.append(source['hostname'])
+            values.append(source['value'])
+
+    inserts = {}
+    for dataset_name, (timestamps, col_names, values) in elements.items():
+        inserts[dataset_name] = to_columnar(parse_timestamps(timestamps), col_names, values)
+
     if tokio.debug.DEBUG:
-        print("Extracted %d inserts in %.4f seconds" % (len(inserts), _timef - _time0))
-        per_dataset = {}
-        for insert in inserts:
-            if insert[0] not in per_dataset:
-                per_dataset[insert[0]] = 0
-            per_dataset[insert[0]] += 1
-        for dataset_name in sorted(per_dataset.keys()):
-            print("  %6d entries for %s" % (per_dataset[dataset_name], dataset_name))
+        print("Extracted %d inserts in %.4f seconds" % (count_inserts(inserts), time.time() - _time0))
+        for dataset_name in sorted(inserts.keys()):
+            print("  %6d entries for %s" % (len(inserts[dataset_name].values), dataset_name))
     return inserts
 
-def update_datasets(inserts, datasets):
-    """Insert list of tuples into a dataset
+def process_buckets(page):
+    """Decode a page of aggregation buckets into columns of elements to insert
 
-    Insert a list of tuples into a :class:`tokio.timeseries.TimeSeries` object serially
+    Counterpart to process_page() for the buckets returned by
+    :meth:`tokio.connectors.collectd_es.CollectdEs.iter_aggregations`.  Each
+    bucket already holds the average of all documents for one host (and plugin
+    instance) in one timestep, so it becomes a single element.  CPU averages
+    are converted back to a sum over cores and a core count so that they are
+    normalized exactly as the elements from process_page() are.
 
     Args:
-        inserts (list of tuples): List of tuples which should be serially
-            inserted into a dataset.  The tuples can be of the form
-
-                * dataset name (str)
-                * timestamp (:class:`datetime.datetime`)
-                * column name (str)
-                * value
-
-            or
-
-                * dataset name (str)
-                * timestamp (:class:`datetime.datetime`)
-                * column name (str)
-                * value
-                * reducer name (str)
-
-            where
-
-                * `dataset name` is the key used to retrieve a target
-                  :class:`tokio.timeseries.TimeSeries` object from the `datasets`
-                  argument
-                * `timestamp` and `column name` reference the element to be udpated
-                * value is the new value to insert into the given (`timestamp`,
-                  `column name`) location within `dataset`.
-                * `reducer name` is None (to just replace whatever value
-                  currently exists in the (`timestamp`, `column name`) location,
-                  or 'sum' to add `value` to the existing value.
+        page (list of dict): Buckets as returned by
+            :func:`tokio.connectors.es.flatten_buckets`
 
+    Returns:
+        dict: Keyed by dataset name, values are :class:`ColumnarInserts`
+    """
+    _time0 = time.time()
+    elements = collections.defaultdict(lambda: ([], [], []))
+    for bucket in page:
+        # bucket keys are epoch milliseconds
+        timestamp = bucket['@timestamp'] / 1000.0
+        if bucket['plugin'] == 'disk':
+            dataset_names = DISK_DATASETS.get(bucket['collectd_type'])
+            val1 = bucket.get('read')
+            val2 = bucket.get('write')
+            if dataset_names is None or val1 is None or val2 is None:
+                continue
+            col_name = "%s:%s" % (bucket['hostname'], bucket['plugin_instance'])
+            updates = zip(dataset_names, (val1, val2))
+        elif bucket['plugin'] == 'cpu' and bucket.get('value') is not None:
+            dataset_name = CPU_TYPE_DATASETS.get(bucket['type_instance'])
+            if dataset_name is None:
+                continue
+            col_name = bucket['hostname']
+            num_cpus = bucket['doc_count']
+            if dataset_name == 'dataservers/cpuload':
+                total = (100.0 - bucket['value']) * num_cpus
+            else:
+                total = bucket['value'] * num_cpus
+            updates = ((dataset_name, total), (dataset2metadataset_key(dataset_name), num_cpus))
+        elif bucket['plugin'] == 'memory' and bucket.get('value') is not None:
+            dataset_name = MEMORY_DATASETS.get(bucket['type_instance'])
+            if dataset_name is None:
+                continue
+            col_name = bucket['hostname']
+            updates = ((dataset_name, bucket['value']),)
+        else:
+            continue
+
+        for dataset_name, value in updates:
+            timestamps, col_names, values = elements[dataset_name]
+            timestamps.append(timestamp)
+            col_names.append(col_name)
+            values.append(value)
+
+    inserts = {}
+    for dataset_name, (timestamps, col_names, values) in elements.items():
+        inserts[dataset_name] = to_columnar(numpy.array(timestamps, dtype=numpy.float64),
+                                            col_names, values)
+
+    tokio.debug.debug_print("Extracted %d inserts from %d buckets in %.4f seconds"
+                            % (count_inserts(inserts), len(page), time.time() - _time0))
+    return inserts
+
+def count_inserts(inserts):
+    """Count the elements contained in the output of process_page()
+
+    Args:
+        inserts (dict): Output of process_page() or process_buckets()
+
+    Returns:
+        int: Total number of elements across all datasets
+    """
+    return sum(len(columnar.values) for columnar in inserts.values())
+
+def get_insert_positions(timeseries, columnar, create_col=True):
+    """Map columns of elements to row and column indices of a dataset
+
+    Equivalent to calling :meth:`tokio.timeseries.TimeSeries.get_insert_pos`
+    on every element.  New columns are added in the order in which they first
+    appear among in-bounds elements.
+
+    Args:
+        timeseries (tokio.timeseries.TimeSeries): dataset being updated
+        columnar (ColumnarInserts): elements to locate
+        create_col (bool): add columns that do not yet exist in `timeseries`
+
+    Returns:
+        tuple: (t_index, c_index, mask) where `mask` is a boolean array that
+        is True for elements that lie within `timeseries`, and `t_index` and
+        `c_index` are the row and column indices of those elements.
+    """
+    t_index = (numpy.floor(columnar.timestamps) - timeseries.timestamps[0]) // timeseries.timestep
+    t_index = t_index.astype(numpy.int64)
+    mask = (t_index >= 0) & (t_index < timeseries.timestamps.shape[0])
+
+    columns = columnar.columns[mask]
+    _, first_seen = numpy.unique(columns, return_index=True)
+    column_map = numpy.full(len(columnar.column_names), -1, dtype=numpy.int64)
+    for code in columns[numpy.sort(first_seen)]:
+        column_name = columnar.column_names[code]
+        c_index = timeseries.column_map.get(column_name)
+        if c_index is None and create_col:
+            c_index = timeseries.add_column(column_name)
+        if c_index is not None:
+            column_map[code] = c_index
+
+    # drop elements whose columns do not exist
+    c_index = column_map[columnar.columns]
+    mask &= c_index >= 0
+    return t_index[mask], c_index[mask], mask
+
+def update_datasets(inserts, datasets):
+    """Insert columns of elements into datasets
+
+    Elements of datasets in ``SUM_DATASETS`` are added to the existing values;
+    all other elements replace the existing values, and if an element is
+    inserted more than once, the last insert wins.
+
+    Args:
+        inserts (dict): Keyed by dataset name, values are
+            :class:`ColumnarInserts` as returned by process_page()
         datasets (dict): Dictionary mapping dataset names (str) to
             :class:`tokio.timeseries.TimeSeries` objects
 
@@ -233,23 +375,21 @@ def update_datasets(inserts, datasets):
         data_volume[key] = 0.0
         errors[key] = 0
 
-    for insert in inserts:
-        try:
-            if len(insert) == 4:
-                (dataset_name, timestamp, col_name, value) = insert
-                reducer = None
-            else:
-                (dataset_name, timestamp, col_name, value, reducer_name) = insert
-                reducer = LAMBDA_MAPS.get(reducer_name)
-        except ValueError:
-            print(insert)
-            raise
-
-        if datasets[dataset_name].insert_element(timestamp, col_name, value, reducer):
-            data_volume[dataset_name] += value
-            tidx, cidx = datasets[dataset_name].get_insert_pos(timestamp, col_name)
+    for dataset_name, columnar in inserts.items():
+        timeseries = datasets[dataset_name]
+        t_index, c_index, mask = get_insert_positions(timeseries, columnar)
+        values = columnar.values[mask]
+        errors[dataset_name] += len(mask) - len(values)
+        data_volume[dataset_name] += values.sum()
+
+        if dataset_name in SUM_DATASETS:
+            numpy.add.at(timeseries.dataset, (t_index, c_index), values)
         else:
-            errors[dataset_name] += 1
+            # keep only the last insert into each element
+            flat_index = t_index * timeseries.dataset.shape[1] + c_index
+            _, last_seen = numpy.unique(flat_index[::-1], return_index=True)
+            last_seen = len(flat_index) - 1 - last_seen
+            timeseries.dataset[t_index[last_seen], c_index[last_seen]] = values[last_seen]
 
     # Update dataset metadata
     for key in datasets:
@@ -292,6 +432,57 @@ def reset_timeseries(timeseries, start, end, value=-0.0):
     indexf, _ = timeseries.get_insert_pos(end, None)
     timeseries.dataset[index0:indexf, :] = value
 
+def find_cpu_norm_elements(inserts, datasets, norm_elements=None):
+    """Find the elements of CPU load datasets that must be normalized
+
+    Args:
+        inserts (dict): output of process_page() that was used to populate
+            datasets
+        datasets (dict of TimeSeries): all of the datasets being populated
+        norm_elements (dict of numpy.ndarray, optional): elements found by a
+            previous call to this function; updated in place if provided
+
+    Returns:
+        dict of numpy.ndarray: Keyed by CPU dataset name, each value is a
+        boolean array with the shape of the dataset that is True for each
+        element which must be normalized
+    """
+    if norm_elements is None:
+        norm_elements = {}
+    for dataset_name in CPU_DATASETS:
+        if dataset_name not in norm_elements:
+            norm_elements[dataset_name] = numpy.zeros(datasets[dataset_name].dataset.shape,
+                                                      dtype=bool)
+        if dataset_name in inserts:
+            t_index, c_index, _ = get_insert_positions(datasets[dataset_name],
+                                                       inserts[dataset_name],
+                                                       create_col=False)
+            norm_elements[dataset_name][t_index, c_index] = True
+
+    return norm_elements
+
+def normalize_cpu_elements(norm_elements, datasets):
+    """Divide CPU load dataset elements by their CPU counts
+
+    Args:
+        norm_elements (dict of numpy.ndarray): output of
+            find_cpu_norm_elements()
+        datasets (dict of TimeSeries): all of the datasets being populated
+
+    Returns:
+        Nothing
+    """
+    for dataset_name in CPU_DATASETS:
+        if dataset_name not in norm_elements:
+            continue
+        mask = norm_elements[dataset_name]
+        dataset = datasets[dataset_name].dataset
+        num_dataset = datasets[dataset2metadataset_key(dataset_name)].dataset
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            dataset[mask] /= num_dataset[mask]
+        # convert NaNs (0.0 / 0.0) back to -0.0
+        dataset[numpy.isnan(dataset)] = -0.0
+
 def normalize_cpu_datasets(inserts, datasets):
     """Normalize CPU load datasets
 
@@ -300,46 +491,174 @@ def normalize_cpu_datasets(inserts, datasets):
     per-core basis, but not all cores may be reported for each timestamp.
 
     Args:
-        inserts (list of tuples): list of inserts that were used to populate
+        inserts (dict): output of process_page() that was used to populate
             datasets
         datasets (dict of TimeSeries): all of the datasets being populated
 
     Returns:
         Nothing
     """
-    dataset_names = set(['dataservers/cpuload', 'dataservers/cpuuser', 'dataservers/cpusys'])
-    num_dataset_names = {}
-
-    norm_elements = {}
-    for dataset_name in dataset_names:
-        norm_elements[dataset_name] = set([])
-        num_dataset_names[dataset_name] = dataset2metadataset_key(dataset_name)
-
-    # build a set of all elements that must be divided
-    for insert in inserts:
-        (dataset_name, timestamp, col_name) = insert[0:3]
-        if dataset_name in dataset_names:
-            # get the position of this element to be inserted
-            t_index, c_index = datasets[dataset_name].get_insert_pos(timestamp, col_name)
-            if t_index is not None and c_index is not None:
-                norm_elements[dataset_name].add((t_index, c_index))
-
-    # now divide each element to be divided
-    for dataset_name in dataset_names:
-        num_dataset_name = num_dataset_names[dataset_name]
-        for t_index, c_index in norm_elements[dataset_name]:
-            datasets[dataset_name].dataset[t_index, c_index] /= \
-                datasets[num_dataset_name].dataset[t_index, c_index]
-        # convert NaNs (0.0 / 0.0) back to -0.0
-        datasets[dataset_name].dataset[numpy.isnan(datasets[dataset_name].dataset)] = -0.0
+    normalize_cpu_elements(find_cpu_norm_elements(inserts, datasets), datasets)
+
+def iter_prefetched(pages, depth, progress=None):
+    """Retrieve pages in a background thread
+
+    Allows the retrieval of pages from Elasticsearch or a cache file to overlap
+    with the decoding and insertion of earlier pages.  At most `depth` pages
+    are retrieved ahead of the consumer, so retrieval stalls rather than
+    accumulating pages in memory when the consumer falls behind.
+
+    Args:
+        pages (iterable): Pages to retrieve
+        depth (int): Maximum number of pages retrieved but not yet consumed
+        progress (dict, optional): If provided, its ``fetched`` key is
+            incremented as each page is retrieved
+
+    Yields:
+        Each page in `pages`
+    """
+    page_queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        """Enqueue without blocking forever if the consumer has gone away
+        """
+        while not stop.is_set():
+            try:
+                page_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fetch():
+        """Retrieve pages until they run out or the consumer goes away
+        """
+        try:
+            for page in pages:
+                if progress is not None:
+                    progress['fetched'] += 1
+                if not put((page, None)):
+                    return
+            put((done, None))
+        except Exception as error: # re-raised by the consumer
+            put((done, error))
+
+    thread = threading.Thread(target=fetch)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            page, error = page_queue.get()
+            if page is done:
+                if error is not None:
+                    raise error
+                break
+            yield page
+    finally:
+        stop.set()
+        while True:
+            try:
+                page_queue.get_nowait()
+            except queue.Empty:
+                break
+        thread.join()
+        # release any resources (e.g., scroll contexts) held by an abandoned generator
+        if hasattr(pages, 'close'):
+            pages.close()
+
+def iter_page_inserts(pages, threads=1, process_function=process_page):
+    """Convert pages into inserts as pages are produced
+
+    Pages are consumed lazily so that `pages` may be a generator of arbitrary
+    length.  When `threads` is greater than one, pages are decoded by a pool of
+    processes and only the compact arrays of decoded elements are passed back.
+    At most two pages per process are decoded ahead of the consumer, and
+    decoded pages are yielded in the order in which they were retrieved.
+
+    Args:
+        pages (iterable): Pages of documents, each of which is passed to
+            `process_function`
+        threads (int): Number of parallel processes to use
+        process_function (function): Function that decodes one page; either
+            process_page() or process_buckets()
+
+    Yields:
+        dict: Output of `process_function` for each page
+    """
+    if threads > 1:
+        pool = multiprocessing.Pool(threads)
+        pending = collections.deque()
+        try:
+            for page in pages:
+                pending.append(pool.apply_async(process_function, (page,)))
+                if len(pending) >= 2 * threads:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            # explicitly terminate to prevent HDF5 locking problems caused by
+            # un-gc'ed file handles
+            pool.terminate()
+    else:
+        for page in pages:
+            yield process_function(page)
+
+def report_progress(progress, elapsed):
+    """Print the progress of pages_to_hdf5()
+
+    Args:
+        progress (dict): Progress counters maintained by pages_to_hdf5()
+        elapsed (float): Seconds since pages_to_hdf5() began processing pages
+    """
+    elapsed = max(elapsed, 1.0e-9)
+    tokio.debug.debug_print(
+        "%d pages retrieved, %d pages processed (%.1f pages/sec), "
+        "%d elements inserted (%.1f elements/sec), %d out of bounds, %d commits"
+        % (progress['fetched'], progress['processed'], progress['processed'] / elapsed,
+           progress['elements'], progress['elements'] / elapsed, progress['errors'],
+           progress['commits']))
+
+def commit_datasets(hdf5_file, datasets, partial=False, new_datasets=()):
+    """Write datasets to an HDF5 file
+
+    Args:
+        hdf5_file (tokio.connectors.hdf5.Hdf5): File to which datasets should
+            be committed
+        datasets (dict of TimeSeries): all of the datasets being populated
+        partial (bool): If True, more pages remain to be inserted, so skip
+            datasets that cannot be committed until all pages are inserted
+            (i.e., those that must still be normalized) and flush the file.
+        new_datasets (set of str): Datasets which did not exist in
+            `hdf5_file` before pages were inserted.  Their columns are sorted
+            before every commit so that columns added after a partial commit
+            are ordered as if there had been no partial commit.
+    """
+    for dataset_name, dataset in datasets.items():
+        if '/_' in dataset_name or (partial and dataset_name in SUM_DATASETS):
+            continue
+        if dataset_name in new_datasets:
+            dataset.sort_columns()
+        hdf5_file.commit_timeseries(dataset)
+    if partial:
+        hdf5_file.flush()
 
 def pages_to_hdf5(pages, output_file, init_start, init_end, query_start, query_end,
-                  timestep, num_servers, devices_per_server, threads=1):
+                  timestep, num_servers, devices_per_server, threads=1,
+                  process_function=process_page, prefetch=0, commit_every=0):
     """Stores a page from Elasticsearch query in an HDF5 file
     Take pages from ElasticSearch query and store them in output_file
 
+    Pages flow through a pipeline whose stages can run concurrently: pages are
+    retrieved by a background thread (if `prefetch` is nonzero), decoded by a
+    pool of processes (if `threads` is greater than one), and inserted into
+    datasets by a single updater.  Each stage holds only a bounded number of
+    pages, so a slow stage throttles the stages before it.
+
     Args:
-        pages (list): A list of page objects (dictionaries)
+        pages (iterable): Page objects (lists of documents); may be a
+            generator, in which case pages are consumed as they are produced
         output_file (str): Path to an HDF5 file in which page data should be
             stored
         init_start (datetime.datetime): Lower bound of time (inclusive) to be
@@ -360,8 +679,22 @@ def pages_to_hdf5(pages, output_file, init_start, init_end, query_start, query_e
             initializing ``output_file``.
         threads (int): Number of parallel threads to utilize when parsing the
             Elasticsearch output
+        process_function (function): Function that converts one page into a
+            list of inserts.  Use process_buckets() if `pages` contains
+            aggregation buckets rather than documents.
+        prefetch (int): Number of pages to retrieve ahead of the decoders in
+            a background thread.  If 0, retrieve pages only as they are needed.
+        commit_every (int): Commit datasets to `output_file` after this many
+            pages are inserted.  CPU load datasets are only committed after all
+            pages are inserted.  If 0, only commit after all pages are inserted.
+
+    Returns:
+        dict: Progress counters, including the number of pages ``fetched``
+        and ``processed``, ``elements`` inserted, out-of-bounds ``errors``, and
+        ``commits``
     """
     datasets = {}
+    new_datasets = set([])
 
     file_exists = False
     if os.path.isfile(output_file):
@@ -420,6 +753,7 @@ def pages_to_hdf5(pages, output_file, init_start, init_end, query_start, query_e
             else:
                 timeseries = hdf5_file.to_timeseries(dataset_name=hdf5_dataset_name)
                 if timeseries is None:
+                    new_datasets.add(dataset_name)
                     timeseries = tokio.timeseries.TimeSeries(dataset_name=hdf5_dataset_name,
                                                              start=init_start,
                                                              end=init_end,
@@ -427,50 +761,43 @@ def pages_to_hdf5(pages, output_file, init_start, init_end, query_start, query_e
                                                              num_columns=num_columns)
             datasets[dataset_name] = timeseries
 
-        # Process all pages retrieved (this is computationally expensive)
-        _time0 = time.time()
-        updates = []
-        if threads > 1:
-            pool = multiprocessing.Pool(threads)
-            for update in pool.imap_unordered(process_page, pages):
-                updates.append(update)
-            # explicitly terminate to prevent HDF5 locking problems caused by
-            # un-gc'ed file handles
-            pool.terminate()
-        else:
-            for page in pages:
-                updates.append(process_page(page))
-        _timef = time.time()
-        _extract_time = _timef - _time0
-        tokio.debug.debug_print("Extracted %d elements from %d pages in %.4f seconds" \
-                                % (sum([len(x) for x in updates]),
-                                   len(pages),
-                                   _extract_time))
-
-        # Take the processed list of data to insert and actually insert them
+        # Process and insert pages as they are retrieved so that only a few
+        # pages are ever held in memory at once
+        progress = {'fetched': 0, 'processed': 0, 'elements': 0, 'errors': 0, 'commits': 0}
+        if prefetch:
+            pages = iter_prefetched(pages, prefetch, progress)
         _time0 = time.time()
-        for update in updates:
-            update_datasets(update, datasets)
-        _timef = time.time()
-        _update_time = _timef - _time0
-        if tokio.debug.DEBUG:
-            print("Inserted %d elements from %d pages in %.4f seconds" \
-                % (len(updates), len(pages), _update_time))
-            print("Processed %d pages in %.4f seconds" \
-                % (len(pages), _extract_time + _update_time))
-
-        for update in updates:
-            normalize_cpu_datasets(update, datasets)
+        last_report = _time0
+        norm_elements = {}
+        for inserts in iter_page_inserts(pages, threads, process_function):
+            progress['errors'] += update_datasets(inserts, datasets)
+            find_cpu_norm_elements(inserts, datasets, norm_elements)
+            if not prefetch:
+                progress['fetched'] += 1
+            progress['processed'] += 1
+            progress['elements'] += count_inserts(inserts)
+
+            if commit_every and progress['processed'] % commit_every == 0:
+                commit_datasets(hdf5_file, datasets, partial=True, new_datasets=new_datasets)
+                progress['commits'] += 1
+
+            if time.time() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.time()
+                report_progress(progress, last_report - _time0)
+
+        normalize_cpu_elements(norm_elements, datasets)
+        report_progress(progress, time.time() - _time0)
 
         # Write datasets out to HDF5 file
         _time0 = time.time()
-        for dataset_name, dataset in datasets.items():
-            if '/_' not in dataset_name:
-                hdf5_file.commit_timeseries(dataset)
+        commit_datasets(hdf5_file, datasets, new_datasets=new_datasets)
+        progress['commits'] += 1
 
     if tokio.debug.DEBUG:
         print("Committed data to disk in %.4f seconds" % (time.time() - _time0))
 
+    return progress
+
 def main(argv=None):
     """Entry point for the CLI interface
     """
@@ -498,10 +825,22 @@ def main(argv=None):
                         help='collection frequency, in seconds (default: 10)')
     parser.add_argument('--timeout', type=int, default=30,
                         help='ElasticSearch timeout time (default: 30)')
+    parser.add_argument('--slices', type=int, default=1,
+                        help='retrieve query results in this many parallel slices (default: 1)')
+    parser.add_argument('--aggregate', action='store_true',
+                        help='have ElasticSearch average documents per timestep instead of '
+                        + 'retrieving every document')
+    parser.add_argument('--max-buckets', type=int, default=10000,
+                        help='max buckets per ElasticSearch aggregation query with --aggregate '
+                        + '(default: 10000)')
     parser.add_argument('--threads', type=int, default=1,
                         help='parallel threads for document extraction (default: 1)')
+    parser.add_argument('--prefetch', type=int, default=4,
+                        help='pages to retrieve ahead of document extraction (default: 4)')
+    parser.add_argument('--commit-every', type=int, default=0,
+                        help='commit to output file after this many pages (default: only at end)')
     parser.add_argument('--input', type=str, default=None,
-                        help="use cached ElasticSearch json as input")
+                        help="use cached ElasticSearch JSON or NDJSON as input")
     parser.add_argument("-o", "--output", type=str, default='output.hdf5',
                         help="output file (default: output.hdf5)")
     parser.add_argument('-h', '--host', type=str, default="localhost",
@@ -536,6 +875,8 @@ def main(argv=None):
         raise Exception('init_start >= init_end')
     elif args.timestep < 1:
         raise Exception('--timestep must be > 0')
+    elif args.aggregate and args.input:
+        raise Exception('--aggregate cannot be used with --input')
 
     # Read input from a cached json file (generated previously via the --json
     # option) or by querying ElasticSearch?
@@ -545,7 +886,8 @@ def main(argv=None):
             'host': args.host,
             'port': args.port,
             'index': args.index,
-            'timeout': args.timeout
+            'timeout': args.timeout,
+            'slices': args.slices,
         }
         username = os.environ.get("PYTOKIO_ES_USER")
         password = os.environ.get("PYTOKIO_ES_PASSWORD")
@@ -554,38 +896,40 @@ def main(argv=None):
 
         esdb = tokio.connectors.collectd_es.CollectdEs(**kwargs)
 
-        pages = None
-        for plugin_query in [tokio.connectors.collectd_es.QUERY_CPU_DATA,
-                             tokio.connectors.collectd_es.QUERY_DISK_DATA,
-                             tokio.connectors.collectd_es.QUERY_MEMORY_DATA]:
-            esdb.query_timeseries(plugin_query,
-                                  query_start,
-                                  query_end)
-            if pages is None:
-                pages = esdb.scroll_pages
-            else:
-                pages += esdb.scroll_pages
-
-            tokio.debug.debug_print("Loaded results from %s:%s" % (args.host, args.port))
-            pages_to_hdf5(pages=pages,
-                          output_file=args.output,
-                          init_start=init_start,
-                          init_end=init_end,
-                          query_start=query_start,
-                          query_end=query_end,
-                          timestep=args.timestep,
-                          num_servers=args.num_nodes,
-                          devices_per_server=args.ssds_per_node,
-                          threads=args.threads)
-    else:
-        _, encoding = mimetypes.guess_type(args.input)
-        if encoding == 'gzip':
-            input_file = gzip.open(args.input, 'rt')
+        # retrieve pages lazily so that each is processed and discarded before
+        # the next is retrieved
+        if args.aggregate:
+            # each window should contain roughly max_buckets buckets for the
+            # plugin with the most distinct series (disk or memory)
+            num_series = args.num_nodes * max(2 * args.ssds_per_node, len(MEMORY_DATASETS))
+            window = datetime.timedelta(seconds=args.timestep * max(1, args.max_buckets // num_series))
+            pages = esdb.iter_aggregations(query_start, query_end, args.timestep, window=window)
+            process_function = process_buckets
         else:
-            input_file = open(args.input, 'rt')
-        pages = json.load(input_file)
-        input_file.close()
-        tokio.debug.debug_print("Loaded results from %s" % args.input)
+            pages = itertools.chain.from_iterable(
+                esdb.iter_timeseries(plugin_query, query_start, query_end)
+                for plugin_query in [tokio.connectors.collectd_es.QUERY_CPU_DATA,
+                                     tokio.connectors.collectd_es.QUERY_DISK_DATA,
+                                     tokio.connectors.collectd_es.QUERY_MEMORY_DATA])
+            process_function = process_page
+
+        pages_to_hdf5(pages=pages,
+                      output_file=args.output,
+                      init_start=init_start,
+                      init_end=init_end,
+                      query_start=query_start,
+                      query_end=query_end,
+                      timestep=args.timestep,
+                      num_servers=args.num_nodes,
+                      devices_per_server=args.ssds_per_node,
+                      threads=args.threads,
+                      process_function=process_function,
+                      prefetch=args.prefetch,
+                      commit_every=args.commit_every)
+        tokio.debug.debug_print("Loaded results from %s:%s" % (args.host, args.port))
+    else:
+        # NDJSON caches are streamed one page at a time
+        pages = tokio.connectors.es.iter_cache(args.input)
         pages_to_hdf5(pages=pages,
                       output_file=args.output,
                       init_start=init_start,
@@ -595,6 +939,9 @@ def main(argv=None):
                       timestep=args.timestep,
                       num_servers=args.num_nodes,
                       devices_per_server=args.ssds_per_node,
-                      threads=args.threads)
+                      threads=args.threads,
+                      prefetch=args.prefetch,
+                      commit_every=args.commit_every)
+        tokio.debug.debug_print("Loaded results from %s" % args.input)
 
     print("Wrote output to %s" % args.output)
@@ -0,0 +1,461 @@
+"""
+Converts Lustre OST fullness (``lfs df``) and OST-OSS mapping (``lctl dl -t``)
+snapshots into the TOKIO Time Series ``fullness`` and ``failover`` datasets.
+
+Snapshots can come from the NERSC-style dumps read by
+:mod:`tokio.connectors.nersc_lfsstate` or from running ``lfs df`` and ``lctl
+dl -t`` directly via :mod:`tokio.connectors.lfshealth`.
+"""
+
+import time
+import datetime
+import argparse
+import warnings
+import numpy
+import tokio.debug
+import tokio.config
+import tokio.timeseries
+import tokio.tools.common
+import tokio.connectors.hdf5
+import tokio.connectors.lfshealth
+import tokio.connectors.nersc_lfsstate
+
+DATE_FMT = "%Y-%m-%dT%H:%M:%S"
+DATE_FMT_PRINT = "YYYY-MM-DDTHH:MM:SS"
+
+SCHEMA_VERSION = "1"
+
+class Archiver(dict):
+    """A dictionary containing TimeSeries objects
+
+    Contains the TimeSeries objects being populated from Lustre health
+    snapshots.  Implemented as a class so that a single object can store all of
+    the TimeSeries objects that are generated by multiple method calls.
+    """
+    def __init__(self, query_start, query_end, timestep, file_system, *args, **kwargs):
+        """Initializes the archiver and stores its settings
+
+        Args:
+            query_start (datetime.datetime): Lower bound of time to be archived,
+                inclusive
+            query_end (datetime.datetime): Upper bound of time to be archived,
+                exclusive
+            timestep (int): Number of seconds between successive rows
+            file_system (str): Lustre file system name (e.g., snx11025) whose
+                targets should be archived
+        """
+        super(Archiver, self).__init__(*args, **kwargs)
+        self.query_start = query_start
+        self.query_end = query_end
+        self.timestep = timestep
+        self.file_system = file_system
+
+        self.config = {
+            'fullness/bytes': {
+                "units": "KiB",
+                "source": "lfs df",
+            },
+            'fullness/bytestotal': {
+                "units": "KiB",
+                "source": "lfs df",
+            },
+            'fullness/inodes': {
+                "units": "inodes",
+                "source": "lfs df -i",
+            },
+            'fullness/inodestotal': {
+                "units": "inodes",
+                "source": "lfs df -i",
+            },
+            'failover/datatargets': {
+                "units": "targets per server",
+                "source": "lctl dl -t",
+            },
+        }
+
+        self.schema = tokio.connectors.hdf5.SCHEMA.get(SCHEMA_VERSION)
+        if self.schema is None:
+            raise KeyError("Schema version %d is not known by connectors.hdf5" % SCHEMA_VERSION)
+
+    def init_dataset(self, dataset_name, columns):
+        """Populate an empty dataset within self, or make room in an existing one
+
+        Args:
+            dataset_name (str): key corresponding to self.config defining which
+                dataset is being initialized
+            columns (list of str): column names the dataset must be able to
+                hold
+
+        Returns:
+            tokio.timeseries.TimeSeries or None: The dataset, or None if
+            ``dataset_name`` is not in the schema
+        """
+        hdf5_dataset_name = self.schema.get(dataset_name)
+        if hdf5_dataset_name is None:
+            warnings.warn("Skipping %s (not in schema)" % dataset_name)
+            return None
+
+        timeseries = self.get(dataset_name)
+        if timeseries is None:
+            timeseries = tokio.timeseries.TimeSeries(dataset_name=hdf5_dataset_name,
+                                                     start=self.query_start,
+                                                     end=self.query_end,
+                                                     timestep=self.timestep,
+                                                     num_columns=len(columns),
+                                                     column_names=columns,
+                                                     sort_hex=True)
+            self[dataset_name] = timeseries
+        else:
+            new_columns = [column for column in columns if column not in timeseries.column_map]
+            shortfall = len(timeseries.columns) + len(new_columns) - timeseries.dataset.shape[1]
+            if shortfall > 0:
+                timeseries.add_columns(shortfall)
+        return timeseries
+
+    def finalize(self):
+        """Sort columns and tack on metadata
+
+        Perform a few finishing actions to all datasets contained in self after
+        they have been populated.  Such actions are configured entirely in
+        self.config and require no external input.
+        """
+        for timeseries in self.values():
+            timeseries.sort_columns()
+        self.set_timeseries_metadata(list(self.config.keys()))
+
+    def set_timeseries_metadata(self, dataset_names):
+        """Set metadata constants (version, units, etc) on datasets and groups
+
+        Args:
+            dataset_names (list of str): keys corresponding to self.config for
+                the datasets whose metadata should be set
+        """
+        for dataset_name in dataset_names:
+            if dataset_name in self:
+                self[dataset_name].dataset_metadata.update({
+                    'version': SCHEMA_VERSION,
+                    'units': self.config[dataset_name]['units'],
+                    'source': self.config[dataset_name]['source'],
+                })
+                self[dataset_name].group_metadata.update({'source': 'lfsstatus'})
+
+    def archive_fullness(self, snapshots, inodes=False):
+        """Archive OST fullness snapshots
+
+        Args:
+            snapshots (dict): Keyed by timestamp (int) with values of the form
+                ``{ file_system: { target_name: { keys: values } } }`` as found
+                in :class:`tokio.connectors.nersc_lfsstate.NerscLfsOstFullness`
+            inodes (bool): If True, snapshots are from ``lfs df -i`` and
+                describe inodes rather than KiB
+        """
+        def get_values(fs_data):
+            """Used and total capacity of each OST"""
+            return dict((target_name, (values['used_kib'], values['total_kib']))
+                        for target_name, values in fs_data.items()
+                        if values['role'] == 'ost')
+
+        if inodes:
+            dataset_names = ['fullness/inodes', 'fullness/inodestotal']
+        else:
+            dataset_names = ['fullness/bytes', 'fullness/bytestotal']
+
+        self.insert_snapshots(dataset_names, *tabulate(snapshots, self.file_system, get_values))
+
+    def archive_failovers(self, snapshots):
+        """Archive OST-OSS mapping snapshots
+
+        Records, for each OST, the number of OSTs being served by that OST's
+        OSS.  OSTs whose count differs from the most common count are likely
+        affected by a failover.
+
+        Args:
+            snapshots (dict): Keyed by timestamp (int) with values of the form
+                ``{ file_system: { target_name: { keys: values } } }`` as found
+                in :class:`tokio.connectors.nersc_lfsstate.NerscLfsOstMap`
+        """
+        def get_values(fs_data):
+            """Number of OSTs on the OSS serving each OST"""
+            ost_ips = dict((target_name, values['target_ip'])
+                           for target_name, values in fs_data.items()
+                           if values['role'] == 'osc')
+            ost_counts = {}
+            for ip_addr in ost_ips.values():
+                ost_counts[ip_addr] = ost_counts.get(ip_addr, 0) + 1
+            return dict((target_name, (ost_counts[ip_addr],))
+                        for target_name, ip_addr in ost_ips.items())
+
+        self.insert_snapshots(['failover/datatargets'], *tabulate(snapshots, self.file_system, get_values))
+
+    def insert_snapshots(self, dataset_names, timestamps, columns, values):
+        """Insert a matrix of snapshots into datasets
+
+        Args:
+            dataset_names (list of str): keys corresponding to self.config; the
+                Nth dataset receives ``values[:, :, N]``
+            timestamps (numpy.ndarray): Seconds since epoch of each snapshot
+            columns (list of str): Name of each column of ``values``
+            values (numpy.ndarray): Three-dimensional matrix of values indexed
+                by snapshot, column, and dataset.  NaNs are skipped.
+        """
+        if not columns:
+            return
+        for index, dataset_name in enumerate(dataset_names):
+            timeseries = self.init_dataset(dataset_name, columns)
+            if timeseries is None:
+                continue
+            for c_index, column in enumerate(columns):
+                timeseries.insert_column(timestamps, column, values[:, c_index, index])
+
+def tabulate(snapshots, file_system, get_values):
+    """Convert per-snapshot dictionaries into a matrix
+
+    Args:
+        snapshots (dict): Keyed by timestamp (int) with values of the form
+            ``{ file_system: { target_name: { keys: values } } }``
+        file_system (str): Lustre file system name whose targets should be
+            tabulated
+        get_values (function): Takes the ``{ target_name: { keys: values } }``
+            for a single snapshot and returns a dict mapping target names to a
+            tuple of values
+
+    Returns:
+        tuple: (timestamps, columns, values) where ``timestamps`` is a
+        numpy.ndarray of seconds since epoch, ``columns`` is a sorted list of
+        column names of the form ``file_system-target_name``, and ``values`` is
+        a numpy.ndarray of shape (len(timestamps), len(columns), N) containing
+        NaN wherever a target was absent from a snapshot
+    """
+    timestamps = sorted(snapshots)
+    rows = [get_values(snapshots[timestamp].get(file_system, {})) for timestamp in timestamps]
+
+    targets = sorted(set().union(*rows)) if rows else []
+    num_values = 0
+    for row in rows:
+        for row_values in row.values():
+            num_values = len(row_values)
+            break
+        if num_values:
+            break
+
+    c_indices = dict((target, c_index) for c_index, target in enumerate(targets))
+    values = numpy.full((len(timestamps), len(targets), num_values), numpy.nan)
+    for t_index, row in enumerate(rows):
+        if row:
+            values[t_index, [c_indices[target] for target in row]] = list(row.values())
+
+    columns = ["%s-%s" % (file_system, target) for target in targets]
+    return numpy.array(timestamps, dtype='i8'), columns, values
+
+def load_snapshots(input_files, loader_class, query_start, query_end):
+    """Load the snapshots from lfsstate dumps that fall within a time range
+
+    Uses :func:`tokio.connectors.nersc_lfsstate.get_index` so that only the
+    snapshots within the time range are parsed.
+
+    Args:
+        input_files (list of str): Paths to ``lfs df`` or ``lctl dl -t`` dumps
+        loader_class: Either
+            :class:`tokio.connectors.nersc_lfsstate.NerscLfsOstFullness` or
+            :class:`tokio.connectors.nersc_lfsstate.NerscLfsOstMap`
+        query_start (datetime.datetime): Lower bound of time to load, inclusive
+        query_end (datetime.datetime): Upper bound of time to load, exclusive
+
+    Returns:
+        dict: Snapshots keyed by timestamp.  If a timestamp appears in more than
+        one file, the last file wins.
+    """
+    start = int(time.mktime(query_start.timetuple()))
+    end = int(time.mktime(query_end.timetuple()))
+    snapshots = {}
+    for input_file in input_files:
+        index = tokio.connectors.nersc_lfsstate.get_index(input_file)
+        timestamps = [timestamp for timestamp in index.timestamps if start <= timestamp < end]
+        if timestamps:
+            tokio.debug.debug_print("Loading %d snapshots from %s" % (len(timestamps), input_file))
+            snapshots.update(loader_class(cache_file=input_file, timestamps=timestamps))
+    return snapshots
+
+def init_hdf5_file(datasets, init_start, init_end, hdf5_file):
+    """
+    Initialize the datasets at full dimensions in the HDF5 file if necessary
+    """
+    schema = tokio.connectors.hdf5.SCHEMA.get(SCHEMA_VERSION)
+    for dataset_name, dataset in datasets.items():
+        hdf5_dataset_name = schema.get(dataset_name)
+        if hdf5_dataset_name is None:
+            if '/_' not in dataset_name:
+                warnings.warn("Dataset key %s is not in schema" % dataset_name)
+            continue
+        if hdf5_dataset_name not in hdf5_file:
+            # attempt to convert dataset into a timeseries
+            timeseries = hdf5_file.to_timeseries(dataset_name=hdf5_dataset_name)
+
+            # if dataset -> timeseries failed, create and commit a new, empty timeseries
+            if timeseries is None:
+                timeseries = tokio.timeseries.TimeSeries(dataset_name=hdf5_dataset_name,
+                                                         start=init_start,
+                                                         end=init_end,
+                                                         timestep=dataset.timestep,
+                                                         num_columns=dataset.dataset.shape[1])
+                hdf5_file.commit_timeseries(timeseries=timeseries)
+            print("Initialized %s in %s with size %s" % (
+                hdf5_dataset_name,
+                hdf5_file.name,
+                timeseries.dataset.shape))
+
+def archive_lfsstatus(init_start, init_end, timestep, file_system, output_file, query_start, query_end,
+                      fullness_files=None, inodes_files=None, map_files=None, live=False):
+    """Converts Lustre health snapshots into TOKIO time series format
+
+    Args:
+        init_start (datetime.datetime): The first timestamp to be included in
+            the HDF5 file
+        init_end (datetime.datetime): The timestamp following the last timestamp
+            to be included in the HDF5 file.
+        timestep (int): Number of seconds between successive entries in the HDF5
+            file to be created.
+        file_system (str): Lustre file system name (e.g., snx11025) whose
+            targets should be archived
+        output_file (str): Path to the file to be created.
+        query_start (datetime.datetime): Time after which snapshots should be
+            archived, inclusive.
+        query_end (datetime.datetime): Time before which snapshots should be
+            archived, exclusive.
+        fullness_files (list of str): Paths to ``lfs df`` dumps
+        inodes_files (list of str): Paths to ``lfs df -i`` dumps
+        map_files (list of str): Paths to ``lctl dl -t`` dumps
+        live (bool): Also run ``lfs df`` and ``lctl dl -t`` and archive their
+            outputs as a snapshot taken now
+    """
+    datasets = Archiver(query_start=query_start,
+                        query_end=query_end,
+                        timestep=timestep,
+                        file_system=file_system)
+
+    if fullness_files:
+        datasets.archive_fullness(load_snapshots(fullness_files,
+                                                 tokio.connectors.nersc_lfsstate.NerscLfsOstFullness,
+                                                 query_start,
+                                                 query_end))
+    if inodes_files:
+        datasets.archive_fullness(load_snapshots(inodes_files,
+                                                 tokio.connectors.nersc_lfsstate.NerscLfsOstFullness,
+                                                 query_start,
+                                                 query_end),
+                                  inodes=True)
+    if map_files:
+        datasets.archive_failovers(load_snapshots(map_files,
+                                                  tokio.connectors.nersc_lfsstate.NerscLfsOstMap,
+                                                  query_start,
+                                                  query_end))
+    if live:
+        now = int(time.time())
+        datasets.archive_fullness({now: tokio.connectors.lfshealth.LfsOstFullness()})
+        datasets.archive_failovers({now: tokio.connectors.lfshealth.LfsOstMap()})
+
+    if not datasets:
+        raise RuntimeError("No snapshots found for %s between %s and %s"
+                           % (file_system, query_start, query_end))
+
+    datasets.finalize()
+
+    with tokio.connectors.hdf5.Hdf5(output_file) as hdf5_file:
+        hdf5_file.attrs['version'] = SCHEMA_VERSION
+
+        init_hdf5_file(datasets, init_start, init_end, hdf5_file)
+
+        for dataset in datasets.values():
+            print("Writing out %s" % dataset.dataset_name)
+            hdf5_file.commit_timeseries(dataset)
+
+    tokio.debug.debug_print("Wrote output to %s" % output_file)
+
+def main(argv=None):
+    """Entry point for the CLI interface
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", type=str, default='output.hdf5',
+                        help="output file (default: output.hdf5)")
+    parser.add_argument('--init-start', type=str, default=None,
+                        help='first timestamp (inclusive) when creating new output file,' +
+                        ' in %s format (default: same as start)' % DATE_FMT_PRINT)
+    parser.add_argument('--init-end', type=str, default=None,
+                        help='final timestamp (exclusive) when creating new output file,' +
+                        ' in %s format (default: same as end)' % DATE_FMT_PRINT)
+    parser.add_argument('--debug', action='store_true', help="produce debug messages")
+    parser.add_argument('--timestep', type=int, default=300,
+                        help='time between rows, in seconds (default: 300)')
+    parser.add_argument("--fullness", type=str, nargs="+", default=None,
+                        help="path to lfs df output file(s)")
+    parser.add_argument("--inodes", type=str, nargs="+", default=None,
+                        help="path to lfs df -i output file(s)")
+    parser.add_argument("--map", type=str, nargs="+", default=None,
+                        help="path to lctl dl -t output file(s)")
+    parser.add_argument("--live", action='store_true',
+                        help="also archive the output of lfs df and lctl dl -t run now")
+    parser.add_argument("filesystem", type=str,
+                        help="logical file system name (e.g., cscratch) or Lustre file system name")
+    parser.add_argument("query_start", type=str,
+                        help="start time of query in %s format" % DATE_FMT_PRINT)
+    parser.add_argument("query_end", type=str,
+                        help="end time of query in %s format" % DATE_FMT_PRINT)
+    args = parser.parse_args(argv)
+
+    if args.debug:
+        tokio.debug.DEBUG = True
+
+    # Convert CLI options into datetime
+    try:
+        query_start = datetime.datetime.strptime(args.query_start, DATE_FMT)
+        query_end = datetime.datetime.strptime(args.query_end, DATE_FMT)
+        init_start = query_start
+        init_end = query_end
+        if args.init_start:
+            init_start = datetime.datetime.strptime(args.init_start, DATE_FMT)
+        if args.init_end:
+            init_end = datetime.datetime.strptime(args.init_end, DATE_FMT)
+    except ValueError:
+        parser.error("Start and end times must be in format %s\n" % DATE_FMT_PRINT)
+        raise
+
+    # Basic input bounds checking
+    if query_start >= query_end:
+        parser.error('query_start >= query_end')
+    elif init_start >= init_end:
+        parser.error('init_start >= init_end')
+    elif args.timestep < 1:
+        parser.error('--timestep must be > 0')
+
+    file_system = tokio.config.CONFIG.get('fsname_to_backend_name', {}).get(args.filesystem,
+                                                                           args.filesystem)
+
+    fullness_files = args.fullness
+    map_files = args.map
+    if not (fullness_files or args.inodes or map_files or args.live):
+        # Dumps are indexed by local date, so look back one day to catch
+        # snapshots written into the previous day's file
+        fullness_files, map_files = [
+            sorted(tokio.tools.common.enumerate_dated_files(
+                start=query_start - datetime.timedelta(days=1),
+                end=query_end,
+                template=tokio.config.CONFIG[config_key],
+                match_first=True))
+            for config_key in ('lfsstatus_fullness_files', 'lfsstatus_map_files')]
+        if not fullness_files and not map_files:
+            raise RuntimeError("No input files match query range")
+        if args.debug:
+            print("Loading the following files:\n  " + "\n  ".join(fullness_files + map_files))
+
+    archive_lfsstatus(
+        init_start=init_start,
+        init_end=init_end,
+        timestep=args.timestep,
+        file_system=file_system,
+        output_file=args.output,
+        query_start=query_start,
+        query_end=query_end,
+        fullness_files=fullness_files,
+        inodes_files=args.inodes,
+        map_files=map_files,
+        live=args.live)
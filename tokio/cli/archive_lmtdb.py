@@ -2,21 +2,28 @@
 Retrieve the contents of an LMT database and cache it locally.
 """
 
+import os
 import sys
+import time
 import datetime
 import argparse
 import warnings
+import numpy
 import tokio.debug
 import tokio.timeseries
 import tokio.connectors.lmtdb
 import tokio.connectors.hdf5
-from tokio.common import isstr
 
 DATE_FMT = "%Y-%m-%dT%H:%M:%S"
 DATE_FMT_PRINT = "YYYY-MM-DDTHH:MM:SS"
 
 SCHEMA_VERSION = "1"
 
+#: Columns that have reported no data in this many seconds before the last
+#: reported data are considered to have stopped reporting when resuming an
+#: incremental update
+RESUME_TRAILING_SECS = 900
+
 class DatasetDict(dict):
     """A dictionary containing TimeSeries objects
 
@@ -194,6 +201,68 @@ class DatasetDict(dict):
                     # for initial over-sizing of the time range by an extra timestamp
                     self[dataset_name].trim_rows(1)
 
+    def find_resume_time(self, hdf5_file, trailing_secs=RESUME_TRAILING_SECS):
+        """Find where an incremental update of an HDF5 file should resume
+
+        Inspects the datasets in an existing HDF5 file that this object would
+        populate and finds, within the query time range, the last row of each
+        in which every column that is still reporting has data.  A column is
+        still reporting if it has data within `trailing_secs` of the last row
+        containing any data.  Columns that stopped reporting earlier, such as
+        those of a server that failed, or that contain no data at all are
+        ignored, since they would otherwise prevent any later row from being
+        considered fully populated.
+
+        Args:
+            hdf5_file (tokio.connectors.hdf5.Hdf5): file being updated
+            trailing_secs (int): Number of seconds before the last row
+                containing any data within which a column must have data to
+                be considered still reporting
+
+        Returns:
+            datetime.datetime: Timestamp of the earliest row, across all
+            datasets, that follows the last fully populated row.  This is
+            ``query_start`` if any dataset does not exist or has no fully
+            populated rows, and ``query_end`` if all rows are fully populated.
+        """
+        resume_time = self.query_end
+        for dataset_name in self.config:
+            hdf5_dataset_name = self.schema.get(dataset_name)
+            if hdf5_dataset_name is None:
+                continue
+            if hdf5_dataset_name not in hdf5_file:
+                return self.query_start
+
+            timestamps = hdf5_file.get_timestamps(hdf5_dataset_name)[:]
+            start_index = max(0, hdf5_file.get_index(hdf5_dataset_name, self.query_start))
+            end_index = min(len(timestamps), hdf5_file.get_index(hdf5_dataset_name, self.query_end))
+            if end_index <= start_index:
+                return self.query_start
+
+            values = hdf5_file[hdf5_dataset_name][start_index:end_index, :]
+            missing = (values == 0.0) & numpy.signbit(values)
+            populated = ~missing
+            if not populated.any():
+                return self.query_start
+
+            # index of the last row in which each column has data, or -1
+            num_rows = populated.shape[0]
+            last_populated = num_rows - 1 - numpy.argmax(populated[::-1, :], axis=0)
+            last_populated[~populated.any(axis=0)] = -1
+            trailing_rows = max(1, int(trailing_secs // self.timestep))
+            reporting = (last_populated >= 0) \
+                & (last_populated > last_populated.max() - trailing_rows)
+
+            full_rows = numpy.nonzero(~missing[:, reporting].any(axis=1))[0]
+            if not len(full_rows):
+                return self.query_start
+
+            resume_index = start_index + full_rows[-1] + 1
+            if resume_index < end_index:
+                resume_time = min(resume_time,
+                                  datetime.datetime.fromtimestamp(timestamps[resume_index]))
+        return resume_time
+
     def set_timeseries_metadata(self, dataset_names):
         """Set metadata constants (version, units, etc) on datasets and groups
 
@@ -226,38 +295,17 @@ class DatasetDict(dict):
         self.init_datasets(dataset_names, lmtdb.mds_names)
 
         # Now query the MDS_DATA table to get byte counts over the query time range
-        results, columns = lmtdb.get_mds_data(self.query_start, self.query_end_plusplus)
-
-
-        # Index the columns to speed up insertion of data
-        col_map = {}
-        try:
-            for db_col in ['TIMESTAMP', 'MDS_ID', 'PCT_CPU']:
-                col_map[db_col] = columns.index(db_col)
-        except ValueError:
-            raise ValueError("LMT database schema does not match expectation")
-
-        # Loop through all the results of the timeseries query
-        for row in results:
-            if isstr(row[col_map['TIMESTAMP']]):
-                # SQLite stores timestamps as a unicode string
-                timestamp = datetime.datetime.strptime(row[col_map['TIMESTAMP']],
-                                                       "%Y-%m-%d %H:%M:%S")
-            else:
-                # MySQL timestamps are automatically converted to datetime.datetime
-                timestamp = row[col_map['TIMESTAMP']]
-            target_name = lmtdb.mds_id_map[row[col_map['MDS_ID']]]
+        for results in lmtdb.iter_timeseries_arrays('MDS_DATA', self.query_start,
+                                                    self.query_end_plusplus):
+            epochs = get_epochs(results['TIMESTAMP'])
             for dataset_name in dataset_names:
                 target_dbcol = self.config[dataset_name].get('column')
                 # target_dbcol=PCT_CPU, target_name=snx11025n022
-                if target_dbcol is not None:
-                    self[dataset_name].insert_element(
-                        timestamp,
-                        target_name,
-                        row[col_map[target_dbcol]])
-                else:
+                if target_dbcol is None:
                     errmsg = "%s in self.config but missing 'column' setting" % dataset_name
                     raise KeyError(errmsg)
+                insert_elements(self[dataset_name], epochs, results['MDS_ID'],
+                                lmtdb.mds_id_map, results[target_dbcol])
 
     def archive_mds_ops_data(self, lmtdb):
         """Extract and encode data from LMT's MDS_OPS_DATA table
@@ -291,45 +339,29 @@ class DatasetDict(dict):
 
         self.init_datasets(dataset_names, lmtdb.mds_names)
 
-        results, columns = lmtdb.get_mds_ops_data(self.query_start, self.query_end_plusplus)
-
-        # Index the columns to speed up insertion of data
-        col_map = {}
-        try:
-            for db_col in ['TIMESTAMP', 'MDS_ID', 'OPERATION_ID', 'SAMPLES']:
-                col_map[db_col] = columns.index(db_col)
-        except ValueError:
-            raise ValueError("LMT database schema does not match expectation")
-
-        # Loop through all the results of the timeseries query
-        for row in results:
-            if isstr(row[col_map['TIMESTAMP']]):
-                # SQLite stores timestamps as a unicode string
-                timestamp = datetime.datetime.strptime(row[col_map['TIMESTAMP']],
-                                                       "%Y-%m-%d %H:%M:%S")
-            else:
-                # MySQL timestamps are automatically converted to datetime.datetime
-                timestamp = row[col_map['TIMESTAMP']]
+        for results in lmtdb.iter_timeseries_arrays('MDS_OPS_DATA', self.query_start,
+                                                     self.query_end_plusplus):
+            # drop rows from MDSes we don't know about
+            known = numpy.isin(results['MDS_ID'], list(lmtdb.mds_id_map.keys()))
+            if not known.all():
+                for mds_id in numpy.unique(results['MDS_ID'][~known]):
+                    warnings.warn("unknown MDS_ID %s" % mds_id)
+                results = results[known]
+
+            epochs = get_epochs(results['TIMESTAMP'])
 
-            # figure out the dataset this row's data will go into (this
+            # figure out the dataset each row's data will go into (this
             # implicitly filters out operations that aren't defined in
             # opname_to_dataset_name)
-            op_name = lmtdb.mds_op_id_map[row[col_map['OPERATION_ID']]]
-            dataset_name = opname_to_dataset_name.get(op_name)
-            if dataset_name is None:
-                continue
-
-            # figure out which column (MDS name) this row's data will go into
-            mds_name = lmtdb.mds_id_map.get(row[col_map['MDS_ID']])
-            if not mds_name:
-                errmsg = "unknown MDS_ID %s" % row[col_map['MDS_ID']]
-                warnings.warn(errmsg)
-                continue
-
-            self[dataset_name].insert_element(
-                timestamp,
-                mds_name,
-                row[col_map['SAMPLES']])
+            for op_id in numpy.unique(results['OPERATION_ID']):
+                op_name = lmtdb.mds_op_id_map[op_id]
+                dataset_name = opname_to_dataset_name.get(op_name)
+                if dataset_name is None:
+                    continue
+                selected = results['OPERATION_ID'] == op_id
+                insert_elements(self[dataset_name], epochs[selected],
+                                results['MDS_ID'][selected], lmtdb.mds_id_map,
+                                results['SAMPLES'][selected])
 
     def archive_oss_data(self, lmtdb):
         """Extract and encode data from LMT's OSS_DATA table
@@ -349,37 +381,17 @@ class DatasetDict(dict):
         self.init_datasets(dataset_names, lmtdb.oss_names)
 
         # Now query the OSS_DATA table to get byte counts over the query time range
-        results, columns = lmtdb.get_oss_data(self.query_start, self.query_end_plusplus)
-
-        # Index the columns to speed up insertion of data
-        col_map = {}
-        try:
-            for db_col in ['TIMESTAMP', 'OSS_ID', 'PCT_CPU', 'PCT_MEMORY']:
-                col_map[db_col] = columns.index(db_col)
-        except ValueError:
-            raise ValueError("LMT database schema does not match expectation")
-
-        # Loop through all the results of the timeseries query
-        for row in results:
-            if isstr(row[col_map['TIMESTAMP']]):
-                # SQLite stores timestamps as a unicode string
-                timestamp = datetime.datetime.strptime(row[col_map['TIMESTAMP']],
-                                                       "%Y-%m-%d %H:%M:%S")
-            else:
-                # MySQL timestamps are automatically converted to datetime.datetime
-                timestamp = row[col_map['TIMESTAMP']]
-            target_name = lmtdb.oss_id_map[row[col_map['OSS_ID']]]
+        for results in lmtdb.iter_timeseries_arrays('OSS_DATA', self.query_start,
+                                                    self.query_end_plusplus):
+            epochs = get_epochs(results['TIMESTAMP'])
             for dataset_name in dataset_names:
                 target_dbcol = self.config[dataset_name].get('column')
                 # target_dbcol=PCT_CPU, target_name=snx11025n022
-                if target_dbcol is not None:
-                    self[dataset_name].insert_element(
-                        timestamp,
-                        target_name,
-                        row[col_map[target_dbcol]])
-                else:
+                if target_dbcol is None:
                     errmsg = "%s in self.config but missing 'column' setting" % dataset_name
                     raise KeyError(errmsg)
+                insert_elements(self[dataset_name], epochs, results['OSS_ID'],
+                                lmtdb.oss_id_map, results[target_dbcol])
 
     def archive_ost_data(self, lmtdb):
         """Extract and encode data from LMT's OST_DATA table
@@ -403,48 +415,80 @@ class DatasetDict(dict):
         self.init_datasets(dataset_names, lmtdb.ost_names)
 
         # Now query the OST_DATA table to get byte counts over the query time range
-        results, columns = lmtdb.get_ost_data(self.query_start, self.query_end_plusplus)
-
-        # Index the columns to speed up insertion of data
-        col_map = {}
-        try:
-            for db_col in ['TIMESTAMP', 'OST_ID', 'READ_BYTES',
-                           'WRITE_BYTES', 'KBYTES_USED', 'KBYTES_FREE',
-                           'INODES_USED', 'INODES_FREE']:
-                col_map[db_col] = columns.index(db_col)
-        except ValueError:
-            raise ValueError("LMT database schema does not match expectation")
-
-        # Loop through all the results of the timeseries query
-        for row in results:
-            if isstr(row[col_map['TIMESTAMP']]):
-                # SQLite stores timestamps as a unicode string
-                timestamp = datetime.datetime.strptime(row[col_map['TIMESTAMP']],
-                                                       "%Y-%m-%d %H:%M:%S")
-            else:
-                # MySQL timestamps are automatically converted to datetime.datetime
-                timestamp = row[col_map['TIMESTAMP']]
-            target_name = lmtdb.ost_id_map[row[col_map['OST_ID']]]
+        for results in lmtdb.iter_timeseries_arrays('OST_DATA', self.query_start,
+                                                    self.query_end_plusplus):
+            epochs = get_epochs(results['TIMESTAMP'])
             for dataset_name in dataset_names:
                 target_dbcol = self.config[dataset_name].get('column')
                 if target_dbcol is not None:
-                    self[dataset_name].insert_element(
-                        timestamp,
-                        target_name,
-                        row[col_map[target_dbcol]])
+                    values = results[target_dbcol]
                 elif dataset_name == 'fullness/bytestotal':
-                    self[dataset_name].insert_element(
-                        timestamp,
-                        target_name,
-                        row[col_map['KBYTES_USED']] + row[col_map['KBYTES_FREE']])
+                    values = results['KBYTES_USED'] + results['KBYTES_FREE']
                 elif dataset_name == 'fullness/inodestotal':
-                    self[dataset_name].insert_element(
-                        timestamp,
-                        target_name,
-                        row[col_map['INODES_USED']] + row[col_map['INODES_FREE']])
+                    values = results['INODES_USED'] + results['INODES_FREE']
                 else:
                     errmsg = "%s in self.config but missing 'column' setting" % dataset_name
                     raise KeyError(errmsg)
+                insert_elements(self[dataset_name], epochs, results['OST_ID'],
+                                lmtdb.ost_id_map, values)
+
+def get_epochs(timestamps):
+    """Convert timestamps from an LMT database into seconds since the epoch
+
+    LMT records timestamps in local time, so each distinct timestamp is
+    converted the same way as :meth:`tokio.timeseries.TimeSeries.get_insert_pos`
+    converts datetime objects.
+
+    Args:
+        timestamps (numpy.ndarray): array of ``datetime64[s]`` timestamps
+
+    Returns:
+        numpy.ndarray: integer seconds since the epoch for each timestamp
+    """
+    unique, inverse = numpy.unique(timestamps, return_inverse=True)
+    epochs = numpy.array([int(time.mktime(x.timetuple())) for x in unique.astype(datetime.datetime)],
+                         dtype=numpy.int64)
+    return epochs[inverse.reshape(-1)]
+
+def insert_elements(timeseries, epochs, target_ids, id_map, values):
+    """Insert many elements into a TimeSeries at once
+
+    Equivalent to calling :meth:`tokio.timeseries.TimeSeries.insert_element`
+    for each element in order, so if more than one element maps to the same
+    position in the dataset, the last one wins.
+
+    Args:
+        timeseries (tokio.timeseries.TimeSeries): dataset being updated
+        epochs (numpy.ndarray): seconds since the epoch of each element
+        target_ids (numpy.ndarray): LMT database ID of the target of each element
+        id_map (dict): mapping of LMT database IDs to column names
+        values (numpy.ndarray): value of each element
+
+    Returns:
+        int: number of elements inserted
+    """
+    t_index = (epochs - timeseries.timestamps[0]) // timeseries.timestep
+    mask = (t_index >= 0) & (t_index < timeseries.timestamps.shape[0])
+    t_index = t_index[mask]
+
+    # map target ids to column indices, creating columns in order of appearance
+    unique_ids, first_seen, inverse = numpy.unique(target_ids[mask], return_index=True,
+                                                   return_inverse=True)
+    column_map = numpy.empty(len(unique_ids), dtype=numpy.int64)
+    for code in numpy.argsort(first_seen):
+        column_name = id_map[unique_ids[code]]
+        c_index = timeseries.column_map.get(column_name)
+        if c_index is None:
+            c_index = timeseries.add_column(column_name)
+        column_map[code] = c_index
+    c_index = column_map[inverse.reshape(-1)]
+
+    # keep only the last element inserted at each position
+    flat_index = t_index * timeseries.dataset.shape[1] + c_index
+    _, last_seen = numpy.unique(flat_index[::-1], return_index=True)
+    keep = len(flat_index) - 1 - last_seen
+    timeseries.dataset[t_index[keep], c_index[keep]] = values[mask][keep]
+    return len(keep)
 
 def init_hdf5_file(datasets, init_start, init_end, hdf5_file):
     """
@@ -474,11 +518,25 @@ def init_hdf5_file(datasets, init_start, init_end, hdf5_file):
                 hdf5_file.name,
                 timeseries.dataset.shape))
 
-def archive_lmtdb(lmtdb, init_start, init_end, timestep, output_file, query_start, query_end):
+def archive_lmtdb(lmtdb, init_start, init_end, timestep, output_file, query_start, query_end,
+                  incremental=False):
     """
     Given a start and end time, retrieve all of the relevant contents of an LMT
     database.
+
+    If `incremental` is True and `output_file` already exists, only query the
+    rows following the last row of `output_file` that is fully populated, plus
+    one row of overlap so that rates can be calculated across the boundary.
     """
+    if incremental and os.path.isfile(output_file):
+        with tokio.connectors.hdf5.Hdf5(output_file, 'r') as hdf5_file:
+            resume_time = DatasetDict(query_start, query_end, timestep).find_resume_time(hdf5_file)
+        if resume_time >= query_end:
+            print("%s is already fully populated from %s to %s" % (output_file, query_start, query_end))
+            return
+        query_start = max(query_start, resume_time - datetime.timedelta(seconds=timestep))
+        tokio.debug.debug_print("Resuming at %s" % query_start)
+
     datasets = DatasetDict(query_start, query_end, timestep)
 
     datasets.archive_ost_data(lmtdb)
@@ -520,6 +578,10 @@ def main(argv=None):
     parser.add_argument("--user", type=str, default=None, help="database user")
     parser.add_argument("--password", type=str, default=None, help="database password")
     parser.add_argument("--database", type=str, default=None, help="database name")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only query data after the last fully populated row of the output file")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="number of time ranges to query concurrently (default: 1)")
     parser.add_argument("query_start", type=str, help="start time in %s format" % DATE_FMT_PRINT)
     parser.add_argument("query_end", type=str, help="end time in %s format" % DATE_FMT_PRINT)
     args = parser.parse_args(argv)
@@ -550,13 +612,14 @@ def main(argv=None):
         raise Exception('--timestep must be > 0')
 
     if args.input is not None:
-        lmtdb = tokio.connectors.lmtdb.LmtDb(cache_file=args.input)
+        lmtdb = tokio.connectors.lmtdb.LmtDb(cache_file=args.input, max_connections=args.threads)
     else:
         lmtdb = tokio.connectors.lmtdb.LmtDb(
             dbhost=args.host,
             dbuser=args.user,
             dbpassword=args.password,
-            dbname=args.database)
+            dbname=args.database,
+            max_connections=args.threads)
 
     archive_lmtdb(lmtdb=lmtdb,
                   init_start=init_start,
@@ -564,4 +627,5 @@ def main(argv=None):
                   timestep=args.timestep,
                   output_file=args.output,
                   query_start=query_start,
-                  query_end=query_end)
+                  query_end=query_end,
+                  incremental=args.incremental)
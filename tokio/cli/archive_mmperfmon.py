@@ -17,12 +17,15 @@ When updating an existing HDF5 file, the minimum required syntax is::
 The init start/end times are only required when creating an empty HDF5 file.
 """
 
+import os
 import re
 import sys
-import operator
+import tarfile
+import collections
 import datetime
 import argparse
 import warnings
+import numpy
 import tokio.debug
 import tokio.config
 import tokio.tools.nersc_mmperfmon
@@ -96,6 +99,11 @@ class Archiver(dict):
         self.num_servers = num_servers
         self.lun_types = {}     # cached mapping between LUN names and their types
         self.server_types = {}  # cached mapping between server names and their types
+        self.destinations = {}  # cached mapping between legend entries and datasets
+        self.luns = set([])
+        self.servers = set([])
+        self.timestamps = set([])
+        self.skipped = set([])  # datasets that are not in the schema
 
         self.schema = tokio.connectors.hdf5.SCHEMA.get(SCHEMA_VERSION)
         if self.schema is None:
@@ -123,83 +131,44 @@ class Archiver(dict):
                 column_names=columns)
             self[dataset_name].sort_columns()
 
-    def init_datasets(self, mmpm):
-        """Initialize all datasets that can be created from an Mmperfmon instance
+    def add_columns(self, dataset_name, columns):
+        """Ensure that a dataset exists and contains the given columns
 
-        This method examines an mmpm and identifies all TimeSeries datasets that
-        can be derived from it, then calculates the dimensions of said datasets
-        based on how many unique columns were found.  This is required because
-        the precise number of columns is difficult to generalize a priori on SAN
-        file systems with arbitrarily connected LUNs and servers.
-
-        Also caches the mappings between LUN and NSD server names and their
-        functions (data or metadata).
+        Initializes the dataset if it does not yet exist.  Otherwise, grows it
+        to accommodate any new columns, since the precise number of columns is
+        difficult to generalize a priori on SAN file systems with arbitrarily
+        connected LUNs and servers.
 
         Args:
-            mmpm (tokio.connectors.mmperfmon.Mmperfmon): Object from which
-                possible datasets should be identified and sized.
+            dataset_name (str): name of dataset to be initialized or extended
+            columns (list of str): columns that should exist in the dataset
+
+        Returns:
+            tokio.timeseries.TimeSeries or None: The dataset, or None if
+            `dataset_name` is not in the schema
         """
-        num_luns = set([])
-        num_servers = set([])
-        min_timestamp = None
-        max_timestamp = None
-
-        # first figure out the dimensions of each dataset and cache type maps
-        datasets = {}
-        for timestamp, fqhosts in mmpm.items():
-            timestamp_int = int(timestamp)
-            if min_timestamp is None or timestamp_int < min_timestamp:
-                min_timestamp = timestamp_int
-            if max_timestamp is None or timestamp_int > max_timestamp:
-                max_timestamp = timestamp_int
-            for fqhost, counters in fqhosts.items():
-                num_servers.add(fqhost)
-                server_type = self.server_type(fqhost)
-                for counter, value in counters.items():
-                    # identify non-scalar counters
-                    if isinstance(value, dict):
-                        for instance in value.keys():
-                            column = fqhost + ":" + instance
-                            lun_type = self.lun_type(instance)
-                            if not lun_type:
-                                continue
-                            num_luns.add(instance)
-
-                            dataset_name = "%ss/%s" % (lun_type, COUNTER_MAP.get(counter, counter))
-                            if dataset_name not in datasets:
-                                datasets[dataset_name] = set([])
-                            datasets[dataset_name].add(column)
-                    else:
-                        canonical_counter = COUNTER_MAP.get(counter, counter)
-                        dataset_name = "%ss/%s" % (server_type, canonical_counter)
-                        if dataset_name not in datasets:
-                            datasets[dataset_name] = set([])
-                        datasets[dataset_name].add(fqhost)
-
-                        # little hacky bits to patch together missing datasets
-                        if canonical_counter == 'cpuuser':
-                            dataset_name = "%ss/cpuload" % server_type
-                            if dataset_name not in datasets:
-                                datasets[dataset_name] = set([])
-                            datasets[dataset_name].add(fqhost)
+        if dataset_name in self.skipped:
+            return None
 
-        # figure out number of luns and servers if necessary
-        if self.num_luns is None:
-            self.num_luns = len(num_luns)
-        if self.num_servers is None:
-            self.num_servers = len(num_servers)
-        if self.init_start is None:
-            self.init_start = datetime.datetime.fromtimestamp(min_timestamp)
-        if self.init_end is None:
-            self.init_end = datetime.datetime.fromtimestamp(max_timestamp)
-
-        # then initialize all datasets
-        for dataset_name, columns in datasets.items():
+        columns = list(collections.OrderedDict.fromkeys(columns))
+        if dataset_name not in self:
             tokio.debug.debug_print("Initializing %s with %d columns between %s and %s" %
                                     (dataset_name, len(columns), self.init_start, self.init_end))
-            self.init_dataset(
-                dataset_name=dataset_name,
-                columns=list(columns))
+            self.init_dataset(dataset_name=dataset_name, columns=columns)
+            if dataset_name not in self:
+                self.skipped.add(dataset_name)
+                return None
+            return self[dataset_name]
+
+        timeseries = self[dataset_name]
+        new_columns = [x for x in columns if x not in timeseries.column_map]
+        shortfall = len(timeseries.columns) + len(new_columns) - timeseries.dataset.shape[1]
+        if shortfall > 0:
+            # grow geometrically so that datasets are not copied for every new column
+            timeseries.add_columns(max(shortfall, timeseries.dataset.shape[1]))
+        for column in new_columns:
+            timeseries.add_column(column)
+        return timeseries
 
     def finalize(self):
         """Convert datasets to deltas where necessary and tack on metadata
@@ -209,6 +178,21 @@ class Archiver(dict):
         self.config and require no external input.
         """
 
+        # discard unused columns and put the rest in a predictable order
+        for timeseries in self.values():
+            unused = timeseries.dataset.shape[1] - len(timeseries.columns)
+            if unused > 0:
+                timeseries.trim_columns(unused)
+            timeseries.sort_columns()
+
+        # figure out number of luns and servers if necessary
+        if self.num_luns is None:
+            self.num_luns = len(self.luns)
+        if self.num_servers is None:
+            self.num_servers = len(self.servers)
+        tokio.debug.debug_print("Found %d hosts" % self.num_servers)
+        tokio.debug.debug_print("Found %d timestamps" % len(self.timestamps))
+
         # convert CPU loads to percents
         for dataset_name in self.keys():
             if dataset_name.endswith('cpuuser') or dataset_name.endswith('cpusys'):
@@ -240,56 +224,102 @@ class Archiver(dict):
                 mmperfmon connector class containing all of the data to be
                 archived
         """
-        self.init_datasets(mmpm)
-
-        for timestamp_int, fqhosts in mmpm.items():
-            for fqhost, counters in fqhosts.items():
-                server_type = self.server_type(fqhost)
-                for counter, value in counters.items():
-                    # if this counter has many instances (e.g., non-normalized)
-                    if isinstance(value, dict):
-                        for instance, actual_value in value.items():
-                            column = fqhost + ":" + instance
-
-                            # infer dataset name from counter name
-                            lun_type = self.lun_type(instance)
-
-                            # without knowing the LUN type, we cannot safely do anything
-                            if not lun_type:
-                                #tokio.debug.debug_print("instance of %s is %s" % (counter, instance))
-                                # currently this just drops all the network counters for loopback
-                                continue
-
-                            dataset_name = "%ss/%s" % (lun_type, COUNTER_MAP.get(counter, counter))
-
-                            # insert element
-                            self[dataset_name].insert_element(
-                                timestamp=datetime.datetime.fromtimestamp(int(timestamp_int)),
-                                column_name=column,
-                                value=actual_value,
-                                align='r')
-                    else:
-                        canonical_counter = COUNTER_MAP.get(counter, counter)
-                        dataset_name = "%ss/%s" % (server_type, canonical_counter)
-                        # insert element
-                        self[dataset_name].insert_element(
-                            timestamp=datetime.datetime.fromtimestamp(int(timestamp_int)),
-                            column_name=fqhost,
-                            value=value,
-                            align='r')
-
-                        # little hacky bits to patch together missing datasets
-                        if canonical_counter == "cpuuser":
-                            dataset_name = "%ss/cpuload" % server_type
-                            self[dataset_name].insert_element(
-                                timestamp=datetime.datetime.fromtimestamp(int(timestamp_int)),
-                                column_name=fqhost,
-                                value=value,
-                                reducer=operator.add,
-                                align='r')
+        self.archive_tables(mmpm.get_tables())
 
-        tokio.debug.debug_print("Found %d hosts" % self.num_servers)
-        tokio.debug.debug_print("Found %d timestamps" % len(set(list(mmpm.keys()))))
+    def archive_tables(self, tables):
+        """Extracts and encodes data from a stream of parsed mmperfmon outputs
+
+        Each table is archived as soon as it is received, so `tables` may be a
+        generator that parses mmperfmon outputs on demand.  If either
+        ``init_start`` or ``init_end`` is unknown, all tables are read before
+        any are archived so that the extent of the data can be determined.
+
+        Args:
+            tables (iterable of tokio.connectors.mmperfmon.MmperfmonTable):
+                Parsed mmperfmon outputs.  Values in later tables supersede
+                those in earlier ones.
+        """
+        if self.init_start is None or self.init_end is None:
+            tables = list(tables)
+            timestamps = [table.timestamps[~numpy.isnan(table.values).all(axis=1)]
+                          for table in tables]
+            timestamps = numpy.concatenate(timestamps) if timestamps else []
+            if len(timestamps):
+                if self.init_start is None:
+                    self.init_start = datetime.datetime.fromtimestamp(int(timestamps.min()))
+                if self.init_end is None:
+                    self.init_end = datetime.datetime.fromtimestamp(int(timestamps.max()))
+
+        for table in tables:
+            self.archive_table(table)
+
+    def archive_table(self, table):
+        """Extracts and encodes data from a single parsed mmperfmon output
+
+        Args:
+            table (tokio.connectors.mmperfmon.MmperfmonTable): Parsed output of
+                a single mmperfmon invocation
+        """
+        found = ~numpy.isnan(table.values)
+
+        # resolve the destination of every column before touching any datasets
+        targets = {}
+        for index in numpy.flatnonzero(found.any(axis=0)):
+            entry = table.columns[index]
+            self.servers.add(entry['host'])
+            destinations = self.get_destinations(entry)
+            if entry['device_id'] and destinations:
+                self.luns.add(entry['device_id'])
+            for dataset_name, column in destinations:
+                targets.setdefault(dataset_name, []).append((column, index))
+        self.timestamps.update(table.timestamps[found.any(axis=1)].tolist())
+
+        for dataset_name, columns in targets.items():
+            timeseries = self.add_columns(dataset_name, [x[0] for x in columns])
+            if timeseries is None:
+                continue
+            for column, index in columns:
+                timeseries.insert_column(
+                    timestamps=table.timestamps,
+                    column_name=column,
+                    values=table.values[:, index],
+                    align='r')
+
+    def get_destinations(self, entry):
+        """Identifies the datasets and columns into which a counter is archived
+
+        Args:
+            entry (dict): Element of
+                :attr:`tokio.connectors.mmperfmon.MmperfmonTable.columns`
+                containing a host, counter, and optional device_id
+
+        Returns:
+            list of tuple: (dataset name, column name) for each destination of
+            the values of `entry`.  Empty if they cannot be archived.
+        """
+        key = (entry['host'], entry['counter'], entry['device_id'])
+        destinations = self.destinations.get(key)
+        if destinations is not None:
+            return destinations
+
+        canonical_counter = COUNTER_MAP.get(entry['counter'], entry['counter'])
+        if entry['device_id']:
+            # without knowing the LUN type, we cannot safely do anything
+            lun_type = self.lun_type(entry['device_id'])
+            if lun_type:
+                destinations = [("%ss/%s" % (lun_type, canonical_counter),
+                                 entry['host'] + ":" + entry['device_id'])]
+            else:
+                destinations = []
+        else:
+            server_type = self.server_type(entry['host'])
+            destinations = [("%ss/%s" % (server_type, canonical_counter), entry['host'])]
+            # little hacky bits to patch together missing datasets
+            if canonical_counter == 'cpuuser':
+                destinations.append(("%ss/cpuload" % server_type, entry['host']))
+
+        self.destinations[key] = destinations
+        return destinations
 
     def lun_type(self, lun_name):
         """Infers the dataset name to which a LUN should belong
@@ -406,7 +436,8 @@ def init_hdf5_file(datasets, init_start, init_end, hdf5_file):
                 hdf5_file.name,
                 timeseries.dataset.shape))
 
-def archive_mmperfmon(init_start, init_end, timestep, num_luns, num_servers, output_file, input_files):
+def archive_mmperfmon(init_start, init_end, timestep, num_luns, num_servers, output_file, input_files,
+                      processes=1, window=None):
     """Retrieves remote data and stores it in TOKIO time series format
 
     Given a start and end time, retrieves all of the relevant contents of a
@@ -427,14 +458,11 @@ def archive_mmperfmon(init_start, init_end, timestep, num_luns, num_servers, out
         output_file (str): Path to the file to be created.
         input_files (list of str): List of paths to input files from which
             mmperfmon connectors should be instantiated.
+        processes (int): Number of processes with which to parse the members
+            of each input file
+        window (int or None): Maximum number of members being parsed at once.
+            If None, twice `processes`.
     """
-    mmpm = None
-    for input_file in input_files:
-        if mmpm is None:
-            mmpm = tokio.connectors.mmperfmon.Mmperfmon.from_file(input_file)
-        else:
-            mmpm.load(input_file)
-
     datasets = Archiver(
         init_start=init_start,
         init_end=init_end,
@@ -442,7 +470,7 @@ def archive_mmperfmon(init_start, init_end, timestep, num_luns, num_servers, out
         num_luns=num_luns,
         num_servers=num_servers)
 
-    datasets.archive(mmpm)
+    datasets.archive_tables(iter_input_tables(input_files, processes=processes, window=window))
 
     datasets.finalize()
 
@@ -457,6 +485,33 @@ def archive_mmperfmon(init_start, init_end, timestep, num_luns, num_servers, out
 
     tokio.debug.debug_print("Wrote output to %s" % output_file)
 
+def iter_input_tables(input_files, processes=1, window=None):
+    """Parse mmperfmon outputs from many input files one at a time
+
+    Directories and tarballs are streamed one member at a time.  Any other
+    input file is loaded in its entirety by
+    :class:`tokio.connectors.mmperfmon.Mmperfmon`.
+
+    Args:
+        input_files (list of str): List of paths to input files from which
+            mmperfmon outputs should be read
+        processes (int): Number of processes with which to parse the members
+            of each input file
+        window (int or None): Maximum number of members being parsed at once.
+            If None, twice `processes`.
+
+    Yields:
+        tokio.connectors.mmperfmon.MmperfmonTable: Parsed mmperfmon outputs in
+        the order in which they appear in `input_files`
+    """
+    for input_file in input_files:
+        if os.path.isdir(input_file) or tarfile.is_tarfile(input_file):
+            tables = tokio.connectors.mmperfmon.iter_tables(input_file, processes, window)
+        else:
+            tables = tokio.connectors.mmperfmon.Mmperfmon(cache_file=input_file).get_tables()
+        for table in tables:
+            yield table
+
 def main(argv=None):
     """Entry point for the CLI interface
     """
@@ -479,6 +534,11 @@ def main(argv=None):
     parser.add_argument("--files", type=str, nargs="*", help="path to mmperfmon output file to "
                         + "use instead of query_start/query_end")
     parser.add_argument("--filesystem", type=str, required=True, help='file system to archive')
+    parser.add_argument('-p', '--processes', type=int, default=1,
+                        help="number of processes with which to parse input files (default: 1)")
+    parser.add_argument('--window', type=int, default=None,
+                        help="maximum number of input file members being parsed at once"
+                        + " (default: twice --processes)")
     parser.add_argument("query_start", type=str,
                         help="start time of query in %s format" % DATE_FMT_PRINT)
     parser.add_argument("query_end", type=str,
@@ -515,6 +575,10 @@ def main(argv=None):
         parser.error('init_start >= init_end')
     elif args.timestep < 1:
         parser.error('--timestep must be > 0')
+    elif args.processes < 1:
+        parser.error('--processes must be > 0')
+    elif args.window is not None and args.window < 1:
+        parser.error('--window must be > 0')
 
     files = args.files
     if not files:
@@ -535,4 +599,6 @@ def main(argv=None):
         num_luns=args.num_luns,
         num_servers=args.num_servers,
         output_file=args.output,
-        input_files=files)
+        input_files=files,
+        processes=args.processes,
+        window=args.window)
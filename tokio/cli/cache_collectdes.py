@@ -3,18 +3,18 @@ Dump a lot of data out of ElasticSearch using the Python API and native
 scrolling support.
 
 Instantiates a :class:`tokio.connectors.collectd_es.CollectdEs` object and
-relies on the :meth:`tokio.connectors.collectd_es.CollectdEs.query_timeseries`
-method to populate a data structure that is then serialized to JSON.
+relies on the :meth:`tokio.connectors.collectd_es.CollectdEs.iter_timeseries`
+method to retrieve pages of results that are serialized to JSON one at a time.
+If the output file ends in ``.ndjson`` or ``.ndjson.gz``, each page is written
+to its own line so that the cache can later be read back one page at a time.
+Passing an existing cache as ``--input`` converts it to the output format.
 """
 
 import sys
-import gzip
-import json
-import time
 import datetime
 import argparse
 import warnings
-import mimetypes
+import itertools
 
 import tokio.debug
 import tokio.connectors.collectd_es
@@ -36,8 +36,10 @@ def main(argv=None):
                         help="produce debug messages")
     parser.add_argument('--timeout', type=int, default=30,
                         help='ElasticSearch timeout time (default: 30)')
+    parser.add_argument('--slices', type=int, default=1,
+                        help='retrieve query results in this many parallel slices (default: 1)')
     parser.add_argument('--input', type=str, default=None,
-                        help="use cached output from previous ES query")
+                        help="use cached output from previous ES query (JSON or NDJSON)")
     parser.add_argument("-o", "--output", type=str, default=None,
                         help="output file")
     parser.add_argument('-h', '--host', type=str, default="localhost",
@@ -47,6 +49,9 @@ def main(argv=None):
     parser.add_argument('-i', '--index', type=str, default='cori-collectd-*',
                         help='ElasticSearch index to query (default:cori-collectd-*)')
     parser.add_argument("-c", "--csv", action="store_true", help="return output in CSV format")
+    parser.add_argument("--ndjson", action="store_true",
+                        help="write one page of JSON per line (default: only if output file "
+                        + "ends in .ndjson or .ndjson.gz)")
     args = parser.parse_args(argv)
 
     if args.debug:
@@ -66,33 +71,28 @@ def main(argv=None):
 
     # Read input from a cached json file (generated previously) or by querying
     # Elasticsearch directly
-    must = []
     if args.input is None:
         ### Try to connect
         esdb = tokio.connectors.collectd_es.CollectdEs(
             host=args.host,
             port=args.port,
             index=args.index,
-            timeout=args.timeout)
-
-        pages = None
-        for plugin_query in [tokio.connectors.collectd_es.QUERY_CPU_DATA,
-                             tokio.connectors.collectd_es.QUERY_DISK_DATA,
-                             tokio.connectors.collectd_es.QUERY_MEMORY_DATA]:
-            esdb.query_timeseries(plugin_query,
-                            query_start,
-                            query_end)
-            if pages is None:
-                pages = esdb.scroll_pages
-            else:
-                pages += esdb.scroll_pages
-
-        tokio.debug.debug_print("Loaded results from %s:%s" % (args.host, args.port))
+            timeout=args.timeout,
+            slices=args.slices)
+        plugin_queries = [tokio.connectors.collectd_es.QUERY_CPU_DATA,
+                          tokio.connectors.collectd_es.QUERY_DISK_DATA,
+                          tokio.connectors.collectd_es.QUERY_MEMORY_DATA]
+        source = "%s:%s" % (args.host, args.port)
     else:
         esdb = tokio.connectors.collectd_es.CollectdEs.from_cache(args.input)
         # the following query is arbitrary but is required to parse the cached output
-        esdb.query_disk(query_start, query_end)
-        tokio.debug.debug_print("Loaded results from %s" % args.input)
+        plugin_queries = [tokio.connectors.collectd_es.QUERY_DISK_DATA]
+        source = args.input
+
+    # pages are retrieved lazily so that each is written out and discarded
+    # before the next is retrieved
+    pages = itertools.chain.from_iterable(
+        esdb.iter_timeseries(plugin_query, query_start, query_end) for plugin_query in plugin_queries)
 
     # Write output
     cache_file = args.output
@@ -100,9 +100,16 @@ def main(argv=None):
         print("Caching to %s" % cache_file)
 
     if args.csv:
-        if cache_file is None:
-            print(esdb.to_dataframe().to_csv())
-        else:
-            esdb.to_dataframe().to_csv(cache_file)
+        output_fp = sys.stdout if cache_file is None else open(cache_file, 'w')
+        num_rows = 0
+        for page in pages:
+            dataframe = esdb.to_dataframe(pages=[page])
+            dataframe.index += num_rows
+            dataframe.to_csv(output_fp, header=(num_rows == 0))
+            num_rows += len(dataframe)
+        if cache_file is not None:
+            output_fp.close()
     else:
-        esdb.save_cache(cache_file)
+        esdb.save_cache(cache_file, pages=pages, ndjson=args.ndjson or None)
+
+    tokio.debug.debug_print("Loaded results from %s" % source)
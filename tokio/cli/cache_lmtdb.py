@@ -1,16 +1,23 @@
 """
 Retrieve the contents of an LMT database and cache it locally.
+
+Rows are written to the output database in batches as they are retrieved so
+that arbitrarily long ranges of time can be cached without holding them in
+memory.
 """
 
 import os
 import datetime
 import argparse
 import tokio.connectors.lmtdb
+import tokio.connectors.cachingdb
 
 def retrieve_tables(lmtdb, datetime_start, datetime_end, limit=None):
     """
     Given a start and end time, retrieve and cache all of the relevant contents
-    of an LMT database.
+    of an LMT database.  If lmtdb is in write-through mode, rows are written to
+    its write cache as they are retrieved; otherwise they are retained in
+    memory until lmtdb.save_cache() is called.
     """
 
     min_ts_id, max_ts_id = lmtdb.get_ts_ids(datetime_start, datetime_end)
@@ -27,7 +34,7 @@ def retrieve_tables(lmtdb, datetime_start, datetime_end, limit=None):
         if limit is not None:
             query_str += " LIMIT %d" % limit
 
-        result = lmtdb.query(
+        lmtdb.cache_query(
             query_str=query_str,
             table=lmtdb_table,
             table_schema=table_schema)
@@ -46,6 +53,8 @@ def main(argv=None):
     parser.add_argument("--user", type=str, default=None, help="database user")
     parser.add_argument("--password", type=str, default=None, help="database password")
     parser.add_argument("--database", type=str, default=None, help="database name")
+    parser.add_argument("--batch-size", type=int, default=tokio.connectors.cachingdb.DEFAULT_BATCH_SIZE,
+                        help="rows to retrieve and write at once (default: %(default)s)")
     args = parser.parse_args(argv)
 
     start = datetime.datetime.strptime(args.start, "%Y-%m-%dT%H:%M:%S")
@@ -64,8 +73,6 @@ def main(argv=None):
             dbpassword=args.password,
             dbname=args.database)
 
-    retrieve_tables(lmtdb, start, end, args.limit)
-
     if cache_file is None:
         i = 0
         while True:
@@ -75,4 +82,6 @@ def main(argv=None):
             else:
                 break
     print("Caching to %s" % cache_file)
-    lmtdb.save_cache(cache_file)
+    lmtdb.open_write_cache(cache_file, batch_size=args.batch_size)
+    retrieve_tables(lmtdb, start, end, args.limit)
+    lmtdb.close_write_cache()
@@ -30,8 +30,10 @@ def main(argv=None):
                         help="produce debug messages")
     parser.add_argument('--timeout', type=int, default=30,
                         help='ElasticSearch timeout time (default: 30)')
+    parser.add_argument('--slices', type=int, default=1,
+                        help='retrieve query results in this many parallel slices (default: 1)')
     parser.add_argument('--input', type=str, default=None,
-                        help="use cached output from previous ES query")
+                        help="use cached output from previous ES query (JSON or NDJSON)")
     parser.add_argument("-o", "--output", type=str, default=None,
                         help="output file")
     parser.add_argument('-h', '--host', type=str, default="localhost",
@@ -41,6 +43,9 @@ def main(argv=None):
     parser.add_argument('-i', '--index', type=str, default='dtn-dtn-log*',
                         help='ElasticSearch index to query (default:dtn-dtn-log*)')
     parser.add_argument("-c", "--csv", action="store_true", help="return output in CSV format")
+    parser.add_argument("--ndjson", action="store_true",
+                        help="write one page of JSON per line (default: only if output file "
+                        + "ends in .ndjson or .ndjson.gz)")
     parser.add_argument('--user', type=str, default=None,
                         help='limit results to transfers owned by this user')
     parser.add_argument('--type', type=str, default=None,
@@ -71,7 +76,8 @@ def main(argv=None):
             host=args.host,
             port=args.port,
             index=args.index,
-            timeout=args.timeout)
+            timeout=args.timeout,
+            slices=args.slices)
 
         if args.user:
             must.append({"term": {"USER": args.user}})
@@ -96,4 +102,4 @@ def main(argv=None):
         else:
             esdb.to_dataframe().to_csv(cache_file)
     else:
-        esdb.save_cache(cache_file)
+        esdb.save_cache(cache_file, ndjson=args.ndjson or None)
@@ -2,6 +2,10 @@
 Process the Darshan daily summary generated by either summarize_darshanlogs
 or index_darshanlogs tools and generate a scoreboard of top sources of I/O based
 on user, file system, and/or application.
+
+Multiple index databases (e.g., shards generated by ``index_darshanlogs
+--shard``) can be queried concurrently; their results are reduced into a single
+scoreboard.
 """
 
 import re
@@ -10,6 +14,7 @@ import json
 import sqlite3
 import argparse
 import collections
+import concurrent.futures
 
 import tokio.config
 
@@ -18,24 +23,46 @@ SELECT
     SUM(s.bytes_read) AS readbytes,
     SUM(s.bytes_written) AS writebytes,
     COUNT(DISTINCT h.filename) AS jobcount,
+    %(col)s
 FROM
     summaries AS s
 INNER JOIN
     headers AS h ON h.log_id = s.log_id,
-    mounts AS m ON m.fs_id = s.fs_id
+    mounts AS m ON m.fs_id = s.fs_id%(where)s
+GROUP BY %(group)s
+ORDER BY (readbytes+writebytes) DESC
+"""
+
+# Equivalent to BASE_QUERY but uses the rollups table maintained by
+# index_darshanlogs.  rollups is aliased as h because it carries the same
+# username and exename columns as the headers table, so the same columns and
+# filters apply to both queries.
+ROLLUP_QUERY = """
+SELECT
+    SUM(h.bytes_read) AS readbytes,
+    SUM(h.bytes_written) AS writebytes,
+    SUM(h.%(jobcount)s) AS jobcount,
+    %(col)s
+FROM
+    rollups AS h
+INNER JOIN
+    mounts AS m ON m.fs_id = h.fs_id%(where)s
+GROUP BY %(group)s
 ORDER BY (readbytes+writebytes) DESC
 """
 
 QUERY_PARAMS = collections.OrderedDict()
-QUERY_PARAMS['per_user'] = {'col': 'h.username'}
+QUERY_PARAMS['per_user'] = {'col': 'h.username', 'by_fs': False}
 QUERY_PARAMS['per_fs'] = {
     'col': 'm.fsname, m.mountpt',
     'group': 'm.fsname',
+    'by_fs': True,
 }
-QUERY_PARAMS['per_exe'] = {'col': 'h.exename'}
+QUERY_PARAMS['per_exe'] = {'col': 'h.exename', 'by_fs': False}
 QUERY_PARAMS['per_user_exe_fs'] = {
-    'col': 'h.username || "|" || h.exename || "|" || m.fsname AS tuple',
+    'col': "h.username || '|' || h.exename || '|' || m.fsname AS tuple",
     'group': 'tuple',
+    'by_fs': True,
 }
 
 VERBOSITY = 0
@@ -43,65 +70,219 @@ VERBOSITY = 0
 def query_index_db(db_filenames,
                    limit_fs=None, limit_user=None, limit_exe=None,
                    exclude_fs=None, exclude_user=None, exclude_exe=None,
-                   max_results=None):
+                   max_results=None, threads=1, use_rollups=True):
     """Reduce Darshan log index by fs, user, and/or exe
+
+    Each database in db_filenames is queried independently, optionally in
+    parallel, and the per-database results are then reduced such that each
+    user, exe, and/or file system appears only once.  This assumes that no
+    Darshan log is represented in more than one of db_filenames.
+
+    If a database contains an up-to-date rollups table, categories are
+    calculated from it rather than from the full summaries table wherever the
+    filters allow.  Job counts cannot be derived from rollups for categories
+    that are not grouped by file system when file system filters are applied,
+    so these categories always use the summaries table.
+
+    Args:
+        db_filenames (list of str): Paths to index databases to query
+        limit_fs (list of str): Only include these mount points or file systems
+        limit_user (list of str): Only include these users
+        limit_exe (list of str): Only include these executable names
+        exclude_fs (list of str): Exclude these mount points or file systems
+        exclude_user (list of str): Exclude these users
+        exclude_exe (list of str): Exclude these executable names
+        max_results (int or None): Maximum number of results to return for
+            each category
+        threads (int): Number of databases to query concurrently
+        use_rollups (bool): Use the rollups table when possible
+
+    Returns:
+        collections.OrderedDict: Keyed by category, and each value is a list
+        of tuples whose first three elements are bytes read, bytes written,
+        and job count.
     """
 
     where = []
-    where0 = []
+    params = []
     if limit_fs:
-        where0 = ["(m.mountpt LIKE '%s' OR m.fsname LIKE '%s')" % (limit, limit) for limit in limit_fs]
-        where.append("(" + " OR ".join(where0) + ")")
+        where.append("(" + " OR ".join(["(m.mountpt LIKE ? OR m.fsname LIKE ?)"] * len(limit_fs)) + ")")
+        for limit in limit_fs:
+            params += [limit, limit]
     if exclude_fs:
-        where0 = ["(m.mountpt NOT LIKE '%s' AND m.fsname NOT LIKE '%s')" % (limit, limit) for limit in exclude_fs]
-        where.append("(" + " AND ".join(where0) + ")")
+        where.append("(" + " AND ".join(["(m.mountpt NOT LIKE ? AND m.fsname NOT LIKE ?)"] * len(exclude_fs)) + ")")
+        for limit in exclude_fs:
+            params += [limit, limit]
 
     if limit_user:
-        where0 = ["h.username LIKE '%s'" % limit for limit in limit_user]
-        where.append("(" + " OR ".join(where0) + ")")
+        where.append("(" + " OR ".join(["h.username LIKE ?"] * len(limit_user)) + ")")
+        params += limit_user
     if exclude_user:
-        where0 = ["h.username NOT LIKE '%s'" % limit for limit in exclude_user]
-        where.append("(" + " AND ".join(where0) + ")")
+        where.append("(" + " AND ".join(["h.username NOT LIKE ?"] * len(exclude_user)) + ")")
+        params += exclude_user
 
     if limit_exe:
-        where0 = ["h.exename LIKE '%s'" % limit for limit in limit_exe]
-        where.append("(" + " OR ".join(where0) + ")")
+        where.append("(" + " OR ".join(["h.exename LIKE ?"] * len(limit_exe)) + ")")
+        params += limit_exe
     if exclude_exe:
-        where0 = ["h.exename NOT LIKE '%s'" % limit for limit in exclude_exe]
-        where.append("(" + " AND ".join(where0) + ")")
+        where.append("(" + " AND ".join(["h.exename NOT LIKE ?"] * len(exclude_exe)) + ")")
+        params += exclude_exe
+
+    query_args = {
+        'where': where,
+        'params': params,
+        'fs_filtered': bool(limit_fs or exclude_fs),
+        'use_rollups': use_rollups,
+        # only safe to limit results in SQL if there is no cross-database
+        # reduction to follow
+        'max_results': max_results if len(db_filenames) == 1 else None,
+    }
+
+    if threads > 1 and len(db_filenames) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+            db_results = list(pool.map(lambda x: _query_one_db(x, **query_args), db_filenames))
+    else:
+        db_results = [_query_one_db(x, **query_args) for x in db_filenames]
+
+    if len(db_results) == 1:
+        return db_results[0]
+
+    return reduce_results(db_results, max_results=max_results)
+
+def build_query(category, where=None, rollup=False):
+    """Generate the SQL query for a scoreboard category
+
+    Args:
+        category (str): Key of QUERY_PARAMS to generate
+        where (list of str): Filter clauses to AND together
+        rollup (bool): Generate a query against the rollups table instead of
+            the summaries table
+
+    Returns:
+        str: SQL query whose placeholders correspond to the filter parameters
+    """
+    config = QUERY_PARAMS[category]
+    query_args = {
+        'col': config['col'],
+        'group': config.get('group', config['col']),
+        'where': "\nWHERE\n    " + "\n    AND ".join(where) if where else "",
+        'jobcount': 'jobcount' if config['by_fs'] else 'primary_jobcount',
+    }
+    return (ROLLUP_QUERY if rollup else BASE_QUERY) % query_args
+
+def get_rollup_status(cursor):
+    """Determine which scoreboard categories can be served by rollups
+
+    Rollups are only usable if they exist and reflect every log in the headers
+    table.  Categories that group by file system name can only use rollups if
+    no two mount points share the same file system name, since job counts
+    cannot be de-duplicated across rollup rows.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor for an index database
+
+    Returns:
+        tuple of (bool, bool): Whether rollups are up to date, and whether
+        they can also be used for categories grouped by file system
+    """
+    cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND (name = 'rollups' OR name = 'rollups_meta')")
+    if cursor.fetchall()[0][0] < 2:
+        return False, False
+
+    cursor.execute("SELECT last_log_id, num_logs FROM rollups_meta")
+    rows = cursor.fetchall()
+    cursor.execute("SELECT MAX(log_id), COUNT(*) FROM headers")
+    if not rows or tuple(rows[0]) != tuple(cursor.fetchall()[0]):
+        vprint("Rollups are missing or out of date", 1)
+        return False, False
+
+    cursor.execute("SELECT COUNT(DISTINCT fsname) = COUNT(*) FROM mounts")
+    return True, bool(cursor.fetchall()[0][0])
 
+def _query_one_db(db_filename, where, params, fs_filtered=False, use_rollups=True, max_results=None):
+    """Run each scoreboard query against a single index database
+
+    Args:
+        db_filename (str): Path to index database
+        where (list of str): Filter clauses to AND together
+        params (list): Values to bind to the placeholders in where
+        fs_filtered (bool): Whether where contains file system filters
+        use_rollups (bool): Use the rollups table when possible
+        max_results (int or None): Maximum number of results to return for
+            each category
+
+    Returns:
+        collections.OrderedDict: Keyed by category and whose values are lists
+        of result tuples
+    """
     results = collections.OrderedDict()
 
-    for db_filename in db_filenames:
-        conn = sqlite3.connect(db_filename)
-        cursor = conn.cursor()
+    conn = sqlite3.connect(db_filename)
+    cursor = conn.cursor()
+
+    rollups_ok, rollups_by_fs_ok = get_rollup_status(cursor) if use_rollups else (False, False)
+
+    for category, config in QUERY_PARAMS.items():
+        if config['by_fs']:
+            rollup = rollups_by_fs_ok
+        else:
+            rollup = rollups_ok and not fs_filtered
 
-        for category, config in QUERY_PARAMS.items():
+        query = build_query(category, where=where, rollup=rollup)
+        query_params = list(params)
+        if max_results:
+            query += "LIMIT ?"
+            query_params.append(max_results)
 
-            query = BASE_QUERY
+        vprint(query, 1)
+        vprint("Parameters: %s" % str(query_params), 1)
 
-            # insert the column to group by
-            query = query.replace("FROM", "    %s\nFROM" % config['col'])
-            query = query.replace("ORDER", "GROUP BY %s\nORDER" % config.get('group', config['col']))
+        cursor.execute(query, query_params)
+        results[category] = cursor.fetchall()
 
-            # insert filter qualifiers
-            if where:
-                query = query.replace("GROUP",
-                                      "WHERE\n    " + "\n    AND ".join(where) + "\nGROUP")
+    cursor.close()
+    conn.close()
 
-            # insert max number of return items
-            if max_results:
-                query += "\nLIMIT %d" % max_results
+    return results
 
-            vprint(query, 1)
+def reduce_results(db_results, max_results=None):
+    """Reduce the results of querying multiple index databases
 
-            cursor.execute(query)
-            if category not in results:
-                results[category] = []
-            results[category] += cursor.fetchall()
+    Sums bytes read, bytes written, and job counts of rows that share the same
+    user, exe, and/or file system across databases.
 
-        cursor.close()
-        conn.close()
+    Args:
+        db_results (list of collections.OrderedDict): Outputs of querying each
+            index database
+        max_results (int or None): Maximum number of results to retain for
+            each category
+
+    Returns:
+        collections.OrderedDict: Reduced results in the same form as each
+        element of db_results
+    """
+    reduced = collections.OrderedDict()
+    for db_result in db_results:
+        for category, rows in db_result.items():
+            if category not in reduced:
+                reduced[category] = collections.OrderedDict()
+            for row in rows:
+                key = tuple(row[3:])
+                if key in reduced[category]:
+                    prev = reduced[category][key]
+                    reduced[category][key] = ((prev[0] or 0) + (row[0] or 0),
+                                              (prev[1] or 0) + (row[1] or 0),
+                                              prev[2] + row[2])
+                else:
+                    reduced[category][key] = tuple(row[0:3])
+
+    results = collections.OrderedDict()
+    for category, rows in reduced.items():
+        results[category] = sorted([val + key for key, val in rows.items()],
+                                   key=lambda x: (x[0] or 0) + (x[1] or 0),
+                                   reverse=True)
+        if max_results:
+            results[category] = results[category][:max_results]
 
     return results
 
@@ -178,9 +359,9 @@ def main(argv=None):
                         help="show top N users, apps, file systems")
     group_fs = parser.add_mutually_exclusive_group()
     group_fs.add_argument("--limit-fs", type=str, default=None,
-                          help="only process data targeting this file system.  MUST be a fully qualified path to the mount point or injected SQL")
+                          help="only process data targeting this file system.  MUST be a fully qualified path to the mount point, a file system name, or an SQL LIKE pattern")
     group_fs.add_argument("--exclude-fs", type=str, default=None,
-                          help="exclude data targeting this file system.  MUST be a fully qualified path to the mount point or injected SQL")
+                          help="exclude data targeting this file system.  MUST be a fully qualified path to the mount point, a file system name, or an SQL LIKE pattern")
     group_user = parser.add_mutually_exclusive_group()
     group_user.add_argument("--limit-user", type=str, default=None,
                             help="only process logs generated by this user")
@@ -191,6 +372,10 @@ def main(argv=None):
                            help="only process logs generated by this binary")
     group_exe.add_argument("--exclude-exe", type=str, default=None,
                            help="exclude logs generated by this binary")
+    parser.add_argument('-t', '--threads', default=1, type=int,
+                        help="Number of index databases to query concurrently (default: 1)")
+    parser.add_argument('--no-rollups', action='store_true',
+                        help="Always query the full summaries table even if rollups are available")
     parser.add_argument('-v', '--verbose', action='count', default=0, help="Verbosity level (default: none)")
 
     args = parser.parse_args(argv)
@@ -205,7 +390,10 @@ def main(argv=None):
         'exclude_exe': args.exclude_exe.split(',') if args.exclude_exe else [],
     }
 
-    results = query_index_db(args.indexfile, **kwargs)
+    results = query_index_db(args.indexfile,
+                             threads=args.threads,
+                             use_rollups=not args.no_rollups,
+                             **kwargs)
 
     if args.json:
         print(json.dumps(results, indent=4, sort_keys=True))
@@ -30,6 +30,8 @@ def main(argv=None):
                          help='load each Darshan log; must be {base[,total][,perf]}')
     parser.add_argument('--logdir', type=str,
                         help='path to DARSHAN_LOG_DIR, exclusive of dated subdirectories (default: use site config value)')
+    parser.add_argument('--index', type=str, default=None,
+                        help='path to Darshan log index database to search before globbing --logdir (default: use site config value)')
     parser.add_argument('--host', type=str, default=None,
                         help="hostname; only required if --logdir is not specified and site config contains multiple darshan_log_dirs")
     parser.add_argument("-v", "--verbose", action="store_true",
@@ -69,6 +71,7 @@ def main(argv=None):
                                                        jobid=args.jobid,
                                                        which=args.load,
                                                        log_dir=args.logdir,
+                                                       index_db=args.index,
                                                        system=args.host)
         print(json.dumps(results, indent=4, sort_keys=True))
 
@@ -78,5 +81,6 @@ def main(argv=None):
                                                             username=args.username,
                                                             jobid=args.jobid,
                                                             log_dir=args.logdir,
+                                                            index_db=args.index,
                                                             system=args.host):
             print(logfile)
@@ -64,11 +64,50 @@ Schemata::
         log_version CHAR,
         walltime INTEGER
     );
+
+    CREATE TABLE rollups (
+        username CHAR,
+        exename CHAR,
+        fs_id INTEGER,
+        day CHAR,
+        bytes_read INTEGER,
+        bytes_written INTEGER,
+        jobcount INTEGER,
+        primary_jobcount INTEGER,
+        FOREIGN KEY (fs_id) REFERENCES mounts (fs_id)
+    );
+
+    CREATE TABLE rollups_meta (
+        last_log_id INTEGER,
+        num_logs INTEGER
+    );
+
+The rollups table is a materialized aggregation of summaries by user, exe, file
+system, and day (UTC date of each job's start time) that is kept current as
+new logs are indexed.  ``jobcount`` is the number of logs that touched the
+file system, while ``primary_jobcount`` counts each log only once (under the
+lowest ``fs_id`` it touched) so that job counts can be summed across file
+systems.  rollups_meta records the headers that have been rolled up so that
+rollups can be updated incrementally and so consumers can detect when they are
+stale.
+
+Multiple indexers can run concurrently (e.g., on several nodes) by giving each
+one a different ``--shard`` of the same log list and its own ``--output``
+database.  The resulting shard databases can then be combined into a single
+index using :meth:`merge_index_dbs` or the ``merge_darshanindex`` tool, or they
+can be queried together by ``darshan_scoreboard``.
+
+Logs can be triaged using only their headers, which are read without
+decompressing any counters.  ``--exclude-user`` and ``--exclude-jobid`` skip
+logs before they are fully parsed, and ``--headers-only`` populates only the
+headers table.  Logs indexed with ``--headers-only`` are fully indexed by a
+subsequent run without that option.
 """
 
 import os
 import re
 import time
+import zlib
 import sqlite3
 import operator
 import functools
@@ -127,6 +166,22 @@ HEADER_COUNTERS = [
 MOUNTS_TABLE = "mounts"
 HEADERS_TABLE = "headers"
 SUMMARIES_TABLE = "summaries"
+ROLLUPS_TABLE = "rollups"
+ROLLUPS_META_TABLE = "rollups_meta"
+
+ROLLUP_KEYS = ['username', 'exename', 'fs_id', 'day']
+ROLLUP_COUNTERS = ['bytes_read', 'bytes_written', 'jobcount', 'primary_jobcount']
+
+# covering indices for incremental rollup updates and darshan_scoreboard, and
+# indices for log lookups by tokio.tools.darshan.find_darshanlogs
+INDICES = {
+    "%s_covering" % ROLLUPS_TABLE: (ROLLUPS_TABLE, ROLLUP_KEYS + ROLLUP_COUNTERS),
+    "%s_fs_covering" % SUMMARIES_TABLE: (SUMMARIES_TABLE, ['fs_id', 'log_id', 'bytes_read', 'bytes_written']),
+    "%s_username_exename" % HEADERS_TABLE: (HEADERS_TABLE, ['username', 'exename']),
+    "%s_jobid" % HEADERS_TABLE: (HEADERS_TABLE, ['jobid', 'start_time']),
+    "%s_username_start_time" % HEADERS_TABLE: (HEADERS_TABLE, ['username', 'start_time']),
+    "%s_start_time" % HEADERS_TABLE: (HEADERS_TABLE, ['start_time']),
+}
 
 VERBOSITY = 0
 QUIET = False
@@ -134,12 +189,87 @@ QUIET = False
 # precompile regular expressions
 MOUNT_TO_FSNAME = {}
 
+# cache of mount point : logical fs name resolved using MOUNT_TO_FSNAME
+MOUNT_FSNAMES = {}
+
+# counters reduced by the lite parser come from these modules
+LITE_MODULES = ('POSIX', 'STDIO')
+
+# size of each read from the darshan-parser pipe
+PIPE_READ_BYTES = 4 * 1024 * 1024
+
 def init_mount_to_fsname():
     """Initialize regexes to map mount points to file system names
     """
     global MOUNT_TO_FSNAME
     for rex_str, fsname in tokio.config.CONFIG.get('mount_to_fsname', {}).items():
         MOUNT_TO_FSNAME[re.compile(rex_str)] = fsname
+    MOUNT_FSNAMES.clear()
+
+def get_fsname(mount):
+    """Return the logical file system name of a mount point
+
+    Args:
+        mount (str): Mount point
+
+    Returns:
+        str: Logical file system name from the last regex in MOUNT_TO_FSNAME
+            that matches mount, or mount itself if none match
+    """
+    fsname = MOUNT_FSNAMES.get(mount)
+    if fsname is None:
+        fsname = mount
+        for mount_rex, logical in MOUNT_TO_FSNAME.items():
+            if mount_rex.match(mount):
+                fsname = logical
+        MOUNT_FSNAMES[mount] = fsname
+    return fsname
+
+class MountLookup(object):
+    """Longest-prefix lookup of the mount points in which files are located
+
+    Mount points are grouped by length so that finding the most specific mount
+    point containing a file takes one set lookup per distinct mount length
+    rather than one string comparison per mount point.
+    """
+    def __init__(self, mount_list):
+        """Build the lookup tables for a mount table
+
+        Args:
+            mount_list (list of str): List of mount points
+        """
+        self.by_length = {}
+        for mount in mount_list:
+            self.by_length.setdefault(len(mount), set()).add(mount)
+        self.lengths = sorted(self.by_length, reverse=True)
+
+        # the most specific mount in the mount table
+        self.longest = max(mount_list, key=len) if mount_list else None
+
+    def get(self, filename):
+        """Return the mount point in which a file is located
+
+        Args:
+            filename (str): Fully equalified path to a file or directory
+
+        Returns:
+            tuple of (str, str) or None: See get_file_mount()
+        """
+        if self.longest is None:
+            return None
+
+        # filename should be a fully qualified path in darshan3 logs; if
+        # if it is not, then the log has been anonymized _and_ this record
+        # does not correspond to a file.  here we assume it is an
+        # anonymized representation of <STDOUT> or <STDERR>
+        if os.sep not in filename and not filename.startswith(self.longest):
+            return "UNKNOWN", "UNKNOWN"
+
+        for length in self.lengths:
+            mount = filename[:length]
+            if mount in self.by_length[length]:
+                return mount, get_fsname(mount)
+        return None
 
 def get_file_mount(filename, mount_list):
     """Return the mount point in which a file is located
@@ -154,26 +284,7 @@ def get_file_mount(filename, mount_list):
             logical file system name.  Returns None if filename does not match
             any mounts
     """
-    # always want the most specific mount path to match first
-    sorted_mount_list = sorted(mount_list, key=len, reverse=True)
-
-    for mount in sorted_mount_list:
-        if filename.startswith(mount):
-            logical = mount
-            for mount_rex, fsname in MOUNT_TO_FSNAME.items():
-                match = mount_rex.match(mount)
-                if match:
-                    logical = fsname
-            return (mount, logical)
-        if filename in ("<STDOUT>", "<STDERR>") and mount == "UNKNOWN":
-            return mount, mount
-        # filename should be a fully qualified path in darshan3 logs; if
-        # if it is not, then the log has been anonymized _and_ this record
-        # does not correspond to a file.  here we assume it is an
-        # anonymized representation of <STDOUT> or <STDERR>
-        elif os.sep not in filename:
-            return "UNKNOWN", "UNKNOWN"
-    return None
+    return MountLookup(mount_list).get(filename)
 
 def summarize_by_fs(darshan_log, max_mb=0.0):
     """Generates summary scalar values for a Darshan log
@@ -274,11 +385,12 @@ def summarize_by_fs(darshan_log, max_mb=0.0):
 
     # Reduce each counter according to its mount point
     logical_mount_names = {}
+    mount_lookup = MountLookup(mount_list)
     for module, log_counters in module_records.items():
         # record_file is the full path to a file that the application manipulated
         for record_file in log_counters:
             # skip file records resident on unknown file systems
-            mount = get_file_mount(record_file, mount_list)
+            mount = mount_lookup.get(record_file)
             if mount is None:
                 continue
             mount, logical = mount
@@ -316,9 +428,24 @@ def summarize_by_fs(darshan_log, max_mb=0.0):
         else:
             mountpts[key] = logical_mount_names.get(key, key)
 
-    # Populate the headers data
+    return {
+        'summaries': reduced_counters,
+        'headers': build_header_record(darshan_data),
+        'mounts': mountpts
+    }
+
+def build_header_record(darshan_data):
+    """Converts a Darshan object's header into a row for the headers table
+
+    Args:
+        darshan_data (tokio.connectors.darshan.Darshan): Darshan object whose
+            header has been populated
+
+    Returns:
+        dict: Values for each column of the headers table
+    """
     header = {}
-    counters = darshan_data.get('header')
+    counters = darshan_data.get('header', {})
     header['filename'] = os.path.basename(darshan_data.log_file)
     for counter in HEADER_COUNTERS:
         header[counter] = counters.get(counter)
@@ -335,12 +462,96 @@ def summarize_by_fs(darshan_log, max_mb=0.0):
     # username is resolved here so that it can be indexed without having to mess around
     header['username'] = darshan_data.filename_metadata.get('username')
 
+    return header
+
+def summarize_header(darshan_log):
+    """Generates a headers table row for a Darshan log without its counters
+
+    Uses the Darshan connector's header-only reader, which decodes the job
+    header and mount table without touching any module records.  Its output
+    has the same form as that of summarize_by_fs() but with empty summaries
+    and mounts.
+
+    Args:
+        darshan_log (str): Path to a Darshan log file
+
+    Returns:
+        dict: Contains three keys (summaries, mounts, and headers) where only
+            headers is populated, or an empty dict if the log's header
+            could not be read
+    """
+    try:
+        darshan_data = tokio.connectors.darshan.Darshan(darshan_log, silent_errors=True)
+        darshan_data.darshan_header()
+    except:
+        darshan_data = None
+
+    if not darshan_data or not darshan_data.get('header'):
+        if not QUIET:
+            errmsg = "Unable to open or parse %s" % darshan_log
+            warnings.warn(errmsg)
+        return {}
+
     return {
-        'summaries': reduced_counters,
-        'headers': header,
-        'mounts': mountpts
+        'summaries': {},
+        'headers': build_header_record(darshan_data),
+        'mounts': {},
     }
 
+def is_excluded(header, exclude_users=None, exclude_jobids=None):
+    """Determines whether a log should be skipped based on its header
+
+    Args:
+        header (dict): Row for the headers table as returned by
+            build_header_record()
+        exclude_users (set of str): User names or numeric uids to skip
+        exclude_jobids (set of str): Job ids to skip
+
+    Returns:
+        bool: True if the log belongs to an excluded user or job
+    """
+    if exclude_users:
+        if header.get('username') in exclude_users or str(header.get('uid')) in exclude_users:
+            return True
+    if exclude_jobids and str(header.get('jobid')) in exclude_jobids:
+        return True
+    return False
+
+def summarize_log(darshan_log, max_mb=0.0, headers_only=False, exclude_users=None,
+                  exclude_jobids=None):
+    """Generates the index records for a single Darshan log
+
+    Reads only the log's header when that is all that is needed, either to
+    decide that the log should be excluded or because only the headers table is
+    being populated.  Otherwise defers to summarize_by_fs().
+
+    Args:
+        darshan_log (str): Path to a Darshan log file
+        max_mb (float): Passed to summarize_by_fs()
+        headers_only (bool): Do not parse counters; only return headers
+        exclude_users (set of str): User names or numeric uids to skip
+        exclude_jobids (set of str): Job ids to skip
+
+    Returns:
+        dict: Output of summarize_by_fs() or summarize_header(), or an empty
+            dict if the log was excluded or could not be parsed
+    """
+    if not headers_only and not exclude_users and not exclude_jobids:
+        return summarize_by_fs(darshan_log, max_mb=max_mb)
+
+    summary = summarize_header(darshan_log)
+    if not summary:
+        return {}
+
+    if is_excluded(summary['headers'], exclude_users, exclude_jobids):
+        vprint("Excluding %s" % darshan_log, 3)
+        return {}
+
+    if headers_only:
+        return summary
+
+    return summarize_by_fs(darshan_log, max_mb=max_mb)
+
 def summarize_by_fs_lite(darshan_log):
     """Generates summary scalar values for a Darshan log
 
@@ -390,113 +601,14 @@ def summarize_by_fs_lite(darshan_log):
             warnings.warn(errmsg)
         return {}
 
-    # hack in UNKNOWN for the stdio module since it does not appear in the mount table
-    mount_list = ["UNKNOWN"]
-
-    logical_mount_names = {} # mapping of mountpoint : logical fs name
-    header = {
-        'filename': os.path.basename(darshan_log),
-    }
-    reduced_counters = {} # mounts->counters
-
     dparser = subprocess.Popen(['darshan-parser', '--base', darshan_log],
                                stdout=subprocess.PIPE)
-
-    logvers = 3
-    while True:
-        line = dparser.stdout.readline().decode('utf-8')
-        if not line:
-            break
-
-        # find header lines
-        if line.startswith('# darshan log version:'):
-            header['version'] = line.split(":", 1)[-1].strip()
-            if header['version'].startswith('2'):
-                logvers = 2
-            continue
-        elif line.startswith('# exe:'):
-            header['exe'] = line.split(":", 1)[-1].strip().split()
-            continue
-        elif line.startswith('# uid:'):
-            header['uid'] = int(line.split(":", 1)[-1].strip())
-            continue
-        elif line.startswith('# jobid:'):
-            header['jobid'] = line.split(":", 1)[-1].strip()
-            continue
-        elif line.startswith('# start_time:'):
-            header['start_time'] = int(line.split(":", 1)[-1])
-            continue
-        elif line.startswith('# end_time:'):
-            header['end_time'] = int(line.split(":", 1)[-1])
-            continue
-        elif line.startswith('# nprocs:'):
-            header['nprocs'] = int(line.split(":", 1)[-1])
-            continue
-        elif line.startswith('# run time:'):
-            header['walltime'] = int(line.split(":", 1)[-1])
-            continue
-
-        # find mount table lines
-        elif line.startswith('# mount entry:'):
-            if logvers == 2:
-                mountpt = line.split(':', 1)[-1].strip().split(None, 1)[-1].rsplit(None, 1)[0]
-            else:
-                mountpt = line.split(':', 1)[-1].strip().split(None, 1)[0]
-            mount_list.append(mountpt)
-            continue
-
-        # find counter lines
-        elif not line.startswith('#'):
-            fields = line.split()
-            if len(fields) < 7:
-                continue
-
-            value = None
-            reducer = None
-
-            # extract key and value; different field layout for darshan2 logs
-            if logvers == 2:
-                counter = fields[2].split('_', 1)[-1]
-                counter = tokio.connectors.darshan.V2_TO_V3.get(counter, counter).lower()
-                if counter in INTEGER_COUNTERS:
-                    value = int(fields[3])
-                    reducer = INTEGER_COUNTERS.get(counter)
-                elif counter in REAL_COUNTERS:
-                    value = float(fields[3])
-                    reducer = REAL_COUNTERS.get(counter)
-            else:
-                # only consider POSIX and STDIO modules for v3
-                if fields[0] not in ('POSIX', 'STDIO'):
-                    continue
-                counter = fields[3].split('_', 1)[-1].lower()
-                if counter in INTEGER_COUNTERS:
-                    value = int(fields[4])
-                    reducer = INTEGER_COUNTERS.get(counter)
-                elif counter in REAL_COUNTERS:
-                    value = float(fields[4])
-                    reducer = REAL_COUNTERS.get(counter)
-
-            if value is None:
-                continue
-
-            mount = fields[-2]
-            mount = get_file_mount(mount, mount_list)
-            if mount is None:
-                continue
-
-            mount, logical = mount
-            logical_mount_names[mount] = logical
-            if mount not in reduced_counters:
-                reduced_counters[mount] = {}
-
-            if counter not in reduced_counters[mount]:
-                reduced_counters[mount][counter] = value
-            elif not reducer:
-                reduced_counters[mount][counter] = value
-            else:
-                reduced_counters[mount][counter] = reducer(reduced_counters[mount][counter], value) if reduced_counters[mount][counter] is not None else value
-
-            continue
+    try:
+        header, reduced_counters, logical_mount_names = reduce_base_output(dparser.stdout)
+    finally:
+        dparser.stdout.close()
+        dparser.wait()
+    header['filename'] = os.path.basename(darshan_log)
 
     # if the file could be opened and read but contained no valid Darshan data,
     # it will have a valid header but no counters; bail
@@ -544,6 +656,148 @@ def summarize_by_fs_lite(darshan_log):
         'mounts': mountpts
     }
 
+def _get_lite_reduction(raw_counter, logvers):
+    """Determine how the lite parser should reduce a darshan-parser counter
+
+    Args:
+        raw_counter (bytes): Counter name as printed by darshan-parser
+        logvers (int): Major version of the Darshan log
+
+    Returns:
+        tuple or None: (counter, type, reducer) where counter is the key in
+            INTEGER_COUNTERS or REAL_COUNTERS, type converts the value, and
+            reducer combines two values.  None if the counter is not indexed.
+    """
+    module, _, counter = raw_counter.decode('utf-8').partition('_')
+    if logvers == 2:
+        counter = tokio.connectors.darshan.V2_TO_V3.get(counter, counter).lower()
+    elif module in LITE_MODULES:
+        counter = counter.lower()
+    else:
+        return None
+
+    if counter in INTEGER_COUNTERS:
+        return counter, int, INTEGER_COUNTERS[counter]
+    elif counter in REAL_COUNTERS:
+        return counter, float, REAL_COUNTERS[counter]
+    return None
+
+def reduce_base_output(stream, chunk_size=PIPE_READ_BYTES):
+    """Reduce the output of darshan-parser --base by mount point
+
+    Reads the output of darshan-parser in large chunks and reduces each counter
+    that appears in INTEGER_COUNTERS or REAL_COUNTERS over all records that
+    share a mount point.  How each distinct counter name and mount point is
+    handled is resolved the first time it is encountered and cached, so most
+    lines are reduced with two dict lookups.
+
+    Args:
+        stream: File-like object producing the bytes output of
+            ``darshan-parser --base``
+        chunk_size (int): Number of bytes to read from stream at a time
+
+    Returns:
+        tuple of (dict, dict, dict): The header, the reduced counters keyed by
+            mount point, and the logical file system name of each mount point
+    """
+    # hack in UNKNOWN for the stdio module since it does not appear in the mount table
+    mount_list = ["UNKNOWN"]
+    mount_lookup = None
+
+    logical_mount_names = {} # mapping of mountpoint : logical fs name
+    header = {}
+    reduced_counters = {} # mounts->counters
+
+    reductions = {} # raw counter name -> (counter, type, reducer) or None
+    record_mounts = {} # raw mount point -> (mount, logical) or None
+
+    logvers = 3
+    counter_field = 3 # module, rank, record id, counter, value, ...
+    remainder = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if chunk:
+            lines = (remainder + chunk).split(b'\n')
+            remainder = lines.pop()
+        elif remainder:
+            lines = [remainder]
+            remainder = b''
+        else:
+            break
+
+        for line in lines:
+            if line.startswith(b'#'):
+                line = line.decode('utf-8')
+                # find header lines
+                if line.startswith('# darshan log version:'):
+                    header['version'] = line.split(":", 1)[-1].strip()
+                    if header['version'].startswith('2'):
+                        logvers = 2
+                        counter_field = 2 # rank, file hash, counter, value, ...
+                elif line.startswith('# exe:'):
+                    header['exe'] = line.split(":", 1)[-1].strip().split()
+                elif line.startswith('# uid:'):
+                    header['uid'] = int(line.split(":", 1)[-1].strip())
+                elif line.startswith('# jobid:'):
+                    header['jobid'] = line.split(":", 1)[-1].strip()
+                elif line.startswith('# start_time:'):
+                    header['start_time'] = int(line.split(":", 1)[-1])
+                elif line.startswith('# end_time:'):
+                    header['end_time'] = int(line.split(":", 1)[-1])
+                elif line.startswith('# nprocs:'):
+                    header['nprocs'] = int(line.split(":", 1)[-1])
+                elif line.startswith('# run time:'):
+                    header['walltime'] = int(line.split(":", 1)[-1])
+                # find mount table lines
+                elif line.startswith('# mount entry:'):
+                    if logvers == 2:
+                        mountpt = line.split(':', 1)[-1].strip().split(None, 1)[-1].rsplit(None, 1)[0]
+                    else:
+                        mountpt = line.split(':', 1)[-1].strip().split(None, 1)[0]
+                    mount_list.append(mountpt)
+                    mount_lookup = None
+                continue
+
+            # counter lines; the last three fields are file name, mount point,
+            # and fs type, and the file name may contain tabs
+            fields = line.split(b'\t', counter_field + 2)
+            if len(fields) < counter_field + 3:
+                continue
+
+            reduction = reductions.get(fields[counter_field], False)
+            if reduction is False:
+                reduction = _get_lite_reduction(fields[counter_field], logvers)
+                reductions[fields[counter_field]] = reduction
+            if reduction is None:
+                continue
+
+            tail = fields[-1].rsplit(b'\t', 2)
+            if len(tail) < 3:
+                continue
+
+            mount = record_mounts.get(tail[1], False)
+            if mount is False:
+                if mount_lookup is None:
+                    mount_lookup = MountLookup(mount_list)
+                    record_mounts.clear()
+                mount = mount_lookup.get(tail[1].decode('utf-8'))
+                record_mounts[tail[1]] = mount
+            if mount is None:
+                continue
+
+            mount, logical = mount
+            counters = reduced_counters.get(mount)
+            if counters is None:
+                counters = reduced_counters[mount] = {}
+                logical_mount_names[mount] = logical
+
+            counter, vtype, reducer = reduction
+            value = vtype(fields[counter_field + 1])
+            prev = counters.get(counter)
+            counters[counter] = value if prev is None else reducer(prev, value)
+
+    return header, reduced_counters, logical_mount_names
+
 def insert_summary(conn, summary):
     """Inserts the output of summarize_by_fs into database
 
@@ -566,9 +820,9 @@ def insert_summary(conn, summary):
         vprint("Parameters: %s" % str((mountpt, fsname)), 4)
         cursor.execute("INSERT OR IGNORE INTO %s (mountpt, fsname) VALUES (?, ?)" % MOUNTS_TABLE, (mountpt, fsname))
 
-    # Update headers table
+    # Update headers table; replace rows left behind by a headers-only index
     header_counters = ["filename", "exe", "username", "exename"] + HEADER_COUNTERS
-    query = "INSERT INTO %s (" % HEADERS_TABLE
+    query = "INSERT OR REPLACE INTO %s (" % HEADERS_TABLE
     query += ", ".join(header_counters)
     query += ") VALUES (" + ",".join(["?"] * len(header_counters))
     query += ")"
@@ -648,12 +902,15 @@ def create_headers_table(conn):
 
 def update_headers_table(conn, header_data):
     """Adds new header data to the headers table
+
+    Existing rows for the same log file (e.g., those created by a headers-only
+    index) are replaced, giving them new log_ids so that rollups are refreshed.
     """
     cursor = conn.cursor()
 
     header_counters = ["filename", "exe", "username", "exename"] + HEADER_COUNTERS
 
-    query = "INSERT INTO %s (" % HEADERS_TABLE
+    query = "INSERT OR REPLACE INTO %s (" % HEADERS_TABLE
     query += ", ".join(header_counters)
     query += ") VALUES (" + ",".join(["?"] * len(header_counters))
     query += ")"
@@ -710,7 +967,123 @@ def update_summaries_table(conn, summary_data):
     cursor.close()
     conn.commit()
 
-def get_existing_logs(conn):
+def create_rollups_table(conn):
+    """Creates the rollups table and its metadata table
+    """
+    cursor = conn.cursor()
+    query = """CREATE TABLE IF NOT EXISTS %s (
+        username CHAR,
+        exename CHAR,
+        fs_id INTEGER,
+        day CHAR,
+        bytes_read INTEGER,
+        bytes_written INTEGER,
+        jobcount INTEGER,
+        primary_jobcount INTEGER,
+        FOREIGN KEY (fs_id) REFERENCES mounts (fs_id)
+    )
+    """ % ROLLUPS_TABLE
+    vprint(query, 3)
+    cursor.execute(query)
+
+    query = """CREATE TABLE IF NOT EXISTS %s (
+        last_log_id INTEGER,
+        num_logs INTEGER
+    )
+    """ % ROLLUPS_META_TABLE
+    vprint(query, 3)
+    cursor.execute(query)
+    cursor.close()
+    conn.commit()
+
+def create_indices(conn):
+    """Creates indices on the headers, summaries, and rollups tables
+    """
+    cursor = conn.cursor()
+    for index_name, (table, columns) in INDICES.items():
+        query = "CREATE INDEX IF NOT EXISTS %s ON %s (%s)" % (index_name, table, ", ".join(columns))
+        vprint(query, 3)
+        cursor.execute(query)
+    cursor.close()
+    conn.commit()
+
+def update_rollups_table(conn):
+    """Brings the rollups table up to date with the summaries table
+
+    Only the (user, exe, file system, day) groups touched by logs added since
+    the last update are recalculated.  If the headers table was modified in a
+    way that invalidates the existing rollups (e.g., logs were deleted), the
+    rollups table is rebuilt from scratch.
+
+    Args:
+        conn (sqlite3.Connection): Connection to index database
+    """
+    cursor = conn.cursor()
+
+    day = "date(h.start_time, 'unixepoch')"
+    select_query = """SELECT
+            h.username,
+            h.exename,
+            s.fs_id,
+            %s,
+            SUM(s.bytes_read),
+            SUM(s.bytes_written),
+            COUNT(DISTINCT s.log_id),
+            SUM(CASE WHEN s.fs_id = (SELECT MIN(s2.fs_id) FROM %s AS s2 WHERE s2.log_id = s.log_id) THEN 1 ELSE 0 END)
+        FROM %s AS s
+        INNER JOIN %s AS h ON h.log_id = s.log_id""" % (day, SUMMARIES_TABLE, SUMMARIES_TABLE, HEADERS_TABLE)
+    group_by = "\n        GROUP BY h.username, h.exename, s.fs_id, %s" % day
+    insert_query = "INSERT INTO %s (%s)\n        " % (ROLLUPS_TABLE, ", ".join(ROLLUP_KEYS + ROLLUP_COUNTERS))
+
+    cursor.execute("SELECT last_log_id, num_logs FROM %s" % ROLLUPS_META_TABLE)
+    rows = cursor.fetchall()
+    last_log_id, num_logs = rows[0] if rows else (None, 0)
+
+    if last_log_id is not None:
+        cursor.execute("SELECT COUNT(*) FROM %s WHERE log_id <= ?" % HEADERS_TABLE, (last_log_id,))
+        if cursor.fetchall()[0][0] != num_logs:
+            vprint("Rollups are inconsistent with %s; rebuilding" % HEADERS_TABLE, 1)
+            last_log_id = None
+
+    if last_log_id is None:
+        cursor.execute("DELETE FROM %s" % ROLLUPS_TABLE)
+        query = insert_query + select_query + group_by
+        vprint(query, 3)
+        cursor.execute(query)
+    else:
+        # identify groups affected by new logs, then recalculate them
+        query = """CREATE TEMP TABLE rollup_keys AS
+        SELECT DISTINCT h.username, h.exename, s.fs_id, %s AS day
+        FROM %s AS s
+        INNER JOIN %s AS h ON h.log_id = s.log_id
+        WHERE h.log_id > ?""" % (day, SUMMARIES_TABLE, HEADERS_TABLE)
+        vprint(query, 3)
+        cursor.execute(query, (last_log_id,))
+
+        match = " AND ".join(["k.%s IS %s.%s" % (x, ROLLUPS_TABLE, x) for x in ROLLUP_KEYS])
+        query = "DELETE FROM %s WHERE EXISTS (SELECT 1 FROM temp.rollup_keys AS k WHERE %s)" % (
+            ROLLUPS_TABLE, match)
+        vprint(query, 3)
+        cursor.execute(query)
+
+        query = insert_query + select_query + """
+        INNER JOIN temp.rollup_keys AS k
+            ON k.username IS h.username
+            AND k.exename IS h.exename
+            AND k.fs_id = s.fs_id
+            AND k.day IS %s""" % day + group_by
+        vprint(query, 3)
+        cursor.execute(query)
+        cursor.execute("DROP TABLE temp.rollup_keys")
+
+    cursor.execute("DELETE FROM %s" % ROLLUPS_META_TABLE)
+    cursor.execute("INSERT INTO %s (last_log_id, num_logs) SELECT MAX(log_id), COUNT(*) FROM %s" % (
+        ROLLUPS_META_TABLE, HEADERS_TABLE))
+
+    cursor.close()
+    conn.commit()
+
+def get_existing_logs(conn, headers_only=False):
     """Returns list of log files already indexed in db
 
     Scans the summaries table for existing entries and returns the file names
@@ -724,11 +1097,21 @@ def get_existing_logs(conn):
     Args:
         conn (sqlite3.Connection): Connection to database containing existing
             logs
+        headers_only (bool): Return all logs in the headers table, including
+            those that have no summaries
 
     Returns:
         list of str: Basenames of Darshan log files represnted in the database
     """
     cursor = conn.cursor()
+    if headers_only:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?",
+                       (HEADERS_TABLE,))
+        if not cursor.fetchall():
+            return []
+        cursor.execute("SELECT filename FROM %s" % HEADERS_TABLE)
+        return [x[0] for x in cursor.fetchall()]
+
     # test table existence first
     cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND (name = ? OR name = ?)",
                    (SUMMARIES_TABLE, HEADERS_TABLE))
@@ -742,7 +1125,23 @@ def get_existing_logs(conn):
     results = cursor.fetchall()
     return [x[0] for x in results]
 
-def process_log_list(conn, log_list):
+def get_log_shard(filename, num_shards):
+    """Determine which shard a Darshan log belongs to
+
+    Shards are assigned by hashing the basename of each log so that the same
+    log always lands in the same shard regardless of which directory it was
+    found in or how many other logs are being indexed.
+
+    Args:
+        filename (str): Path to a Darshan log
+        num_shards (int): Total number of shards
+
+    Returns:
+        int: Shard number between 0 and num_shards - 1, inclusive
+    """
+    return zlib.crc32(os.path.basename(filename).encode('utf-8')) % num_shards
+
+def process_log_list(conn, log_list, shard=0, num_shards=1, headers_only=False):
     """Expand and filter the list of logs to process
 
     Takes log_list as input by user and returns a list of Darshan logs that
@@ -750,7 +1149,8 @@ def process_log_list(conn, log_list):
 
     1. Expands log_list from a single-element list pointing to a directory [of
        logs] into a list of log files
-    2. Returns the subset of Darshan logs which do not already appear in the
+    2. Discards logs that do not belong to the requested shard
+    3. Returns the subset of Darshan logs which do not already appear in the
        given database.
 
     Relies on the logic of get_existing_logs() to determine whether a log
@@ -764,6 +1164,10 @@ def process_log_list(conn, log_list):
         conn (sqlite3.Connection): Database containing log data
         log_list (list of str): List of paths to Darshan logs or a single-element
             list to a directory
+        shard (int): Shard number of logs to retain
+        num_shards (int): Total number of shards into which log_list is divided
+        headers_only (bool): Treat logs that only appear in the headers table
+            as already indexed
 
     Returns:
         list of str: Subset of log_list that contains only those Darshan logs
@@ -771,7 +1175,7 @@ def process_log_list(conn, log_list):
     """
     # Filter out logs that were already processed.  NOTE: get_existing_logs()
     # returns basename; exclude_list is path/basename
-    exclude_list = get_existing_logs(conn)
+    exclude_list = get_existing_logs(conn, headers_only=headers_only)
     vprint("%d log files already found in database" % len(exclude_list), 1)
 
     # If only one argument is passed in but it's a directory, enumerate all the
@@ -781,26 +1185,30 @@ def process_log_list(conn, log_list):
     # darshan log or directory
     num_excluded = 0
     new_log_list = []
+    num_other_shards = 0
     if len(log_list) == 1 and os.path.isdir(log_list[0]):
-        for filename in os.listdir(log_list[0]):
-            filename = os.path.join(log_list[0], filename)
-            if os.path.isfile(filename) and os.path.basename(filename) not in exclude_list:
-                new_log_list.append(filename)
-            else:
-                num_excluded += 1
-    else:
-        for filename in log_list:
-            if os.path.basename(filename) not in exclude_list:
-                new_log_list.append(filename)
-            else:
-                num_excluded += 1
+        log_list = [os.path.join(log_list[0], x) for x in os.listdir(log_list[0])]
+        log_list = [x for x in log_list if os.path.isfile(x)]
+
+    exclude_list = set(exclude_list)
+    for filename in log_list:
+        if num_shards > 1 and get_log_shard(filename, num_shards) != shard:
+            num_other_shards += 1
+        elif os.path.basename(filename) not in exclude_list:
+            new_log_list.append(filename)
+        else:
+            num_excluded += 1
 
+    if num_shards > 1:
+        vprint("Skipping %d logs belonging to other shards" % num_other_shards, 1)
     vprint("Adding %d new logs" % len(new_log_list), 1)
     vprint("Excluding %d existing logs" % num_excluded, 1)
 
     return new_log_list
 
-def index_darshanlogs(log_list, output_file, threads=1, max_mb=0.0, bulk_insert=True):
+def index_darshanlogs(log_list, output_file, threads=1, max_mb=0.0, bulk_insert=True,
+                      shard=0, num_shards=1, headers_only=False, exclude_users=None,
+                      exclude_jobids=None):
     """Calculate the sum bytes read/written
 
     Given a list of input files, parse each as a Darshan log in parallel to
@@ -819,6 +1227,14 @@ def index_darshanlogs(log_list, output_file, threads=1, max_mb=0.0, bulk_insert=
         max_mb (float): Skip logs of size larger than this value
         bulk_insert (bool): If False, have each thread update the database
             as soon as it has parsed a log
+        shard (int): Only index logs belonging to this shard
+        num_shards (int): Number of shards into which log_list is divided.
+            Each shard should be written to a different output_file.
+        headers_only (bool): Only populate the headers table using the
+            header-only Darshan reader; do not parse any counters
+        exclude_users (list of str): Skip logs belonging to these user names
+            or numeric uids
+        exclude_jobids (list of str): Skip logs belonging to these job ids
 
     Returns:
         dict: Reduced data along different reduction dimensions
@@ -829,7 +1245,8 @@ def index_darshanlogs(log_list, output_file, threads=1, max_mb=0.0, bulk_insert=
     init_mount_to_fsname()
 
     t_start = time.time()
-    new_log_list = process_log_list(conn, log_list)
+    new_log_list = process_log_list(conn, log_list, shard=shard, num_shards=num_shards,
+                                    headers_only=headers_only)
     vprint("Built log list in %.1f seconds" % (time.time() - t_start), 2)
 
     # Create tables and indices
@@ -837,21 +1254,28 @@ def index_darshanlogs(log_list, output_file, threads=1, max_mb=0.0, bulk_insert=
     create_mount_table(conn)
     create_headers_table(conn)
     create_summaries_table(conn)
+    create_rollups_table(conn)
+    create_indices(conn)
     vprint("Initialized tables in %.1f seconds" % (time.time() - t_start), 2)
 
     # Analyze the remaining logs in parallel
     t_start = time.time()
     log_records = []
     mount_points = {}
+    summarize = functools.partial(summarize_log,
+                                  max_mb=max_mb,
+                                  headers_only=headers_only,
+                                  exclude_users=set(str(x) for x in exclude_users or []),
+                                  exclude_jobids=set(str(x) for x in exclude_jobids or []))
     # multiprocessing is super flaky (e.g., it deadlocks on macOS), so provide an escape hatch
     if threads > 1:
         #mpcontext = multiprocessing.get_context('forkserver')
         #with mpcontext.Pool(processes=threads) as pool:
         with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
             #results = pool.imap_unordered(functools.partial(summarize_by_fs, max_mb=max_mb), new_log_list)
-            results = pool.map(functools.partial(summarize_by_fs, max_mb=max_mb), new_log_list)
+            results = pool.map(summarize, new_log_list)
     else:
-        results = [summarize_by_fs(x, max_mb=max_mb) for x in new_log_list]
+        results = [summarize(x) for x in new_log_list]
 
     for result in results:
         if result:
@@ -874,6 +1298,81 @@ def index_darshanlogs(log_list, output_file, threads=1, max_mb=0.0, bulk_insert=
         update_summaries_table(conn, [x['summaries'] for x in log_records])
         vprint("Updated summaries table in %.1f seconds" % (time.time() - t_start), 2)
 
+    t_start = time.time()
+    update_rollups_table(conn)
+    vprint("Updated rollups table in %.1f seconds" % (time.time() - t_start), 2)
+
+    conn.close()
+    vprint("Updated %s" % output_file, 1)
+
+def merge_index_dbs(input_files, output_file):
+    """Combines multiple index databases into one
+
+    Merges the contents of one or more index databases (e.g., shards generated
+    by concurrent invocations of :meth:`index_darshanlogs`) into a single
+    database.  Each input is attached to the output database and copied using
+    bulk ``INSERT ... SELECT`` statements.  Because each input assigns its own
+    ``log_id`` and ``fs_id`` values, summaries are remapped by joining on the
+    log filename and mount point.  Logs that already exist in the output
+    database are not duplicated.
+
+    Args:
+        input_files (list of str): Paths to index databases to merge
+        output_file (str): Path to the index database to create or update
+    """
+    conn = sqlite3.connect(output_file)
+
+    create_mount_table(conn)
+    create_headers_table(conn)
+    create_summaries_table(conn)
+    create_rollups_table(conn)
+    create_indices(conn)
+
+    header_counters = ["filename", "exe", "username", "exename"] + HEADER_COUNTERS
+
+    for input_file in input_files:
+        if os.path.abspath(input_file) == os.path.abspath(output_file):
+            continue
+
+        t_start = time.time()
+        conn.execute("ATTACH DATABASE ? AS shard", (input_file,))
+        cursor = conn.cursor()
+
+        query = "INSERT OR IGNORE INTO main.%s (mountpt, fsname) SELECT mountpt, fsname FROM shard.%s" % (
+            MOUNTS_TABLE, MOUNTS_TABLE)
+        vprint(query, 3)
+        cursor.execute(query)
+
+        query = "INSERT OR IGNORE INTO main.%s (%s) SELECT %s FROM shard.%s" % (
+            HEADERS_TABLE,
+            ", ".join(header_counters),
+            ", ".join(header_counters),
+            HEADERS_TABLE)
+        vprint(query, 3)
+        cursor.execute(query)
+
+        query = """INSERT OR IGNORE INTO main.%s (log_id, fs_id, %s)
+        SELECT mh.log_id, mm.fs_id, %s
+        FROM shard.%s AS s
+        INNER JOIN shard.%s AS sh ON sh.log_id = s.log_id
+        INNER JOIN shard.%s AS sm ON sm.fs_id = s.fs_id
+        INNER JOIN main.%s AS mh ON mh.filename = sh.filename
+        INNER JOIN main.%s AS mm ON mm.mountpt = sm.mountpt
+        """ % (SUMMARIES_TABLE,
+               ", ".join(SUMMARY_COUNTERS),
+               ", ".join(["s.%s" % x for x in SUMMARY_COUNTERS]),
+               SUMMARIES_TABLE, HEADERS_TABLE, MOUNTS_TABLE,
+               HEADERS_TABLE, MOUNTS_TABLE)
+        vprint(query, 3)
+        cursor.execute(query)
+
+        cursor.close()
+        conn.commit()
+        conn.execute("DETACH DATABASE shard")
+        vprint("Merged %s in %.1f seconds" % (input_file, time.time() - t_start), 1)
+
+    update_rollups_table(conn)
+
     conn.close()
     vprint("Updated %s" % output_file, 1)
 
@@ -903,8 +1402,25 @@ def main(argv=None):
     parser.add_argument('-v', '--verbose', action='count', default=0, help="Verbosity level (default: none)")
     parser.add_argument('-q', '--quiet', action='store_true', help="Suppress warnings for invalid Darshan logs")
     parser.add_argument('--no-bulk-insert', action='store_true', help="Insert each log record as soon as it is processed")
+    parser.add_argument('--shard', type=str, default=None,
+                        help="Only index logs in shard N of M, specified as N/M with N counting from 0 (default: index all logs)")
+    parser.add_argument('--headers-only', action='store_true',
+                        help="Only populate the headers table without parsing counters")
+    parser.add_argument('--exclude-user', type=str, action='append', default=[],
+                        help="Skip logs belonging to this user name or uid (may be repeated)")
+    parser.add_argument('--exclude-jobid', type=str, action='append', default=[],
+                        help="Skip logs belonging to this job id (may be repeated)")
     args = parser.parse_args(argv)
 
+    shard, num_shards = 0, 1
+    if args.shard:
+        try:
+            shard, num_shards = [int(x) for x in args.shard.split('/', 1)]
+        except ValueError:
+            raise ValueError("--shard must be of the form N/M")
+        if not 0 <= shard < num_shards:
+            raise ValueError("--shard N/M requires 0 <= N < M")
+
     VERBOSITY = args.verbose
     QUIET = args.quiet
 
@@ -912,4 +1428,9 @@ def main(argv=None):
                       threads=args.threads,
                       max_mb=args.max_mb,
                       bulk_insert=not args.no_bulk_insert,
+                      shard=shard,
+                      num_shards=num_shards,
+                      headers_only=args.headers_only,
+                      exclude_users=args.exclude_user,
+                      exclude_jobids=args.exclude_jobid,
                       output_file=args.output)
@@ -0,0 +1,30 @@
+"""
+Build sidecar indices for NERSC ``lfs df`` and ``lctl dl -t`` dumps so that
+:mod:`tokio.tools.lfsstatus` can read individual snapshots without scanning or
+parsing whole files.  See :class:`tokio.connectors.nersc_lfsstate.LfsStateIndex`
+for details.
+"""
+
+import argparse
+import tokio.connectors.nersc_lfsstate as nersc_lfsstate
+
+def main(argv=None):
+    """Entry point for the CLI interface
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+", type=str,
+                        help="ost-fullness or ost-map files to index")
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help="Verbosity level (default: none)")
+    args = parser.parse_args(argv)
+
+    for cache_file in args.files:
+        index = nersc_lfsstate.LfsStateIndex(cache_file)
+        if index.load():
+            if args.verbose:
+                print("%s is already indexed" % cache_file)
+            continue
+        index.build()
+        index.save()
+        if args.verbose:
+            print("Indexed %d snapshots in %s" % (len(index), cache_file))
@@ -0,0 +1,25 @@
+"""
+Combine multiple Darshan log index databases, such as the shards generated by
+concurrent invocations of ``index_darshanlogs --shard``, into a single index
+database.  See :meth:`tokio.cli.index_darshanlogs.merge_index_dbs` for details.
+"""
+
+import argparse
+import tokio.cli.index_darshanlogs
+
+def main(argv=None):
+    """Entry point for the CLI interface
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("indexfiles", nargs="+", type=str,
+                        help="index databases created by index_darshanlogs to merge")
+    parser.add_argument('-o', '--output', type=str, default='darshanlogs.db',
+                        help="Name of output file (default: darshanlogs.db)")
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help="Verbosity level (default: none)")
+    args = parser.parse_args(argv)
+
+    tokio.cli.index_darshanlogs.VERBOSITY = args.verbose
+
+    tokio.cli.index_darshanlogs.merge_index_dbs(input_files=args.indexfiles,
+                                                output_file=args.output)
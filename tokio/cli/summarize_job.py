@@ -19,6 +19,8 @@ import tokio.connectors.darshan
 import tokio.connectors.slurm
 import tokio.connectors.nersc_jobsdb
 import tokio.tools.hdf5
+import tokio.tools.jobindex
+import tokio.tools.jobinfo
 import tokio.tools.lfsstatus
 import tokio.tools.topology
 
@@ -508,6 +510,18 @@ def retrieve_topology_data(results, jobinfo_cache_file, nodemap_cache_file):
         merge_dicts(results, module_results, prefix='topology_')
     return results
 
+def cache_job_info(rows, jobinfo_cache_file, nodemap_cache_file):
+    """
+    Retrieve job info for all records needing topology data in one batch
+    """
+    if nodemap_cache_file is None:
+        return
+    if jobinfo_cache_file is not None and os.path.isfile(jobinfo_cache_file):
+        return
+    jobids = [results['_jobid'] for results in rows if '_jobid' in results]
+    if len(jobids) > 1:
+        tokio.tools.jobinfo.cache_jobs(jobids=jobids)
+
 def retrieve_jobid(results, jobid, file_count):
     """
     Get JobId from either Slurm or the CLI argument
@@ -579,28 +593,41 @@ def retrieve_ost_data(results, ost, ost_fullness=None, ost_map=None):
 
     return results
 
-def retrieve_concurrent_job_data(results, jobhost, concurrentjobs):
+def retrieve_concurrent_job_data(rows, jobhost, concurrentjobs):
     """
-    Get information about all jobs that were running during a time period
+    Get information about all jobs that were running during each record's time
+    period using a single job index covering all records
     """
+    if concurrentjobs is None or jobhost is None:
+        return rows
 
-    if concurrentjobs is not None \
-    and results['_datetime_start'] is not None \
-    and results['_datetime_end'] is not None \
-    and jobhost is not None:
-        if concurrentjobs == "":
-            cache_file = None
-        else:
-            cache_file = concurrentjobs
-
-        start_stamp = int(time.mktime(results['_datetime_start'].timetuple()))
-        end_stamp = int(time.mktime(results['_datetime_end'].timetuple()))
-        nerscjobsdb = tokio.connectors.nersc_jobsdb.NerscJobsDb(cache_file=cache_file)
-        concurrent_job_info = nerscjobsdb.get_concurrent_jobs(start_stamp, end_stamp, jobhost)
-        results['jobsdb_concurrent_jobs'] = concurrent_job_info['numjobs']
-        results['jobsdb_concurrent_nodes'] = concurrent_job_info['numnodes']
-        results['jobsdb_concurrent_nodehrs'] = concurrent_job_info['nodehrs']
-    return results
+    windows = []
+    for results in rows:
+        if results.get('_datetime_start') is not None \
+        and results.get('_datetime_end') is not None:
+            windows.append((results,
+                            int(time.mktime(results['_datetime_start'].timetuple())),
+                            int(time.mktime(results['_datetime_end'].timetuple()))))
+    if not windows:
+        return rows
+
+    if concurrentjobs == "":
+        cache_file = None
+    else:
+        cache_file = concurrentjobs
+
+    start_stamps = [window[1] for window in windows]
+    end_stamps = [window[2] for window in windows]
+    job_index = tokio.tools.jobindex.JobIndex.from_jobsdb(min(start_stamps),
+                                                          max(end_stamps),
+                                                          jobhost,
+                                                          cache_file=cache_file)
+    concurrent_job_info = job_index.get_concurrent_jobs(start_stamps, end_stamps)
+    for index, (results, _, _) in enumerate(windows):
+        results['jobsdb_concurrent_jobs'] = int(concurrent_job_info['numjobs'][index])
+        results['jobsdb_concurrent_nodes'] = int(concurrent_job_info['numnodes'][index])
+        results['jobsdb_concurrent_nodehrs'] = float(concurrent_job_info['nodehrs'][index])
+    return rows
 
 def main(argv=None):
     """Entry point for the CLI interface
@@ -659,21 +686,29 @@ def main(argv=None):
 
     # If --jobid is specified, override whatever is in the Darshan log
     results = retrieve_jobid(results, args.slurm_jobid, len(args.files))
+    rows = []
     for i in range(records_to_process):
         # records_to_process == 1 but len(args.files) == 0 when no darshan log is given
         if len(args.files) > 0:
             results = retrieve_darshan_data(results, args.files[i], silent_errors=args.silent_errors)
+        rows.append(results)
+        results = {}
+
+    # Retrieve job info for every job at once rather than once per record
+    cache_job_info(rows, jobinfo_cache_file=args.slurm_jobid, nodemap_cache_file=args.topology)
+
+    for results in rows:
         results = retrieve_lmt_data(results, args.file_system)
         results = retrieve_topology_data(results,
                                          jobinfo_cache_file=args.slurm_jobid,
                                          nodemap_cache_file=args.topology)
         results = retrieve_ost_data(results, args.ost, args.ost_fullness, args.ost_map)
-        results = retrieve_concurrent_job_data(results, args.jobhost, args.concurrentjobs)
 
         # don't append empty rows
         if len(results) > 0:
             json_rows.append(results)
-        results = {}
+
+    json_rows = retrieve_concurrent_job_data(json_rows, args.jobhost, args.concurrentjobs)
 
     if args.json:
         print(json.dumps(json_rows, indent=4, sort_keys=True, default=serialize_datetime))
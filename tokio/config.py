@@ -42,7 +42,9 @@ MAGIC_VARIABLES = [
     'LFSSTATUS_FULLNESS_FILES',
     'LFSSTATUS_MAP_FILES',
     'DARSHAN_LOG_DIRS',
-    'ESNET_SNMP_URI'
+    'DARSHAN_INDEX_DBS',
+    'ESNET_SNMP_URI',
+    'QUERY_CACHE_DIR'
 ]
 
 def init_config():
@@ -4,9 +4,50 @@ This module provides generic infrastructure for retrieving data from a
 relational database that contains immutable data.  It can use a local caching
 database (sqlite3) to allow for reanalysis on platforms that cannot access the
 original remote database or to reduce the load on remote databases.
+
+Many independent queries, such as those covering consecutive ranges of time,
+can be issued concurrently using :meth:`CachingDb.query_many`.  Each worker
+thread borrows a connection from a bounded :class:`ConnectionPool`, and queries
+that fail because of transient errors such as lost connections or deadlocks are
+retried on a fresh connection.
+
+Queries that return many rows can be streamed using :meth:`CachingDb.iter_query`
+and :meth:`CachingDb.iter_query_many`, which fetch rows in batches and decode each
+batch into a NumPy structured array rather than retaining every row as a tuple.
+Remote MySQL databases are read using server-side cursors so that the client
+never buffers an entire result set.
+
+Large ranges of a database can be copied into a cache database without holding
+them in memory by enabling write-through mode with
+:meth:`CachingDb.open_write_cache`.  Rows that would otherwise accumulate in
+``saved_results`` are instead written to the cache database in batches as they
+are fetched, and secondary indexes are built once all rows have been written by
+:meth:`CachingDb.close_write_cache`.
+
+The results of queries issued through :meth:`CachingDb.query` can also be
+reused by a :class:`QueryCache`.  Results are keyed by the database, the query
+with its whitespace normalized, and the query parameters.  They are held in
+memory in least-recently-used order up to a byte budget and can also be written
+to a directory as JSON so that they survive across processes.  Each subclass sets how
+long results from each of its tables may be reused in its ``query_cache_ttls``
+attribute.  Queries against tables without a TTL are never cached.  The
+directory is taken from the ``query_cache_dir`` configuration value or the
+``PYTOKIO_QUERY_CACHE_DIR`` environment variable if it is not given explicitly.
 """
 
+import os
+import re
+import json
+import time
+import queue
+import pickle
+import hashlib
 import warnings
+import threading
+import collections
+import concurrent.futures
+import numpy
+from .. import config
 try:
     import pymysql
     pymysql.install_as_MySQLdb()
@@ -19,14 +60,224 @@ except ImportError:
 
 import sqlite3
 
+HIT_MEMORY = 0
 HIT_CACHE_DB = 1
 HIT_REMOTE_DB = 2
+HIT_QUERY_CACHE_DIR = 3
+
+#: MySQL error codes that indicate a query may succeed if retried: lock wait
+#: timeout, deadlock, server has gone away, and lost connection
+TRANSIENT_MYSQL_ERRORS = (1205, 1213, 2006, 2013)
+
+#: Number of rows fetched from a cursor at once when streaming query results
+DEFAULT_BATCH_SIZE = 50000
+
+#: Default number of bytes of query results held in memory by a QueryCache
+DEFAULT_QUERY_CACHE_BYTES = 64 * 1024 * 1024
+
+#: Matches the names of tables referenced by a query
+TABLE_NAME_REX = re.compile(r'\b(?:FROM|JOIN)\s+([A-Za-z_][\w.]*)', re.IGNORECASE)
+
+class QueryCache(object):
+    """Cache of query results with expiration and least-recently-used eviction
+    """
+    def __init__(self, max_bytes=DEFAULT_QUERY_CACHE_BYTES, cache_dir=None):
+        """Create an empty cache
+
+        Args:
+            max_bytes (int): Maximum size of the results held in memory, as
+                measured by the size of their pickled representation
+            cache_dir (str or None): Directory in which results are also
+                stored so that they can be reused by other processes.  If None,
+                results are only held in memory.
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.nbytes = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Retrieve unexpired results from memory, then from the cache directory
+
+        Args:
+            key (str): Key returned by ``get_query_key()``
+
+        Returns:
+            tuple: (list of rows, HIT_MEMORY or HIT_QUERY_CACHE_DIR) if the key
+            was found, or (None, None) if it was not
+        """
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                return list(entry[2]), HIT_MEMORY
+            self._evict(key)
+
+        if self.cache_dir is None:
+            return None, None
+        cache_path = self._get_path(key)
+        try:
+            with open(cache_path, 'r') as cache_file:
+                expires, rows = json.load(cache_file)
+            rows = [tuple(row) for row in rows]
+        except (IOError, OSError, ValueError, TypeError):
+            return None, None
+        if expires <= now:
+            try:
+                os.unlink(cache_path)
+            except OSError:
+                pass
+            return None, None
+        self._insert(key, expires, rows, _get_nbytes(rows))
+        return list(rows), HIT_QUERY_CACHE_DIR
+
+    def put(self, key, rows, ttl):
+        """Store results in memory and in the cache directory
+
+        Args:
+            key (str): Key returned by ``get_query_key()``
+            rows (list): Rows returned by the query
+            ttl (float): Number of seconds for which the rows may be reused
+        """
+        expires = time.time() + ttl
+        rows = list(rows)
+        self._insert(key, expires, rows, _get_nbytes(rows))
+
+        if self.cache_dir is not None:
+            cache_path = self._get_path(key)
+            try:
+                serialized = json.dumps([expires, rows])
+            except (TypeError, ValueError) as error:
+                # rows containing e.g. datetimes or bytes are only held in memory
+                warnings.warn("Could not write query cache %s: %s" % (cache_path, error))
+                return
+            temp_path = os.path.join(self.cache_dir, '.%d.%s' % (os.getpid(), os.path.basename(cache_path)))
+            try:
+                if not os.path.isdir(self.cache_dir):
+                    os.makedirs(self.cache_dir)
+                with open(temp_path, 'w') as cache_file:
+                    cache_file.write(serialized)
+                os.rename(temp_path, cache_path)
+            except (IOError, OSError) as error:
+                warnings.warn("Could not write query cache %s: %s" % (cache_path, error))
+
+    def clear(self):
+        """Drop all results held in memory
+        """
+        self._entries.clear()
+        self.nbytes = 0
+
+    def _insert(self, key, expires, rows, nbytes):
+        """Hold results in memory, evicting the least recently used results
+        """
+        if key in self._entries:
+            self._evict(key)
+        if nbytes > self.max_bytes:
+            return
+        while self.nbytes + nbytes > self.max_bytes:
+            self._evict(next(iter(self._entries)))
+        self._entries[key] = (expires, nbytes, rows)
+        self.nbytes += nbytes
+
+    def _evict(self, key):
+        """Drop one key's results from memory
+        """
+        self.nbytes -= self._entries.pop(key)[1]
+
+    def _get_path(self, key):
+        """Path to the file in the cache directory that stores a key's results
+        """
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+def _get_nbytes(rows):
+    """Estimate the memory consumed by query results
+
+    Args:
+        rows (list): Rows returned by a query
+
+    Returns:
+        int: Size of the pickled representation of `rows`
+    """
+    return len(pickle.dumps(rows, protocol=pickle.HIGHEST_PROTOCOL))
+
+class ConnectionPool(object):
+    """Bounded pool of database connections shared by worker threads
+    """
+    def __init__(self, connect_function, max_connections):
+        """Create an empty pool
+
+        Args:
+            connect_function (function): Function that takes no arguments and
+                returns a new database connection
+            max_connections (int): Maximum number of connections that may be
+                open at once
+        """
+        self.connect_function = connect_function
+        self.max_connections = max_connections
+        self._idle = queue.LifoQueue()
+        self._available = threading.BoundedSemaphore(max_connections)
+
+    def acquire(self):
+        """Borrow a connection, blocking until one is available
+
+        Returns:
+            A database connection which must be returned with release()
+        """
+        self._available.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self.connect_function()
+        except Exception:
+            self._available.release()
+            raise
+
+    def release(self, connection, discard=False):
+        """Return a borrowed connection to the pool
+
+        Args:
+            connection: Connection returned by acquire()
+            discard (bool): Close the connection instead of reusing it
+        """
+        if discard:
+            try:
+                connection.close()
+            except Exception: # connection may already be broken
+                pass
+        else:
+            self._idle.put(connection)
+        self._available.release()
+
+    def close(self):
+        """Close all idle connections
+        """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
 
 class CachingDb(object):
     """Connect relational database with an optional caching layer interposed.
     """
+    #: Seconds for which query() may reuse the results of queries against each
+    #: table, keyed by upper-case table name.  Queries that reference any table
+    #: not listed here are never cached.
+    query_cache_ttls = {}
+
     #pylint: disable=too-many-arguments
-    def __init__(self, dbhost=None, dbuser=None, dbpassword=None, dbname=None, cache_file=None):
+    def __init__(self, dbhost=None, dbuser=None, dbpassword=None, dbname=None, cache_file=None,
+                 max_connections=1, max_retries=3, retry_delay=1.0,
+                 query_cache_bytes=DEFAULT_QUERY_CACHE_BYTES, query_cache_dir=None):
         """Connect to a relational database.
 
         If instantiated with a cache_file argument, all queries will go to that
@@ -44,6 +295,17 @@ class CachingDb(object):
             dbname (str, optional): name of database to use when connecting
             cache_file (str, optional):  Path to an SQLite3 database to use as
                 a caching layer.
+            max_connections (int): Maximum number of queries that
+                ``query_many()`` issues concurrently
+            max_retries (int): Number of times ``query_many()`` retries a query
+                that failed because of a transient error
+            retry_delay (float): Seconds to wait before the first retry; the
+                delay doubles with each subsequent retry
+            query_cache_bytes (int): Maximum size of query results that
+                ``query()`` holds in memory for reuse
+            query_cache_dir (str, optional): Directory in which query results
+                are stored for reuse by later processes.  Defaults to the
+                ``query_cache_dir`` configuration value.
 
         Attributes:
             saved_results (dict): in-memory data cache, keyed by table names
@@ -60,6 +322,19 @@ class CachingDb(object):
             remote_db: remote database connection handle
             remote_db_ps (str): paramstyle of the remote database as defined
                 by `PEP-0249`_
+            max_connections (int): Maximum number of queries that
+                ``query_many()`` issues concurrently
+            max_retries (int): Number of times ``query_many()`` retries a query
+                that failed because of a transient error
+            retry_delay (float): Seconds to wait before the first retry
+            write_cache_file (str): path to the cache database to which query
+                results are written in write-through mode
+            write_cache_db (sqlite3.Connection): connection handle for
+                `write_cache_file`, or None if write-through mode is disabled
+            write_batch_size (int): maximum number of rows fetched and written
+                at once in write-through mode
+            query_cache (QueryCache): results of earlier queries that may be
+                reused by ``query()``
 
         .. _PEP-0249: https://www.python.org/dev/peps/pep-0249
         """
@@ -75,15 +350,35 @@ class CachingDb(object):
         # }
         self.saved_results = {}
         self.last_hit = None
+        self._saved_query_keys = {}
 
         # cache db
         self.cache_file = None
         self.cache_db = None
         self.cache_db_ps = None
+        self._cache_signature = None
 
         # actual db
         self.remote_db = None
         self.remote_db_ps = None
+        self._remote_db_args = None
+
+        # for query_many
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._pool = None
+
+        # write-through cache db
+        self.write_cache_file = None
+        self.write_cache_db = None
+        self.write_batch_size = DEFAULT_BATCH_SIZE
+        self._write_cache_schemata = {}
+
+        # query result cache
+        if query_cache_dir is None:
+            query_cache_dir = config.CONFIG.get('query_cache_dir')
+        self.query_cache = QueryCache(max_bytes=query_cache_bytes, cache_dir=query_cache_dir)
 
         # Connect to cache db if specified
         if cache_file is not None:
@@ -121,10 +416,13 @@ class CachingDb(object):
             warnings.warn("attempting to use both remote and cache db; disabling cache db")
             self.close_cache()
 
-        self.remote_db = MySQLdb.connect(host=dbhost,
-                                         user=dbuser,
-                                         passwd=dbpassword,
-                                         db=dbname)
+        self._remote_db_args = {
+            'host': dbhost,
+            'user': dbuser,
+            'passwd': dbpassword,
+            'db': dbname,
+        }
+        self.remote_db = MySQLdb.connect(**self._remote_db_args)
         self.remote_db_ps = get_paramstyle_symbol(MySQLdb.paramstyle)
 
     def close(self):
@@ -135,6 +433,8 @@ class CachingDb(object):
         """
         self.remote_db = None
         self.remote_db_ps = None
+        self._remote_db_args = None
+        self._close_pool()
 
     def connect_cache(self, cache_file):
         """Open the cache database file and set the handler attribute.
@@ -147,6 +447,13 @@ class CachingDb(object):
             self.cache_db = sqlite3.connect(cache_file)
             self.cache_file = cache_file
             self.cache_db_ps = get_paramstyle_symbol(sqlite3.paramstyle)
+            # identify the contents of the file so that query results cached
+            # from it are not reused if it is later replaced
+            try:
+                stat = os.stat(cache_file)
+                self._cache_signature = [stat.st_size, stat.st_mtime]
+            except OSError:
+                self._cache_signature = None
 
     def close_cache(self):
         """Close the cache database handler and reset caching db attributes.
@@ -154,12 +461,87 @@ class CachingDb(object):
         if self.cache_db is not None:
             self.cache_db = self.cache_db.close()
             self.cache_file = None
+            self._cache_signature = None
+        self._close_pool()
+
+    def _close_pool(self):
+        """Close the connections used by query_many()
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def _get_pool(self):
+        """Get the connection pool and paramstyle for the active database
+
+        Connections to the cache database are opened with the same file as the
+        ``cache_db`` attribute; connections to the remote database use the same
+        parameters as the ``remote_db`` attribute.
+
+        Returns:
+            tuple: (ConnectionPool, paramstyle, HIT_CACHE_DB or HIT_REMOTE_DB)
+        """
+        if self.cache_db is not None:
+            cache_file = self.cache_file
+            connect_function = lambda: sqlite3.connect(cache_file, check_same_thread=False)
+            paramstyle, hit = self.cache_db_ps, HIT_CACHE_DB
+        elif self.remote_db is not None:
+            remote_db_args = self._remote_db_args
+            connect_function = lambda: MySQLdb.connect(**remote_db_args)
+            paramstyle, hit = self.remote_db_ps, HIT_REMOTE_DB
+        else:
+            raise RuntimeError('No databases available to query')
+
+        if self._pool is None or self._pool.max_connections != self.max_connections:
+            self._close_pool()
+            self._pool = ConnectionPool(connect_function, self.max_connections)
+        return self._pool, paramstyle, hit
+
+    def open_write_cache(self, cache_file, batch_size=DEFAULT_BATCH_SIZE):
+        """Write the results of subsequent queries directly to a cache database.
+
+        Enables write-through mode.  Rather than retaining the results of
+        queries that specify a table in ``saved_results`` until
+        ``save_cache()`` is called, rows are inserted into `cache_file` in
+        batches of `batch_size` as they are fetched.  As with ``save_cache()``,
+        rows whose primary keys are already in the cache database replace the
+        existing rows.
+
+        Args:
+            cache_file (str): Path to the cache database to which query results
+                should be written.  This should be a different file from the
+                `cache_file` attribute.
+            batch_size (int): maximum number of rows to fetch and write at once
+        """
+        self.close_write_cache()
+        self.write_cache_db = sqlite3.connect(cache_file)
+        self.write_cache_file = cache_file
+        self.write_batch_size = batch_size
+
+    def close_write_cache(self):
+        """Finish writing the cache database and disable write-through mode.
+
+        Creates any secondary indexes defined in the schemata of the tables that
+        were written.  Indexes are only built after all rows have been inserted
+        since maintaining them during the inserts is much slower.
+        """
+        if self.write_cache_db is None:
+            return
+        for table, table_schema in self._write_cache_schemata.items():
+            if table_schema is not None:
+                create_cache_indexes(self.write_cache_db, table, table_schema)
+        self.write_cache_db.commit()
+        self.write_cache_db.close()
+        self.write_cache_db = None
+        self.write_cache_file = None
+        self._write_cache_schemata = {}
 
     def drop_cache(self, tables=None):
         """Flush saved results from memory.
 
         If tables are specified, only drop those tables' results.  If no tables
-        are provided, flush everything.
+        are provided, flush everything including the query results held in
+        memory for reuse.
 
         Args:
             tables (list, optional): List of table names (str) to flush.  If
@@ -172,6 +554,10 @@ class CachingDb(object):
 
         for drop_cache in drop_caches:
             del self.saved_results[drop_cache]
+            self._saved_query_keys.pop(drop_cache, None)
+
+        if tables is None:
+            self.query_cache.clear()
 
     def save_cache(self, cache_file):
         """Commit the in-memory cache to a cache database.
@@ -199,6 +585,7 @@ class CachingDb(object):
                 'cache_file': self.cache_file,
                 'cache_db': self.cache_db,
                 'cache_db_ps': self.cache_db_ps,
+                'cache_signature': self._cache_signature,
             }
 
         ### Open a new cache db connection without closing the old cache db
@@ -236,11 +623,7 @@ class CachingDb(object):
             ###   (1) the table doesn't already exist in the cache database, or
             ###   (2) 'schema' isn't set correctly by the downstream application
             if table_info['schema'] is not None:
-                self.cache_db.execute(
-                    "CREATE TABLE IF NOT EXISTS %s (%s, PRIMARY KEY(%s))" %
-                    (table,
-                     ', '.join(table_info['schema']['columns']),
-                     ', '.join(table_info['schema']['primary_key'])))
+                create_cache_table(self.cache_db, table, table_info['schema'])
 
             ### INSERT OR REPLACE so that the cache db never wins if a duplicate
             ### primary key is detected
@@ -248,6 +631,8 @@ class CachingDb(object):
             self.cache_db.executemany(
                 query_str,
                 table_info['rows'])
+            if table_info['schema'] is not None:
+                create_cache_indexes(self.cache_db, table, table_info['schema'])
             self.cache_db.commit()
 
             ### Drop committed rows from memory
@@ -255,6 +640,7 @@ class CachingDb(object):
 
         for drop_cache in drop_caches:
             del self.saved_results[drop_cache]
+            self._saved_query_keys.pop(drop_cache, None)
 
         self.close_cache()
 
@@ -263,12 +649,18 @@ class CachingDb(object):
             self.cache_file = old_state['cache_file']
             self.cache_db = old_state['cache_db']
             self.cache_db_ps = old_state['cache_db_ps']
+            self._cache_signature = old_state['cache_signature']
 
-    def query(self, query_str, query_variables=(), table=None, table_schema=None):
+    def query(self, query_str, query_variables=(), table=None, table_schema=None, nocache=False):
         """Pass a query through all layers of cache and return on the first hit.
 
         If a table is specified, the results of this query can be saved to the
-        cache db into a table of that name.
+        cache db into a table of that name.  In write-through mode, the results
+        are fetched and written to the cache database in batches.
+
+        If every table referenced by the query has a TTL in
+        ``query_cache_ttls``, the results are stored in ``query_cache`` and
+        reused by identical queries until the shortest of those TTLs expires.
 
         Args:
             query_str (str): SQL query expressed as a string
@@ -279,6 +671,7 @@ class CachingDb(object):
             table_schema (str, optional): when `table` is specified, the SQL
                 line to initialize the table in which the query results will
                 be cached.
+            nocache (bool): neither reuse nor store results in ``query_cache``
 
         Returns:
             tuple: Tuple of tuples corresponding to rows of fields as returned
@@ -288,6 +681,27 @@ class CachingDb(object):
         ### Collapse query string to remove extraneous whitespace
         query_str = ' '.join(query_str.split())
 
+        ### Stream results into the write-through cache (if enabled)
+        if table is not None and self.write_cache_db is not None:
+            results = []
+            for rows in self._iter_write_through(query_str, query_variables, table, table_schema):
+                results += rows
+            return results
+
+        ### Check the query cache.  Results are saved to the table unless they
+        ### are already held in saved_results, which save_cache() and
+        ### drop_cache() may have emptied since the results were retrieved.
+        ttl = 0 if nocache else self.get_query_ttl(query_str)
+        if ttl > 0:
+            cache_key = self.get_query_key(query_str, query_variables)
+            results, hit = self.query_cache.get(cache_key)
+            if results is not None:
+                self.last_hit = hit
+                if cache_key not in self._saved_query_keys.get(table, ()):
+                    self._save_results(results, table, table_schema)
+                    self._mark_saved(cache_key, table)
+                return results
+
         ### Check the cache database (if available)
         if self.cache_db is not None:
             results = self._query_sqlite3(query_str, query_variables)
@@ -299,7 +713,361 @@ class CachingDb(object):
         else:
             raise RuntimeError('No databases available to query')
 
-        if table is not None:
+        self._save_results(results, table, table_schema)
+
+        if ttl > 0:
+            self.query_cache.put(cache_key, results, ttl)
+            self._mark_saved(cache_key, table)
+
+        return results
+
+    def get_query_ttl(self, query_str):
+        """Determine how long the results of a query may be reused
+
+        Args:
+            query_str (str): SQL query expressed as a string
+
+        Returns:
+            float: The shortest TTL in ``query_cache_ttls`` of the tables
+            referenced by `query_str`, or 0 if any of them has no TTL
+        """
+        tables = set(x.split('.')[-1].upper() for x in TABLE_NAME_REX.findall(query_str))
+        if not tables:
+            return 0
+        return min(self.query_cache_ttls.get(x, 0) for x in tables)
+
+    def get_query_key(self, query_str, query_variables=()):
+        """Generate the key under which the results of a query are cached
+
+        Args:
+            query_str (str): SQL query expressed as a string
+            query_variables (tuple): parameters to be substituted into
+                `query_str` if `query_str` is a parameterized query
+
+        Returns:
+            str: Key identifying the database, the query with its whitespace
+            collapsed, and its parameters.  SQLite databases are identified by
+            the path, size, and modification time of their file.
+        """
+        if self.cache_db is not None:
+            database = 'sqlite:%s:%s' % (os.path.abspath(self.cache_file), self._cache_signature)
+        elif self._remote_db_args is not None:
+            database = 'mysql:%(user)s@%(host)s/%(db)s' % self._remote_db_args
+        else:
+            database = None
+        return repr((database, ' '.join(query_str.split()), tuple(query_variables)))
+
+    def cache_query(self, query_str, query_variables=(), table=None, table_schema=None):
+        """Save the results of a query without returning them.
+
+        Behaves like ``query()`` with a table specified, but does not retain
+        the rows returned.  In write-through mode, no more than
+        ``write_batch_size`` rows are held in memory at once regardless of how
+        many rows the query returns.
+
+        Args:
+            query_str (str): SQL query expressed as a string
+            query_variables (tuple): parameters to be substituted into
+                `query_str` if `query_str` is a parameterized query
+            table (str): name of table in the cache database to save the
+                results of the query
+            table_schema (str, optional): the SQL line to initialize the table
+                in which the query results will be cached.
+
+        Returns:
+            int: Number of rows saved
+        """
+        if self.write_cache_db is None:
+            return len(self.query(query_str, query_variables, table, table_schema))
+
+        query_str = ' '.join(query_str.split())
+        num_rows = 0
+        for rows in self._iter_write_through(query_str, query_variables, table, table_schema):
+            num_rows += len(rows)
+        return num_rows
+
+    def query_many(self, query_str, query_variables_list, table=None, table_schema=None):
+        """Issue one parameterized query for each set of variables concurrently
+
+        Up to ``max_connections`` queries are run at once, each on its own
+        connection borrowed from a connection pool.  Queries that fail because
+        of transient errors are retried up to ``max_retries`` times.  Results
+        are returned, and saved if `table` is specified, in the same order as
+        `query_variables_list` regardless of the order in which the queries
+        complete.
+
+        Args:
+            query_str (str): SQL query expressed as a string
+            query_variables_list (list of tuple): parameters to be substituted
+                into `query_str` for each query
+            table (str, optional): name of table in the cache database to save
+                the results of the queries
+            table_schema (str, optional): when `table` is specified, the SQL
+                line to initialize the table in which the query results will
+                be cached.
+
+        Returns:
+            list: The rows returned by each query, in the same order as
+            `query_variables_list`
+        """
+        query_str = ' '.join(query_str.split())
+        pool, paramstyle, hit = self._get_pool()
+        if '%(ps)' in query_str:
+            query_str = query_str % {'ps': paramstyle}
+
+        query_variables_list = list(query_variables_list)
+        num_workers = min(self.max_connections, len(query_variables_list))
+        if num_workers > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+                futures = [executor.submit(self._query_pooled, pool, query_str, x)
+                           for x in query_variables_list]
+                results = [x.result() for x in futures]
+        else:
+            results = [self._query_pooled(pool, query_str, x) for x in query_variables_list]
+
+        self.last_hit = hit
+        for rows in results:
+            self._save_results(rows, table, table_schema)
+
+        return results
+
+    def iter_query(self, query_str, query_variables=(), dtype=None, batch_size=DEFAULT_BATCH_SIZE):
+        """Stream the results of a query as NumPy structured arrays
+
+        Rows are fetched `batch_size` at a time and each batch is decoded into
+        a structured array.  Unlike ``query()``, results are never retained in
+        ``saved_results``.
+
+        Args:
+            query_str (str): SQL query expressed as a string
+            query_variables (tuple): parameters to be substituted into
+                `query_str` if `query_str` is a parameterized query
+            dtype (numpy.dtype): structured dtype with one field per column
+                returned by the query
+            batch_size (int): maximum number of rows in each array
+
+        Yields:
+            numpy.ndarray: Structured array of up to `batch_size` rows
+        """
+        query_str = ' '.join(query_str.split())
+        pool, paramstyle, hit = self._get_pool()
+        if '%(ps)' in query_str:
+            query_str = query_str % {'ps': paramstyle}
+
+        connection = pool.acquire()
+        discard = True
+        try:
+            cursor = connection.cursor(*self._streaming_cursor_args(hit))
+            cursor.execute(query_str, query_variables)
+            self.last_hit = hit
+            for array in iter_arrays(cursor, dtype, batch_size):
+                yield array
+            discard = False
+        finally:
+            pool.release(connection, discard=discard)
+
+    def iter_query_many(self, query_str, query_variables_list, dtype=None,
+                        batch_size=DEFAULT_BATCH_SIZE):
+        """Stream the results of many queries as NumPy structured arrays
+
+        Combines ``query_many()`` and ``iter_query()``.  Up to
+        ``max_connections`` queries are run concurrently, and the results of
+        each query are decoded into structured arrays by the thread that ran
+        it.  Arrays are yielded in the same order as `query_variables_list`,
+        and no more than twice ``max_connections`` queries are retrieved ahead
+        of the consumer.
+
+        Args:
+            query_str (str): SQL query expressed as a string
+            query_variables_list (list of tuple): parameters to be substituted
+                into `query_str` for each query
+            dtype (numpy.dtype): structured dtype with one field per column
+                returned by the query
+            batch_size (int): maximum number of rows in each array
+
+        Yields:
+            numpy.ndarray: Structured array of up to `batch_size` rows
+        """
+        query_str = ' '.join(query_str.split())
+        pool, paramstyle, hit = self._get_pool()
+        if '%(ps)' in query_str:
+            query_str = query_str % {'ps': paramstyle}
+        kwargs = {
+            'dtype': dtype,
+            'batch_size': batch_size,
+            'cursor_args': self._streaming_cursor_args(hit),
+        }
+
+        query_variables_list = list(query_variables_list)
+        num_workers = min(self.max_connections, len(query_variables_list))
+        if num_workers <= 1:
+            for query_variables in query_variables_list:
+                for array in self._query_pooled(pool, query_str, query_variables, **kwargs):
+                    yield array
+            self.last_hit = hit
+            return
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_workers)
+        pending = collections.deque()
+        try:
+            for query_variables in query_variables_list:
+                pending.append(executor.submit(self._query_pooled, pool, query_str,
+                                               query_variables, **kwargs))
+                if len(pending) >= 2 * num_workers:
+                    for array in pending.popleft().result():
+                        yield array
+            while pending:
+                for array in pending.popleft().result():
+                    yield array
+            self.last_hit = hit
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def _streaming_cursor_args(self, hit):
+        """Arguments to cursor() that return rows without buffering them
+
+        Args:
+            hit (int): HIT_CACHE_DB or HIT_REMOTE_DB
+
+        Returns:
+            tuple: Positional arguments to pass to a connection's cursor()
+        """
+        if hit == HIT_REMOTE_DB:
+            return (MySQLdb.cursors.SSCursor,)
+        return ()
+
+    def _query_pooled(self, pool, query_str, query_variables, dtype=None,
+                      batch_size=DEFAULT_BATCH_SIZE, cursor_args=()):
+        """Run a query on a pooled connection, retrying transient failures
+
+        Args:
+            pool (ConnectionPool): Pool from which to borrow a connection
+            query_str (str): SQL query with the paramstyle already substituted
+            query_variables (tuple): parameters to be substituted into
+                `query_str`
+            dtype (numpy.dtype or None): If specified, decode rows into
+                structured arrays of this dtype
+            batch_size (int): maximum number of rows in each array
+            cursor_args (tuple): Positional arguments to cursor()
+
+        Returns:
+            list: Rows returned by the query, or structured arrays if `dtype`
+            was specified
+        """
+        attempt = 0
+        while True:
+            connection = pool.acquire()
+            try:
+                cursor = connection.cursor(*cursor_args)
+                cursor.execute(query_str, query_variables)
+                if dtype is None:
+                    rows = cursor.fetchall()
+                else:
+                    rows = list(iter_arrays(cursor, dtype, batch_size))
+                cursor.close()
+            except Exception as error:
+                pool.release(connection, discard=True)
+                if attempt >= self.max_retries or not is_transient_error(error):
+                    raise
+                warnings.warn("Retrying query after transient error: %s" % error)
+                time.sleep(self.retry_delay * 2**attempt)
+                attempt += 1
+            else:
+                pool.release(connection)
+                return rows
+
+    def _iter_write_through(self, query_str, query_variables, table, table_schema):
+        """Fetch the results of a query in batches and write them to the cache
+
+        Args:
+            query_str (str): SQL query with extraneous whitespace removed
+            query_variables (tuple): parameters to be substituted into
+                `query_str`
+            table (str): name of table in the write-through cache database
+            table_schema (str or None): schema of `table`
+
+        Yields:
+            list: Up to ``write_batch_size`` rows after they have been written
+        """
+        if self.cache_db is not None:
+            database, paramstyle, hit = self.cache_db, self.cache_db_ps, HIT_CACHE_DB
+        elif self.remote_db is not None:
+            database, paramstyle, hit = self.remote_db, self.remote_db_ps, HIT_REMOTE_DB
+        else:
+            raise RuntimeError('No databases available to query')
+        if '%(ps)' in query_str:
+            query_str = query_str % {'ps': paramstyle}
+
+        cursor = database.cursor(*self._streaming_cursor_args(hit))
+        try:
+            cursor.execute(query_str, query_variables)
+            self.last_hit = hit
+            self._write_results([], table, table_schema)
+            while True:
+                rows = list(cursor.fetchmany(self.write_batch_size))
+                if not rows:
+                    break
+                self._write_results(rows, table)
+                yield rows
+        finally:
+            cursor.close()
+
+    def _write_results(self, results, table, table_schema=None):
+        """Insert the results of a query into the write-through cache database
+
+        Args:
+            results (list): Rows returned by a query
+            table (str): name of table in the cache database in which rows
+                should be inserted
+            table_schema (str, optional): the SQL line to initialize `table`.
+                Need only be specified the first time rows are written to a
+                table.
+        """
+        if table_schema is not None:
+            self._write_cache_schemata[table] = table_schema
+            create_cache_table(self.write_cache_db, table, table_schema)
+        else:
+            self._write_cache_schemata.setdefault(table, None)
+
+        for index in range(0, len(results), self.write_batch_size):
+            batch = results[index:index + self.write_batch_size]
+            ### INSERT OR REPLACE so that duplicate primary keys are resolved
+            ### in favor of the most recently retrieved row
+            self.write_cache_db.executemany(
+                "insert or replace into %s values (%s)" % (table, ','.join(['?'] * len(batch[0]))),
+                batch)
+            self.write_cache_db.commit()
+
+    def _mark_saved(self, cache_key, table):
+        """Record that the results of a query are held in saved_results
+
+        Args:
+            cache_key (str): Key returned by ``get_query_key()``
+            table (str or None): name of the table to which the results were
+                saved.  If None or in write-through mode, do nothing.
+        """
+        if table is not None and self.write_cache_db is None:
+            self._saved_query_keys.setdefault(table, set([])).add(cache_key)
+
+    def _save_results(self, results, table=None, table_schema=None):
+        """Append the results of a query to saved_results
+
+        In write-through mode, the results are written to the cache database
+        instead.
+
+        Args:
+            results: Rows returned by a query
+            table (str, optional): name of table in the cache database to save
+                the results of the query.  If None, do nothing.
+            table_schema (str, optional): when `table` is specified, the SQL
+                line to initialize the table in which the query results will
+                be cached.
+        """
+        if table is not None and self.write_cache_db is not None:
+            self._write_results(list(results), table, table_schema)
+        elif table is not None:
             ### Initialize the table if our intent is to save the result of this
             ### query.
             if table not in self.saved_results:
@@ -315,8 +1083,6 @@ class CachingDb(object):
             ### Append our results
             self.saved_results[table]['rows'] += list(results)
 
-        return results
-
     def _query_sqlite3(self, query_str, query_variables):
         """Run a query against the cache database and return the full output.
 
@@ -349,6 +1115,68 @@ class CachingDb(object):
         cursor.close()
         return rows
 
+def create_cache_table(cache_db, table, table_schema):
+    """Create a table in a cache database if it does not already exist
+
+    Args:
+        cache_db (sqlite3.Connection): cache database connection handle
+        table (str): name of table to create
+        table_schema (dict): schema of the table with keys ``columns`` and
+            ``primary_key``
+    """
+    cache_db.execute(
+        "CREATE TABLE IF NOT EXISTS %s (%s, PRIMARY KEY(%s))" %
+        (table,
+         ', '.join(table_schema['columns']),
+         ', '.join(table_schema['primary_key'])))
+
+def create_cache_indexes(cache_db, table, table_schema):
+    """Create the secondary indexes of a table in a cache database
+
+    Args:
+        cache_db (sqlite3.Connection): cache database connection handle
+        table (str): name of table to index
+        table_schema (dict): schema of the table.  If it has an ``indexes`` key,
+            its value is a list of lists of the columns to index.
+    """
+    for columns in table_schema.get('indexes', []):
+        cache_db.execute("CREATE INDEX IF NOT EXISTS %s_%s_INDEX ON %s (%s)" % (
+            table, '_'.join(columns), table, ', '.join(columns)))
+
+def iter_arrays(cursor, dtype, batch_size=DEFAULT_BATCH_SIZE):
+    """Fetch rows from a cursor in batches and decode them into arrays
+
+    Args:
+        cursor: Cursor on which a query has been executed
+        dtype (numpy.dtype): structured dtype with one field per column
+            returned by the query.  NULLs are decoded as NaN in floating-point
+            fields.
+        batch_size (int): maximum number of rows in each array
+
+    Yields:
+        numpy.ndarray: Structured array of up to `batch_size` rows
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield numpy.array(rows, dtype=dtype)
+
+def is_transient_error(error):
+    """Determine if a failed query may succeed if it is retried
+
+    Args:
+        error (Exception): Exception raised by a database driver
+
+    Returns:
+        bool: True if `error` indicates a lost connection, deadlock, lock
+        timeout, or locked SQLite database
+    """
+    if isinstance(error, sqlite3.OperationalError):
+        return 'locked' in str(error) or 'busy' in str(error)
+    code = error.args[0] if getattr(error, 'args', None) else None
+    return isinstance(code, int) and code in TRANSIENT_MYSQL_ERRORS
+
 def get_paramstyle_symbol(paramstyle):
     """Infer the correct paramstyle for a database.paramstyle
 
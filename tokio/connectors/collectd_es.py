@@ -20,6 +20,14 @@ es.mutate_query(QUERY_CPU_DATA, term='regexp', field='type_instance', value='(id
 QUERY_MEMORY_DATA = copy.deepcopy(BASE_QUERY)
 es.mutate_query(QUERY_MEMORY_DATA, term='term', field='plugin', value='memory')
 
+### Fields by which each query's documents are bucketed and the fields averaged
+### within each bucket when retrieving aggregations instead of documents
+AGGREGATIONS = [
+    (QUERY_CPU_DATA, ['plugin', 'hostname', 'type_instance'], ['value']),
+    (QUERY_DISK_DATA, ['plugin', 'hostname', 'plugin_instance', 'collectd_type'], ['read', 'write']),
+    (QUERY_MEMORY_DATA, ['plugin', 'hostname', 'type_instance'], ['value']),
+]
+
 ### Only return the following _source fields
 SOURCE_FILTER = [
     '@timestamp',
@@ -132,10 +140,76 @@ class CollectdEs(es.EsConnection):
                               flush_every=flush_every,
                               flush_function=flush_function)
 
-    def to_dataframe(self):
+    def iter_timeseries(self, query_template, start, end, source_filter=None,
+                        filter_function=None):
+        """Map connection-wide attributes to super(self).iter_timeseries arguments
+
+        Args:
+            query_template (dict): a query object containing at least one
+                ``@timestamp`` field
+            start (datetime.datetime): lower bound for query (inclusive)
+            end (datetime.datetime): upper bound for query (exclusive)
+            source_filter (bool or list): Return all fields contained in each
+                document's _source field if True; otherwise, only return source
+                fields contained in the provided list of str.  If None, use the
+                default for this connector.
+            filter_function (function, optional): Function to apply to each
+                page before it is yielded.  If None, use the default for this
+                connector.
+
+        Yields:
+            list: Each page's documents as returned by `filter_function`
+        """
+        if source_filter is None:
+            source_filter = SOURCE_FILTER
+        if filter_function is None:
+            filter_function = self.filter_function
+        return super(CollectdEs, self)\
+            .iter_timeseries(query_template=query_template,
+                             start=start,
+                             end=end,
+                             source_filter=source_filter,
+                             filter_function=filter_function)
+
+    def iter_aggregations(self, start, end, timestep, window=None, max_terms=10000):
+        """Retrieve cpu, disk, and memory data already averaged per timestep
+
+        Instead of retrieving every document, has Elasticsearch bucket each
+        plugin's documents by host, plugin instance, and `timestep` and return
+        only the average value within each bucket.  See ``AGGREGATIONS`` for
+        the fields used.
+
+        Args:
+            start (datetime.datetime): lower bound for query (inclusive)
+            end (datetime.datetime): upper bound for query (exclusive)
+            timestep (int): width of each time bucket, in seconds
+            window (datetime.timedelta or None): time range covered by each
+                aggregation query
+            max_terms (int): maximum number of hosts or plugin instances
+
+        Yields:
+            list of dict: Buckets as returned by
+            :func:`tokio.connectors.es.flatten_buckets`
+        """
+        for query_template, group_by, metrics in AGGREGATIONS:
+            for buckets in self.iter_aggregated_timeseries(query_template=query_template,
+                                                           start=start,
+                                                           end=end,
+                                                           group_by=group_by,
+                                                           metrics=metrics,
+                                                           interval=timestep,
+                                                           window=window,
+                                                           max_terms=max_terms):
+                yield buckets
+
+    def to_dataframe(self, pages=None):
         """Converts self.scroll_pages to a DataFrame
 
+        Args:
+            pages (list, optional): Pages to convert instead of
+                ``scroll_pages``
+
         Returns:
             pandas.DataFrame: Contents of the last query's pages
         """
-        return super(CollectdEs, self).to_dataframe(fields=SOURCE_FILTER)
+        return super(CollectdEs, self).to_dataframe(fields=SOURCE_FILTER, pages=pages)
@@ -52,12 +52,21 @@ Note:
     logs to ASCII, then convert the ASCII into Python objects.  In the future,
     we plan on using the Python API provided by darshan-utils to circumvent the
     ASCII translation.
+
+    The one exception is :meth:`Darshan.darshan_header`, which decodes only
+    the ``header`` and ``mounts`` sections of Darshan 3 logs directly from the
+    binary log.  This is much faster than running ``darshan-parser`` when only
+    job-level metadata (uid, jobid, nprocs, run time, etc) is needed.
 """
 
 import os
 import re
+import bz2
 import json
+import time
+import zlib
 import errno
+import struct
 import subprocess
 import warnings
 from .common import SubprocessOutputDict
@@ -65,6 +74,28 @@ from ..common import isstr
 
 DARSHAN_PARSER_BIN = 'darshan-parser'
 
+DARSHAN_MAGIC_NR = 6567223
+
+# darshan_comp_type enum values and the name darshan-parser gives each
+DARSHAN_COMP_TYPES = {
+    0: 'ZLIB',
+    1: 'BZIP2',
+    2: 'NONE',
+}
+
+# struct darshan_header is version_string[8], magic_nr, comp_type,
+# partial_flag, name_map, then DARSHAN_MAX_MODS mod_maps and (since 3.10)
+# DARSHAN_MAX_MODS mod_vers.  DARSHAN_MAX_MODS grew from 16 to 64 in 3.20, so
+# the header size is determined by the earliest log version to which each
+# applies.
+DARSHAN_HEADER_SIZES = [
+    ((3, 20), 40 + 64 * 16 + 4 * 64),
+    ((3, 10), 40 + 16 * 16 + 4 * 16),
+    ((3, 0), 40 + 16 * 16),
+]
+
+DARSHAN_JOB_METADATA_LEN = 1024
+
 DARSHAN_FILENAME_REX = re.compile(r'([^_%s]+)_([^%s]*?)_id(\d+)_(\d+)-(\d+)-(\d+)-(\d+)_(\d+).darshan' % (os.path.sep, os.path.sep))
 
 class Darshan(SubprocessOutputDict):
@@ -178,6 +209,59 @@ class Darshan(SubprocessOutputDict):
         self._only_counters = set() if not counters else set(counters)
         return self._darshan_parser()
 
+    def darshan_header(self):
+        """Populate only the header and mount table
+
+        Decodes the job header, exe/metadata, and mount table of a Darshan 3
+        log directly from the binary log without decompressing any module
+        records.  Logs that cannot be decoded this way (e.g., Darshan 2 logs)
+        fall back to ``darshan-parser``, which is terminated as soon as the
+        mount table has been read.
+
+        Returns:
+            dict: Dictionary containing the ``header`` and ``mounts`` keys in
+            the same form as produced by ``darshan-parser --base``.
+        """
+        if self.log_file is None:
+            return self
+
+        decoded = read_header(self.log_file)
+        if decoded is not None:
+            self.update(decoded)
+        elif os.path.getsize(self.log_file) > 0:
+            self._load_header_subprocess()
+
+        return self
+
+    def _load_header_subprocess(self):
+        """Run darshan-parser just long enough to parse its header lines
+        """
+        cmd = self.subprocess_cmd + [self.log_file]
+
+        try:
+            if self.silent_errors:
+                dparser = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            else:
+                dparser = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        except OSError as error:
+            if error.errno == errno.ENOENT:
+                raise type(error)(error.errno, "%s command not found" % self.subprocess_cmd[0])
+            raise
+
+        def header_lines():
+            """Yield lines of darshan-parser until module records begin"""
+            for line in iter(dparser.stdout.readline, b''):
+                if line.startswith(b'# *****') or not line.startswith(b'#'):
+                    break
+                yield line
+
+        self._parser_mode = "BASE"
+        self._parse_darshan_parser(header_lines())
+        dparser.stdout.close()
+        if dparser.poll() is None:
+            dparser.kill()
+        dparser.wait()
+
     def _darshan_parser(self):
         """Call darshan-parser to initialize values in self
         """
@@ -566,6 +650,118 @@ def parse_perf_counters(line):
 
     return key.strip(), value.strip()
 
+def read_header(log_file):
+    """Decode the header and mount table of a Darshan 3 log
+
+    Reads the fixed-size log header, whose size is determined by the log
+    version, and decompresses only the job region that follows it, which
+    contains the job record, the exe string, and the mount table.  None of the
+    name or module regions are read.
+
+    Args:
+        log_file (str): Path to a Darshan log file
+
+    Returns:
+        dict or None: Dictionary containing ``header`` and ``mounts`` keys
+        that are identical in structure to those produced by
+        :meth:`Darshan.darshan_parser_base`, or None if `log_file` is not a
+        Darshan 3 log that can be decoded or its job record is implausible.
+    """
+    with open(log_file, 'rb') as fp:
+        prefix = fp.read(40)
+        if len(prefix) < 40 or not prefix.startswith(b'3.'):
+            return None
+
+        # determine byte order from the magic number
+        for endian in ('<', '>'):
+            if struct.unpack(endian + 'q', prefix[8:16])[0] == DARSHAN_MAGIC_NR:
+                break
+        else:
+            return None
+
+        version = prefix[0:8].split(b'\0', 1)[0].decode(errors='replace')
+        try:
+            version_tuple = tuple(int(x) for x in version.split('.'))
+        except ValueError:
+            return None
+        header_size = None
+        for min_version, size in DARSHAN_HEADER_SIZES:
+            if version_tuple >= min_version:
+                header_size = size
+                break
+
+        comp_type = struct.unpack('B', prefix[16:17])[0]
+        name_map_off = struct.unpack(endian + 'Q', prefix[24:32])[0]
+        if header_size is None \
+                or comp_type not in DARSHAN_COMP_TYPES \
+                or not header_size < name_map_off <= 1048576:
+            return None
+
+        # the job region lies between the header and the name map
+        region = prefix + fp.read(name_map_off - len(prefix))
+
+    try:
+        if comp_type == 0:
+            job = zlib.decompress(region[header_size:])
+        elif comp_type == 1:
+            job = bz2.decompress(region[header_size:])
+        else:
+            job = region[header_size:]
+    except (zlib.error, IOError, ValueError):
+        return None
+
+    # darshan 3.41 split start and end times into seconds and nanoseconds
+    nsec_times = version_tuple >= (3, 41)
+    job_fmt = endian + ('7q' if nsec_times else '5q')
+    job_size = struct.calcsize(job_fmt)
+    if len(job) < job_size + DARSHAN_JOB_METADATA_LEN:
+        return None
+
+    if nsec_times:
+        uid, start_sec, start_nsec, end_sec, end_nsec, nprocs, jobid = \
+            struct.unpack(job_fmt, job[:job_size])
+        walltime = (end_sec + end_nsec / 1.0e9) - (start_sec + start_nsec / 1.0e9)
+    else:
+        uid, start_sec, end_sec, nprocs, jobid = struct.unpack(job_fmt, job[:job_size])
+        walltime = end_sec - start_sec + 1
+
+    # a job record decoded from the wrong offset is unlikely to be plausible
+    if uid < 0 or jobid < 0 or nprocs < 1 or not 0 < start_sec <= end_sec < 2**32:
+        return None
+
+    metadata = job[job_size:job_size + DARSHAN_JOB_METADATA_LEN].split(b'\0', 1)[0]
+    exe_mnt = job[job_size + DARSHAN_JOB_METADATA_LEN:].split(b'\0', 1)[0]
+    exe_mnt = exe_mnt.decode(errors='replace').split('\n')
+
+    header = {
+        'version': version,
+        'compression': DARSHAN_COMP_TYPES[comp_type],
+        'exe': exe_mnt[0].split(),
+        'uid': uid,
+        'jobid': str(jobid),
+        'start_time': start_sec,
+        'start_time_string': time.ctime(start_sec),
+        'end_time': end_sec,
+        'end_time_string': time.ctime(end_sec),
+        'nprocs': nprocs,
+        'walltime': walltime,
+    }
+    for line in metadata.decode(errors='replace').splitlines():
+        if '=' in line:
+            key, val = line.split('=', 1)
+            header.setdefault('metadata', []).append("%s = %s" % (key, val))
+
+    mounts = {}
+    for line in exe_mnt[1:]:
+        if '\t' in line:
+            fs_type, mount_pt = line.split('\t', 1)
+            mounts[mount_pt] = fs_type
+
+    return {
+        'header': header,
+        'mounts': mounts,
+    }
+
 def parse_filename_metadata(filename):
     """Extracts metadata from a Darshan log's file name
 
@@ -3,14 +3,49 @@
 
 This module provides a wrapper around the Elasticsearch connection handler and
 methods to query, scroll, and process pages of scrolling data.
+
+Queries that return many pages can be retrieved in parallel using
+Elasticsearch's sliced scroll by setting the ``slices`` attribute of an
+:class:`EsConnection`.  Each slice is scrolled independently by a pool of
+worker threads, and pages are handed to the caller in the order in which they
+arrive, so callers must not rely on documents being returned in any particular
+order.
+
+Pages can be cached to files in one of two formats.  The original format is a
+single JSON list of pages, which must be decoded in its entirety before any page
+can be used.  Files whose names end in ``.ndjson`` or ``.jsonl``, optionally
+followed by ``.gz``, instead contain one page per line, so they can be written as
+pages are scrolled and read back one page at a time.  :func:`iter_cache` reads either format, and
+:func:`convert_cache` converts between them.
+
+Time-bounded queries issued through :meth:`EsConnection.query_timeseries` can
+also be cached persistently by setting the ``cache_dir`` attribute of an
+:class:`EsConnection`.  The requested time range is divided into buckets aligned
+to multiples of ``cache_bucket`` seconds, and the hits returned for each bucket
+are stored in their own NDJSON cache file keyed by the query template, index,
+and bucket.  Subsequent queries overlapping the same buckets read them from disk
+and only query Elasticsearch for the buckets that are missing.  Buckets that
+ended less than ``cache_settle`` seconds ago may still be receiving documents,
+so they, along with buckets only partially covered by the requested time range,
+are always queried and never cached.  Queries for records that span a time range
+(those given an ``end_key``) are only cached if ``cache_max_duration`` is set,
+since such records may not be indexed until long after the buckets they overlap
+have ended.
 """
 
+import os
+import sys
 import copy
 import time
 import json
+import queue
 import mimetypes
 import gzip
+import hashlib
+import datetime
 import warnings
+import threading
+import concurrent.futures
 import pandas
 from .. import debug
 try:
@@ -19,6 +54,14 @@ try:
 except ImportError:
     HAVE_ES_PKG = True
 
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+
+#: Default width of each time bucket cached by query_timeseries, in seconds
+DEFAULT_CACHE_BUCKET = 3600
+
+#: Default seconds after a time bucket ends before it may be cached
+DEFAULT_CACHE_SETTLE = 3600
+
 BASE_QUERY = {
     "query": {
         "constant_score": {
@@ -44,7 +87,9 @@ class EsConnection(object):
     scrolling functionality for very long documents and callback functions to be
     run after each page is retrieved.
     """
-    def __init__(self, host, port, index=None, scroll_size='1m', page_size=10000, timeout=30, **kwargs):
+    def __init__(self, host, port, index=None, scroll_size='1m', page_size=10000, timeout=30,
+                 slices=1, max_workers=None, cache_dir=None, cache_bucket=DEFAULT_CACHE_BUCKET,
+                 cache_settle=DEFAULT_CACHE_SETTLE, cache_max_duration=None, **kwargs):
         """Configure and connect to an Elasticsearch endpoint.
 
         Args:
@@ -57,6 +102,19 @@ class EsConnection(object):
                 page (e.g., 10000 for 10k docs per scroll)
             timeout (int): how many seconds to wait for a response from
                 Elasticsearch before the query should time out
+            slices (int): number of slices into which scrolling queries are
+                divided and retrieved in parallel.  If 1, do not slice.
+            max_workers (int or None): number of threads used to retrieve
+                slices.  If None, use one thread per slice.
+            cache_dir (str or None): directory in which the results of
+                ``query_timeseries()`` are cached.  If None, do not cache.
+            cache_bucket (int): width of each cached time bucket, in seconds
+            cache_settle (int): seconds that must elapse after a time bucket
+                ends before its results may be cached
+            cache_max_duration (int or None): longest time, in seconds, that a
+                record spanning a time range may remain unfinished and
+                unindexed.  Applies only to queries that specify an
+                ``end_key``; if None, such queries are never cached.
 
         Attributes:
             client: Elasticsearch connection handler
@@ -69,6 +127,18 @@ class EsConnection(object):
             page_size (int): max number of documents returned per page
             scroll_size (int): duration to keep scroll search context open
             scroll_id: identifier for the scroll search context currently in use
+            slices (int): number of slices into which scrolling queries are
+                divided
+            max_workers (int or None): number of threads used to retrieve
+                slices
+            cache_dir (str or None): directory in which the results of
+                ``query_timeseries()`` are cached
+            cache_bucket (int): width of each cached time bucket, in seconds
+            cache_settle (int): seconds after a time bucket ends before its
+                results may be cached
+            cache_max_duration (int or None): longest time, in seconds, that a
+                record spanning a time range may remain unfinished and
+                unindexed
             sort_by (str): field by which Elasticsearch should sort results
                 before returning them as query results
             fake_pages (list): A list of ``page`` structures that should be
@@ -93,6 +163,14 @@ class EsConnection(object):
         self.page_size = page_size
         self.scroll_size = scroll_size
         self.scroll_id = None
+        # for sliced scrolling
+        self.slices = slices
+        self.max_workers = max_workers
+        # for the query_timeseries cache
+        self.cache_dir = cache_dir
+        self.cache_bucket = cache_bucket
+        self.cache_settle = cache_settle
+        self.cache_max_duration = cache_max_duration
         # for query_and_scroll
         self._num_flushes = 0
         self._filter_function = None
@@ -104,6 +182,7 @@ class EsConnection(object):
         self.sort_by = ''
         # for debugging
         self.fake_pages = []
+        self._fake_page_source = None
         # if elasticsearch package is not available, we MUST run in local mode.
         # But this can also be changed at runtime if, e.g., elasticsearch _is_
         # available, but a connection cannot be made to the Elasticsearch
@@ -117,37 +196,31 @@ class EsConnection(object):
     def from_cache(cls, cache_file):
         """Initializes an EsConnection object from a cache file.
 
-        This path is designed to be used for testing.
+        This path is designed to be used for testing.  Pages are read from the
+        cache file lazily as they are scrolled.
 
         Args:
-            cache_file (str): Path to the JSON formatted list of pages
+            cache_file (str): Path to the JSON or NDJSON formatted list of pages
         """
-        _, encoding = mimetypes.guess_type(cache_file)
-        if encoding == 'gzip':
-            input_fp = gzip.open(cache_file, 'rt')
-        else:
-            input_fp = open(cache_file, 'rt')
-
-        # convert cached hits into something resembling a real Elasticsearch response
-        pages = []
-        for hits in json.load(input_fp):
-            pages.append({
-                '_scroll_id': '0',
-                'hits': {
-                    'hits': hits
+        def iter_fake_pages():
+            """Convert cached hits into something resembling a real Elasticsearch response
+            """
+            for hits in iter_cache(cache_file):
+                yield {
+                    '_scroll_id': '0',
+                    'hits': {
+                        'hits': hits
+                    }
                 }
-            })
-
-        # never forget to terminate fake pages with an empty page
-        pages.append({'_scroll_id': 0, 'hits': {'hits': []}})
-        input_fp.close()
+            # never forget to terminate fake pages with an empty page
+            yield {'_scroll_id': 0, 'hits': {'hits': []}}
 
         instance = cls(host=None, port=None, index=None)
         instance.local_mode = True
-        instance.fake_pages = pages
+        instance._fake_page_source = iter_fake_pages()
         return instance
 
-    def save_cache(self, output_file=None):
+    def save_cache(self, output_file=None, pages=None, ndjson=None):
         """Persist the response of the last query to a file
 
         This is a little different from other connectors' save_cache() methods
@@ -160,15 +233,17 @@ class EsConnection(object):
         Args:
             output_file (str or None): Path to file to which json should be
                 written.  If None, write to stdout.  Default is None.
+            pages (iterable, optional): Pages to write instead of
+                ``scroll_pages``.  Pages are written one at a time as they are
+                produced, so this may be a generator such as that returned by
+                ``iter_scroll()``.
+            ndjson (bool or None): Write one page per line instead of a single
+                JSON list of pages.  If None, write NDJSON only if
+                ``output_file`` has an NDJSON file extension.
         """
-        # write out pages to a file
-        if output_file is None:
-            print(json.dumps(self.scroll_pages, indent=4))
-        else:
-            _, encoding = mimetypes.guess_type(output_file)
-            output_file = gzip.open(output_file, 'w') if encoding == 'gzip' else open(output_file, 'w')
-            json.dump(self.scroll_pages, output_file)
-            output_file.close()
+        if pages is None:
+            pages = self.scroll_pages
+        write_cache(output_file, pages, ndjson=ndjson)
 
     def _process_page(self):
         """Remove a page from the incoming queue and append it
@@ -184,9 +259,8 @@ class EsConnection(object):
         if not self.page['hits']['hits']:
             return False
 
-        self.scroll_id = self.page.get('_scroll_id')
+        self.scroll_id = self.page.get('_scroll_id', self.scroll_id)
         num_hits = len(self.page['hits']['hits'])
-        self._total_hits += num_hits
 
         # if this page will push us over flush_every, flush it first
         if self._flush_function is not None \
@@ -210,8 +284,22 @@ class EsConnection(object):
         return True
 
 
+    def _have_fake_pages(self):
+        """Ensure that the next fake page, if any, is in ``fake_pages``
+
+        Returns:
+            bool: True if at least one fake page remains
+        """
+        if not self.fake_pages and self._fake_page_source is not None:
+            page = next(self._fake_page_source, None)
+            if page is None:
+                self._fake_page_source = None
+            else:
+                self.fake_pages.append(page)
+        return bool(self.fake_pages)
+
     def _pop_fake_page(self):
-        if not self.fake_pages:
+        if not self._have_fake_pages():
             warn_str = "fake_pages is empty on a query/scroll; this means either"
             warn_str += "\n\n"
             warn_str += "1. You forgot to set self.fake_pages before issuing the query, or\n"
@@ -286,45 +374,63 @@ class EsConnection(object):
 
         return self.page
 
-    def query_and_scroll(self, query, source_filter=True, filter_function=None,
-                         flush_every=None, flush_function=None):
-        """Issue a query and retain all results.
+    def clear_scroll(self):
+        """Release the scroll context of the last query.
 
-        Issues a query and scrolls through every resulting page, optionally
-        applying in situ logic for filtering and flushing.  All resulting pages
-        are appended to the ``scroll_pages`` attribute of this object.
+        Elasticsearch retains the state of a scrolling query until its scroll
+        context times out, so contexts should be cleared as soon as they are no
+        longer needed.  In local mode, any fake pages remaining in the current
+        scroll are discarded instead.
+        """
+        if self.local_mode:
+            # discard the remainder of this scroll, including its empty page
+            while self._have_fake_pages() and self.page and self.page['hits']['hits']:
+                self.page = self.fake_pages.pop(0)
+        elif self.client and self.scroll_id is not None:
+            try:
+                self.client.clear_scroll(scroll_id=self.scroll_id)
+            except Exception as error: # scroll contexts expire anyway
+                warnings.warn("Failed to clear scroll context: %s" % error)
+        self.scroll_id = None
 
-        The ``scroll_pages`` attribute must be wiped by whatever is consuming it;
-        if this does not happen, `query_and_scroll()` will continue appending
-        results to the results of previous queries.
+    def iter_scroll(self, query, source_filter=True, filter_function=None):
+        """Issue a query and yield each page of results as it arrives.
+
+        Issues a query and scrolls through every resulting page, but does not
+        retain any pages.  This allows arbitrarily large queries to be
+        processed with bounded memory.  The scroll context is cleared once all
+        pages have been yielded or the generator is closed.
+
+        If the ``slices`` attribute is greater than one, the query is divided
+        into that many slices which are scrolled in parallel, and pages are
+        yielded in the order in which they are received from any slice.
 
         Args:
             query (dict): Dictionary representing the query to issue
             source_filter (bool or list): Return all fields contained in each
                 document's _source field if True; otherwise, only return source
                 fields contained in the provided list of str.
-            filter_function (function, optional): Function to call before each
-                set of results is appended to the ``scroll_pages`` attribute; if
-                specified, return value of this function is what is appended.
-            flush_every (int or None): trigger the flush function once the
-                number of docs contained across all ``scroll_pages`` reaches
-                this value.  If None, do not apply `flush_function`.
-            flush_function (function, optional): function to call when
-                `flush_every` docs are retrieved.
+            filter_function (function, optional): Function to apply to each
+                page; if specified, the return value of this function is
+                yielded instead of the raw page.
+
+        Yields:
+            dict: Each page retrieved, or the output of `filter_function`
+            applied to each page.
         """
         ### Print query
         debug.debug_print(json.dumps(query, indent=4))
 
         ### Run query
         time0 = time.time()
-
-        # initialize the scroll state
-        self.scroll_pages = []
-        self._filter_function = filter_function
-        self._flush_every = flush_every
-        self._flush_function = flush_function
         self._total_hits = 0
-        self._hits_since_flush = 0
+
+        # fake pages can only be served as a single scroll
+        if self.slices > 1 and not self.local_mode:
+            for page in self._iter_sliced_scroll(query, source_filter, filter_function):
+                yield page
+            debug.debug_print("Elasticsearch query took %s seconds" % (time.time() - time0))
+            return
 
         # Get first set of results and a scroll id
         if self.local_mode:
@@ -341,19 +447,180 @@ class EsConnection(object):
                 _source=source_filter,
             )
 
-        more = self._process_page()
-
         # Get remaining pages
-        while more:
-            self.page = self.scroll()
-            more = self._process_page()
+        try:
+            while self.page['hits']['hits']:
+                self.scroll_id = self.page.get('_scroll_id')
+                self._total_hits += len(self.page['hits']['hits'])
+                if filter_function is None:
+                    yield self.page
+                else:
+                    yield filter_function(self.page)
+                self.page = self.scroll()
+        finally:
+            self.clear_scroll()
         debug.debug_print("Elasticsearch query took %s seconds" % (time.time() - time0))
 
+    def _iter_sliced_scroll(self, query, source_filter, filter_function):
+        """Retrieve each slice of a scrolling query in parallel.
+
+        Dispatches one worker per slice, each of which issues the query with its
+        own ``slice`` clause and scrolls through its own context.  Pages are
+        passed back through a bounded queue so that workers cannot get more
+        than a few pages ahead of the consumer.  ``self.page`` is set to each
+        raw page before it is yielded so that ``_process_page()`` behaves the
+        same as it does for unsliced scrolls.
+
+        Args:
+            query (dict): Dictionary representing the query to issue
+            source_filter (bool or list): Passed to the search for each slice
+            filter_function (function, optional): Function to apply to each
+                page before it is yielded
+
+        Yields:
+            dict: Each page retrieved, or the output of `filter_function`
+            applied to each page.
+        """
+        if not self.client:
+            # allow lazy connect
+            self.connect()
+
+        max_workers = self.max_workers if self.max_workers else self.slices
+        page_queue = queue.Queue(maxsize=2 * max_workers)
+        stop = threading.Event()
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        for slice_id in range(self.slices):
+            executor.submit(self._scroll_slice, query, slice_id, source_filter, page_queue, stop)
+
+        try:
+            remaining = self.slices
+            while remaining:
+                page, error = page_queue.get()
+                if page is None:
+                    # this slice is exhausted
+                    remaining -= 1
+                    if error is not None:
+                        raise error
+                    continue
+                self.page = page
+                self._total_hits += len(page['hits']['hits'])
+                if filter_function is None:
+                    yield page
+                else:
+                    yield filter_function(page)
+        finally:
+            # tell workers to give up, then unblock any waiting to enqueue
+            stop.set()
+            while True:
+                try:
+                    page_queue.get_nowait()
+                except queue.Empty:
+                    break
+            executor.shutdown(wait=True)
+            self.scroll_id = None
+
+    def _scroll_slice(self, query, slice_id, source_filter, page_queue, stop):
+        """Scroll through one slice of a query and enqueue its pages.
+
+        Runs in a worker thread.  Once the slice is exhausted, `stop` is set,
+        or an error occurs, a ``(None, error)`` tuple is enqueued and the slice's
+        scroll context is cleared.
+
+        Args:
+            query (dict): Dictionary representing the query to issue
+            slice_id (int): Which slice of ``self.slices`` to retrieve
+            source_filter (bool or list): Passed to the search
+            page_queue (queue.Queue): Queue into which ``(page, None)`` tuples
+                are put
+            stop (threading.Event): Set when the consumer no longer wants pages
+        """
+        def put(item):
+            """Enqueue without blocking forever if the consumer has gone away
+            """
+            while not stop.is_set():
+                try:
+                    page_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        sliced_query = copy.deepcopy(query) if query else {}
+        sliced_query['slice'] = {'id': slice_id, 'max': self.slices}
+
+        scroll_id = None
+        error = None
+        try:
+            page = self.client.search(
+                index=self.index,
+                body=sliced_query,
+                scroll=self.scroll_size,
+                size=self.page_size,
+                _source=source_filter,
+            )
+            scroll_id = page.get('_scroll_id')
+            while page['hits']['hits'] and put((page, None)):
+                page = self.client.scroll(scroll_id=scroll_id, scroll=self.scroll_size)
+                scroll_id = page.get('_scroll_id', scroll_id)
+        except Exception as exc: # re-raised by the consumer
+            error = exc
+        finally:
+            if scroll_id is not None:
+                try:
+                    self.client.clear_scroll(scroll_id=scroll_id)
+                except Exception as exc: # scroll contexts expire anyway
+                    warnings.warn("Failed to clear scroll context: %s" % exc)
+            put((None, error))
+
+    def query_and_scroll(self, query, source_filter=True, filter_function=None,
+                         flush_every=None, flush_function=None):
+        """Issue a query and retain all results.
+
+        Issues a query and scrolls through every resulting page, optionally
+        applying in situ logic for filtering and flushing.  All resulting pages
+        are appended to the ``scroll_pages`` attribute of this object.
+
+        The ``scroll_pages`` attribute must be wiped by whatever is consuming it;
+        if this does not happen, `query_and_scroll()` will continue appending
+        results to the results of previous queries.
+
+        Args:
+            query (dict): Dictionary representing the query to issue
+            source_filter (bool or list): Return all fields contained in each
+                document's _source field if True; otherwise, only return source
+                fields contained in the provided list of str.
+            filter_function (function, optional): Function to call before each
+                set of results is appended to the ``scroll_pages`` attribute; if
+                specified, return value of this function is what is appended.
+            flush_every (int or None): trigger the flush function once the
+                number of docs contained across all ``scroll_pages`` reaches
+                this value.  If None, do not apply `flush_function`.
+            flush_function (function, optional): function to call when
+                `flush_every` docs are retrieved.
+        """
+        self._init_scroll_pages(filter_function, flush_every, flush_function)
+        for _ in self.iter_scroll(query, source_filter=source_filter):
+            self._process_page()
+
+    def _init_scroll_pages(self, filter_function, flush_every, flush_function):
+        """Initialize the state used by _process_page()
+        """
+        self.scroll_pages = []
+        self._filter_function = filter_function
+        self._flush_every = flush_every
+        self._flush_function = flush_function
+        self._hits_since_flush = 0
+
     def query_timeseries(self, query_template, start, end, source_filter=True,
                          filter_function=None, flush_every=None,
-                         flush_function=None):
+                         flush_function=None, start_key='@timestamp', end_key=None):
         """Craft and issue query bounded by time
 
+        If the ``cache_dir`` attribute is set, results are read from and
+        written to a persistent cache of time buckets as described in
+        :meth:`iter_cached_timeseries`.
+
         Args:
             query_template (dict): a query object containing at least one
                 ``@timestamp`` field
@@ -370,24 +637,209 @@ class EsConnection(object):
                 this value.  If None, do not apply `flush_function`.
             flush_function (function, optional): function to call when
                 `flush_every` docs are retrieved.
+            start_key (str): Passed to :func:`build_timeseries_query`
+            end_key (str): Passed to :func:`build_timeseries_query`
+        """
+        if self.cache_dir is None or self.local_mode:
+            query = build_timeseries_query(query_template, start, end,
+                                           start_key=start_key, end_key=end_key)
+            self.query_and_scroll(
+                query=query,
+                source_filter=source_filter,
+                filter_function=filter_function,
+                flush_every=flush_every,
+                flush_function=flush_function)
+            return
+
+        self._init_scroll_pages(filter_function, flush_every, flush_function)
+        for page in self.iter_cached_timeseries(query_template, start, end,
+                                                source_filter=source_filter,
+                                                start_key=start_key,
+                                                end_key=end_key):
+            self.page = page
+            self._process_page()
+
+    def iter_cached_timeseries(self, query_template, start, end, source_filter=True,
+                               start_key='@timestamp', end_key=None):
+        """Yield the pages of a time-bounded query using the bucket cache
+
+        Divides the time range into buckets aligned to multiples of
+        ``cache_bucket`` seconds.  Buckets that lie entirely within the time
+        range and ended at least ``cache_settle`` seconds ago are read from
+        ``cache_dir`` if they were cached by a previous query; otherwise they
+        are queried individually and cached as they are scrolled.  The
+        remaining portions of the time range are queried without being cached.
+
+        If `end_key` is specified, records spanning multiple buckets are
+        returned by the query for each bucket they overlap, so records are
+        deduplicated by their ``_id``.  Such records may only be indexed once
+        they end, so buckets must also have ended at least
+        ``cache_max_duration`` seconds ago to be cached.  If
+        ``cache_max_duration`` is None, no buckets are cached and the whole
+        time range is queried at once.
+
+        Args:
+            query_template (dict): a query object containing at least one
+                ``@timestamp`` field
+            start (datetime.datetime): lower bound for query (inclusive)
+            end (datetime.datetime): upper bound for query (exclusive)
+            source_filter (bool or list): Return all fields contained in each
+                document's _source field if True; otherwise, only return source
+                fields contained in the provided list of str.
+            start_key (str): Passed to :func:`build_timeseries_query`
+            end_key (str): Passed to :func:`build_timeseries_query`
+
+        Yields:
+            dict: Pages containing only the ``hits`` of each page retrieved
+        """
+        cache_key = get_cache_key(query_template, self.index, source_filter, start_key, end_key)
+        cache_dir = os.path.join(self.cache_dir, cache_key)
+        settled = time.time() - self.cache_settle
+        seen_ids = None
+        if end_key is not None:
+            seen_ids = set()
+            if self.cache_max_duration is None:
+                settled = float('-inf')
+            else:
+                settled -= self.cache_max_duration
+
+        for seg_start, seg_end, cacheable in split_time_buckets(start, end, self.cache_bucket,
+                                                                settled):
+            cache_file = None
+            if cacheable:
+                cache_file = os.path.join(cache_dir, "%d-%d.ndjson.gz" % (
+                    time.mktime(seg_start.timetuple()), time.mktime(seg_end.timetuple())))
+
+            if cache_file and os.path.isfile(cache_file):
+                debug.debug_print("Reading cached bucket %s" % cache_file)
+                pages = iter_cache(cache_file)
+            else:
+                query = build_timeseries_query(query_template, seg_start, seg_end,
+                                               start_key=start_key, end_key=end_key)
+                pages = self.iter_scroll(query, source_filter=source_filter,
+                                         filter_function=lambda x: x['hits']['hits'])
+                if cache_file:
+                    pages = _iter_write_cache(cache_file, pages)
+
+            for hits in pages:
+                if seen_ids is not None:
+                    hits = [x for x in hits if x.get('_id') not in seen_ids]
+                    seen_ids.update(x.get('_id') for x in hits)
+                if hits:
+                    yield {'hits': {'hits': hits}}
+
+    def iter_timeseries(self, query_template, start, end, source_filter=True,
+                        filter_function=None):
+        """Craft and issue query bounded by time and yield its pages
+
+        Args:
+            query_template (dict): a query object containing at least one
+                ``@timestamp`` field
+            start (datetime.datetime): lower bound for query (inclusive)
+            end (datetime.datetime): upper bound for query (exclusive)
+            source_filter (bool or list): Return all fields contained in each
+                document's _source field if True; otherwise, only return source
+                fields contained in the provided list of str.
+            filter_function (function, optional): Function to apply to each
+                page before it is yielded.
+
+        Yields:
+            dict: Each page retrieved, or the output of `filter_function`
+            applied to each page.
         """
         query = build_timeseries_query(query_template, start, end)
 
-        self.query_and_scroll(
+        return self.iter_scroll(
             query=query,
             source_filter=source_filter,
-            filter_function=filter_function,
-            flush_every=flush_every,
-            flush_function=flush_function)
+            filter_function=filter_function)
+
+    def query_aggregation(self, query, group_by, metrics, interval, max_terms=10000):
+        """Issue a query that buckets documents instead of returning them
+
+        Documents matching `query` are grouped by each field in `group_by`,
+        then into ``interval``-second time buckets, and each field in
+        `metrics` is averaged within each bucket.  Only the buckets are
+        returned, so the volume of data transferred scales with the number of
+        buckets rather than the number of documents.
+
+        Args:
+            query (dict): Dictionary representing the query to issue
+            group_by (list of str): fields whose values define each bucket
+            metrics (list of str): fields to average within each bucket
+            interval (int): width of each time bucket, in seconds
+            max_terms (int): maximum number of distinct values returned for
+                each field in `group_by`
+
+        Returns:
+            list of dict: Output of :func:`flatten_buckets`
+        """
+        body = copy.deepcopy(query) if query else {}
+        body['aggs'] = build_histogram_aggregation(group_by, metrics, interval, max_terms)
+
+        debug.debug_print(json.dumps(body, indent=4))
+        time0 = time.time()
 
-    def to_dataframe(self, fields):
+        if self.local_mode:
+            self._pop_fake_page()
+        else:
+            if not self.client:
+                # allow lazy connect
+                self.connect()
+            self.page = self.client.search(index=self.index, body=body, size=0)
+
+        buckets = flatten_buckets(self.page.get('aggregations', {}), group_by, metrics)
+        debug.debug_print("Elasticsearch aggregation returned %d buckets in %s seconds"
+                          % (len(buckets), time.time() - time0))
+        return buckets
+
+    def iter_aggregated_timeseries(self, query_template, start, end, group_by, metrics,
+                                   interval, window=None, max_terms=10000):
+        """Craft and issue aggregation queries bounded by time
+
+        Divides the time range into windows and issues one aggregation query
+        per window so that no single response exceeds the number of buckets
+        Elasticsearch is willing to return.
+
+        Args:
+            query_template (dict): a query object containing at least one
+                ``@timestamp`` field
+            start (datetime.datetime): lower bound for query (inclusive)
+            end (datetime.datetime): upper bound for query (exclusive)
+            group_by (list of str): fields whose values define each bucket
+            metrics (list of str): fields to average within each bucket
+            interval (int): width of each time bucket, in seconds
+            window (datetime.timedelta or None): time range covered by each
+                query; should be a multiple of `interval`.  If None, issue a
+                single query.
+            max_terms (int): maximum number of distinct values returned for
+                each field in `group_by`
+
+        Yields:
+            list of dict: Buckets returned for each window
+        """
+        window_start = start
+        while window_start < end:
+            window_end = end if window is None else min(end, window_start + window)
+            query = build_timeseries_query(query_template, window_start, window_end)
+            yield self.query_aggregation(query, group_by, metrics, interval, max_terms)
+            window_start = window_end
+
+    def to_dataframe(self, fields, pages=None):
         """Converts self.scroll_pages to CSV
 
+        Args:
+            fields (list of str): _source fields to include as columns
+            pages (list, optional): Pages to convert instead of
+                ``scroll_pages``
+
         Returns:
             str: Contents of the last query's pages in CSV format
         """
+        if pages is None:
+            pages = self.scroll_pages
         to_df = []
-        for page in self.scroll_pages:
+        for page in pages:
             for record in page:
                 record_dict = {}
                 for field in fields:
@@ -395,6 +847,239 @@ class EsConnection(object):
                 to_df.append(record_dict)
         return pandas.DataFrame(to_df)
 
+def is_ndjson(cache_file):
+    """Determine if a cache file should contain one page per line
+
+    Args:
+        cache_file (str): Path to a cache file, optionally gzipped
+
+    Returns:
+        bool: True if `cache_file` has an NDJSON file extension
+    """
+    if cache_file is None:
+        return False
+    _, encoding = mimetypes.guess_type(cache_file)
+    if encoding == 'gzip' and cache_file.endswith('.gz'):
+        cache_file = cache_file[:-3]
+    return cache_file.endswith(NDJSON_EXTENSIONS)
+
+def _open_cache(cache_file, mode):
+    """Open a cache file, transparently handling gzip compression
+    """
+    _, encoding = mimetypes.guess_type(cache_file)
+    if encoding == 'gzip':
+        return gzip.open(cache_file, mode + 't')
+    return open(cache_file, mode)
+
+def iter_cache(cache_file):
+    """Read the pages contained in a cache file one at a time
+
+    NDJSON caches are decoded one line at a time.  Caches in the original
+    format must be decoded in their entirety before the first page is yielded.
+
+    Args:
+        cache_file (str): Path to a JSON or NDJSON cache file, optionally
+            gzipped
+
+    Yields:
+        Each page contained in `cache_file`
+    """
+    with _open_cache(cache_file, 'r') as input_fp:
+        if is_ndjson(cache_file):
+            for line in input_fp:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            for page in json.load(input_fp):
+                yield page
+
+def write_cache(output_file, pages, ndjson=None):
+    """Write pages to a cache file as they are produced
+
+    Args:
+        output_file (str or None): Path to file to which pages should be
+            written.  If None, write to stdout.
+        pages (iterable): Pages to write
+        ndjson (bool or None): Write one page per line instead of a single JSON
+            list of pages.  If None, infer from the extension of `output_file`.
+    """
+    if ndjson is None:
+        ndjson = is_ndjson(output_file)
+
+    output_fp = sys.stdout if output_file is None else _open_cache(output_file, 'w')
+
+    if ndjson:
+        for page in pages:
+            json.dump(page, output_fp)
+            output_fp.write("\n")
+    else:
+        output_fp.write("[")
+        for index, page in enumerate(pages):
+            if index:
+                output_fp.write(",\n")
+            json.dump(page, output_fp)
+        output_fp.write("]\n")
+
+    if output_file is not None:
+        output_fp.close()
+
+def convert_cache(input_file, output_file, ndjson=None):
+    """Convert a cache file between the JSON and NDJSON formats
+
+    Args:
+        input_file (str): Path to a JSON or NDJSON cache file
+        output_file (str): Path to which the converted cache is written
+        ndjson (bool or None): Write NDJSON instead of JSON.  If None, infer
+            from the extension of `output_file`.
+    """
+    write_cache(output_file, iter_cache(input_file), ndjson=ndjson)
+
+def _iter_write_cache(cache_file, pages):
+    """Pass pages through while writing them to an NDJSON cache file
+
+    Pages are written to a temporary file that is only renamed to `cache_file`
+    once every page has been consumed, so an interrupted query never leaves
+    behind an incomplete cache file.
+    """
+    cache_dir, basename = os.path.split(cache_file)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    temp_file = os.path.join(cache_dir, ".%d.%s" % (os.getpid(), basename))
+    complete = False
+    try:
+        with _open_cache(temp_file, 'w') as output_fp:
+            for page in pages:
+                json.dump(page, output_fp)
+                output_fp.write("\n")
+                yield page
+        os.rename(temp_file, cache_file)
+        complete = True
+        debug.debug_print("Cached bucket %s" % cache_file)
+    finally:
+        if not complete and os.path.exists(temp_file):
+            os.unlink(temp_file)
+
+def get_cache_key(query_template, index, source_filter, start_key='@timestamp', end_key=None):
+    """Derive the name under which a time-bounded query is cached
+
+    Args:
+        query_template (dict): a query object containing at least one
+            ``@timestamp`` field
+        index (str or None): name of index against which the query is issued
+        source_filter (bool or list): fields returned by the query
+        start_key (str): Passed to :func:`build_timeseries_query`
+        end_key (str): Passed to :func:`build_timeseries_query`
+
+    Returns:
+        str: A name that is unique to the given query parameters
+    """
+    key = json.dumps([query_template, index, source_filter, start_key, end_key], sort_keys=True)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def split_time_buckets(start, end, bucket, settled):
+    """Divide a time range into cacheable buckets and uncacheable remainders
+
+    Args:
+        start (datetime.datetime): lower bound of time range (inclusive)
+        end (datetime.datetime): upper bound of time range (exclusive)
+        bucket (int): width of each bucket, in seconds.  Buckets are aligned
+            to multiples of this width since the epoch.
+        settled (float): seconds since the epoch before which buckets must end
+            to be cacheable
+
+    Returns:
+        list of tuple: Each tuple is ``(start, end, cacheable)`` for one
+        segment of the time range.  Adjacent uncacheable segments are merged.
+    """
+    start_epoch = int(time.mktime(start.timetuple()))
+    end_epoch = int(time.mktime(end.timetuple()))
+    segments = []
+    seg_start = start_epoch
+    while seg_start < end_epoch:
+        seg_end = min(end_epoch, (seg_start // bucket + 1) * bucket)
+        cacheable = seg_start % bucket == 0 \
+            and seg_end - seg_start == bucket \
+            and seg_end <= settled
+        if segments and not cacheable and not segments[-1][2]:
+            segments[-1][1] = seg_end
+        else:
+            segments.append([seg_start, seg_end, cacheable])
+        seg_start = seg_end
+
+    return [(datetime.datetime.fromtimestamp(x), datetime.datetime.fromtimestamp(y), cacheable)
+            for x, y, cacheable in segments]
+
+def build_histogram_aggregation(group_by, metrics, interval, max_terms=10000,
+                                time_key='@timestamp'):
+    """Create a nested terms and date_histogram aggregation
+
+    Args:
+        group_by (list of str): fields to bucket with nested terms
+            aggregations, outermost first
+        metrics (list of str): fields to average within each time bucket
+        interval (int): width of each time bucket, in seconds
+        max_terms (int): maximum number of buckets returned by each terms
+            aggregation
+        time_key (str): field containing the timestamp of each document
+
+    Returns:
+        dict: An aggregation suitable for the ``aggs`` key of a query
+    """
+    aggs = {
+        time_key: {
+            "date_histogram": {
+                "field": time_key,
+                # "interval" was renamed "fixed_interval" in Elasticsearch 7.2
+                "interval": "%ds" % interval,
+                "min_doc_count": 1,
+            },
+            "aggs": dict((metric, {"avg": {"field": metric}}) for metric in metrics),
+        }
+    }
+    for field in reversed(group_by):
+        aggs = {
+            field: {
+                "terms": {"field": field, "size": max_terms},
+                "aggs": aggs,
+            }
+        }
+    return aggs
+
+def flatten_buckets(aggregations, group_by, metrics, time_key='@timestamp'):
+    """Flatten the response to a build_histogram_aggregation() query
+
+    Args:
+        aggregations (dict): the ``aggregations`` key of a query response
+        group_by (list of str): fields passed to build_histogram_aggregation()
+        metrics (list of str): fields passed to build_histogram_aggregation()
+        time_key (str): field passed to build_histogram_aggregation()
+
+    Returns:
+        list of dict: One dict per time bucket, keyed by each field in
+        `group_by` and `metrics`, ``doc_count``, and `time_key`, whose value is
+        the start of the bucket in milliseconds since the epoch.  Metrics for
+        which no documents had values are None.
+    """
+    rows = []
+    def walk(aggregation, depth, row):
+        """Descend through one level of nested buckets"""
+        if depth < len(group_by):
+            for bucket in aggregation[group_by[depth]]['buckets']:
+                row[group_by[depth]] = bucket['key']
+                walk(bucket, depth + 1, row)
+        else:
+            for bucket in aggregation[time_key]['buckets']:
+                flat = dict(row)
+                flat[time_key] = bucket['key']
+                flat['doc_count'] = bucket['doc_count']
+                for metric in metrics:
+                    flat[metric] = bucket[metric]['value']
+                rows.append(flat)
+
+    if aggregations:
+        walk(aggregations, 0, {})
+    return rows
+
 def build_timeseries_query(orig_query, start, end, start_key='@timestamp', end_key=None):
     """Create a query object with time ranges bounded.
 
@@ -6,9 +6,11 @@ CachingDb class.
 
 import os
 import datetime
+import numpy
 from . import cachingdb
 
-### Names and schemata of all LMT database tables worth caching
+### Names and schemata of all LMT database tables worth caching.  Secondary
+### indexes are created on the columns used to select ranges of time.
 LMTDB_TABLES = {
     "FILESYSTEM_INFO": {
         'columns': [
@@ -30,6 +32,7 @@ LMTDB_TABLES = {
             'INODES_USED',
         ],
         'primary_key': ['MDS_ID', 'TS_ID'],
+        'indexes': [['TS_ID']],
     },
     "MDS_INFO": {
         'columns': [
@@ -51,6 +54,7 @@ LMTDB_TABLES = {
             'SUMSQUARES',
         ],
         'primary_key': ['MDS_ID', 'TS_ID', 'OPERATION_ID'],
+        'indexes': [['TS_ID']],
     },
     "MDS_VARIABLE_INFO": {
         'columns': [
@@ -79,6 +83,7 @@ LMTDB_TABLES = {
             'PCT_MEMORY'
         ],
         'primary_key': ['OSS_ID', 'TS_ID'],
+        'indexes': [['TS_ID']],
     },
     "OSS_INFO": {
         'columns': [
@@ -105,6 +110,7 @@ LMTDB_TABLES = {
             'INODES_USED'
         ],
         'primary_key': ['OST_ID', 'TS_ID'],
+        'indexes': [['TS_ID']],
     },
     "OST_INFO": {
         'columns': [
@@ -131,16 +137,44 @@ LMTDB_TABLES = {
     "TIMESTAMP_INFO": {
         'columns': ['TS_ID', 'TIMESTAMP'],
         'primary_key': ['TS_ID'],
+        'indexes': [['TIMESTAMP']],
     },
 }
 
+#: Seconds after which LMT stops inserting rows for a given timestamp
+LMTDB_SETTLE_TIME = 300
+
+#: Seconds for which query results may be reused.  The lookup tables only change
+#: when a file system is reconfigured, while the time series tables may receive
+#: new rows until they settle.
+LMTDB_QUERY_CACHE_TTLS = {
+    'FILESYSTEM_INFO': 7 * 86400,
+    'MDS_INFO': 7 * 86400,
+    'MDS_VARIABLE_INFO': 7 * 86400,
+    'OPERATION_INFO': 7 * 86400,
+    'OSS_INFO': 7 * 86400,
+    'OST_INFO': 7 * 86400,
+    'OST_VARIABLE_INFO': 7 * 86400,
+    'MDS_DATA': LMTDB_SETTLE_TIME,
+    'MDS_OPS_DATA': LMTDB_SETTLE_TIME,
+    'OSS_DATA': LMTDB_SETTLE_TIME,
+    'OST_DATA': LMTDB_SETTLE_TIME,
+    'TIMESTAMP_INFO': LMTDB_SETTLE_TIME,
+}
+
 class LmtDb(cachingdb.CachingDb):
     """
     Class to wrap the connection to an LMT MySQL database or SQLite database
     """
-    def __init__(self, dbhost=None, dbuser=None, dbpassword=None, dbname=None, cache_file=None):
+    query_cache_ttls = LMTDB_QUERY_CACHE_TTLS
+
+    def __init__(self, dbhost=None, dbuser=None, dbpassword=None, dbname=None, cache_file=None,
+                 max_connections=1, query_cache_dir=None):
         """
-        Initialize LmtDb with either a MySQL or SQLite backend
+        Initialize LmtDb with either a MySQL or SQLite backend.  Time series
+        queries are divided into chunks, and up to `max_connections` chunks
+        are queried concurrently.  The lookup tables queried here are reused
+        from `query_cache_dir` by later instances if it is given.
         """
         # Get database parameters
         if dbhost is None:
@@ -157,7 +191,9 @@ class LmtDb(cachingdb.CachingDb):
             dbuser=dbuser,
             dbpassword=dbpassword,
             dbname=dbname,
-            cache_file=cache_file)
+            cache_file=cache_file,
+            max_connections=max_connections,
+            query_cache_dir=query_cache_dir)
 
         # The list of OST names is an immutable property of a database, so
         # fetch and cache it here.  Also maintain a mapping of OST_ID to
@@ -215,44 +251,45 @@ class LmtDb(cachingdb.CachingDb):
         """
         Break a timeseries query into smaller queries over smaller time ranges.
         This is an optimization to avoid the O(N*M) scaling of the JOINs in the
-        underlying SQL query.
+        underlying SQL query.  Up to ``max_connections`` chunks are queried
+        concurrently, and their rows are returned in the order of the chunks.
         """
-        table_schema = LMTDB_TABLES.get(table.upper())
-        if table_schema is None:
-            raise KeyError("Table '%s' is not valid" % table)
-        else:
-            result_columns = ['TIMESTAMP'] + table_schema['columns']
-        format_dict = {
-            'schema': ', '.join(result_columns).replace("TS_ID,", "TIMESTAMP_INFO.TS_ID,"),
-            'table': table,
-        }
-
-        index0 = len(self.saved_results.get(table, {'rows': []})['rows'])
-        chunk_start = datetime_start
-        while chunk_start < datetime_end:
-            if timechunk is None:
-                chunk_end = datetime_end
-            else:
-                chunk_end = chunk_start + timechunk
-            if chunk_end > datetime_end:
-                chunk_end = datetime_end
-            start_stamp = chunk_start.strftime("%Y-%m-%d %H:%M:%S")
-            end_stamp = chunk_end.strftime("%Y-%m-%d %H:%M:%S")
-
-            query_str = """SELECT
-                               %(schema)s
-                           FROM
-                               %(table)s
-                           INNER JOIN TIMESTAMP_INFO ON TIMESTAMP_INFO.TS_ID = %(table)s.TS_ID
-                           WHERE
-                               TIMESTAMP_INFO.TIMESTAMP >= %%(ps)s
-                               AND TIMESTAMP_INFO.TIMESTAMP < %%(ps)s
-                           """ % format_dict
-            self.query(query_str, (start_stamp, end_stamp), table=table, table_schema=table_schema)
-            if timechunk is not None:
-                chunk_start += timechunk
-
-        return self.saved_results[table]['rows'][index0:], result_columns
+        query_str, result_columns, table_schema = get_timeseries_query(table)
+        chunks = get_timechunks(datetime_start, datetime_end, timechunk)
+
+        results = self.query_many(query_str, chunks, table=table, table_schema=table_schema)
+
+        return [row for rows in results for row in rows], result_columns
+
+    def iter_timeseries_arrays(self, table, datetime_start, datetime_end,
+                               timechunk=datetime.timedelta(hours=1),
+                               batch_size=cachingdb.DEFAULT_BATCH_SIZE):
+        """Stream a timeseries query as NumPy structured arrays
+
+        Issues the same chunked queries as get_timeseries_data(), but decodes
+        rows into structured arrays in batches instead of retaining them as
+        tuples in ``saved_results``.  Arrays are yielded in the order of the
+        chunks, so rows remain ordered by timestamp.
+
+        Args:
+            table (str): name of LMT table to query
+            datetime_start (datetime.datetime): lower bound on time series data
+                to retrieve, inclusive
+            datetime_end (datetime.datetime): upper bound on time series data to
+                retrieve, exclusive
+            timechunk (datetime.timedelta): divide time range query into
+                sub-ranges of this width to work around N*N scaling of JOINs
+            batch_size (int): maximum number of rows in each array
+
+        Yields:
+            numpy.ndarray: Structured array with fields named after the columns
+            of `table` and a ``TIMESTAMP`` field of dtype ``datetime64[s]``
+        """
+        query_str, result_columns, _ = get_timeseries_query(table)
+        chunks = get_timechunks(datetime_start, datetime_end, timechunk)
+        return self.iter_query_many(query_str, chunks,
+                                    dtype=get_timeseries_dtype(result_columns),
+                                    batch_size=batch_size)
 
     def get_mds_data(self, datetime_start, datetime_end, timechunk=datetime.timedelta(hours=1)):
         """Schema-agnostic method for retrieving MDS load data.
@@ -349,3 +386,79 @@ class LmtDb(cachingdb.CachingDb):
                                         datetime_start,
                                         datetime_end,
                                         timechunk=timechunk)
+
+def get_timeseries_query(table):
+    """Build the query used to retrieve time series data from a table
+
+    Args:
+        table (str): name of LMT table to query
+
+    Returns:
+        tuple: (query string, list of result column names, table schema)
+    """
+    table_schema = LMTDB_TABLES.get(table.upper())
+    if table_schema is None:
+        raise KeyError("Table '%s' is not valid" % table)
+    else:
+        result_columns = ['TIMESTAMP'] + table_schema['columns']
+    format_dict = {
+        'schema': ', '.join(result_columns).replace("TS_ID,", "TIMESTAMP_INFO.TS_ID,"),
+        'table': table,
+    }
+
+    query_str = """SELECT
+                       %(schema)s
+                   FROM
+                       %(table)s
+                   INNER JOIN TIMESTAMP_INFO ON TIMESTAMP_INFO.TS_ID = %(table)s.TS_ID
+                   WHERE
+                       TIMESTAMP_INFO.TIMESTAMP >= %%(ps)s
+                       AND TIMESTAMP_INFO.TIMESTAMP < %%(ps)s
+                   """ % format_dict
+    return query_str, result_columns, table_schema
+
+def get_timechunks(datetime_start, datetime_end, timechunk):
+    """Divide a time range into query variables for each chunk
+
+    Args:
+        datetime_start (datetime.datetime): lower bound of time range, inclusive
+        datetime_end (datetime.datetime): upper bound of time range, exclusive
+        timechunk (datetime.timedelta or None): width of each chunk.  If None,
+            do not divide the time range.
+
+    Returns:
+        list of tuple: (start, end) timestamp strings for each chunk
+    """
+    chunks = []
+    chunk_start = datetime_start
+    while chunk_start < datetime_end:
+        if timechunk is None:
+            chunk_end = datetime_end
+        else:
+            chunk_end = chunk_start + timechunk
+        if chunk_end > datetime_end:
+            chunk_end = datetime_end
+        chunks.append((chunk_start.strftime("%Y-%m-%d %H:%M:%S"),
+                       chunk_end.strftime("%Y-%m-%d %H:%M:%S")))
+        chunk_start = chunk_end
+    return chunks
+
+def get_timeseries_dtype(columns):
+    """Determine the structured dtype of time series query results
+
+    Args:
+        columns (list of str): column names returned by the query
+
+    Returns:
+        numpy.dtype: ``datetime64[s]`` for TIMESTAMP, 64-bit integers for ID
+        columns, and 64-bit floats for all other columns
+    """
+    dtype = []
+    for column in columns:
+        if column == 'TIMESTAMP':
+            dtype.append((column, 'datetime64[s]'))
+        elif column.endswith('_ID'):
+            dtype.append((column, numpy.int64))
+        else:
+            dtype.append((column, numpy.float64))
+    return numpy.dtype(dtype)
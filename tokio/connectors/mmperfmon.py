@@ -46,25 +46,42 @@ where
 It is also worth noting that mmperfmon treats a timestamp labeled as, for
 example, ``2019-03-04-16:01:00`` as containing all data from the period between
 2019-03-04-16:00:00 and 2019-03-04-16:01:00.
+
+Directories and tarballs containing the outputs of many mmperfmon invocations
+can be parsed by a pool of processes by passing ``processes`` when
+instantiating :class:`Mmperfmon`.  Each member is parsed independently and the
+results are merged in the order in which the members appear, so the result is
+identical to that of parsing the members serially.
+
+The output of each invocation is parsed into a :class:`MmperfmonTable`.  This is
+a matrix of values with one row per timestamp and one column per legend entry.
+The fixed-width columns of each table are sliced out of a character array, and
+their units are converted a whole column at a time rather than value by value.
+:meth:`Mmperfmon.to_dataframe` and ``archive_mmperfmon`` read these tables
+directly.  The dict representation is built from the same tables.
 """
 
 import os
 import re
 import json
 import gzip
+import time
 import tarfile
 import datetime
 import warnings
 import mimetypes
+import collections
+import concurrent.futures
 
+import numpy
 import pandas
 
 from .common import SubprocessOutputDict, walk_file_collection
-from ..common import to_epoch, recast_string, JSONEncoder
+from ..common import recast_string, JSONEncoder
 
-_REX_LEGEND = re.compile(r'^\s*(\d+):\s+([^|]+)\|([^|]+)\|(\S+)\s*$')
-_REX_ROWHEAD = re.compile(r'^\s*Row\s+Timestamp')
-_REX_ROW = re.compile(r'^\s*\d+\s+(\d{4}-\d\d-\d\d-\d\d:\d\d:\d\d)\s+')
+_REX_LEGEND = re.compile(r'^[ \t]*(\d+):[ \t]+([^|\n]+)\|([^|\n]+)\|(\S+)[ \t\r]*$', re.MULTILINE)
+_REX_ROWHEAD = re.compile(r'^[ \t]*Row[ \t]+Timestamp[^\r\n]*', re.MULTILINE)
+_REX_ROW = re.compile(r'^[ \t]*\d+[ \t]+\d{4}-\d\d-\d\d-\d\d:\d\d:\d\d[ \t][^\r\n]*', re.MULTILINE)
 
 MMPERFMON_DATE_FMT = "%Y-%m-%d-%H:%M:%S"
 MMPERFMON_UNITS_TO_BYTES = {
@@ -96,11 +113,22 @@ class Mmperfmon(SubprocessOutputDict):
 
     """
     def __init__(self, *args, **kwargs):
+        """Load mmperfmon output
+
+        Accepts the same arguments as SubprocessOutputDict plus the following.
+
+        Args:
+            processes (int): Number of processes with which to parse the
+                members of a directory or tarball.  If 1, parse them serially.
+            window (int or None): Maximum number of members being parsed or
+                awaiting merge at once.  If None, twice `processes`.
+        """
+        self.processes = kwargs.pop('processes', 1)
+        self.window = kwargs.pop('window', None)
         super(Mmperfmon, self).__init__(*args, **kwargs)
         self.subprocess_cmd = None
         self.legend = {}
-        self.rows = {}
-        self.col_offsets = []
+        self.tables = []
         self.load()
 
     def __repr__(self):
@@ -134,6 +162,10 @@ class Mmperfmon(SubprocessOutputDict):
         if cache_file:
             self.cache_file = cache_file
 
+        if self.from_string is not None or not self.cache_file:
+            super(Mmperfmon, self).load()
+            return
+
         try:
             self.load_multiple(input_file=self.cache_file)
         except tarfile.ReadError:
@@ -142,17 +174,54 @@ class Mmperfmon(SubprocessOutputDict):
     def load_multiple(self, input_file):
         """Load one or more input files from a directory or tarball
 
+        If ``processes`` is greater than one, members are parsed in parallel by
+        a pool of processes and merged into self in the order in which they
+        appear in `input_file`.
+
         Args:
             input_file (str): Path to either a directory or a tarfile containing
             multiple text files, each of which contains the output of a single
             mmperfmon invocation.
         """
-        for (member_name, _, member_handle) in walk_file_collection(input_file):
-            try:
-                self.load_str(input_str=member_handle.read())
-            except:
-                warnings.warn("Parsing error in %s" % member_name)
-                raise
+        for table in iter_tables(input_file, self.processes, self.window):
+            self.add_table(table)
+
+    def add_table(self, table):
+        """Merge a parsed table into self
+
+        Args:
+            table (MmperfmonTable): Parsed output of a single mmperfmon
+                invocation such as that returned by :func:`parse_table`
+        """
+        if self.tables is not None:
+            self.tables.append(table)
+        self.legend = {index + 1: entry for index, entry in enumerate(table.legend)}
+        for timestamp, hosts in table.to_dict().items():
+            if timestamp not in self:
+                self[timestamp] = hosts
+                continue
+            for hostname, counters in hosts.items():
+                to_update = self[timestamp].setdefault(hostname, {})
+                for counter, value in counters.items():
+                    if isinstance(value, dict) and counter in to_update:
+                        to_update[counter].update(value)
+                    else:
+                        to_update[counter] = value
+
+    def get_tables(self):
+        """Return the contents of self as a list of tables
+
+        Tables are returned in the order in which they were loaded, so values
+        in later tables supersede those in earlier ones.  If self was populated
+        from something other than mmperfmon output (e.g., a JSON cache file),
+        it is first converted into a single table.
+
+        Returns:
+            list of MmperfmonTable: Tables containing all of the data in self
+        """
+        if self.tables is None:
+            self.tables = [MmperfmonTable.from_dict(self)]
+        return self.tables
 
     def load_cache(self, cache_file=None):
         """Loads from one of two formats of cache files
@@ -174,6 +243,7 @@ class Mmperfmon(SubprocessOutputDict):
             for key, value in loaded_json.items():
                 key = recast_string(key)
                 self[key] = value
+            self.tables = None
         except ValueError:
             input_fp.close()
             super(Mmperfmon, self).load_cache(cache_file=cache_file)
@@ -185,78 +255,7 @@ class Mmperfmon(SubprocessOutputDict):
         Args:
             input_str (str): Text output of the ``mmperfmon query`` command
         """
-        # clean out state from any previous parsings
-        self.legend = {}
-        self.rows = {}
-        self.col_offsets = []
-
-        for line in input_str.splitlines():
-            # decode the legend
-            if not isinstance(line, str):
-                line = line.decode()
-            match = _REX_LEGEND.search(line)
-            if match is not None:
-                # extract values
-                row, hostname, counter = (match.group(1), match.group(2), match.group(4))
-                # counter will catch LUN names in the case of nsd-level counters
-                device_id = None
-                if '|' in counter:
-                    # an optional device_id is specified; append it to the hostname
-                    device_id, counter = counter.rsplit('|', 1)
-                self.legend[int(row)] = {'host': hostname, 'counter': counter, 'device_id': device_id}
-                # the reverse map doesn't hurt to have
-                # self.legend[hostname] = {'row': int(row), 'counter': counter}
-                continue
-
-            # find the row header to determine offsets
-            match = _REX_ROWHEAD.search(line)
-            if match is not None:
-                self.col_offsets = get_col_pos(line, align='right')
-
-            # divide data row into fixed-width fields based on row header format
-            match = _REX_ROW.search(line)
-            if match is not None and self.col_offsets:
-                fields = [line[istart:istop] for istart, istop in self.col_offsets]
-                rowid = int(fields[0].strip())
-                if rowid not in self.rows:
-                    self.rows[rowid] = fields
-                else:
-                    # skip the rowid and timestamp columns after the first time a row appears
-                    self.rows[rowid] += fields[2:]
-
-        # begin processing the fully tabularized data structure
-        for rowid in sorted(self.rows.keys()):
-            fields = self.rows[rowid]
-            timestamp = to_epoch(datetime.datetime.strptime(fields[1], MMPERFMON_DATE_FMT))
-            for index, val in enumerate(fields[2:]):
-                orig_counter = self.legend[index + 1]['counter']
-                hostname = self.legend[index + 1]['host']
-                device_id = self.legend[index + 1].get('device_id')
-
-                # turn number strings into numerics
-                old_value = recast_string(val.strip())
-
-                # skip null values entirely as if they never existed
-                if old_value is None:
-                    continue
-
-                # attempt to turn human-readable byte quantities into numbers of bytes
-                new_value = value_unit_to_bytes(old_value)
-                new_counter = orig_counter + "_bytes" if type(old_value) != type(new_value) else orig_counter
-
-                if timestamp not in self:
-                    self[timestamp] = {}
-                to_update = self[timestamp].get(hostname, {})
-
-                if device_id:
-                    if new_counter not in to_update:
-                        to_update[new_counter] = {}
-                    to_update[new_counter].update({device_id: new_value})
-                else:
-                    to_update[new_counter] = new_value 
-
-                if hostname not in self[timestamp]:
-                    self[timestamp][hostname] = to_update
+        self.add_table(parse_table(input_str))
 
     def to_dataframe_by_host(self, host):
         """Returns data from a specific host as a DataFrame
@@ -268,24 +267,14 @@ class Mmperfmon(SubprocessOutputDict):
             pandas.DataFrame: All measurements from the given host.  Columns
             correspond to different metrics; indexed in time.
         """
-        to_df = {}
-        for timestamp, hosts in self.items():
-            metrics = hosts.get(host)
-            if metrics is not None:
-                timestamp_o = datetime.datetime.fromtimestamp(timestamp)
-                to_df[timestamp_o] = {}
-                for key, value in metrics.items():
-                    if isinstance(value, dict):
-                        for deviceid, devicevalue in value.items():
-                            new_key = key + ":" + deviceid 
-                            to_df[timestamp_o][new_key] = devicevalue
-                    else:
-                        to_df[timestamp_o][key] = value
-
-        dataframe = pandas.DataFrame.from_dict(to_df, orient='index')
-        dataframe.index.name = 'timestamp'
-        return dataframe
+        def get_key(entry):
+            if entry['host'] != host:
+                return None
+            if entry['device_id']:
+                return entry['counter'] + ":" + entry['device_id']
+            return entry['counter']
 
+        return self._to_dataframe(get_key)
 
     def to_dataframe_by_metric(self, metric):
         """Returns data for a specific metric as a DataFrame
@@ -297,30 +286,80 @@ class Mmperfmon(SubprocessOutputDict):
             pandas.DataFrame: All measurements of the given metric for all
             hosts.  Columns represent hosts; indexed in time.
         """
-        to_df = {}
-        for timestamp, hosts in self.items():
-            for hostname, counters in hosts.items():
-                value = counters.get(metric)
-                if value is None:
-                    continue
+        def get_key(entry):
+            if entry['counter'] != metric:
+                return None
+            if entry['device_id']:
+                return entry['host'] + ":" + entry['device_id']
+            return entry['host']
 
-                timestamp_o = datetime.datetime.fromtimestamp(timestamp)
-                if timestamp_o not in to_df:
-                    to_df[timestamp_o] = {}
+        return self._to_dataframe(get_key)
 
-                if isinstance(value, dict):
-                    for deviceid, devicevalue in value.items():
-                        key = hostname + ":" + deviceid
-                        to_df[timestamp_o][key] = devicevalue
-                else:
-                    key = hostname
-                    to_df[timestamp_o][key] = value
+    def _to_dataframe(self, get_key):
+        """Returns the table columns selected by a function as a DataFrame
+
+        Args:
+            get_key (function): Takes a legend entry and returns the name of
+                the DataFrame column in which it belongs, or None to skip it
 
-        dataframe = pandas.DataFrame.from_dict(to_df, orient='index')
+        Returns:
+            pandas.DataFrame: Selected measurements indexed in time.  Where
+            more than one table contains a value for the same timestamp and
+            column, the one loaded last is used.
+        """
+        timestamps, keys, values, integers = [], [], [], []
+        string_keys = set()
+        for table in self.get_tables():
+            for index, entry in enumerate(table.columns):
+                key = get_key(entry)
+                if key is None:
+                    continue
+                found = ~numpy.isnan(table.values[:, index])
+                timestamps.append(table.timestamps[found])
+                keys.append(numpy.full(found.sum(), key, dtype=object))
+                values.append(table.values[found, index])
+                integers.append(table.integers[found, index])
+            # values that could not be converted into numbers are kept as strings
+            for (row, index), text in table.strings.items():
+                key = get_key(table.legend[index])
+                if key is None:
+                    continue
+                timestamps.append(table.timestamps[row:row + 1])
+                keys.append(numpy.array([key], dtype=object))
+                values.append(numpy.array([text], dtype=object))
+                integers.append(numpy.zeros(1, dtype=bool))
+                string_keys.add(key)
+
+        if not timestamps:
+            dataframe = pandas.DataFrame()
+            dataframe.index.name = 'timestamp'
+            return dataframe
+
+        keys = numpy.concatenate(keys)
+        integers = numpy.concatenate(integers)
+        dataframe = pandas.DataFrame({
+            'timestamp': numpy.concatenate(timestamps),
+            'key': keys,
+            'value': numpy.concatenate(values)})
+        dataframe = dataframe.drop_duplicates(['timestamp', 'key'], keep='last')
+        dataframe = dataframe.pivot(index='timestamp', columns='key', values='value')
+        dataframe = dataframe.reindex(columns=pandas.unique(keys))
+
+        # restore integer columns to their original type
+        non_integer = set(keys[~integers])
+        for column in dataframe.columns:
+            if column in string_keys:
+                dataframe[column] = dataframe[column].infer_objects()
+            elif string_keys:
+                dataframe[column] = dataframe[column].astype('float64')
+            if column not in non_integer and not dataframe[column].isnull().any():
+                dataframe[column] = dataframe[column].astype('int64')
+
+        dataframe.index = [datetime.datetime.fromtimestamp(x) for x in dataframe.index]
         dataframe.index.name = 'timestamp'
+        dataframe.columns.name = None
         return dataframe
 
-
     def to_dataframe(self, by_host=None, by_metric=None):
         """Convert to a pandas.DataFrame
         """
@@ -340,6 +379,436 @@ class Mmperfmon(SubprocessOutputDict):
         """
         return json.dumps(self, cls=JSONEncoder, **kwargs)
 
+class MmperfmonTable(object):
+    """Output of a single mmperfmon invocation as a matrix
+
+    Attributes:
+        timestamps (numpy.ndarray): Seconds since epoch of each row
+        legend (list of dict): Host, counter, and device_id of each column as
+            reported by mmperfmon
+        columns (list of dict): Same as `legend`, but counters whose values
+            carried units are suffixed with ``_bytes`` since their values are
+            converted to bytes
+        values (numpy.ndarray): Matrix of values with one row per timestamp
+            and one column per legend entry; NaN where mmperfmon reported null
+            or a value that is not a number
+        integers (numpy.ndarray): Matrix of bools that is True where a value
+            was reported as an integer
+        in_bytes (numpy.ndarray): Vector of bools that is True for each column
+            whose values were converted into bytes
+        strings (dict): Values that could not be converted into numbers, such
+            as those with unknown units, keyed by (row, column)
+    """
+    def __init__(self, timestamps, legend, values, integers=None, in_bytes=None, strings=None):
+        self.timestamps = timestamps
+        self.legend = legend
+        self.values = values
+        if integers is None:
+            integers = numpy.zeros(values.shape, dtype=bool)
+        self.integers = integers
+        if in_bytes is None:
+            in_bytes = numpy.zeros(len(legend), dtype=bool)
+        self.in_bytes = in_bytes
+        self.strings = strings if strings is not None else {}
+        self.columns = [dict(entry, counter=entry['counter'] + "_bytes") if converted else entry
+                        for entry, converted in zip(legend, in_bytes.tolist())]
+
+    @classmethod
+    def from_dict(cls, parsed):
+        """Convert parsed mmperfmon output into a table
+
+        Args:
+            parsed (dict): Parsed output with the same structure as
+                :class:`Mmperfmon`
+
+        Returns:
+            MmperfmonTable: Table containing all of the values in `parsed`
+        """
+        columns = collections.OrderedDict()
+        for hosts in parsed.values():
+            for hostname, counters in hosts.items():
+                for counter, value in counters.items():
+                    if isinstance(value, dict):
+                        for device_id in value:
+                            columns.setdefault((hostname, counter, device_id), len(columns))
+                    else:
+                        columns.setdefault((hostname, counter, None), len(columns))
+
+        timestamps = sorted(parsed.keys())
+        values = numpy.full((len(timestamps), len(columns)), numpy.nan)
+        integers = numpy.zeros(values.shape, dtype=bool)
+        strings = {}
+        for row, timestamp in enumerate(timestamps):
+            for hostname, counters in parsed[timestamp].items():
+                for counter, value in counters.items():
+                    if isinstance(value, dict):
+                        items = [((hostname, counter, x), y) for x, y in value.items()]
+                    else:
+                        items = [((hostname, counter, None), value)]
+                    for key, item in items:
+                        if item is None:
+                            continue
+                        if isinstance(item, str):
+                            strings[(row, columns[key])] = item
+                            continue
+                        values[row, columns[key]] = item
+                        integers[row, columns[key]] = isinstance(item, int)
+
+        legend = [{'host': x[0], 'counter': x[1], 'device_id': x[2]} for x in columns]
+        return cls(numpy.array(timestamps, dtype='i8'), legend, values, integers,
+                   strings=strings)
+
+    def to_dict(self):
+        """Convert the table into the structure used by :class:`Mmperfmon`
+
+        Returns:
+            dict: Nested dict keyed by timestamp, hostname, counter, and, if
+            applicable, device_id
+        """
+        parsed = {}
+        keys = [(x['host'], x['counter'], x['device_id']) for x in self.columns]
+        integers = self.integers.tolist()
+        for row, (timestamp, values) in enumerate(zip(self.timestamps.tolist(),
+                                                      self.values.tolist())):
+            for index, value in enumerate(values):
+                hostname, counter, device_id = keys[index]
+                if value != value:
+                    # skip null values entirely as if they never existed
+                    value = self.strings.get((row, index))
+                    if value is None:
+                        continue
+                    counter = self.legend[index]['counter']
+                elif integers[row][index]:
+                    value = int(value)
+                to_update = parsed.setdefault(timestamp, {}).setdefault(hostname, {})
+                if device_id:
+                    to_update.setdefault(counter, {})[device_id] = value
+                else:
+                    to_update[counter] = value
+        return parsed
+
+def parse_table(input_str):
+    """Parse the output of a single mmperfmon invocation into a table
+
+    Data rows are grouped into the blocks that follow each row header.  Each
+    block is padded into a character array from which each column is sliced
+    and converted to numbers at once.  Tables that are too wide for a single
+    block wrap into several blocks that repeat the row ids and timestamps, and
+    their columns are numbered consecutively.
+
+    Args:
+        input_str (str): Text output of the ``mmperfmon query`` command
+
+    Returns:
+        MmperfmonTable: Parsed output
+    """
+    if not isinstance(input_str, str):
+        input_str = input_str.decode()
+
+    # find the row headers to determine offsets, then the data rows that follow each
+    headers = list(_REX_ROWHEAD.finditer(input_str))
+    blocks = []
+    for index, header in enumerate(headers):
+        stop = headers[index + 1].start() if index + 1 < len(headers) else len(input_str)
+        lines = _REX_ROW.findall(input_str, header.end(), stop)
+        if lines:
+            blocks.append((get_col_pos(header.group(0), align='right'), lines))
+
+    # decode the legend, which precedes the table
+    legend = {}
+    for match in _REX_LEGEND.finditer(input_str, 0, headers[0].start() if headers else len(input_str)):
+        row, hostname, counter = (match.group(1), match.group(2), match.group(4))
+        # counter will catch LUN names in the case of nsd-level counters
+        device_id = None
+        if '|' in counter:
+            device_id, counter = counter.rsplit('|', 1)
+        legend[int(row)] = {'host': hostname, 'counter': counter, 'device_id': device_id}
+
+    legend = [dict(legend[x]) for x in sorted(legend)]
+    num_columns = len(legend)
+    if not blocks:
+        return MmperfmonTable(numpy.zeros(0, dtype='i8'), legend,
+                              numpy.full((0, num_columns), numpy.nan))
+
+    # pad the data rows of each block into a character array whose last column is blank
+    blocks = _join_blocks(blocks)
+    arrays = []
+    for col_offsets, lines in blocks:
+        lengths = set(map(len, lines))
+        width = max(max(lengths), max(istop or 0 for _, istop in col_offsets))
+        if len(lengths) == 1 and width in lengths:
+            # rows of mmperfmon output are usually the same width
+            text = '\n'.join(lines) + '\n'
+        else:
+            text = ''.join(line.ljust(width + 1) for line in lines)
+        chars = numpy.frombuffer(text.encode('ascii', 'replace'), dtype='S1').reshape(-1, width + 1)
+        arrays.append((chars, [(istart, istop or width) for istart, istop in col_offsets]))
+
+    cell_width = max(istop - istart for _, col_offsets in arrays for istart, istop in col_offsets)
+    cells = [_slice_cells(chars, col_offsets, cell_width) for chars, col_offsets in arrays]
+
+    rowids = [numpy.char.strip(x[:, 0]).astype('i8') for x in cells]
+    all_rowids = numpy.unique(numpy.concatenate(rowids))
+    timestamp_strs = numpy.zeros(len(all_rowids), dtype=cells[0].dtype)
+    values = numpy.full((len(all_rowids), num_columns), numpy.nan)
+    integers = numpy.zeros(values.shape, dtype=bool)
+    in_bytes = numpy.zeros(num_columns, dtype=bool)
+    strings = {}
+
+    # take each row's timestamp from the first block in which it appears
+    for block_rowids, block_cells in reversed(list(zip(rowids, cells))):
+        timestamp_strs[numpy.searchsorted(all_rowids, block_rowids)] = block_cells[:, 1]
+    timestamp_strs, inverse = numpy.unique(numpy.char.strip(timestamp_strs), return_inverse=True)
+    timestamps = numpy.array([_to_epoch(x) for x in timestamp_strs], dtype='i8')[inverse]
+
+    # convert the values of every block at once
+    cell_values, cell_integers, cell_units, cell_strings = _convert_cells(
+        numpy.concatenate([x[:, 2:].ravel() for x in cells]))
+
+    column = 0
+    offset = 0
+    for block_rowids, block_cells in zip(rowids, cells):
+        rows = numpy.searchsorted(all_rowids, block_rowids)[:, None]
+        shape = (block_cells.shape[0], block_cells.shape[1] - 2)
+        size = shape[0] * shape[1]
+        block_values = cell_values[offset:offset + size].reshape(shape)
+        block_integers = cell_integers[offset:offset + size].reshape(shape)
+        block_units = cell_units[offset:offset + size].reshape(shape).any(axis=0)
+        block_strings = cell_strings[offset:offset + size].reshape(shape)
+        offset += size
+
+        width = min(shape[1], num_columns - column)
+        values[rows, numpy.arange(column, column + width)] = block_values[:, :width]
+        integers[rows, numpy.arange(column, column + width)] = block_integers[:, :width]
+        in_bytes[column:column + width] = block_units[:width]
+        for row, index in numpy.argwhere(block_strings[:, :width]).tolist():
+            strings[(int(rows[row, 0]), column + index)] = block_cells[row, 2 + index].strip().decode()
+        column += shape[1]
+
+    return MmperfmonTable(timestamps, legend, values, integers, in_bytes, strings)
+
+def _join_blocks(blocks):
+    """Join the blocks of a wrapped table side by side
+
+    Tables that are too wide for a single block are wrapped into several
+    blocks, each of which repeats the same row ids and timestamps.  If every
+    block repeats exactly the same rows, join each row of every block into a
+    single line so that the whole table can be sliced at once.
+
+    Args:
+        blocks (list of tuple): Column offsets from :func:`get_col_pos` and the
+            data rows that follow each row header
+
+    Returns:
+        list of tuple: `blocks` joined into a single block if possible;
+        otherwise, `blocks` unmodified
+    """
+    if len(blocks) < 2:
+        return blocks
+
+    first_offsets, first_lines = blocks[0]
+    prefix = first_offsets[1][1]
+    if prefix is None:
+        return blocks
+    prefixes = [line[:prefix] for line in first_lines]
+    for col_offsets, lines in blocks[1:]:
+        if col_offsets[1][1] != prefix or len(col_offsets) < 3 \
+                or [line[:prefix] for line in lines] != prefixes:
+            return blocks
+
+    joined_offsets = []
+    joined_lines = [''] * len(first_lines)
+    width = 0
+    for col_offsets, lines in blocks:
+        block_width = max(max(len(x) for x in lines), max(istop or 0 for _, istop in col_offsets))
+        # the row id and timestamp columns are only kept from the first block
+        skip = 0 if width == 0 else prefix
+        joined_offsets += [(istart - skip + width, (istop or block_width) - skip + width)
+                           for istart, istop in (col_offsets if width == 0 else col_offsets[2:])]
+        joined_lines = [x + y[skip:].ljust(block_width - skip) for x, y in zip(joined_lines, lines)]
+        width += block_width - skip
+    return [(joined_offsets, joined_lines)]
+
+def _slice_cells(chars, col_offsets, cell_width):
+    """Slice right-aligned, fixed-width columns out of a character array
+
+    Args:
+        chars (numpy.ndarray): Array of single characters with one row per
+            line of text and a last column of whitespace
+        col_offsets (list of tuple): Start and stop offsets of each column
+        cell_width (int): Width of the widest column
+
+    Returns:
+        numpy.ndarray: Array of byte strings with one row per row of `chars`
+        and one column per element of `col_offsets`.  Cells are padded on the
+        left with whitespace.
+    """
+    blank = chars.shape[1] - 1
+    starts = numpy.array([istart for istart, _ in col_offsets])
+    stops = numpy.array([istop for _, istop in col_offsets])
+    index = stops[:, None] - cell_width + numpy.arange(cell_width)
+    index[index < starts[:, None]] = blank
+    return numpy.ascontiguousarray(chars[:, index.ravel()]).view('S%d' % cell_width)
+
+def _convert_cells(cells):
+    """Convert the text of many table cells into numbers
+
+    Args:
+        cells (numpy.ndarray): Array of byte strings, each containing a number,
+            a number followed by a unit, or null
+
+    Returns:
+        tuple: Vectors of values (NaN where null or not a number), of whether
+        each value was reported as an integer, of whether each value was
+        converted from a human-readable unit into bytes, and of whether each
+        value is not a number and should be kept as a string
+    """
+    numbers = numpy.char.strip(cells)
+
+    # only values with units contain spaces after stripping
+    has_units = (numbers.view('u1').reshape(len(numbers), numbers.itemsize) == ord(' ')).any(axis=1)
+    unit_indices = numpy.flatnonzero(has_units)
+    if len(unit_indices):
+        parts = numpy.char.partition(numbers[unit_indices], b' ')
+        numbers[unit_indices] = numpy.char.strip(parts[:, 0])
+        units = numpy.char.strip(parts[:, 2])
+
+    null = (numbers == b'null') | (numbers == b'')
+    numbers[null] = b'nan'
+    try:
+        values = numbers.astype(numpy.float64)
+        strings = numpy.zeros(len(numbers), dtype=bool)
+    except ValueError:
+        values = numpy.array([_to_float(x) for x in numbers])
+        strings = ~null & numpy.isnan(values)
+
+    # integers are reported without decimal points or units
+    integers = ~null & ~has_units & numpy.char.isdigit(numpy.char.lstrip(numbers, b'-'))
+
+    # attempt to turn human-readable byte quantities into numbers of bytes
+    converted = has_units & ~strings
+    if len(unit_indices):
+        for unit in numpy.unique(units):
+            multiple = MMPERFMON_UNITS_TO_BYTES.get(unit.decode())
+            if multiple is None:
+                # values with unknown units are kept as they were reported
+                matches = unit_indices[units == unit]
+                values[matches] = numpy.nan
+                strings[matches] = True
+                converted[matches] = False
+            else:
+                values[unit_indices[units == unit]] *= multiple
+
+    return values, integers, converted, strings
+
+def _to_epoch(timestamp_str):
+    """Convert an mmperfmon timestamp into seconds since epoch
+
+    Equivalent to ``to_epoch(datetime.datetime.strptime(timestamp_str,
+    MMPERFMON_DATE_FMT))`` for timestamps already validated by ``_REX_ROW``
+    but avoids the considerable overhead of strptime.
+
+    Args:
+        timestamp_str (bytes): Timestamp of the form ``2019-01-11-10:00:00``
+
+    Returns:
+        int: Seconds since epoch, interpreting `timestamp_str` as local time
+    """
+    return int(time.mktime((int(timestamp_str[0:4]), int(timestamp_str[5:7]),
+                            int(timestamp_str[8:10]), int(timestamp_str[11:13]),
+                            int(timestamp_str[14:16]), int(timestamp_str[17:19]),
+                            0, 0, -1)))
+
+def _to_float(number):
+    """Convert a number string that numpy cannot parse into a float
+
+    Args:
+        number (bytes): String representation of a number
+
+    Returns:
+        float: Value of `number` or NaN if it is not numeric
+    """
+    value = recast_string(number.decode())
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return numpy.nan
+
+def iter_tables(input_file, processes=1, window=None):
+    """Parse the members of a directory or tarball one at a time
+
+    Only the members being parsed are held in memory, so arbitrarily large
+    collections of mmperfmon outputs can be streamed through a consumer such
+    as ``archive_mmperfmon``.
+
+    Args:
+        input_file (str): Path to either a directory or a tarfile containing
+            multiple text files, each of which contains the output of a single
+            mmperfmon invocation.
+        processes (int): Number of worker processes.  If 1, parse members
+            serially in the calling process.
+        window (int or None): Maximum number of members in flight when
+            `processes` is greater than one.  If None, twice `processes`.
+
+    Yields:
+        MmperfmonTable: Parsed output of each member in the order in which
+        members appear in `input_file`
+    """
+    if processes > 1:
+        for _, table in iter_parsed_members(input_file, processes, window):
+            yield table
+        return
+
+    for (member_name, _, member_handle) in walk_file_collection(input_file):
+        try:
+            table = parse_table(member_handle.read())
+        except:
+            warnings.warn("Parsing error in %s" % member_name)
+            raise
+        yield table
+
+def iter_parsed_members(input_file, processes, window=None):
+    """Parse the members of a directory or tarball in a pool of processes
+
+    Members are read from `input_file` in the calling process and parsed by
+    :func:`parse_table` in worker processes.  No more than `window` members are
+    held in memory, either as text waiting to be parsed or as parsed results
+    waiting to be consumed.
+
+    Args:
+        input_file (str): Path to either a directory or a tarfile containing
+            multiple text files, each of which contains the output of a single
+            mmperfmon invocation.
+        processes (int): Number of worker processes
+        window (int or None): Maximum number of members in flight.  If None,
+            twice `processes`.
+
+    Yields:
+        tuple: (member name, MmperfmonTable) in the order in which members
+        appear in `input_file`
+    """
+    def get_result(member_name, future):
+        try:
+            return member_name, future.result()
+        except:
+            warnings.warn("Parsing error in %s" % member_name)
+            raise
+
+    if window is None:
+        window = 2 * processes
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=processes)
+    pending = collections.deque()
+    try:
+        for (member_name, _, member_handle) in walk_file_collection(input_file):
+            if len(pending) >= window:
+                yield get_result(*pending.popleft())
+            pending.append((member_name, executor.submit(parse_table, member_handle.read())))
+        while pending:
+            yield get_result(*pending.popleft())
+    finally:
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
 def get_col_pos(line, align=None):
     """Return column offsets of a left-aligned text table
 
@@ -151,21 +151,24 @@ class NerscGlobusLogs(es.EsConnection):
                 source_filter/filter_function/flush_every/flush_function are
                 ignored.
         """
-        query = es.build_timeseries_query(
-            query_template,
-            start,
-            end,
-            start_key='start_date',
-            end_key='end_date')
-
         if scroll:
-            self.query_and_scroll(
-                query=query,
+            super(NerscGlobusLogs, self).query_timeseries(
+                query_template=query_template,
+                start=start,
+                end=end,
                 source_filter=self.source_filter,
                 filter_function=self.filter_function,
                 flush_every=self.flush_every,
-                flush_function=self.flush_function)
+                flush_function=self.flush_function,
+                start_key='start_date',
+                end_key='end_date')
         else:
+            query = es.build_timeseries_query(
+                query_template,
+                start,
+                end,
+                start_key='start_date',
+                end_key='end_date')
             super(NerscGlobusLogs, self).query(query=query)
 
     def to_dataframe(self):
@@ -33,14 +33,20 @@ FROM
     summary AS s
 """
 
-HIT_MEMORY = 0
-HIT_CACHE_DB = 1
-HIT_REMOTE_DB = 2
+HIT_MEMORY = cachingdb.HIT_MEMORY
+HIT_CACHE_DB = cachingdb.HIT_CACHE_DB
+HIT_REMOTE_DB = cachingdb.HIT_REMOTE_DB
+
+#: Seconds for which query results may be reused.  Jobs are only added to the
+#: database after they complete, so results may change until this long after
+#: the end of the time range being queried.
+NERSC_JOBSDB_SETTLE_TIME = 3600
 
 class NerscJobsDb(cachingdb.CachingDb):
     """
     Connect to and interact with the NERSC jobs database.  Maintains a query
-    cache where the results of queries are cached in memory.  If a query is
+    cache where the results of queries are cached in memory, and optionally on
+    disk, for up to ``NERSC_JOBSDB_SETTLE_TIME`` seconds.  If a query is
     repeated, its values are simply regurgitated from here rather than touching
     any databases.
 
@@ -56,9 +62,10 @@ class NerscJobsDb(cachingdb.CachingDb):
     there.  At any time the memory cache can be committed to a cache database to
     be used or transported later.
     """
-    def __init__(self, dbhost=None, dbuser=None, dbpassword=None, dbname=None, cache_file=None):
-        # in-memory query cache
-        self.cached_queries = {}
+    query_cache_ttls = {'SUMMARY': NERSC_JOBSDB_SETTLE_TIME}
+
+    def __init__(self, dbhost=None, dbuser=None, dbpassword=None, dbname=None, cache_file=None,
+                 query_cache_dir=None):
         self.last_results = None # for debugging
 
         if dbhost is None:
@@ -75,43 +82,24 @@ class NerscJobsDb(cachingdb.CachingDb):
             dbuser=dbuser,
             dbpassword=dbpassword,
             dbname=dbname,
-            cache_file=cache_file)
+            cache_file=cache_file,
+            query_cache_dir=query_cache_dir)
 
-    def drop_cache(self):
-        """
-        Clear the query cache
-        """
-        super(NerscJobsDb, self).drop_cache()
-        self.cached_queries = {}
+    @property
+    def cached_queries(self):
+        """QueryCache: results of earlier queries held for reuse"""
+        return self.query_cache
 
     def query(self, query_str, query_variables=(), nocache=False):
         """
         Pass a query through all layers of cache and return on the first hit.
         """
-
-        ### Collapse query string to remove extraneous whitespace
-        query_str = ' '.join(query_str.split())
-        cache_key = query_str % {'ps': '%s'} % query_variables
-
-        ### FIRST: check cache for the results of this query--we can get away
-        ### with this because the NERSC Jobs DB is append-only
-        if cache_key in self.cached_queries and not nocache:
-            index_start, index_end = self.cached_queries[cache_key]
-            results = self.saved_results['summary']['rows'][index_start:index_end]
-            self.last_hit = HIT_MEMORY
-        else:
-            if 'summary' not in self.saved_results:
-                index_start = 0
-            else:
-                index_start = len(self.saved_results['summary']['rows'])
-            results = super(NerscJobsDb, self).query(
-                query_str,
-                query_variables,
-                table='summary',
-                table_schema=NERSC_JOBSDB_SCHEMA)
-            index_end = len(self.saved_results['summary']['rows'])
-            if not nocache:
-                self.cached_queries[cache_key] = (index_start, index_end)
+        results = super(NerscJobsDb, self).query(
+            query_str,
+            query_variables,
+            table='summary',
+            table_schema=NERSC_JOBSDB_SCHEMA,
+            nocache=nocache)
 
         self.last_results = results # for debugging
         return results
@@ -124,22 +112,13 @@ class NerscJobsDb(cachingdb.CachingDb):
         core hours that were burned overall during the start/end time of
         interest.
         """
-        query_str = NERSC_JOBSDB_QUERY + """
-        WHERE
-            s.hostname = %(ps)s
-        AND s.completion > %(ps)s
-        AND s.start < %(ps)s
-        """
-
         totals = {
             'nodehrs': 0.0,
             'numnodes': 0,
             'numjobs': 0,
         }
 
-        results = self.query(
-            query_str,
-            (nersc_host, start_timestamp, end_timestamp))
+        results = self.get_jobs_running_between(start_timestamp, end_timestamp, nersc_host)
 
         for (_, _, this_start, this_end, nnodes) in results:
             real_start = max(this_start, start_timestamp)
@@ -153,7 +132,31 @@ class NerscJobsDb(cachingdb.CachingDb):
 
         return totals
 
-#   def get_concurrent_jobs(self, start_timestamp, end_timestamp, nersc_host):
+    def get_jobs_running_between(self, start_timestamp, end_timestamp, nersc_host):
+        """Return all jobs that were running during a time window
+
+        Args:
+            start_timestamp (int): Find jobs that completed after this time, in
+                seconds since epoch
+            end_timestamp (int): Find jobs that started before this time, in
+                seconds since epoch
+            nersc_host (str): NERSC host on which jobs ran
+
+        Returns:
+            list of tuple: One (stepid, hostname, start, completion, numnodes)
+            tuple for each job that was running during the time window
+        """
+        query_str = NERSC_JOBSDB_QUERY + """
+        WHERE
+            s.hostname = %(ps)s
+        AND s.completion > %(ps)s
+        AND s.start < %(ps)s
+        """
+
+        return self.query(
+            query_str,
+            (nersc_host, start_timestamp, end_timestamp))
+
     def get_job_startend(self, jobid, nersc_host):
         """Return start and end time for a given job id
 
@@ -11,11 +11,22 @@ Lustre health monitoring cron jobs which periodically issue the following::
     /usr/sbin/lctl dl -t >> ost-map.txt
 
 Accepts ASCII text files, or gzip-compressed text files.
+
+Because these dumps grow by one snapshot every few minutes, loading a whole day
+to find a single snapshot is expensive.  :class:`LfsStateIndex` records where
+each ``BEGIN`` block starts so that individual snapshots can be read directly.
+For gzip files, the index records the offset of the gzip member containing each
+block, so files whose blocks were compressed as separate members (e.g., appended
+with ``gzip >>`` or compressed with ``bgzip``) can be seeked without
+decompressing the members that precede them.
 """
 
+import os
 import sys
 import gzip
+import json
 import re
+import zlib
 import warnings
 import mimetypes
 import tokio.connectors.lfshealth
@@ -50,18 +61,34 @@ where the columns are
 Carries the implicit assumption that all OSTs are prefixed with `snx`.
 """
 
+_REX_BEGIN = re.compile(br'^BEGIN[ \t]+(\d+)', re.MULTILINE)
+"""Regular expression to find the timestamp line that starts each snapshot"""
+
+INDEX_SUFFIX = '.idx'
+"""Suffix appended to a dump's file name to form its sidecar index file name"""
+
+INDEX_CACHE_SIZE = 64
+"""Maximum number of LfsStateIndex objects retained by :func:`get_index`"""
+
+_INDEX_CACHE = {}
+
+_READ_CHUNK = 1024 * 1024
+
 class NerscLfsOstMap(dict):
     """Subclass of dictionary that self-populates with Lustre OST-OSS mapping.
     """
-    def __init__(self, cache_file=None):
+    def __init__(self, cache_file=None, timestamps=None):
         """Load the mapping of OSTs to OSSes.
 
         Args:
             cache_file (str, optional): Path to a cache file to load instead of
                 issuing the ``lctl dl -t`` command
+            timestamps (list of int, optional): Only load the snapshots whose
+                ``BEGIN`` timestamps are in this list
         """
         super(NerscLfsOstMap, self).__init__(self)
         self.cache_file = cache_file
+        self.timestamps = timestamps
         self.load_ost_map_file()
 
     def __repr__(self):
@@ -94,17 +121,36 @@ class NerscLfsOstMap(dict):
         populates self with keys of the form::
 
             { timestamp(int) : { file_system: { ost_name : { keys: values } } } }
+
+        If the ``timestamps`` attribute is not None, only the snapshots whose
+        ``BEGIN`` timestamps are listed are read using :func:`get_index`.
         """
+        if self.timestamps is not None:
+            index = get_index(self.cache_file)
+            for position in index.locate(self.timestamps):
+                self._load_lines(index.read_block(position).splitlines(True))
+            return
+
         _, encoding = mimetypes.guess_type(self.cache_file)
         if encoding == 'gzip':
             input_file = gzip.open(self.cache_file, 'rt')
         else:
             input_file = open(self.cache_file, 'r')
 
+        self._load_lines(input_file)
+
+        input_file.close()
+
+    def _load_lines(self, lines):
+        """Parse lines of ``lctl dl -t`` output separated by ``BEGIN`` lines.
+
+        Args:
+            lines (iterable of str): Lines of text to parse
+        """
         this_timestamp = None
         degenerate_keys = 0
         load_str = []
-        for line in input_file:
+        for line in lines:
             if line.startswith('BEGIN'):
                 if degenerate_keys > 0:
                     warnings.warn("%d degenerate keys found for timestamp %d" % (degenerate_keys, this_timestamp))
@@ -124,7 +170,10 @@ class NerscLfsOstMap(dict):
             else:
                 load_str.append(line)
 
-        input_file.close()
+        # append the final block
+        if load_str and this_timestamp is not None:
+            self.__setitem__(this_timestamp,
+                             tokio.connectors.lfshealth.LfsOstMap(from_string='\n'.join(load_str)))
 
     def save_cache(self, output_file=None):
         """Serialize object into a form resembling the output of ``lctl dl -t``.
@@ -178,15 +227,18 @@ class NerscLfsOstMap(dict):
 class NerscLfsOstFullness(dict):
     """Subclass of dictionary that self-populates with Lustre OST fullness.
     """
-    def __init__(self, cache_file=None):
+    def __init__(self, cache_file=None, timestamps=None):
         """Load the fullness of OSTs
 
         Args:
             cache_file (str, optional): Path to a cache file to load instead of
                 issuing the ``lfs df`` command
+            timestamps (list of int, optional): Only load the snapshots whose
+                ``BEGIN`` timestamps are in this list
         """
         super(NerscLfsOstFullness, self).__init__(self)
         self.cache_file = cache_file
+        self.timestamps = timestamps
         self.load_ost_fullness_file()
 
     def __repr__(self):
@@ -233,17 +285,34 @@ class NerscLfsOstFullness(dict):
 
         Parses the output of a file containing concatenated outputs of `lfs df`
         separated by lines of the form `BEGIN 0000` where 0000 is the UNIX epoch
-        time.
+        time.  If the ``timestamps`` attribute is not None, only the snapshots
+        whose ``BEGIN`` timestamps are listed are read using :func:`get_index`.
         """
+        if self.timestamps is not None:
+            index = get_index(self.cache_file)
+            for position in index.locate(self.timestamps):
+                self._load_lines(index.read_block(position).splitlines(True))
+            return
+
         _, encoding = mimetypes.guess_type(self.cache_file)
         if encoding == 'gzip':
             input_file = gzip.open(self.cache_file, 'rt')
         else:
             input_file = open(self.cache_file, 'r')
 
+        self._load_lines(input_file)
+
+        input_file.close()
+
+    def _load_lines(self, lines):
+        """Parse lines of ``lfs df`` output separated by ``BEGIN`` lines.
+
+        Args:
+            lines (iterable of str): Lines of text to parse
+        """
         this_timestamp = None
         degenerate_keys = 0
-        for line in input_file:
+        for line in lines:
             if line.startswith('BEGIN'):
                 if degenerate_keys > 0:
                     warnings.warn("%d degenerate keys found for timestamp %d"
@@ -274,8 +343,6 @@ class NerscLfsOstFullness(dict):
                         'target_index': int(match.group(8)),
                     }
 
-        input_file.close()
-
     def save_cache(self, output_file=None):
         """Serialize object into a form resembling the output of ``lfs df``.
 
@@ -298,3 +365,229 @@ class NerscLfsOstFullness(dict):
                 written.
         """
         output.write(str(self))
+
+class LfsStateIndex(object):
+    """Locations of the ``BEGIN`` blocks within a NERSC lfsstate dump.
+
+    Each snapshot is located by a ``member_offset``, the byte offset in the
+    file of the gzip member in which the snapshot starts (always zero for
+    uncompressed files), and an ``offset``, the position of the ``BEGIN``
+    line within the decompressed contents of the file starting at that member.
+    """
+    def __init__(self, cache_file):
+        """Create an empty index for a file.
+
+        Args:
+            cache_file (str): Path to an ``lfs df`` or ``lctl dl -t`` dump
+        """
+        self.cache_file = cache_file
+        _, encoding = mimetypes.guess_type(cache_file)
+        self.compressed = encoding == 'gzip'
+        self.signature = None
+        self.timestamps = []
+        self.member_offsets = []
+        self.offsets = []
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def build(self):
+        """Scan the file and record the location of every ``BEGIN`` line.
+        """
+        stat = os.stat(self.cache_file)
+        self.signature = [stat.st_size, stat.st_mtime]
+        self.timestamps = []
+        self.member_offsets = []
+        self.offsets = []
+
+        # tail holds an incomplete line carried over from the previous chunk
+        tail = b''
+        tail_start = (0, 0)
+        for member_offset, position, data in self._iter_chunks():
+            if not tail:
+                tail_start = (member_offset, position)
+            buf = tail + data
+            last_newline = buf.rfind(b'\n')
+            if last_newline < 0:
+                tail = buf
+                continue
+            self._add_matches(buf[:last_newline + 1], len(tail), tail_start, member_offset, position)
+            tail = buf[last_newline + 1:]
+            tail_start = (member_offset, position + last_newline + 1 - (len(buf) - len(data)))
+        if tail:
+            self._add_matches(tail, len(tail), tail_start, None, None)
+
+    def _add_matches(self, buf, tail_len, tail_start, member_offset, position):
+        """Record the ``BEGIN`` lines found in a buffer of complete lines.
+
+        Args:
+            buf (bytes): Complete lines of decompressed text
+            tail_len (int): Number of leading bytes of ``buf`` which were
+                carried over from a previous chunk
+            tail_start (tuple): (member_offset, position) of the first byte of
+                ``buf``
+            member_offset (int): Member offset of the chunk that follows the
+                carried-over bytes
+            position (int): Position within its member of the chunk that
+                follows the carried-over bytes
+        """
+        for match in _REX_BEGIN.finditer(buf):
+            offset = match.start()
+            if offset < tail_len:
+                self.member_offsets.append(tail_start[0])
+                self.offsets.append(tail_start[1] + offset)
+            else:
+                self.member_offsets.append(member_offset)
+                self.offsets.append(position + offset - tail_len)
+            self.timestamps.append(int(match.group(1)))
+
+    def _iter_chunks(self):
+        """Iterate over the decompressed contents of the file.
+
+        Yields:
+            tuple: (member_offset, position, data) where ``data`` is a chunk of
+            decompressed bytes which begins ``position`` bytes into the gzip
+            member starting at byte ``member_offset`` of the file.
+        """
+        with open(self.cache_file, 'rb') as input_file:
+            if not self.compressed:
+                position = 0
+                data = input_file.read(_READ_CHUNK)
+                while data:
+                    yield 0, position, data
+                    position += len(data)
+                    data = input_file.read(_READ_CHUNK)
+                return
+
+            member_offset = 0
+            position = 0
+            consumed = 0
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data = input_file.read(_READ_CHUNK)
+            while data:
+                consumed += len(data)
+                while data:
+                    decompressed = decompressor.decompress(data)
+                    if decompressed:
+                        yield member_offset, position, decompressed
+                        position += len(decompressed)
+                    if not decompressor.eof:
+                        break
+                    # a new gzip member starts right after this one ends
+                    data = decompressor.unused_data
+                    member_offset = consumed - len(data)
+                    position = 0
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    if not data.strip(b'\x00'):
+                        break
+                data = input_file.read(_READ_CHUNK)
+
+    def locate(self, timestamps):
+        """Find the blocks corresponding to one or more timestamps.
+
+        Args:
+            timestamps (list of int): Timestamps of ``BEGIN`` lines to find
+
+        Returns:
+            list of int: Positions within this index of every block whose
+            timestamp is in ``timestamps``, in file order
+        """
+        timestamps = set(timestamps)
+        return [position for position, timestamp in enumerate(self.timestamps)
+                if timestamp in timestamps]
+
+    def read_block(self, position):
+        """Read a single snapshot from the file.
+
+        Args:
+            position (int): Position of the block within this index
+
+        Returns:
+            str: The ``BEGIN`` line and all of the lines that follow it up to,
+            but not including, the next ``BEGIN`` line
+        """
+        with open(self.cache_file, 'rb') as raw_file:
+            raw_file.seek(self.member_offsets[position])
+            if self.compressed:
+                input_file = gzip.GzipFile(fileobj=raw_file, mode='rb')
+            else:
+                input_file = raw_file
+            input_file.seek(self.offsets[position])
+            lines = [input_file.readline()]
+            for line in input_file:
+                if line.startswith(b'BEGIN'):
+                    break
+                lines.append(line)
+        return b''.join(lines).decode('utf-8')
+
+    def save(self, index_file=None):
+        """Write the index to a sidecar file.
+
+        Args:
+            index_file (str, optional): Path to which the index should be
+                written.  Defaults to the path of the indexed file with
+                :attr:`INDEX_SUFFIX` appended.
+        """
+        if index_file is None:
+            index_file = self.cache_file + INDEX_SUFFIX
+        with open(index_file, 'w') as output:
+            json.dump({
+                'signature': self.signature,
+                'timestamps': self.timestamps,
+                'member_offsets': self.member_offsets,
+                'offsets': self.offsets,
+            }, output)
+
+    def load(self, index_file=None):
+        """Load the index from a sidecar file.
+
+        Args:
+            index_file (str, optional): Path from which the index should be
+                read.  Defaults to the path of the indexed file with
+                :attr:`INDEX_SUFFIX` appended.
+
+        Returns:
+            bool: True if the index was loaded; False if the sidecar does not
+            exist or describes a different version of the indexed file
+        """
+        if index_file is None:
+            index_file = self.cache_file + INDEX_SUFFIX
+        if not os.path.isfile(index_file):
+            return False
+        with open(index_file, 'r') as input_file:
+            loaded = json.load(input_file)
+        stat = os.stat(self.cache_file)
+        if loaded.get('signature') != [stat.st_size, stat.st_mtime]:
+            return False
+        self.signature = loaded['signature']
+        self.timestamps = loaded['timestamps']
+        self.member_offsets = loaded['member_offsets']
+        self.offsets = loaded['offsets']
+        return True
+
+def get_index(cache_file):
+    """Get the index of an lfsstate dump.
+
+    Returns a previously built index if the file has not changed since it was
+    indexed, then tries a sidecar index file, and finally scans the file.
+
+    Args:
+        cache_file (str): Path to an ``lfs df`` or ``lctl dl -t`` dump
+
+    Returns:
+        LfsStateIndex: Index of the ``BEGIN`` blocks in ``cache_file``
+    """
+    key = os.path.abspath(cache_file)
+    stat = os.stat(cache_file)
+    index = _INDEX_CACHE.get(key)
+    if index is not None and index.signature == [stat.st_size, stat.st_mtime]:
+        return index
+
+    index = LfsStateIndex(cache_file)
+    if not index.load():
+        index.build()
+
+    if key not in _INDEX_CACHE and len(_INDEX_CACHE) >= INDEX_CACHE_SIZE:
+        del _INDEX_CACHE[next(iter(_INDEX_CACHE))]
+    _INDEX_CACHE[key] = index
+    return index
@@ -4,8 +4,13 @@
 This connector provides Python bindings to retrieve information made available
 through the standard Slurm saccount and scontrol CLI commands.  It is currently
 very limited in functionality.
+
+Slurm's hostlist notation (e.g., ``nid0[5032-5159]``) is expanded and compacted
+natively, so nodelists can be manipulated on hosts that do not have Slurm
+installed.
 """
 
+import re
 import json
 import errno
 import warnings
@@ -15,6 +20,7 @@ try:
 except ImportError:
     import io
 import subprocess
+import numpy
 import pandas
 from tokio.common import isstr
 from tokio.connectors.common import SubprocessOutputDict
@@ -24,6 +30,18 @@ SCONTROL = 'scontrol'
 
 DEFAULT_KEYS = ['jobidraw', 'start', 'end']
 
+HOSTLIST_CACHE_SIZE = 4096
+"""Maximum number of expanded nodelists retained by :func:`expand_nodelist`"""
+
+_HOSTLIST_CACHE = {}
+
+SACCT_CHUNK_SIZE = 500
+"""Maximum number of job ids passed to a single invocation of sacct"""
+
+_HOSTLIST_DELIMITERS = ', \t\n'
+
+_REX_NODE_NUMBER = re.compile(r'^(.*?)(\d+)$')
+
 def jobs_running_between(start, end, keys=None):
     """Generate a list of Slurm jobs that ran between a time range
 
@@ -50,23 +68,215 @@ def jobs_running_between(start, end, keys=None):
     else:
         args += ['--format', ','.join(keys)]
 
+    print(" ".join([SACCT] + args))
+    return Slurm(from_string=_run_sacct(args))
+
+def load_jobs(jobids, keys=None, chunk_size=SACCT_CHUNK_SIZE):
+    """Retrieve many Slurm jobs using as few invocations of sacct as possible
+
+    Passes up to `chunk_size` job ids to each invocation of ``sacct --jobs`` so
+    that analyses spanning thousands of jobs do not incur one slurmdbd round
+    trip per job.  Jobs unknown to sacct are omitted from the result.
+
+    Args:
+        jobids (list): Slurm job ids to retrieve
+        keys (list): List of Slurm fields to return for each job; jobidraw
+            is always included
+        chunk_size (int): Maximum number of job ids to pass to each invocation
+            of sacct
+
+    Returns:
+        dict: Keyed by job id and whose values are
+        :class:`tokio.connectors.slurm.Slurm` objects, each containing all
+        tasks of a single job
+    """
+    if keys is None:
+        keys = DEFAULT_KEYS + ['nodelist']
+    # jobidraw must come first since parse_sacct keys records by the first column
+    keys = ['jobidraw'] + [key for key in keys if key != 'jobidraw']
+
+    unique_jobids = []
+    seen = set([])
+    for jobid in jobids:
+        jobid = str(jobid)
+        if jobid not in seen:
+            seen.add(jobid)
+            unique_jobids.append(jobid)
+
+    jobs = {}
+    for index in range(0, len(unique_jobids), chunk_size):
+        args = ['--jobs', ','.join(unique_jobids[index:index + chunk_size]),
+                '--format=%s' % ','.join(keys),
+                '--parsable2']
+        jobs.update(split_jobs(Slurm(from_string=_run_sacct(args))))
+    return jobs
+
+def split_jobs(slurm):
+    """Split a Slurm object containing many jobs into one object per job
+
+    Args:
+        slurm (tokio.connectors.slurm.Slurm): Slurm object containing tasks
+            from any number of jobs, e.g., the output of
+            :func:`jobs_running_between` or a cached ``sacct`` dump
+
+    Returns:
+        dict: Keyed by job id and whose values are
+        :class:`tokio.connectors.slurm.Slurm` objects, each containing all
+        tasks of a single job
+    """
+    jobs = {}
+    for taskid, counters in slurm.items():
+        jobid = taskid.split('.', 1)[0]
+        if jobid not in jobs:
+            jobs[jobid] = Slurm(jobid=jobid, from_string="")
+        jobs[jobid][taskid] = counters
+    return jobs
+
+def _run_sacct(args):
+    """Run sacct and return its output
+
+    Args:
+        args (list): Arguments to pass to sacct
+
+    Returns:
+        str: The stdout of sacct
+    """
     try:
-        print(" ".join([SACCT] + args))
         output_str = subprocess.check_output([SACCT] + args)
-        if not isstr(output_str):
-            output_str = output_str.decode() # for python3
     except OSError as error:
         if error.errno == errno.ENOENT:
-            raise type(error)(error.errno, "Slurm CLI (%s command) not found" % SCONTROL)
+            raise type(error)(error.errno, "Slurm CLI (%s command) not found" % SACCT)
         raise
 
-    return Slurm(from_string=output_str)
+    if not isstr(output_str):
+        output_str = output_str.decode() # for python3
+    return output_str
+
+def _split_top_level(node_string):
+    """Split a hostlist on the delimiters that fall outside of brackets.
+
+    Args:
+        node_string (str): Node list in Slurm's compact notation
+
+    Returns:
+        list of str: Each host expression contained in `node_string`
+    """
+    terms = []
+    depth = 0
+    start = 0
+    for index, char in enumerate(node_string):
+        if char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+            if depth < 0:
+                raise ValueError("unbalanced ']' in hostlist '%s'" % node_string)
+        elif depth == 0 and char in _HOSTLIST_DELIMITERS:
+            terms.append(node_string[start:index])
+            start = index + 1
+    if depth != 0:
+        raise ValueError("unbalanced '[' in hostlist '%s'" % node_string)
+    terms.append(node_string[start:])
+    return [term for term in terms if term]
+
+def _expand_ranges(range_string, node_string):
+    """Expand the contents of one bracket expression.
+
+    Args:
+        range_string (str): Comma-separated list of integers and ranges, e.g.,
+            ``0001-0003,0007``; the width of each range's lower bound sets the
+            zero padding of its members
+        node_string (str): The full hostlist, used only for error reporting
+
+    Returns:
+        list of str: Every (padded) number described by `range_string` in order
+    """
+    values = []
+    for item in range_string.split(','):
+        lo_str, _, hi_str = item.strip().partition('-')
+        if not lo_str.isdigit() or (hi_str and not hi_str.isdigit()):
+            raise ValueError("invalid range '%s' in hostlist '%s'" % (item, node_string))
+        low = int(lo_str)
+        high = int(hi_str) if hi_str else low
+        if high < low:
+            raise ValueError("invalid range '%s' in hostlist '%s'" % (item, node_string))
+        width = len(lo_str)
+        values += ["%0*d" % (width, value) for value in range(low, high + 1)]
+    return values
+
+def _expand_term(term, node_string):
+    """Expand a single host expression which may contain several bracket sets.
+
+    Expressions such as ``r[1-2]n[01-02]`` are expanded as the Cartesian product
+    of their bracket expressions with the leftmost varying slowest, matching the
+    order produced by ``scontrol show hostname``.  Bracket expressions may
+    themselves contain nested expressions such as ``n[0[1-2],10]``.
+
+    Args:
+        term (str): One host expression containing no top-level delimiters
+        node_string (str): The full hostlist, used only for error reporting
+
+    Returns:
+        list of str: Expanded host names in order
+    """
+    open_index = term.find('[')
+    if open_index < 0:
+        if ']' in term:
+            raise ValueError("unbalanced ']' in hostlist '%s'" % node_string)
+        return [term]
+
+    # find the bracket that closes open_index
+    depth = 0
+    for close_index in range(open_index, len(term)):
+        if term[close_index] == '[':
+            depth += 1
+        elif term[close_index] == ']':
+            depth -= 1
+            if depth == 0:
+                break
+
+    prefix = term[:open_index]
+    inner = term[open_index + 1:close_index]
+    if '[' in inner:
+        # nested brackets: each item of the inner list is itself a hostlist
+        middles = []
+        for subterm in _split_top_level(inner):
+            middles += _expand_term(subterm, node_string)
+    else:
+        middles = _expand_ranges(inner, node_string)
+
+    suffixes = _expand_term(term[close_index + 1:], node_string)
+    return [prefix + middle + suffix for middle in middles for suffix in suffixes]
+
+def _expand_cached(node_string):
+    """Expand a nodelist string, memoizing the result.
+
+    Args:
+        node_string (str): Node list in Slurm's compact notation
+
+    Returns:
+        tuple of str: Expanded host names in the order given by `node_string`
+    """
+    node_names = _HOSTLIST_CACHE.get(node_string)
+    if node_names is None:
+        node_names = []
+        for term in _split_top_level(node_string.strip()):
+            node_names += _expand_term(term, node_string)
+        node_names = tuple(node_names)
+        if len(_HOSTLIST_CACHE) >= HOSTLIST_CACHE_SIZE:
+            del _HOSTLIST_CACHE[next(iter(_HOSTLIST_CACHE))]
+        _HOSTLIST_CACHE[node_string] = node_names
+    return node_names
 
 def expand_nodelist(node_string):
     """Expand Slurm compact nodelist into a set of nodes.
 
-    Wraps ``scontrol show hostname nid0[5032-5159]`` to expand a Slurm nodelist
-    string into a list of nodes.
+    Expands a Slurm nodelist string into a set of nodes natively, producing the
+    same node names as ``scontrol show hostname nid0[5032-5159]`` without
+    invoking Slurm.  Comma-separated lists, zero-padded ranges, multiple
+    bracket expressions per host name, and nested brackets are supported.
+    Expansions are memoized, so repeatedly expanding the same nodelist (as
+    happens for every task of a job) is cheap.
 
     Args:
         node_string (str): Node list in Slurm's compact notation (e.g.,
@@ -75,53 +285,115 @@ def expand_nodelist(node_string):
     Returns:
         set: Set of strings which encode the fully expanded node names contained
         in `node_string`.
+
+    Raises:
+        ValueError: If `node_string` is not a valid Slurm hostlist
     """
-    node_names = set([])
-    try:
-        output_str = subprocess.check_output([SCONTROL, 'show', 'hostname', node_string])
-    except OSError as error:
-        if error.errno == errno.ENOENT:
-            raise type(error)(error.errno, "Slurm CLI (%s command) not found" % SCONTROL)
-        raise
+    return set(_expand_cached(node_string))
 
-    if not isstr(output_str):
-        output_str = output_str.decode() # for python3
+def expand_nodelist_nids(node_string):
+    """Expand Slurm compact nodelist into an array of node ids.
 
-    for line in output_str.splitlines():
-        node_name = line.strip()
-        if node_name:
-            node_names.add(node_name)
+    Expands a nodelist such as ``nid0[5032-5159]`` and returns the integer
+    suffix of each node name.  This is the numeric node id (nid) on Cray
+    systems and is the form expected by topology lookups.
 
-    return node_names
+    Args:
+        node_string (str): Node list in Slurm's compact notation
+
+    Returns:
+        numpy.ndarray: Sorted array of unique integer node ids
+
+    Raises:
+        ValueError: If any node name in `node_string` does not end in a number
+    """
+    return nodes_to_nids(_expand_cached(node_string))
+
+def nodes_to_nids(node_names):
+    """Convert node names into integer node ids.
+
+    Args:
+        node_names (iterable of str): Node names such as ``nid05032``
+
+    Returns:
+        numpy.ndarray: Sorted array of unique integer node ids
+
+    Raises:
+        ValueError: If any node name does not end in a number
+    """
+    nids = []
+    for node_name in node_names:
+        match = _REX_NODE_NUMBER.match(node_name)
+        if not match:
+            raise ValueError("node name '%s' has no numeric suffix" % node_name)
+        nids.append(int(match.group(2)))
+    return numpy.unique(numpy.array(nids, dtype=numpy.int64))
 
 def compact_nodelist(node_string):
     """Convert a string of nodes into compact representation.
 
-    Wraps ``scontrol show hostlist nid05032,nid05033,...`` to compress a list of
-    nodes to a Slurm nodelist string.  This is effectively the reverse of
-    ``expand_nodelist()``
+    Compresses a list of nodes into a Slurm nodelist string in the same manner
+    as ``scontrol show hostlist nid05032,nid05033,...`` without invoking Slurm.
+    Node names are deduplicated and sorted, nodes sharing a prefix are grouped
+    into a single bracket expression, and the zero padding of each node number
+    is preserved.  This is effectively the reverse of ``expand_nodelist()``.
 
     Args:
-        node_string (str): Comma-separated list of node names (e.g.,
-            ``nid05032,nid05033,...``)
+        node_string (str or iterable): Comma-separated list of node names (e.g.,
+            ``nid05032,nid05033,...``) or an iterable of node names
     Returns:
         str: The compact representation of `node_string` (e.g.,
-        ``nid0[5032-5159]``)
+        ``nid[05032-05159]``)
     """
-    if not isstr(node_string):
-        node_string = ','.join(list(node_string))
-
-    try:
-        node_string = subprocess.check_output([SCONTROL, 'show', 'hostlist', node_string]).strip()
-    except OSError as error:
-        if error.errno == errno.ENOENT:
-            # "No such file or directory" from subprocess.check_output
-            pass
-
     if isstr(node_string):
-        return node_string
+        node_names = _expand_cached(node_string)
     else:
-        return node_string.decode()
+        node_names = node_string
+
+    # group node numbers by (prefix, width); unpadded numbers have width 0
+    groups = {}
+    for node_name in set(node_names):
+        match = _REX_NODE_NUMBER.match(node_name)
+        if not match:
+            groups.setdefault((node_name, None), set([]))
+            continue
+        prefix, digits = match.groups()
+        width = len(digits) if digits.startswith('0') and len(digits) > 1 else 0
+        groups.setdefault((prefix, width), set([])).add(int(digits))
+
+    # unpadded numbers that fill a padded width print identically, so merge them
+    for (prefix, width), numbers in list(groups.items()):
+        if width == 0 or (prefix, 0) not in groups:
+            continue
+        fits = set([number for number in groups[(prefix, 0)] if len(str(number)) == width])
+        numbers |= fits
+        groups[(prefix, 0)] -= fits
+        if not groups[(prefix, 0)]:
+            del groups[(prefix, 0)]
+
+    terms = []
+    for prefix, width in sorted(groups, key=lambda x: (x[0], x[1] or 0)):
+        if width is None:
+            terms.append(prefix)
+            continue
+        numbers = sorted(groups[(prefix, width)])
+        if len(numbers) == 1:
+            terms.append("%s%0*d" % (prefix, width, numbers[0]))
+            continue
+        ranges = []
+        low = high = numbers[0]
+        for number in numbers[1:] + [None]:
+            if number is not None and number == high + 1:
+                high = number
+                continue
+            if low == high:
+                ranges.append("%0*d" % (width, low))
+            else:
+                ranges.append("%0*d-%0*d" % (width, low, width, high))
+            low = high = number
+        terms.append("%s[%s]" % (prefix, ','.join(ranges)))
+
+    return ','.join(terms)
 
 _RECAST_KEY_MAP = {
     'start':    (
@@ -276,9 +548,8 @@ class Slurm(SubprocessOutputDict):
 
         Scan self and convert special keys into native Python objects where
         appropriate.  If no keys are given, scan everything.  Do NOT attempt
-        to recast anything that is not a string--this is to avoid relying on
-        expand_nodelist if a key is already recast since expand_nodelist does
-        not function outside of an environment containing Slurm.
+        to recast anything that is not a string--values that were already
+        recast (e.g., nodelists loaded from a JSON cache) are left untouched.
 
         Args:
             *target_keys (list, optional): Only convert these keys into native
@@ -334,6 +605,19 @@ class Slurm(SubprocessOutputDict):
 
         return nodelist
 
+    def get_job_nids(self):
+        """Return the integer node ids of all job nodes used.
+
+        Equivalent to :meth:`get_job_nodes` but returns the numeric suffix of
+        each node name (the nid on Cray systems) as an array suitable for
+        vectorized topology lookups.
+
+        Returns:
+            numpy.ndarray: Sorted array of unique integer node ids used by the
+            job described by this object
+        """
+        return nodes_to_nids(self.get_job_nodes())
+
     def get_job_startend(self):
         """Find earliest start and latest end time for a job.
 
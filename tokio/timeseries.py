@@ -265,6 +265,40 @@ class TimeSeries(object):
             self.dataset[t_index, c_index] = value
         return True
 
+    def insert_column(self, timestamps, column_name, values, align='l'):
+        """Inserts many values into a single column
+
+        Vectorized equivalent of calling insert_element() once for each
+        timestamp and value without a reducer.  Values that are NaN or whose
+        timestamps fall outside of the dataset are skipped.
+
+        Args:
+            timestamps (numpy.ndarray): Seconds since epoch that determine the
+                row index into which each element of `values` is inserted
+            column_name (str): Determines the column into which `values` should
+                be inserted; created if it does not exist
+            values (numpy.ndarray): Values to insert into the dataset
+            align (str): "left" or "right"; governs whether or not each of the
+                given `timestamps` represents the left or right edge of the bin.
+
+        Returns:
+            int: Number of values inserted
+        """
+        t_index = ((numpy.asarray(timestamps, dtype='i8') - self.timestamps[0])
+                   // self.timestep).astype('i8')
+        if align[0] == 'r':
+            t_index -= 1
+        values = numpy.asarray(values, dtype=self.dataset.dtype)
+        mask = (t_index >= 0) & (t_index < self.timestamps.shape[0]) & ~numpy.isnan(values)
+        if not mask.any():
+            return 0
+
+        c_index = self.column_map.get(column_name)
+        if c_index is None:
+            c_index = self.add_column(column_name)
+        self.dataset[t_index[mask], c_index] = values[mask]
+        return int(mask.sum())
+
     def convert_to_deltas(self, align='l'):
         """Converts a matrix of monotonically increasing rows into deltas.
         
@@ -305,6 +339,22 @@ class TimeSeries(object):
         self.dataset = numpy.vstack((self.dataset, new_dataset_rows))
         self.timestamps = numpy.hstack((self.timestamps, new_timestamp_rows))
 
+    def trim_columns(self, num_columns=1):
+        """
+        Trim some columns off the end of self.dataset and self.columns
+        """
+        self.dataset = self.dataset[:, 0:-1*num_columns]
+        if len(self.columns) > self.dataset.shape[1]:
+            self.columns = self.columns[0:self.dataset.shape[1]]
+            self.update_column_map()
+
+    def add_columns(self, num_columns=1):
+        """
+        Add additional, unnamed columns to the end of self.dataset
+        """
+        new_dataset_columns = numpy.full((self.dataset.shape[0], num_columns), -0.0)
+        self.dataset = numpy.hstack((self.dataset, new_dataset_columns))
+
 def sorted_nodenames(nodenames, sort_hex=False):
     """
     Gnarly routine to sort nodenames naturally.  Required for nodes named things
@@ -56,7 +56,7 @@ def enumerate_dated_files(start, end, template,
     if end < start:
         raise IndexError("datetime_end < datetime_start")
 
-    check_paths = _expand_check_paths(template, lookup_key)
+    check_paths = expand_check_paths(template, lookup_key)
 
     day = start
     results = []
@@ -67,7 +67,7 @@ def enumerate_dated_files(start, end, template,
     return list(set(results))
 
 
-def _expand_check_paths(template, lookup_key):
+def expand_check_paths(template, lookup_key):
     """Generate paths to examine from a variable-type template.
 
     `template` may be one of three data structures:
@@ -93,12 +93,12 @@ def _expand_check_paths(template, lookup_key):
     check_paths = []
     if isinstance(template, dict):
         if lookup_key is None:
-            check_paths += _expand_check_paths(list(template.values()), lookup_key)
+            check_paths += expand_check_paths(list(template.values()), lookup_key)
         else:
-            check_paths += _expand_check_paths(template.get(lookup_key, []), lookup_key)
+            check_paths += expand_check_paths(template.get(lookup_key, []), lookup_key)
     elif isinstance(template, list):
         for value in template:
-            check_paths += _expand_check_paths(value, lookup_key)
+            check_paths += expand_check_paths(value, lookup_key)
     else:
         check_paths += [template]
 
@@ -4,6 +4,9 @@ Tools to find Darshan logs within a system-wide repository
 
 import os
 import glob
+import time
+import sqlite3
+import datetime
 from tokio.debug import debug_print
 import tokio.tools.common
 import tokio.tools.jobinfo
@@ -23,7 +26,7 @@ DARSHAN_LOG_GLOB_FIELDS = {
 
 def load_darshanlogs(datetime_start=None, datetime_end=None, username=None,
                      jobid=None, log_dir=None, system=None,
-                     which=None, **kwargs):
+                     which=None, index_db=None, **kwargs):
     """Return parsed Darshan logs matching a set of criteria
 
     Finds Darshan logs that match the input criteria, loads them, and returns a
@@ -39,6 +42,9 @@ def load_darshanlogs(datetime_start=None, datetime_end=None, username=None,
         system (str): key to pass to enumerate_dated_files's lookup_key
             when resolving darshan_log_dir
         which (str): 'base', 'total', and/or 'perf' as a comma-delimited string
+        index_db (str, list, or dict): path(s) to Darshan log index databases
+            to search before falling back to globbing log_dir.  See
+            find_darshanlogs().
         kwargs: arguments to pass to the connectors.darshan.Darshan object
             initializer
 
@@ -63,7 +69,8 @@ def load_darshanlogs(datetime_start=None, datetime_end=None, username=None,
                                          username=username,
                                          jobid=jobid,
                                          system=system,
-                                         log_dir=log_dir)
+                                         log_dir=log_dir,
+                                         index_db=index_db)
 
     results = {}
     for matching_logfile in matching_logfiles:
@@ -79,10 +86,17 @@ def load_darshanlogs(datetime_start=None, datetime_end=None, username=None,
     return results
 
 def find_darshanlogs(datetime_start=None, datetime_end=None, username=None, jobid=None,
-                     log_dir=None, system=None):
+                     log_dir=None, system=None, index_db=None):
     """Return darshan log file paths matching a set of criteria
 
-    Attempts to find Darshan logs that match the input criteria.
+    Attempts to find Darshan logs that match the input criteria.  If one or
+    more index databases generated by ``index_darshanlogs`` are available, they
+    are searched first so that matching logs can be located without touching
+    the file system.  The dated subdirectories of log_dir are then globbed for
+    any days within the search window that are not covered by an index
+    database, and the results of both are merged.  If the index databases
+    return no matches at all (e.g., because they do not yet contain the most
+    recent logs), every day in the search window is globbed instead.
 
     Args:
         datetime_start (datetime.datetime): date to begin looking for Darshan logs
@@ -92,6 +106,10 @@ def find_darshanlogs(datetime_start=None, datetime_end=None, username=None, jobi
         log_dir (str): path to Darshan log directory base
         system (str or None): key to pass to enumerate_dated_files's lookup_key
             when resolving darshan_log_dir
+        index_db (str, list, or dict): path(s) to Darshan log index databases
+            in the same form as ``darshan_log_dirs``.  Paths may contain
+            strftime format strings to reference dated index databases.
+            Defaults to ``darshan_index_dbs`` from the site configuration.
 
     Returns:
         list: paths of matching Darshan logs as strings
@@ -102,6 +120,27 @@ def find_darshanlogs(datetime_start=None, datetime_end=None, username=None, jobi
         * Use a default `darshan_log_dir` from `tokio.config`
     """
 
+    if log_dir is None:
+        log_dir = tokio.config.CONFIG.get('darshan_log_dirs')
+
+    if index_db is None:
+        index_db = tokio.config.CONFIG.get('darshan_index_dbs')
+
+    results = []
+    indexed_dates = set([])
+    if index_db and log_dir:
+        results, indexed_dates = _find_darshanlogs_index(datetime_start=datetime_start,
+                                                         datetime_end=datetime_end,
+                                                         username=username,
+                                                         jobid=jobid,
+                                                         log_dir=log_dir,
+                                                         system=system,
+                                                         index_db=index_db)
+        if results and datetime_start is None:
+            return results
+        elif not results:
+            indexed_dates = set([])
+
     if datetime_start is None:
         if jobid is None:
             raise TypeError("datetime_start must be defined if jobid is not")
@@ -111,25 +150,29 @@ def find_darshanlogs(datetime_start=None, datetime_end=None, username=None, jobi
     if datetime_end is None:
         datetime_end = datetime_start
 
-    # first expand the eligible Darshan base directories
-    if log_dir is None:
-        log_dir = tokio.config.CONFIG.get('darshan_log_dirs')
+    search_dirs = []
+    day = datetime_start
+    while day.date() <= datetime_end.date():
+        if day.date() in indexed_dates:
+            day += datetime.timedelta(days=1)
+            continue
 
-    base_dirs = tokio.tools.common.enumerate_dated_files(start=datetime_start,
-                                                         end=datetime_end,
-                                                         template=log_dir,
-                                                         lookup_key=system,
-                                                         match_first=(system is not None))
+        # first expand the eligible Darshan base directories
+        base_dirs = tokio.tools.common.enumerate_dated_files(start=day,
+                                                             end=day,
+                                                             template=log_dir,
+                                                             lookup_key=system,
+                                                             match_first=(system is not None))
 
-    # then run another pass of enumerate_dated_files to resolve the path within
-    # the base darshan log directory
-    search_dirs = []
-    for base_dir in base_dirs:
-        search_dirs += tokio.tools.common.enumerate_dated_files(
-            start=datetime_start,
-            end=datetime_end,
-            template=os.path.join(base_dir, "%-Y", "%-m", "%-d"),
-            lookup_key=system)
+        # then run another pass of enumerate_dated_files to resolve the path
+        # within the base darshan log directory
+        for base_dir in base_dirs:
+            search_dirs += tokio.tools.common.enumerate_dated_files(
+                start=day,
+                end=day,
+                template=os.path.join(base_dir, "%-Y", "%-m", "%-d"),
+                lookup_key=system)
+        day += datetime.timedelta(days=1)
 
     debug_print("Darshan log search directories are:\n  " + "\n  ".join(search_dirs))
 
@@ -139,8 +182,190 @@ def find_darshanlogs(datetime_start=None, datetime_end=None, username=None, jobi
     if username:
         glob_fields['username'] = username
 
-    results = []
     for search_dir in search_dirs:
         results += glob.glob(os.path.join(search_dir, DARHSAN_LOG_NAME_STR % glob_fields))
 
     return list(set(results))
+
+def find_darshanlogs_index(datetime_start=None, datetime_end=None, username=None,
+                           jobid=None, log_dir=None, system=None, index_db=None):
+    """Return darshan log file paths matching a set of criteria from an index
+
+    Searches the headers table of one or more index databases generated by
+    ``index_darshanlogs`` and reconstructs the full path to each matching log
+    from its start time.  Unlike find_darshanlogs(), this does not glob the
+    Darshan log directories.
+
+    Args:
+        datetime_start (datetime.datetime): date to begin looking for Darshan logs
+        datetime_end (datetime.datetime): date to stop looking for Darshan logs
+        username (str): username of user who generated the log
+        jobid (int): jobid corresponding to Darshan log
+        log_dir (str, list, or dict): path to Darshan log directory base
+        system (str or None): key to pass to enumerate_dated_files's lookup_key
+            when resolving log_dir and index_db
+        index_db (str, list, or dict): path(s) to index databases.  Paths may
+            contain strftime format strings, in which case datetime_start must
+            be specified.
+
+    Returns:
+        list: paths of matching Darshan logs as strings
+    """
+    return _find_darshanlogs_index(datetime_start=datetime_start,
+                                   datetime_end=datetime_end,
+                                   username=username,
+                                   jobid=jobid,
+                                   log_dir=log_dir,
+                                   system=system,
+                                   index_db=index_db)[0]
+
+def _find_darshanlogs_index(datetime_start=None, datetime_end=None, username=None,
+                            jobid=None, log_dir=None, system=None, index_db=None):
+    """Return darshan log file paths from an index and the days it covers
+
+    Takes the same arguments as find_darshanlogs_index().
+
+    A day is covered by the index if a dated index database exists for it or
+    if an undated index database contains logs that started on a later day.
+    Logs from the day of the latest log in an undated index database may not
+    all have been indexed yet, so that day is not covered.
+
+    Returns:
+        tuple: list of paths of matching Darshan logs as strings and set of
+        datetime.date covered by the index databases searched.  The set is
+        empty if datetime_start is not specified.
+    """
+    if datetime_start is None and jobid is None:
+        raise TypeError("datetime_start must be defined if jobid is not")
+
+    if datetime_start is not None and datetime_end is None:
+        datetime_end = datetime_start
+
+    # dated index databases cannot be resolved without a date
+    check_paths = tokio.tools.common.expand_check_paths(index_db, system)
+    dated_paths = [x for x in check_paths if '%' in x]
+    index_dbs = set([x for x in check_paths if '%' not in x and os.path.isfile(x)])
+
+    # track which days are covered by an index database so that the caller can
+    # fall back to globbing only those days that are not
+    indexed_dates = set([])
+    if datetime_start is not None:
+        last_indexed = None
+        for index_db_file in index_dbs:
+            latest = _get_latest_start_time(index_db_file)
+            if latest is not None:
+                latest = datetime.date.fromtimestamp(latest)
+                if last_indexed is None or latest > last_indexed:
+                    last_indexed = latest
+
+        day = datetime_start
+        while day.date() <= datetime_end.date():
+            matches = []
+            if dated_paths:
+                matches = tokio.tools.common.enumerate_dated_files(start=day,
+                                                                   end=day,
+                                                                   template=dated_paths,
+                                                                   match_first=False)
+            if matches:
+                index_dbs.update(matches)
+                indexed_dates.add(day.date())
+            elif last_indexed is not None and day.date() < last_indexed:
+                indexed_dates.add(day.date())
+            day += datetime.timedelta(days=1)
+
+    base_dirs = tokio.tools.common.expand_check_paths(log_dir, system)
+    if not index_dbs or not base_dirs:
+        return [], set([])
+
+    where = []
+    params = []
+    if jobid is not None:
+        where.append("jobid = ?")
+        params.append(str(jobid))
+    if username:
+        where.append("username = ?")
+        params.append(username)
+    if datetime_start is not None:
+        # match the day granularity of Darshan log directories
+        where.append("start_time >= ? AND start_time < ?")
+        params.append(int(time.mktime(datetime_start.date().timetuple())))
+        params.append(int(time.mktime((datetime_end.date() + datetime.timedelta(days=1)).timetuple())))
+
+    query = "SELECT filename, start_time FROM headers WHERE " + " AND ".join(where)
+
+    results = set([])
+    for index_db_file in index_dbs:
+        debug_print("Searching %s: %s %s" % (index_db_file, query, params))
+        conn = sqlite3.connect(index_db_file)
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        for filename, start_time in cursor.fetchall():
+            log_path = _get_darshanlog_path(filename, start_time, base_dirs)
+            if log_path:
+                results.add(log_path)
+        cursor.close()
+        conn.close()
+
+    return list(results), indexed_dates
+
+def _get_latest_start_time(index_db_file):
+    """Find the start time of the most recent log in an index database
+
+    Args:
+        index_db_file (str): Path to an index database
+
+    Returns:
+        int or None: Start time of the most recent log in seconds since epoch,
+        or None if the index database contains no logs
+    """
+    conn = sqlite3.connect(index_db_file)
+    cursor = conn.cursor()
+    cursor.execute("SELECT MAX(start_time) FROM headers")
+    latest = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    return latest
+
+def _get_darshanlog_path(filename, start_time, base_dirs):
+    """Reconstruct the full path to a Darshan log from its index entry
+
+    Darshan logs are stored in subdirectories of the form YYYY/M/D that
+    correspond to the start date embedded in the log's file name.
+
+    Args:
+        filename (str): Basename of Darshan log
+        start_time (int): Job start time in seconds since epoch
+        base_dirs (list of str): Darshan log directory base(s)
+
+    Returns:
+        str or None: Path to the log, or None if it cannot be determined
+    """
+    if start_time is None:
+        return None
+    start = datetime.datetime.fromtimestamp(start_time)
+    month = start.month
+    day = start.day
+    year = start.year
+
+    # the file name is authoritative for month and day; the year only needs
+    # fixing up when the start time and the file name straddle new year's day
+    filename_metadata = tokio.connectors.darshan.parse_filename_metadata(filename)
+    if filename_metadata:
+        month = filename_metadata['start_month']
+        day = filename_metadata['start_day']
+        if month - start.month > 6:
+            year -= 1
+        elif start.month - month > 6:
+            year += 1
+
+    paths = [os.path.join(start.strftime(base_dir), str(year), str(month), str(day), filename)
+             for base_dir in base_dirs]
+
+    if len(paths) == 1:
+        return paths[0]
+
+    # only touch the file system if the log could be in multiple places
+    for path in paths:
+        if os.path.isfile(path):
+            return path
+    return None
@@ -0,0 +1,258 @@
+"""Index of job start/end times for answering many interval queries at once
+
+Provides an in-memory index of jobs built in bulk from either the NERSC jobs
+database or Slurm accounting data (e.g., a cached ``sacct`` dump).  Once built,
+the index answers "how many jobs, nodes, and node-hours overlapped each of these
+time windows" for any number of windows in a single vectorized call rather than
+issuing one database query or ``sacct`` invocation per window.
+
+A job is considered to overlap the window ``[t0, t1)`` if it ended after `t0`
+and started before `t1`; this is the same criterion used by
+:meth:`tokio.connectors.nersc_jobsdb.NerscJobsDb.get_concurrent_jobs`.
+"""
+
+import time
+import numpy
+import tokio.connectors.slurm
+import tokio.connectors.nersc_jobsdb
+
+class JobIndex(object):
+    """Start times, end times, and node counts of jobs sorted for interval queries
+
+    Times are stored as integer seconds since the epoch.  Two copies of the
+    job table are kept, one sorted by start time and one sorted by end time,
+    along with prefix sums of node counts and node-seconds over each.  These
+    allow the number of jobs, nodes, and node-seconds overlapping a window to be
+    computed with a handful of binary searches regardless of how many jobs
+    overlap it.
+    """
+    def __init__(self, jobids=None, starts=None, ends=None, nnodes=None, cache_file=None):
+        """Build an index from arrays describing each job
+
+        Args:
+            jobids (list of str): Job id of each job
+            starts (list of int): Start time of each job in seconds since epoch
+            ends (list of int): End time of each job in seconds since epoch
+            nnodes (list of int): Number of nodes used by each job
+            cache_file (str): Path to an index previously written by
+                :meth:`save_cache`; if given, all other arguments are ignored
+
+        Attributes:
+            jobids (numpy.ndarray): Job id of each job, sorted by start time
+            starts (numpy.ndarray): Start time of each job, sorted by start time
+            ends (numpy.ndarray): End time of each job, sorted by start time
+            nnodes (numpy.ndarray): Node count of each job, sorted by start time
+        """
+        if cache_file is not None:
+            with numpy.load(cache_file) as cached:
+                jobids = cached['jobids']
+                starts = cached['starts']
+                ends = cached['ends']
+                nnodes = cached['nnodes']
+
+        if jobids is None:
+            jobids = []
+        starts = numpy.asarray(starts if starts is not None else [], dtype=numpy.int64)
+        ends = numpy.asarray(ends if ends is not None else [], dtype=numpy.int64)
+        nnodes = numpy.asarray(nnodes if nnodes is not None else [], dtype=numpy.int64)
+        jobids = numpy.asarray([str(jobid) for jobid in jobids], dtype=str)
+        if not len(jobids) == len(starts) == len(ends) == len(nnodes):
+            raise ValueError("jobids, starts, ends, and nnodes must be the same length")
+
+        # a job that ended before it started did not run at all
+        ends = numpy.maximum(ends, starts)
+
+        order = numpy.argsort(starts, kind='mergesort')
+        self.jobids = jobids[order]
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self.nnodes = nnodes[order]
+
+        # offset all times to keep node-second prefix sums well within int64
+        self._origin = self.starts[0] if len(self.starts) else 0
+        self._sorted_starts = self.starts - self._origin
+        self._start_nodes, self._start_nodesecs = _prefix_sums(self._sorted_starts,
+                                                               self.nnodes)
+
+        order = numpy.argsort(self.ends, kind='mergesort')
+        self._sorted_ends = self.ends[order] - self._origin
+        self._end_nodes, self._end_nodesecs = _prefix_sums(self._sorted_ends,
+                                                           self.nnodes[order])
+
+    def __len__(self):
+        return len(self.jobids)
+
+    @classmethod
+    def from_slurm(cls, slurm_data):
+        """Build an index from Slurm accounting data
+
+        Only job allocation records are indexed; steps (e.g., ``1234.batch``)
+        are skipped so that each job is counted once.  The number of nodes
+        used by each job is taken from its ``nnodes`` field if present and
+        from the size of its ``nodelist`` otherwise.
+
+        Args:
+            slurm_data (tokio.connectors.slurm.Slurm): Slurm object containing
+                any number of jobs, e.g., loaded from a cached ``sacct`` dump or
+                returned by :func:`tokio.connectors.slurm.jobs_running_between`
+
+        Returns:
+            JobIndex: Index of all jobs in `slurm_data`
+        """
+        jobids = []
+        starts = []
+        ends = []
+        nnodes = []
+        for taskid, counters in slurm_data.items():
+            if '.' in taskid:
+                continue
+            if 'nnodes' in counters:
+                num_nodes = int(counters['nnodes'])
+            elif 'nodelist' in counters:
+                num_nodes = len(counters['nodelist'])
+            else:
+                raise ValueError("job %s has neither nnodes nor nodelist" % taskid)
+            jobids.append(taskid)
+            starts.append(int(time.mktime(counters['start'].timetuple())))
+            ends.append(int(time.mktime(counters['end'].timetuple())))
+            nnodes.append(num_nodes)
+        return cls(jobids=jobids, starts=starts, ends=ends, nnodes=nnodes)
+
+    @classmethod
+    def from_sacct(cls, cache_file):
+        """Build an index from a cached ``sacct`` dump
+
+        Args:
+            cache_file (str): Path to the output of ``sacct --parsable2`` which
+                includes at least the jobidraw, start, end, and either nnodes
+                or nodelist fields
+
+        Returns:
+            JobIndex: Index of all jobs in `cache_file`
+        """
+        return cls.from_slurm(tokio.connectors.slurm.Slurm(cache_file=cache_file))
+
+    @classmethod
+    def from_jobsdb(cls, start, end, nersc_host, nerscjobsdb=None, cache_file=None):
+        """Build an index from the NERSC jobs database
+
+        Args:
+            start (int): Index jobs that ended after this time, in seconds
+                since epoch
+            end (int): Index jobs that started before this time, in seconds
+                since epoch
+            nersc_host (str): Index jobs that ran on this NERSC host
+            nerscjobsdb (tokio.connectors.nersc_jobsdb.NerscJobsDb): Jobs
+                database connection to use; one is created if not specified
+            cache_file (str): Path to a jobs database cache file; only used if
+                `nerscjobsdb` is not specified
+
+        Returns:
+            JobIndex: Index of all jobs on `nersc_host` running between `start`
+            and `end`
+        """
+        if nerscjobsdb is None:
+            nerscjobsdb = tokio.connectors.nersc_jobsdb.NerscJobsDb(cache_file=cache_file)
+        results = nerscjobsdb.get_jobs_running_between(start, end, nersc_host)
+        return cls(jobids=[row[0] for row in results],
+                   starts=[row[2] for row in results],
+                   ends=[row[3] for row in results],
+                   nnodes=[row[4] for row in results])
+
+    def save_cache(self, output_file):
+        """Serialize the index to a NumPy archive
+
+        Args:
+            output_file (str): Path to which the index should be written
+        """
+        with open(output_file, 'wb') as output_fp:
+            numpy.savez_compressed(output_fp,
+                                   jobids=self.jobids,
+                                   starts=self.starts,
+                                   ends=self.ends,
+                                   nnodes=self.nnodes)
+
+    def get_concurrent_jobs(self, start_times, end_times):
+        """Count jobs, nodes, and node-hours overlapping one or more windows
+
+        Args:
+            start_times (int or list of int): Start of each window in seconds
+                since epoch
+            end_times (int or list of int): End of each window in seconds since
+                epoch
+
+        Returns:
+            dict: Contains ``numjobs``, ``numnodes``, and ``nodehrs`` keys, the
+            same as :meth:`tokio.connectors.nersc_jobsdb.NerscJobsDb.get_concurrent_jobs`.
+            If scalar windows are given, values are scalars; otherwise they are
+            arrays with one element per window.
+        """
+        scalar = numpy.ndim(start_times) == 0 and numpy.ndim(end_times) == 0
+        window_starts = numpy.atleast_1d(numpy.asarray(start_times, dtype=numpy.int64)) - self._origin
+        window_ends = numpy.atleast_1d(numpy.asarray(end_times, dtype=numpy.int64)) - self._origin
+
+        # jobs overlapping [t0, t1) are those starting before t1 less those ending by t0
+        started = numpy.searchsorted(self._sorted_starts, window_ends, side='left')
+        ended = numpy.searchsorted(self._sorted_ends, window_starts, side='right')
+        numjobs = started - ended
+        numnodes = self._start_nodes[started] - self._end_nodes[ended]
+        nodesecs = self._get_nodesecs(window_ends) - self._get_nodesecs(window_starts)
+
+        totals = {
+            'numjobs': numjobs,
+            'numnodes': numnodes,
+            'nodehrs': nodesecs / 3600.0,
+        }
+        if scalar:
+            totals['numjobs'] = int(numjobs[0])
+            totals['numnodes'] = int(numnodes[0])
+            totals['nodehrs'] = float(totals['nodehrs'][0])
+        return totals
+
+    def get_running_jobs(self, start_time, end_time):
+        """List the jobs overlapping a window
+
+        Args:
+            start_time (int): Start of window in seconds since epoch
+            end_time (int): End of window in seconds since epoch
+
+        Returns:
+            numpy.ndarray: Job ids of jobs overlapping the window, in order of
+            start time
+        """
+        last = numpy.searchsorted(self.starts, end_time, side='left')
+        mask = self.ends[:last] > start_time
+        return self.jobids[:last][mask]
+
+    def _get_nodesecs(self, times):
+        """Calculate node-seconds consumed by all jobs before each time
+
+        Args:
+            times (numpy.ndarray): Times relative to the index origin
+
+        Returns:
+            numpy.ndarray: Node-seconds consumed by all jobs before each of
+            `times`
+        """
+        started = numpy.searchsorted(self._sorted_starts, times, side='left')
+        ended = numpy.searchsorted(self._sorted_ends, times, side='left')
+        # node-seconds of jobs that started, less node-seconds they have not
+        # yet consumed because they already ended
+        return (times * self._start_nodes[started] - self._start_nodesecs[started]) \
+            - (times * self._end_nodes[ended] - self._end_nodesecs[ended])
+
+def _prefix_sums(times, nnodes):
+    """Calculate cumulative node counts and node-seconds
+
+    Args:
+        times (numpy.ndarray): Sorted times relative to the index origin
+        nnodes (numpy.ndarray): Node count corresponding to each of `times`
+
+    Returns:
+        tuple of numpy.ndarray: Cumulative sums of `nnodes` and of
+        ``nnodes * times``, each with a leading zero so that element ``i`` is
+        the sum over the first ``i`` jobs
+    """
+    zero = numpy.zeros(1, dtype=numpy.int64)
+    return (numpy.concatenate((zero, numpy.cumsum(nnodes))),
+            numpy.concatenate((zero, numpy.cumsum(nnodes * times))))
@@ -18,9 +18,96 @@ except ImportError:
 DEFAULT_JOBID_PROVIDERS = ['slurm']
 DEFAULT_JOBNODES_PROVIDERS = ['slurm']
 
+DEFAULT_CACHE_WINDOW = datetime.timedelta(days=1)
+
+_SLURM_JOBS = {}
+
+def cache_jobs(jobids=None, start=None, end=None, cache_file=None,
+               chunk_size=None, window=DEFAULT_CACHE_WINDOW):
+    """Populate the job info cache for many jobs at once.
+
+    Retrieves job information for a batch of jobs in as few Slurm queries as
+    possible and retains it so that subsequent calls to
+    :func:`get_job_startend` and :func:`get_job_nodes` for those jobs do not
+    invoke sacct.  Jobs may be selected by job id, by the time range in which
+    they were running, or by loading a cached sacct dump containing many jobs.
+
+    Args:
+        jobids (list, optional): Job ids to retrieve using batched
+            ``sacct --jobs`` queries
+        start (datetime.datetime, optional): Retrieve jobs that were running
+            at or after this time; must be specified with `end`
+        end (datetime.datetime, optional): Retrieve jobs that were running at
+            or before this time; must be specified with `start`
+        cache_file (str, optional): Path to a cached sacct output or Slurm
+            JSON file containing any number of jobs
+        chunk_size (int, optional): Maximum number of job ids passed to each
+            sacct invocation; defaults to
+            :attr:`tokio.connectors.slurm.SACCT_CHUNK_SIZE`
+        window (datetime.timedelta): Length of the time range covered by each
+            sacct invocation when `start` and `end` are given
+
+    Returns:
+        int: Number of jobs added to the cache
+    """
+    jobs = {}
+    if cache_file is not None:
+        slurm_data = tokio.connectors.slurm.Slurm(cache_file=cache_file)
+        jobs.update(tokio.connectors.slurm.split_jobs(slurm_data))
+
+    if jobids is not None:
+        if chunk_size is None:
+            chunk_size = tokio.connectors.slurm.SACCT_CHUNK_SIZE
+        jobs.update(tokio.connectors.slurm.load_jobs(jobids, chunk_size=chunk_size))
+
+    if start is not None and end is not None:
+        window_start = start
+        while window_start < end:
+            window_end = min(window_start + window, end)
+            slurm_data = tokio.connectors.slurm.jobs_running_between(
+                window_start,
+                window_end,
+                keys=tokio.connectors.slurm.DEFAULT_KEYS + ['nodelist'])
+            jobs.update(tokio.connectors.slurm.split_jobs(slurm_data))
+            window_start = window_end
+    elif start is not None or end is not None:
+        raise ValueError("start and end must be specified together")
+
+    _SLURM_JOBS.update(jobs)
+    return len(jobs)
+
+def clear_cache():
+    """Discard all job info retained by :func:`cache_jobs`
+    """
+    _SLURM_JOBS.clear()
+
+def _get_slurm_job(jobid, cache_file=None):
+    """Retrieve a Slurm job, consulting the job info cache first.
+
+    Args:
+        jobid (str): Slurm job id
+        cache_file (str, optional): Path to a cached Slurm file; bypasses the
+            job info cache if specified
+
+    Returns:
+        tokio.connectors.slurm.Slurm: Slurm object describing `jobid`
+    """
+    if cache_file is not None:
+        return tokio.connectors.slurm.Slurm(jobid=jobid, cache_file=cache_file)
+
+    slurm_job = _SLURM_JOBS.get(str(jobid))
+    if slurm_job is None:
+        slurm_job = tokio.connectors.slurm.Slurm(jobid=jobid)
+        if slurm_job:
+            _SLURM_JOBS[str(jobid)] = slurm_job
+    return slurm_job
+
 def get_job_startend(jobid, cache_file=None):
     """Find earliest start and latest end time for a job.
 
+    Jobs previously retrieved by :func:`cache_jobs` are served from the job
+    info cache without invoking Slurm.
+
     Returns:
         tuple of datetime.datetime: Two-item tuple of (earliest start time,
             latest end time)
@@ -31,7 +118,7 @@ def get_job_startend(jobid, cache_file=None):
     jobid_providers = config.CONFIG.get('jobinfo_jobid_providers', DEFAULT_JOBID_PROVIDERS)
     for jobid_provider in jobid_providers:
         if jobid_provider == 'slurm':
-            slurm_job = tokio.connectors.slurm.Slurm(jobid=jobid, cache_file=cache_file)
+            slurm_job = _get_slurm_job(jobid, cache_file)
             return slurm_job.get_job_startend()
         elif jobid_provider == 'nersc_jobsdb':
             nersc_host = config.CONFIG.get('nersc_host')
@@ -49,7 +136,9 @@ def get_job_startend(jobid, cache_file=None):
 def get_job_nodes(jobid, cache_file=None):
     """Return a list of all job nodes used.
 
-    Creates a list of all nodes used for a jobid.
+    Creates a list of all nodes used for a jobid.  Jobs previously retrieved
+    by :func:`cache_jobs` are served from the job info cache without invoking
+    Slurm.
 
     Returns:
         set: Set of node names used by the job described by this object
@@ -60,7 +149,7 @@ def get_job_nodes(jobid, cache_file=None):
     jobnodes_providers = config.CONFIG.get('jobinfo_jobnodes_providers', DEFAULT_JOBNODES_PROVIDERS)
     for jobnodes_provider in jobnodes_providers:
         if jobnodes_provider == 'slurm':
-            slurm_job = tokio.connectors.slurm.Slurm(jobid=jobid, cache_file=cache_file)
+            slurm_job = _get_slurm_job(jobid, cache_file)
             return slurm_job.get_job_nodes()
         else:
             raise tokio.ConfigError("No valid jobnodes providers found")
@@ -5,12 +5,15 @@ fullness at that time
 """
 
 import time
+import bisect
 import datetime
+import numpy
 import tokio.tools.common
 import tokio.config
 import tokio.connectors.nersc_lfsstate as nersc_lfsstate
 
 DEFAULT_FULLNESS_PROVIDERS = ['hdf5', 'nersc_lfsstate']
+DEFAULT_FAILURES_PROVIDERS = ['hdf5', 'nersc_lfsstate']
 
 def get_fullness(file_system, datetime_target, **kwargs):
     """Get file system fullness
@@ -76,9 +79,35 @@ def get_failures(file_system, datetime_target, **kwargs):
 
     Returns:
         dict: various statistics about the file system fullness
+
+    Raises:
+        tokio.ConfigError: When no valid providers are found
     """
-    fsname = tokio.config.CONFIG.get('fsname_to_backend_name', {}).get(file_system)
-    return get_lfsstate(fsname if fsname else file_system, datetime_target, "failures", **kwargs)
+    providers = tokio.config.CONFIG.get('lfsstatus_failures_providers', DEFAULT_FAILURES_PROVIDERS)
+    match = False
+    failures = {}
+    for provider in providers:
+        if provider == 'hdf5':
+            match = True
+            try:
+                failures = get_failures_hdf5(file_system, datetime_target)
+            except KeyError:
+                # get_failures_hdf5 throws KeyError if failover data is not available
+                match = False
+            if failures:
+                return failures
+        if provider == 'nersc_lfsstate':
+            match = True
+            fsname = tokio.config.CONFIG.get('fsname_to_backend_name', {}).get(file_system)
+            return get_lfsstate(fsname if fsname else file_system,
+                                datetime_target,
+                                "failures",
+                                **kwargs)
+
+    if match:
+        return failures
+
+    raise tokio.ConfigError("No valid lfsstatus failures providers found")
 
 
 def get_fullness_lfsstate(file_system, datetime_target, cache_file=None):
@@ -169,39 +198,41 @@ def get_lfsstate(file_system, datetime_target, metric, cache_file=None):
             template_path,
             str(datetime_target)))
 
-    # We can get away with the following because NerscLfsOstFullness,
-    # NerscLfsOstMap, and NerscLfsOstMap.get_failovers all have the same
+    # Index the BEGIN blocks of every file so that only the snapshot of
+    # interest needs to be parsed.  If a timestamp appears in more than one
+    # file, the last file wins.
+    timestamp_files = {}
+    for health_file in ost_health_files:
+        for timestamp in nersc_lfsstate.get_index(health_file).timestamps:
+            timestamp_files[timestamp] = health_file
+
+    timestamps = sorted(timestamp_files)
+    if not timestamps:
+        raise IOError("No OST health data found in %s for %s" % (
+            ', '.join(ost_health_files),
+            str(datetime_target)))
+
+    # Find the sample immediately preceding our timestamp of interest.  If the
+    # records start after the target time stamp, or if they all end before it,
+    # just report the first record (target_index=0)
+    target_timestamp = int(time.mktime(datetime_target.timetuple()))
+    target_index = bisect.bisect_left(timestamps, target_timestamp)
+    if target_index == len(timestamps):
+        target_index = 0
+    else:
+        target_index = max(target_index - 1, 0)
+
+    # NerscLfsOstFullness and NerscLfsOstMap.get_failovers have the same
     # structure
+    target_file = timestamp_files[timestamps[target_index]]
     if metric == "fullness":
-        ost_health = None
-        for df_file in ost_health_files:
-            if ost_health is None:
-                ost_health = nersc_lfsstate.NerscLfsOstFullness(cache_file=df_file)
-            else:
-                ost_health.update(nersc_lfsstate.NerscLfsOstFullness(cache_file=df_file))
+        ost_health = nersc_lfsstate.NerscLfsOstFullness(
+            cache_file=target_file,
+            timestamps=[timestamps[target_index]])
     elif metric == "failures":
-        ost_map = None
-        for map_file in ost_health_files:
-            if ost_map is None:
-                ost_map = nersc_lfsstate.NerscLfsOstMap(cache_file=map_file)
-            else:
-                ost_map.update(nersc_lfsstate.NerscLfsOstMap(cache_file=map_file))
-        ost_health = ost_map.get_failovers()
-
-    timestamps = sorted([int(x) for x in ost_health])
-
-    # Unoptimized walk through to find our timestamp of interest
-    target_timestamp = int(time.mktime(datetime_target.timetuple()))
-    # If the day's records start after the target time stamp, just report the
-    # first record (target_index=0)
-    target_index = 0
-    for index, timestamp in enumerate(timestamps):
-        if timestamp >= target_timestamp:
-            if index == 0:
-                break
-            else:
-                target_index = index - 1
-                break
+        ost_health = nersc_lfsstate.NerscLfsOstMap(
+            cache_file=target_file,
+            timestamps=[timestamps[target_index]]).get_failovers()
 
     fs_data = ost_health[timestamps[target_index]][file_system]
 
@@ -240,61 +271,200 @@ def get_fullness_hdf5(file_system, datetime_target):
         ValueError: if an OST name is encountered which does not conform to
             a naming convention from which an OST index can be derived
     """
-    # For concordance with the lfsstate version, assume a generous lookbehind
-    # that captures at least a few timesteps.  Lookahead does not need to be as
-    # generous.
-    df_bytes = tokio.tools.hdf5.get_dataframe_from_time_range(
-        fsname=file_system,
-        dataset_name='/fullness/bytes',
-        datetime_start=datetime_target - datetime.timedelta(hours=1),
-        datetime_end=datetime_target + datetime.timedelta(hours=1))
-    df_bytes_tot = tokio.tools.hdf5.get_dataframe_from_time_range(
-        fsname=file_system,
-        dataset_name='/fullness/bytestotal',
-        datetime_start=datetime_target - datetime.timedelta(hours=1),
-        datetime_end=datetime_target + datetime.timedelta(hours=1))
-
-    # Bail if nothing is found
-    if df_bytes is None or df_bytes_tot is None or len(df_bytes) == 0 or len(df_bytes_tot) == 0:
+    snapshot = _get_hdf5_snapshot(file_system,
+                                  datetime_target,
+                                  ['fullness/bytes', 'fullness/bytestotal'])
+    if snapshot is None:
         return {}
 
-    # NAs must be filled or else fullness/total values will be spuriously low
-    df_bytes = df_bytes.fillna(method='ffill').fillna(method='bfill')
-    df_bytes_tot = df_bytes_tot.fillna(method='ffill').fillna(method='bfill')
-
-    # Find closest matching timestamp
-    iloc = df_bytes.index.get_loc(datetime_target, method='nearest')
-
     # Build a dictionary that _summarize_fullness will accept as input
     results = {}
-    for ostname, value in df_bytes.iloc[iloc].items():
+    (used, used_units), (total, total_units) = snapshot['values']
+    for ostname, used_value, total_value in zip(snapshot['columns'], used, total):
+        if _is_missing(used_value) or _is_missing(total_value):
+            continue
         ostname_key = ostname.split('-')[-1]
         try:
             target_index = int(ostname_key.lower().lstrip('ost'), 16)
         except ValueError as error:
             raise type(error)("Cannot derive OST index from name '%s'" % ostname)
-        used_kib = int(value / 1024.0)
-        total_kib = int(df_bytes_tot.iloc[iloc][ostname] / 1024.0)
         results[ostname_key] = {
-            'used_kib': used_kib,
-            'total_kib': total_kib,
+            'used_kib': int(_to_kib(used_value, used_units)),
+            'total_kib': int(_to_kib(total_value, total_units)),
             'target_index': target_index,
         }
 
     summarized_data = _summarize_fullness(results)
+    summarized_data.update(_snapshot_timestamps(snapshot, datetime_target))
+    return summarized_data
 
-    # for interpolation and error bounding
-    if iloc < len(df_bytes.index):
-        summarized_data['ost_next_timestamp'] = df_bytes.index[iloc + 1].to_pydatetime()
 
-    summarized_data.update({
-        'ost_actual_timestamp': df_bytes.index[iloc].to_pydatetime(),
-        'ost_requested_timestamp': datetime_target,
-    })
+def get_failures_hdf5(file_system, datetime_target):
+    """Get file system failures from an HDF5 object
+
+    Reconstructs the failover summary from the ``failover/datatargets``
+    dataset, which records the number of OSTs being served by each OST's OSS.
 
+    Args:
+        file_system (str): Name of file system whose data should be retrieved
+        datetime_target (datetime.datetime): Time at which requested data
+            should be retrieved
+
+    Returns:
+        dict: various statistics about the file system failures
+    """
+    snapshot = _get_hdf5_snapshot(file_system, datetime_target, ['failover/datatargets'])
+    if snapshot is None:
+        return {}
+
+    # Each OSS serving N OSTs contributes N OSTs with a value of N
+    ost_counts = {}
+    for value in snapshot['values'][0][0]:
+        if not _is_missing(value):
+            ost_counts[int(value)] = ost_counts.get(int(value), 0) + 1
+    if not ost_counts:
+        return {}
+    histogram = dict((count, num_osts // count) for count, num_osts in sorted(ost_counts.items()))
+    mode = max(histogram, key=histogram.get)
+
+    summarized_data = _summarize_failover_counts(
+        num_abnormal_ip=sum(num_oss for count, num_oss in histogram.items() if count != mode),
+        num_abnormal_osts=sum(num_osts for count, num_osts in ost_counts.items() if count != mode),
+        mode=mode)
+    summarized_data.update(_snapshot_timestamps(snapshot, datetime_target))
     return summarized_data
 
 
+def _get_hdf5_snapshot(file_system, datetime_target, dataset_names,
+                       lookbehind=datetime.timedelta(days=1),
+                       lookahead=datetime.timedelta(hours=1)):
+    """Find the latest populated row preceding a time in TOKIO HDF5 files
+
+    Computes the row index for ``datetime_target`` directly from each file's
+    first timestamp and timestep, then reads backwards from there until a row
+    containing data is found, so only a few rows are read per lookup.
+
+    Args:
+        file_system (str): Logical name of file system whose data should be
+            retrieved
+        datetime_target (datetime.datetime): Time at which requested data
+            should be retrieved
+        dataset_names (list of str): Datasets to read.  The first is used to
+            decide which rows are populated.
+        lookbehind (datetime.timedelta): How far before ``datetime_target`` to
+            search for data
+        lookahead (datetime.timedelta): How far after ``datetime_target`` to
+            search for the next populated row
+
+    Returns:
+        dict or None: None if no data was found; otherwise, a dict with keys
+        ``timestamp`` (int), ``next_timestamp`` (int or None), ``columns``
+        (list of str), and ``values``, a list containing a (numpy.ndarray,
+        units) tuple for each of ``dataset_names``
+    """
+    target_timestamp = int(time.mktime(datetime_target.timetuple()))
+    hdf5_filenames = tokio.tools.hdf5.enumerate_hdf5(file_system,
+                                                     datetime_target - lookbehind,
+                                                     datetime_target)
+    best = None
+    for hdf5_filename in sorted(hdf5_filenames):
+        with tokio.connectors.hdf5.Hdf5(hdf5_filename, mode='r') as hdf5_file:
+            try:
+                dataset = hdf5_file[dataset_names[0]]
+            except KeyError:
+                continue
+            timestamps = hdf5_file.get_timestamps(dataset_names[0])
+            num_rows = min(timestamps.shape[0], dataset.shape[0])
+            if num_rows < 2:
+                continue
+            t_start = int(timestamps[0])
+            timestep = hdf5_file.get_timestep(dataset_names[0], timestamps[0:2])
+
+            # rows whose timestamps precede the target
+            stop = min(max(-(-(target_timestamp - t_start) // timestep), 0), num_rows)
+            start = max(stop - int(lookbehind.total_seconds() // timestep), 0)
+            row = _find_populated_row(dataset, start, stop, reverse=True)
+            if row is None or (best is not None and int(timestamps[row]) <= best['timestamp']):
+                continue
+
+            next_row = _find_populated_row(dataset,
+                                           row + 1,
+                                           min(stop + int(lookahead.total_seconds() // timestep),
+                                               num_rows))
+            columns = list(hdf5_file.get_columns(dataset_names[0]))
+            values = []
+            for dataset_name in dataset_names:
+                if list(hdf5_file.get_columns(dataset_name)) != columns:
+                    raise KeyError("%s and %s have different columns in %s"
+                                   % (dataset_names[0], dataset_name, hdf5_filename))
+                units = hdf5_file[dataset_name].attrs.get('units')
+                if isinstance(units, bytes):
+                    units = units.decode()
+                values.append((hdf5_file[dataset_name][row, :len(columns)], units))
+
+            best = {
+                'timestamp': int(timestamps[row]),
+                'next_timestamp': None if next_row is None else int(timestamps[next_row]),
+                'columns': columns,
+                'values': values,
+            }
+    return best
+
+
+def _find_populated_row(dataset, start, stop, reverse=False, chunk_size=16):
+    """Find the first or last row of a dataset containing any data
+
+    Args:
+        dataset (h5py.Dataset): Two-dimensional dataset to search
+        start (int): First row to search, inclusive
+        stop (int): Last row to search, exclusive
+        reverse (bool): Find the last populated row rather than the first
+        chunk_size (int): Number of rows to read at a time
+
+    Returns:
+        int or None: Index of the populated row, or None if none was found
+    """
+    if reverse:
+        chunks = [(max(chunk_stop - chunk_size, start), chunk_stop)
+                  for chunk_stop in range(stop, start, -chunk_size)]
+    else:
+        chunks = [(chunk_start, min(chunk_start + chunk_size, stop))
+                  for chunk_start in range(start, stop, chunk_size)]
+    for chunk_start, chunk_stop in chunks:
+        values = dataset[chunk_start:chunk_stop, :]
+        populated = numpy.nonzero(~_is_missing(values).all(axis=1))[0]
+        if len(populated):
+            return chunk_start + (populated[-1] if reverse else populated[0])
+    return None
+
+
+def _is_missing(values):
+    """Identify elements that were never populated (-0.0) in a TOKIO dataset
+    """
+    return (values == 0.0) & numpy.signbit(values)
+
+
+def _to_kib(value, units):
+    """Convert a fullness value into KiB based on the units of its dataset
+    """
+    if units == 'KiB':
+        return value
+    return value / 1024.0
+
+
+def _snapshot_timestamps(snapshot, datetime_target):
+    """Describe the time of a snapshot found by _get_hdf5_snapshot
+    """
+    results = {
+        'ost_actual_timestamp': snapshot['timestamp'],
+        'ost_requested_timestamp': int(time.mktime(datetime_target.timetuple())),
+    }
+    # for interpolation and error bounding
+    if snapshot['next_timestamp'] is not None:
+        results['ost_next_timestamp'] = snapshot['next_timestamp']
+    return results
+
+
 def _summarize_fullness(fs_data):
     """Summarize fullness data for a single time record
 
@@ -397,13 +567,30 @@ def _summarize_failover(fs_data):
     Returns:
         dict: summary metrics about the state of failovers on the file system
     """
-    num_abnormal_ip = len(fs_data['abnormal_ips'])
     num_abnormal_osts = 0
+    for _, ost_list in fs_data['abnormal_ips'].items():
+        num_abnormal_osts += len(ost_list)
+
+    return _summarize_failover_counts(num_abnormal_ip=len(fs_data['abnormal_ips']),
+                                      num_abnormal_osts=num_abnormal_osts,
+                                      mode=fs_data['mode'])
+
+
+def _summarize_failover_counts(num_abnormal_ip, num_abnormal_osts, mode):
+    """Summarize failover data from counts of abnormal OSSes and OSTs
+
+    Args:
+        num_abnormal_ip (int): number of OSSes serving an abnormal number of
+            OSTs
+        num_abnormal_osts (int): number of OSTs served by those OSSes
+        mode (int): statistical mode of OSTs per OSS
+
+    Returns:
+        dict: summary metrics about the state of failovers on the file system
+    """
     if num_abnormal_ip:
-        for _, ost_list in fs_data['abnormal_ips'].items():
-            num_abnormal_osts += len(ost_list)
         avg_overload = float(num_abnormal_osts) / float(num_abnormal_ip)
-        avg_overload_factor = avg_overload / float(fs_data['mode'])
+        avg_overload_factor = avg_overload / float(mode)
     else:
         avg_overload = 0.0
         avg_overload_factor = 1.0